@@ -100,11 +100,13 @@ class AccelerometerController(sensor_utils.BasicSensorController):
     # the data will be dumped in a char file in the scan order.
     # Stores the (scan order -> signal name) mapping for later use.
     self.index_to_signal = {}
+    scan_elements = self._GetSysfsValues(
+        ['%s_%s' % (signal_name, suffix) for signal_name in self.signal_names
+         for suffix in ('index', 'type')], scan_elements_path)
     for signal_name in self.signal_names:
-      index = int(
-          self._GetSysfsValue('%s_index' % signal_name, scan_elements_path))
+      index = int(scan_elements['%s_index' % signal_name])
       scan_type = _ParseIIOBufferScanType(
-          self._GetSysfsValue('%s_type' % signal_name, scan_elements_path))
+          scan_elements['%s_type' % signal_name])
       self.index_to_signal[index] = dict(name=signal_name, scan_type=scan_type)
 
   def CleanUpCalibrationValues(self):
@@ -7,7 +7,9 @@
 
 
 import logging
+import pipes
 import posixpath  # Assume most linux devices will be running POSIX os.
+import uuid
 
 from cros.factory.device import accelerometer
 from cros.factory.device import ambient_light_sensor
@@ -21,6 +23,7 @@ from cros.factory.device import i2c
 from cros.factory.device import info
 from cros.factory.device import init
 from cros.factory.device import led
+from cros.factory.device.links import agent
 from cros.factory.device import magnetometer
 from cros.factory.device import memory
 from cros.factory.device import partitions
@@ -37,6 +40,7 @@ from cros.factory.device import usb_c
 from cros.factory.device import vsync_sensor
 from cros.factory.device import wifi
 from cros.factory.utils import file_utils
+from cros.factory.utils import sys_interface
 from cros.factory.utils import sys_utils
 from cros.factory.utils import type_utils
 
@@ -238,6 +242,52 @@ class LinuxBoard(device_types.DeviceBoard):
 
     return self.CheckOutput(args)
 
+  @type_utils.Overrides
+  def ReadFiles(self, paths):
+    """Returns contents of many files on target device.
+
+    On remote devices, the files are read by the link agent if the link has
+    one, otherwise by one shell command printing the files separated by a
+    random boundary.
+
+    Args:
+      paths: A list of file paths on target device.
+
+    Returns:
+      A dict {path: contents} of files that were read successfully.
+    """
+    paths = list(paths)
+    if self.link.IsLocal() or not paths:
+      return super(LinuxBoard, self).ReadFiles(paths)
+
+    link_agent = self.link.GetAgent()
+    if link_agent:
+      try:
+        result = {}
+        for path, data in link_agent.ReadFiles(paths).items():
+          try:
+            result[path] = data.decode('utf-8')
+          except UnicodeDecodeError:
+            pass
+        return result
+      except agent.AgentUnavailableError:
+        pass
+
+    # Each file is followed by '\n<boundary> <exit code of cat>\n'.
+    boundary = uuid.uuid4().hex
+    output = self.CheckOutput(''.join(
+        'cat %s 2>/dev/null; r=$?; echo; echo %s $r; ' % (
+            pipes.quote(path), boundary) for path in paths))
+    chunks = output.split('\n%s ' % boundary)
+    result = {}
+    contents = chunks[0]
+    for path, chunk in zip(paths, chunks[1:]):
+      returncode, unused_newline, next_contents = chunk.partition('\n')
+      if returncode == '0':
+        result[path] = contents
+      contents = next_contents
+    return result
+
   @type_utils.Overrides
   def WriteFile(self, path, content):
     """Writes some content into file on target device.
@@ -351,6 +401,75 @@ class LinuxBoard(device_types.DeviceBoard):
     results = self.CallOutput('ls -d %s' % pattern)
     return results.splitlines() if results else []
 
+  @type_utils.Overrides
+  def StatMany(self, paths):
+    """Returns the status of many files on target device, following symlinks.
+
+    Args:
+      paths: A list of file paths on target device.
+
+    Returns:
+      A dict {path: sys_interface.FileStat} of existing files.
+    """
+    paths = list(paths)
+    if self.link.IsLocal() or not paths:
+      return super(LinuxBoard, self).StatMany(paths)
+
+    link_agent = self.link.GetAgent()
+    if link_agent:
+      try:
+        return {path: sys_interface.FileStat(st['mode'], st['size'],
+                                             st['mtime'])
+                for path, st in link_agent.StatMany(paths).items()}
+      except agent.AgentUnavailableError:
+        pass
+
+    # One line for each file, which is empty if the file does not exist.
+    output = self.CheckOutput(''.join(
+        "stat -L -c '%%f %%s %%Y' %s 2>/dev/null || echo; " % pipes.quote(path)
+        for path in paths))
+    result = {}
+    for path, line in zip(paths, output.split('\n')):
+      if line:
+        mode, size, mtime = line.split()
+        result[path] = sys_interface.FileStat(
+            int(mode, 16), int(size), int(mtime))
+    return result
+
+  @type_utils.Overrides
+  def GlobMany(self, patterns):
+    """Finds files on target device by many patterns in one round trip.
+
+    Args:
+      patterns: A list of file path patterns, see Glob.
+
+    Returns:
+      A dict {pattern: list of matching files}.
+    """
+    patterns = list(patterns)
+    if self.link.IsLocal() or not patterns:
+      return super(LinuxBoard, self).GlobMany(patterns)
+
+    link_agent = self.link.GetAgent()
+    if link_agent:
+      try:
+        return link_agent.GlobMany(patterns)
+      except agent.AgentUnavailableError:
+        pass
+
+    # Same as Glob, and the results of each pattern follow a boundary line.
+    boundary = uuid.uuid4().hex
+    output = self.CheckOutput(''.join(
+        'echo %s; ls -d %s 2>/dev/null; ' % (boundary, pattern)
+        for pattern in patterns))
+    results = []
+    for line in output.splitlines():
+      if line == boundary:
+        results.append([])
+      elif results:
+        results[-1].append(line)
+    return dict(zip(patterns, results))
+
   @type_utils.Overrides
   def GetStartupMessages(self):
     res = {}
@@ -5,11 +5,18 @@
 
 """Tests for SystemInterface and DeviceInterface in LinuxBoard."""
 
+import os
+import shutil
+import tempfile
 import unittest
 from unittest import mock
 
 from cros.factory.device.boards import linux
 from cros.factory.device import device_types
+from cros.factory.device.links import agent
+from cros.factory.device.links import local
+from cros.factory.utils import file_utils
+from cros.factory.utils import sys_interface
 
 
 class MockProcess:
@@ -141,5 +148,57 @@ class LinuxTargetTest(unittest.TestCase):
                       'ec_console_log': 'ec_console_log_value'})
 
 
+class BatchFileTest(unittest.TestCase):
+  """Tests batched file APIs with the local machine as a remote device."""
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.link = device_types.DeviceLink()
+    self.link.Shell = local.LocalLink().Shell
+    self.dut = linux.LinuxBoard(self.link)
+    self.local = sys_interface.SystemInterface()
+
+    for name, contents in [('a', 'A\n'), ('b', ''), ('c', 'no newline'),
+                           ('d', '\n\nlines\n\n')]:
+      file_utils.WriteFile(os.path.join(self.temp_dir, name), contents)
+    os.mkdir(os.path.join(self.temp_dir, 'dir'))
+    self.paths = [os.path.join(self.temp_dir, name)
+                  for name in ['a', 'b', 'non-exist', 'c', 'dir', 'd']]
+    self.patterns = [os.path.join(self.temp_dir, pattern)
+                     for pattern in ['*', '[ab]', 'x*', 'd']]
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _CheckSameAsLocal(self):
+    self.assertEqual(self.local.ReadFiles(self.paths),
+                     self.dut.ReadFiles(self.paths))
+    self.assertEqual(
+        {path: st._replace(mtime=int(st.mtime))
+         for path, st in self.local.StatMany(self.paths).items()},
+        {path: st._replace(mtime=int(st.mtime))
+         for path, st in self.dut.StatMany(self.paths).items()})
+    self.assertEqual(
+        {pattern: sorted(paths)
+         for pattern, paths in self.local.GlobMany(self.patterns).items()},
+        {pattern: sorted(paths)
+         for pattern, paths in self.dut.GlobMany(self.patterns).items()})
+
+  def testShell(self):
+    self.dut.CheckOutput = mock.MagicMock(wraps=self.dut.CheckOutput)
+    self._CheckSameAsLocal()
+    self.assertEqual(3, self.dut.CheckOutput.call_count)
+    self.assertEqual({}, self.dut.ReadFiles([]))
+
+  def testAgent(self):
+    link_agent = agent.LinkAgent(local.LocalLink())
+    self.link.GetAgent = lambda: link_agent
+    try:
+      self.dut.CheckOutput = mock.MagicMock(side_effect=AssertionError)
+      self._CheckSameAsLocal()
+    finally:
+      link_agent.Close()
+
+
 if __name__ == '__main__':
   unittest.main()
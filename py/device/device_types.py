@@ -104,6 +104,13 @@ class DeviceLink:
     """
     return False
 
+  def GetAgent(self):
+    """Returns the agent on the device, or None if the link doesn't use one.
+
+    See cros.factory.device.links.agent.LinkAgent.
+    """
+    return None
+
   @classmethod
   def PrepareLink(cls):
     """Setup prerequisites of device connections.
@@ -23,6 +23,16 @@ class HardwareMonitorDevice(device_types.DeviceComponent):
   def GetAttribute(self, name):
     return self._device.ReadFile(self._device.path.join(self._path, name))
 
+  def GetAttributes(self, names):
+    """Returns a dict {name: value} of attributes that can be read.
+
+    All attributes are read in one round trip.
+    """
+    paths = {name: self._device.path.join(self._path, name) for name in names}
+    contents = self._device.ReadFiles(list(paths.values()))
+    return {name: contents[path] for name, path in paths.items()
+            if path in contents}
+
   def GetPath(self):
     return self._path
 
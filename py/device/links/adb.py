@@ -12,6 +12,7 @@ import tempfile
 import uuid
 
 from cros.factory.device import device_types
+from cros.factory.device.links import agent
 from cros.factory.utils import file_utils
 from cros.factory.utils import process_utils
 
@@ -69,14 +70,34 @@ class ADBLink(device_types.DeviceLink):
     exit_code_hack: Boolean to indicate if we should enable the hack to get
         command execution exit code. Set to True if either your ADB client or
         Android device are using a version smaller than N release.
+    use_agent: Boolean to run commands and transfer small files by a
+        long-lived agent on device (see links.agent) instead of spawning adb
+        for each call.  Falls back to adb if the agent can't be started, for
+        example, when the device doesn't have python3.  The agent needs stdin
+        of PIPE, so it is not used with exit_code_hack.
   """
 
-  def __init__(self, temp_dir='/data/local/tmp', exit_code_hack=True):
+  def __init__(self, temp_dir='/data/local/tmp', exit_code_hack=True,
+               use_agent=False):
     self._temp_dir = temp_dir
     self._exit_code_hack = exit_code_hack
+    if use_agent and exit_code_hack:
+      logging.warning('%s: agent is disabled since ADB with exit_code_hack '
+                      'does not support stdin PIPE.', type(self).__name__)
+      use_agent = False
+    self._agent = agent.LinkAgent(self) if use_agent else None
 
   def Push(self, local, remote):
     """See DeviceLink.Push"""
+    if self._agent:
+      try:
+        if self._agent.PushFile(local, remote):
+          return
+      except agent.AgentUnavailableError:
+        pass
+      except IOError as e:
+        raise subprocess.CalledProcessError(
+            1, 'Push failed: src=%s, dst=%s: %s' % (local, remote, e))
     subprocess.check_output(['adb', 'push', local, remote],
                             stderr=subprocess.STDOUT)
 
@@ -87,6 +108,14 @@ class ADBLink(device_types.DeviceLink):
   def Pull(self, remote, local=None):
     """See DeviceLink.Pull"""
     if local is None:
+      if self._agent:
+        try:
+          return self._agent.ReadFile(remote).decode('utf-8')
+        except agent.AgentUnavailableError:
+          pass
+        except IOError as e:
+          raise subprocess.CalledProcessError(
+              1, 'Pull failed: src=%s: %s' % (remote, e))
       with file_utils.UnopenedTemporaryFile() as path:
         self.Pull(remote, path)
         with open(path) as f:
@@ -99,6 +128,12 @@ class ADBLink(device_types.DeviceLink):
   def Shell(self, command, stdin=None, stdout=None, stderr=None, cwd=None,
             encoding='utf-8'):
     """See DeviceLink.Shell"""
+    if self._agent:
+      proc = self._agent.TryPopen(command, stdin=stdin, stdout=stdout,
+                                  stderr=stderr, cwd=cwd)
+      if proc:
+        return proc
+
     # ADB shell does not provide interactive shell, which means we are not
     # able to send stdin data in an interactive way (
     # https://code.google.com/p/android/issues/detail?id=74856). As described
@@ -133,8 +168,10 @@ class ADBLink(device_types.DeviceLink):
     delete_tmps = ''
     if stdin is not None:
       if stdin == subprocess.PIPE:
-        logging.warning('%s: stdin PIPE is not supported yet.',
-                        type(self).__name__)
+        # Versions of ADB which need exit_code_hack don't pass stdin through.
+        if self._exit_code_hack:
+          logging.warning('%s: stdin PIPE is not supported yet.',
+                          type(self).__name__)
       else:
         with tempfile.NamedTemporaryFile() as tmp_file:
           data = stdin.read()
@@ -173,6 +210,10 @@ class ADBLink(device_types.DeviceLink):
                                     stderr=stderr, encoding=encoding),
                    session_id)
 
+  def GetAgent(self):
+    """See DeviceLink.GetAgent"""
+    return self._agent
+
   def IsReady(self):
     """See DeviceLink.IsReady"""
     return process_utils.CheckOutput(['adb', 'get-state']).strip() == 'device'
@@ -0,0 +1,490 @@
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""A long-lived agent on the device to avoid spawning a process per call.
+
+Links like SSHLink and ADBLink spawn a local ssh or adb process for each
+command, which costs much more than the command itself for small calls like
+`test -e` or `cat`.  LinkAgent starts one Python process on the device through
+the link, and sends requests to it through its stdin and stdout.  Requests are
+JSON lines with an ID, and are handled concurrently by the agent, so many
+callers can share the channel.
+
+The agent supports running commands, and reading, writing, stat and glob of
+files, also of many files in one request.  If Python is not available on the
+device, or the agent dies, callers should fall back to the link::
+
+  proc = agent.TryPopen(command, stdout=stdout)
+  if proc is None:
+    proc = <spawn a process>
+"""
+
+import base64
+import concurrent.futures
+import itertools
+import json
+import logging
+import os
+import pipes
+import select
+import signal
+import subprocess
+import threading
+import time
+
+from cros.factory.utils import process_utils
+
+
+# The script run on the device.  It must only use the standard library.
+_AGENT_SCRIPT = r'''
+import base64, glob, json, os, stat, subprocess, sys, threading
+
+lock = threading.Lock()
+procs = {}
+
+def Reply(response):
+  line = (json.dumps(response) + '\n').encode('utf-8')
+  with lock:
+    sys.stdout.buffer.write(line)
+    sys.stdout.buffer.flush()
+
+def Exec(request):
+  data = request.get('stdin')
+  proc = subprocess.Popen(
+      request['command'], shell=True, cwd=request.get('cwd'),
+      stdin=subprocess.DEVNULL if data is None else subprocess.PIPE,
+      stdout=subprocess.PIPE,
+      stderr=(subprocess.STDOUT if request.get('merge_stderr') else
+              subprocess.PIPE),
+      start_new_session=True)
+  with lock:
+    procs[request['id']] = proc
+  try:
+    stdout, stderr = proc.communicate(
+        None if data is None else base64.b64decode(data))
+  finally:
+    with lock:
+      procs.pop(request['id'], None)
+  return {'returncode': proc.returncode,
+          'stdout': base64.b64encode(stdout).decode('ascii'),
+          'stderr': base64.b64encode(stderr or b'').decode('ascii')}
+
+def Kill(request):
+  with lock:
+    proc = procs.get(request['target'])
+  if proc:
+    os.killpg(proc.pid, request['signal'])
+
+def Read(request):
+  with open(request['path'], 'rb') as f:
+    if request.get('skip'):
+      f.seek(request['skip'])
+    data = f.read() if request.get('count') is None else f.read(
+        request['count'])
+  return base64.b64encode(data).decode('ascii')
+
+def Write(request):
+  path = request['path']
+  if os.path.isdir(path):
+    path = os.path.join(path, request['name'])
+  fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, request['mode'])
+  with os.fdopen(fd, 'wb') as f:
+    f.write(base64.b64decode(request['data']))
+
+def Stat(request):
+  path = request['path']
+  st = os.lstat(path) if request.get('lstat') else os.stat(path)
+  size = st.st_size
+  if stat.S_ISBLK(st.st_mode):
+    with open(path, 'rb') as f:
+      size = f.seek(0, os.SEEK_END)
+  return {'mode': st.st_mode, 'size': size, 'mtime': st.st_mtime}
+
+def Glob(request):
+  return sorted(glob.glob(request['pattern']))
+
+def Batch(request):
+  results = []
+  for sub_request in request['requests']:
+    try:
+      results.append({'result': HANDLERS[sub_request['op']](sub_request)})
+    except OSError as e:
+      results.append({'errno': e.errno, 'error': str(e)})
+    except Exception as e:
+      results.append({'error': '%s: %s' % (type(e).__name__, e)})
+  return results
+
+HANDLERS = {'exec': Exec, 'kill': Kill, 'read': Read, 'write': Write,
+            'stat': Stat, 'glob': Glob, 'batch': Batch}
+
+def Handle(request):
+  try:
+    Reply({'id': request['id'], 'result': HANDLERS[request['op']](request)})
+  except OSError as e:
+    Reply({'id': request['id'], 'errno': e.errno, 'error': str(e)})
+  except Exception as e:
+    Reply({'id': request['id'], 'error': '%s: %s' % (type(e).__name__, e)})
+
+Reply({'id': 0, 'result': 'hello'})
+for line in sys.stdin.buffer:
+  thread = threading.Thread(target=Handle, args=(json.loads(line),))
+  thread.daemon = True
+  thread.start()
+'''
+
+# Seconds to wait for the agent to start.
+_DEFAULT_START_TIMEOUT_SECS = 10
+# Seconds to wait for the result of a request before falling back to the link.
+_DEFAULT_CALL_TIMEOUT_SECS = 60
+# Seconds to wait before starting the agent again after a failure.
+_DEFAULT_RETRY_INTERVAL_SECS = 60
+# Files larger than this are transferred by the link instead.
+_DEFAULT_MAX_FILE_SIZE = 4 * 1024 * 1024
+# Same as ssh(1) when the connection fails.
+_RETURNCODE_CONNECTION_ERROR = 255
+
+
+class AgentUnavailableError(Exception):
+  """The agent is not running, so the request was not handled."""
+
+
+def _ToBytes(data):
+  return data.encode('utf-8') if isinstance(data, str) else data
+
+
+def _WriteToFile(target, data):
+  """Writes data like a child process writing to the file.
+
+  Args:
+    target: A file object, a file descriptor, or subprocess.DEVNULL.
+    data: Bytes to write.
+  """
+  if target == subprocess.DEVNULL or not data:
+    return
+  if isinstance(target, int):
+    fd = target
+  else:
+    target.flush()
+    fd = target.fileno()
+  while data:
+    data = data[os.write(fd, data):]
+
+
+class AgentProcess:
+  """A command run by the agent, with an interface similar to subprocess.Popen.
+
+  The output of the command is written to the files given as stdout and stderr
+  when it terminates, and PIPE is not supported.
+  """
+
+  def __init__(self, agent, request_id, future, stdout, stderr):
+    self.pid = None
+    self.stdin = None
+    self.stdout = None
+    self.stderr = None
+    self.returncode = None
+    self._agent = agent
+    self._request_id = request_id
+    self._future = future
+    self._stdout_file = stdout
+    self._stderr_file = stderr
+    self._lock = threading.Lock()
+
+  def _Finish(self):
+    with self._lock:
+      if self.returncode is not None:
+        return
+      try:
+        result = self._future.result()
+      except AgentUnavailableError:
+        logging.warning('LinkAgent: connection lost while running command')
+        self.returncode = _RETURNCODE_CONNECTION_ERROR
+        return
+      _WriteToFile(self._stdout_file, base64.b64decode(result['stdout']))
+      _WriteToFile(self._stderr_file, base64.b64decode(result['stderr']))
+      self.returncode = result['returncode']
+
+  def poll(self):
+    if self._future.done():
+      self._Finish()
+    return self.returncode
+
+  def wait(self, timeout=None):
+    done, unused_not_done = concurrent.futures.wait([self._future], timeout)
+    if not done:
+      raise subprocess.TimeoutExpired(self._request_id, timeout)
+    self._Finish()
+    return self.returncode
+
+  def communicate(self, input=None, timeout=None):
+    # pylint: disable=redefined-builtin
+    del input  # Unused; stdin is sent when the command starts.
+    self.wait(timeout)
+    return None, None
+
+  def send_signal(self, sig):
+    if not self._future.done():
+      self._agent.Notify('kill', target=self._request_id, signal=int(sig))
+
+  def terminate(self):
+    self.send_signal(signal.SIGTERM)
+
+  def kill(self):
+    self.send_signal(signal.SIGKILL)
+
+
+class LinkAgent:
+  """A channel to an agent process started on the device through a link.
+
+  The agent is started when first used, and started again if it dies.  Methods
+  raise AgentUnavailableError if the agent can't be started, for example, when
+  Python is not installed on the device, or if it doesn't respond in time.
+
+  Args:
+    link: A DeviceLink whose Shell supports stdin and stdout of PIPE.
+    python: The Python interpreter on the device.
+  """
+
+  def __init__(self, link, python='python3'):
+    self._link = link
+    self._python = python
+    self._process = None
+    self._lock = threading.Lock()
+    self._write_lock = threading.Lock()
+    self._pending = {}
+    self._ids = itertools.count(1)
+    self._next_start_time = 0
+
+  def Close(self):
+    with self._lock:
+      process, self._process = self._process, None
+    if process:
+      process.stdin.close()
+      process.wait()
+
+  def IsAvailable(self):
+    """Returns True if the agent is running or can be started."""
+    try:
+      self._GetProcess()
+      return True
+    except AgentUnavailableError:
+      return False
+
+  def _GetProcess(self):
+    with self._lock:
+      if self._process and self._process.poll() is None:
+        return self._process
+      if time.time() < self._next_start_time:
+        raise AgentUnavailableError
+      try:
+        self._process = self._Start()
+        return self._process
+      except Exception:
+        logging.warning('LinkAgent: failed to start agent on %s',
+                        type(self._link).__name__, exc_info=True)
+        self._process = None
+        self._next_start_time = time.time() + _DEFAULT_RETRY_INTERVAL_SECS
+        raise AgentUnavailableError
+
+  def _Start(self):
+    process = self._link.Shell([self._python, '-u', '-c', _AGENT_SCRIPT],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               encoding=None)
+    try:
+      readable, unused_w, unused_x = select.select(
+          [process.stdout], [], [], _DEFAULT_START_TIMEOUT_SECS)
+      hello = process.stdout.readline() if readable else b''
+      if json.loads(hello or b'{}').get('result') != 'hello':
+        raise IOError('Agent did not start: %r' % hello)
+    except Exception:
+      process.kill()
+      process.wait()
+      raise
+    process_utils.StartDaemonThread(
+        target=self._RunReader, args=(process,), name='LinkAgentReader')
+    logging.info('LinkAgent: started agent on %s', type(self._link).__name__)
+    return process
+
+  def _RunReader(self, process):
+    """Dispatches responses from the agent to the pending requests."""
+    try:
+      for line in process.stdout:
+        try:
+          response = json.loads(line)
+          future_id = response['id']
+        except (ValueError, KeyError, TypeError):
+          # For example, a terminal echoing the requests.
+          logging.warning('LinkAgent: ignored unexpected output %r',
+                          line[:200])
+          continue
+        with self._lock:
+          future = self._pending.pop(future_id, None)
+        if not future:
+          continue
+        if 'error' not in response:
+          future.set_result(response.get('result'))
+        elif response.get('errno') is not None:
+          future.set_exception(IOError(response['errno'], response['error']))
+        else:
+          future.set_exception(IOError(response['error']))
+    except Exception:
+      logging.exception('LinkAgent: failed to read from agent')
+    finally:
+      if process.poll() is None:
+        process.kill()
+      process.wait()
+      with self._lock:
+        pending, self._pending = self._pending, {}
+        if self._process is process:
+          self._process = None
+      for future in pending.values():
+        future.set_exception(AgentUnavailableError())
+
+  def _Send(self, op, **kwargs):
+    """Sends a request, and returns (request ID, future of the result)."""
+    process = self._GetProcess()
+    request_id = next(self._ids)
+    future = concurrent.futures.Future()
+    with self._lock:
+      self._pending[request_id] = future
+    request = dict(kwargs, id=request_id, op=op)
+    try:
+      with self._write_lock:
+        process.stdin.write(json.dumps(request).encode('utf-8') + b'\n')
+        process.stdin.flush()
+    except (IOError, ValueError):
+      with self._lock:
+        self._pending.pop(request_id, None)
+      raise AgentUnavailableError
+    return request_id, future
+
+  def _Call(self, op, **kwargs):
+    request_id, future = self._Send(op, **kwargs)
+    try:
+      return future.result(timeout=_DEFAULT_CALL_TIMEOUT_SECS)
+    except concurrent.futures.TimeoutError:
+      with self._lock:
+        self._pending.pop(request_id, None)
+      logging.warning('LinkAgent: %s timed out, falling back to %s', op,
+                      type(self._link).__name__)
+      raise AgentUnavailableError
+
+  def Notify(self, op, **kwargs):
+    """Sends a request without waiting for the result."""
+    try:
+      self._Send(op, **kwargs)
+    except AgentUnavailableError:
+      pass
+
+  def TryPopen(self, command, stdin=None, stdout=None, stderr=None, cwd=None):
+    """Runs a command by the agent, if possible.
+
+    Args:
+      See DeviceLink.Shell.
+
+    Returns:
+      An AgentProcess, or None if the agent is not available or the arguments
+      are not supported (PIPE for stdin, stdout or stderr).
+    """
+    if subprocess.PIPE in (stdin, stdout, stderr):
+      return None
+    for target in (stdout, stderr):
+      if (target not in (None, subprocess.DEVNULL, subprocess.STDOUT) and
+          not hasattr(target, 'fileno')):
+        return None
+    if stdout == subprocess.STDOUT:
+      return None
+
+    # Don't consume stdin if the caller will fall back.
+    if not self.IsAvailable():
+      return None
+
+    if not isinstance(command, str):
+      command = ' '.join(pipes.quote(param) for param in command)
+    kwargs = {'command': command, 'cwd': cwd,
+              'merge_stderr': stderr == subprocess.STDOUT}
+    if stdin not in (None, subprocess.DEVNULL):
+      kwargs['stdin'] = base64.b64encode(_ToBytes(stdin.read())).decode(
+          'ascii')
+    try:
+      request_id, future = self._Send('exec', **kwargs)
+    except AgentUnavailableError:
+      return None
+    # Like a child process inheriting file descriptors of this process.
+    if stdout is None:
+      stdout = 1
+    if stderr is None:
+      stderr = 2
+    elif stderr == subprocess.STDOUT:
+      stderr = subprocess.DEVNULL
+    return AgentProcess(self, request_id, future, stdout, stderr)
+
+  def ReadFile(self, path, count=None, skip=None):
+    """Returns the contents of a file on the device as bytes."""
+    return base64.b64decode(
+        self._Call('read', path=path, count=count, skip=skip))
+
+  def WriteFile(self, path, data, mode=0o644, name=None):
+    """Writes a file on the device.
+
+    Args:
+      path: Path of the file.  If it is a directory, the file is written as
+          `name` in the directory.
+      data: Contents of the file as str or bytes.
+      mode: Permission of the file if it's created.
+      name: The file name if path is a directory.
+    """
+    self._Call('write', path=path, mode=mode, name=name,
+               data=base64.b64encode(_ToBytes(data)).decode('ascii'))
+
+  def PushFile(self, local, remote):
+    """Copies a local file to the device like scp.
+
+    Returns:
+      False if the file is too large to be copied by the agent.
+    """
+    st = os.stat(local)
+    if st.st_size > _DEFAULT_MAX_FILE_SIZE:
+      return False
+    with open(local, 'rb') as f:
+      self.WriteFile(remote, f.read(), mode=st.st_mode & 0o777,
+                     name=os.path.basename(local))
+    return True
+
+  def Stat(self, path, lstat=False):
+    """Returns a dict of 'mode', 'size' and 'mtime' of a file on the device.
+
+    The size of a block device is the size of its contents.
+    """
+    return self._Call('stat', path=path, lstat=lstat)
+
+  def Glob(self, pattern):
+    """Returns the sorted list of paths matching pattern on the device."""
+    return self._Call('glob', pattern=pattern)
+
+  def _Batch(self, op, key, values):
+    """Sends requests of op for each value as one request.
+
+    Returns:
+      A dict {value: result} of the requests that succeeded.
+    """
+    values = list(values)
+    responses = self._Call(
+        'batch', requests=[{'op': op, key: value} for value in values])
+    return {value: response['result']
+            for value, response in zip(values, responses)
+            if 'error' not in response}
+
+  def ReadFiles(self, paths):
+    """Returns a dict {path: contents as bytes} of files that can be read."""
+    return {path: base64.b64decode(data)
+            for path, data in self._Batch('read', 'path', paths).items()}
+
+  def StatMany(self, paths):
+    """Returns a dict {path: result of Stat} of existing files."""
+    return self._Batch('stat', 'path', paths)
+
+  def GlobMany(self, patterns):
+    """Returns a dict {pattern: result of Glob}."""
+    return self._Batch('glob', 'pattern', patterns)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for small calls to a DUT by spawning and by LinkAgent.
+
+The local machine stands in for the DUT: LocalLink spawns `sh -c` for each
+call, which is a lower bound of the cost of spawning ssh(1) or adb, so the
+numbers of spawning on a real SSHLink or ADBLink are much lower.  Each kind of
+call is also sent to a LinkAgent started through the link, from 1 and
+--threads threads at once.
+
+Example:
+
+  agent_benchmark.py --calls 1000 --threads 4
+"""
+
+import argparse
+import subprocess
+import threading
+import time
+
+from cros.factory.device.links import agent
+from cros.factory.device.links import local
+
+
+def _Bench(func, calls, threads):
+  """Returns calls per second of func."""
+  def _Run(count):
+    for unused_i in range(count):
+      func()
+
+  workers = [threading.Thread(target=_Run, args=(calls // threads,))
+             for unused_i in range(threads)]
+  start_time = time.time()
+  for worker in workers:
+    worker.start()
+  for worker in workers:
+    worker.join()
+  return calls // threads * threads / (time.time() - start_time)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--calls', type=int, default=1000,
+                      help='Number of calls.')
+  parser.add_argument('--threads', type=int, default=4,
+                      help='Number of threads making calls concurrently.')
+  args = parser.parse_args()
+
+  link = local.LocalLink()
+  link_agent = agent.LinkAgent(link)
+  assert link_agent.IsAvailable()
+
+  def _Wait(process):
+    assert process.wait() == 0
+
+  cases = [
+      ('spawn test -e', lambda: _Wait(link.Shell(['test', '-e', '/']))),
+      ('agent test -e',
+       lambda: _Wait(link_agent.TryPopen(['test', '-e', '/']))),
+      ('agent stat', lambda: link_agent.Stat('/')),
+      ('spawn cat', lambda: _Wait(link.Shell(['cat', '/proc/uptime'],
+                                             stdout=subprocess.DEVNULL))),
+      ('agent read', lambda: link_agent.ReadFile('/proc/uptime')),
+  ]
+  try:
+    for name, func in cases:
+      for threads in sorted({1, args.threads}):
+        print('%-14s threads=%-3d %8.0f calls/s' % (
+            name, threads, _Bench(func, args.calls, threads)))
+  finally:
+    link_agent.Close()
+
+
+if __name__ == '__main__':
+  main()
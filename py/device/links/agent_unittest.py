@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import errno
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from cros.factory.device.links import agent
+from cros.factory.device.links import local
+from cros.factory.utils import file_utils
+
+
+class LinkAgentTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.agent = agent.LinkAgent(local.LocalLink())
+
+  def tearDown(self):
+    self.agent.Close()
+    shutil.rmtree(self.temp_dir)
+
+  def _Run(self, command, **kwargs):
+    with tempfile.TemporaryFile('w+') as stdout:
+      process = self.agent.TryPopen(command, stdout=stdout, **kwargs)
+      returncode = process.wait()
+      stdout.seek(0)
+      return returncode, stdout.read()
+
+  def testPopen(self):
+    self.assertEqual((0, 'a b\n'), self._Run(['echo', 'a', 'b']))
+    self.assertEqual((3, ''), self._Run('exit 3'))
+    self.assertEqual((0, self.temp_dir + '\n'),
+                     self._Run('pwd', cwd=self.temp_dir))
+    self.assertEqual((0, 'out\nerr\n'),
+                     self._Run('echo out; echo err >&2',
+                               stderr=subprocess.STDOUT))
+    with tempfile.TemporaryFile('w+') as stdin:
+      stdin.write('input')
+      stdin.seek(0)
+      self.assertEqual((0, 'input'), self._Run('cat', stdin=stdin))
+
+  def testPopenNotSupported(self):
+    self.assertIsNone(self.agent.TryPopen('true', stdout=subprocess.PIPE))
+    self.assertIsNone(self.agent.TryPopen('true', stdin=subprocess.PIPE))
+
+  def testKill(self):
+    process = self.agent.TryPopen('sleep 30', stdout=subprocess.DEVNULL)
+    self.assertIsNone(process.poll())
+    with self.assertRaises(subprocess.TimeoutExpired):
+      process.wait(0.1)
+    process.kill()
+    self.assertEqual(-9, process.wait(10))
+
+  def testFiles(self):
+    path = os.path.join(self.temp_dir, 'file')
+    self.agent.WriteFile(path, 'abc')
+    self.assertEqual(b'abc', self.agent.ReadFile(path))
+    self.assertEqual(b'b', self.agent.ReadFile(path, count=1, skip=1))
+    stat = self.agent.Stat(path)
+    self.assertEqual(3, stat['size'])
+    self.assertEqual(0o644, stat['mode'] & 0o777)
+    self.assertEqual([path], self.agent.Glob(os.path.join(self.temp_dir, 'f*')))
+
+    # Pushes into a directory.
+    local_path = os.path.join(self.temp_dir, 'local')
+    file_utils.WriteFile(local_path, 'data')
+    os.chmod(local_path, 0o600)
+    remote_dir = os.path.join(self.temp_dir, 'dir')
+    os.mkdir(remote_dir)
+    self.assertTrue(self.agent.PushFile(local_path, remote_dir))
+    remote_path = os.path.join(remote_dir, 'local')
+    self.assertEqual('data', file_utils.ReadFile(remote_path))
+    self.assertEqual(0o600, os.stat(remote_path).st_mode & 0o777)
+
+    with self.assertRaises(IOError) as context:
+      self.agent.ReadFile(os.path.join(self.temp_dir, 'non-exist'))
+    self.assertEqual(errno.ENOENT, context.exception.errno)
+
+  def testBatch(self):
+    path = os.path.join(self.temp_dir, 'file')
+    file_utils.WriteFile(path, 'abc')
+    missing_path = os.path.join(self.temp_dir, 'non-exist')
+    self.assertEqual({path: b'abc'},
+                     self.agent.ReadFiles([path, missing_path, self.temp_dir]))
+    self.assertEqual([path], list(self.agent.StatMany([path, missing_path])))
+    self.assertEqual({path: [path], missing_path: []},
+                     self.agent.GlobMany([path, missing_path]))
+
+  def testRestart(self):
+    self.assertEqual((0, ''), self._Run('true'))
+    # The agent exits when the command kills its parent.
+    self.assertEqual(255, self._Run('kill $PPID; sleep 10')[0])
+    self.assertEqual((0, 'ok\n'), self._Run('echo ok'))
+
+  def testUnexpectedOutput(self):
+    # Lines which are not responses, like a terminal echoing the requests, are
+    # ignored.
+    self.assertEqual((0, ''), self._Run(
+        'printf "garbage\\n[]\\n{}\\n123\\n" >/proc/$PPID/fd/1'))
+    self.assertEqual((0, 'ok\n'), self._Run('echo ok'))
+
+  def testCallTimeout(self):
+    fifo_path = os.path.join(self.temp_dir, 'fifo')
+    os.mkfifo(fifo_path)
+    with mock.patch.object(agent, '_DEFAULT_CALL_TIMEOUT_SECS', 0.5):
+      # Opening the FIFO blocks until it's opened for writing.
+      with self.assertRaises(agent.AgentUnavailableError):
+        self.agent.ReadFile(fifo_path)
+    with open(fifo_path, 'w'):
+      pass
+    self.assertEqual(b'', self.agent.ReadFile('/dev/null'))
+
+  def testUnavailable(self):
+    self.agent = agent.LinkAgent(local.LocalLink(), python='false')
+    self.assertFalse(self.agent.IsAvailable())
+    self.assertIsNone(self.agent.TryPopen('true'))
+    with self.assertRaises(agent.AgentUnavailableError):
+      self.agent.ReadFile('/dev/null')
+
+
+if __name__ == '__main__':
+  unittest.main()
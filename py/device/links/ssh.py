@@ -14,6 +14,7 @@ import threading
 import time
 
 from cros.factory.device import device_types
+from cros.factory.device.links import agent
 from cros.factory.test import state
 from cros.factory.test.utils import dhcp_utils
 from cros.factory.utils import file_utils
@@ -72,6 +73,10 @@ class SSHLink(device_types.DeviceLink):
     connect_timeout: An integer for ssh(1) connection timeout in seconds.
     control_persist: An integer for ssh(1) to keep master connection remain
               opened for given seconds, or None to not using master control.
+    use_agent: A bool, whether to run commands and transfer small files by a
+              long-lived agent on DUT (see links.agent) instead of spawning
+              ssh(1) for each call.  Falls back to ssh(1) if the agent can't
+              be started, for example, when DUT doesn't have python3.
 
   dut_options example:
     dut_options for fixed-IP:
@@ -103,7 +108,8 @@ class SSHLink(device_types.DeviceLink):
   """
 
   def __init__(self, host=None, user='root', port=22, identity=None,
-               use_ping=True, connect_timeout=1, control_persist=300):
+               use_ping=True, connect_timeout=1, control_persist=300,
+               use_agent=False):
     self._host = host
     self.user = user
     self.port = port
@@ -111,6 +117,7 @@ class SSHLink(device_types.DeviceLink):
     self.use_ping = use_ping
     self.connect_timeout = connect_timeout
     self.control_persist = control_persist
+    self._agent = agent.LinkAgent(self) if use_agent else None
 
     self._state = state.GetInstance()
 
@@ -213,6 +220,15 @@ class SSHLink(device_types.DeviceLink):
 
   def Push(self, local, remote):
     """See DeviceLink.Push"""
+    if self._agent:
+      try:
+        if self._agent.PushFile(local, remote):
+          return 0
+      except agent.AgentUnavailableError:
+        pass
+      except IOError as e:
+        raise subprocess.CalledProcessError(
+            1, 'Push failed: src=%s, dst=%s: %s' % (local, remote, e))
     return self._DoSCP(local, remote, is_push=True)
 
   def PushDirectory(self, local, remote):
@@ -222,6 +238,14 @@ class SSHLink(device_types.DeviceLink):
   def Pull(self, remote, local=None):
     """See DeviceLink.Pull"""
     if local is None:
+      if self._agent:
+        try:
+          return self._agent.ReadFile(remote).decode('utf-8')
+        except agent.AgentUnavailableError:
+          pass
+        except IOError as e:
+          raise subprocess.CalledProcessError(
+              1, 'Pull failed: src=%s: %s' % (remote, e))
       with file_utils.UnopenedTemporaryFile() as path:
         self.Pull(remote, path)
         with open(path) as f:
@@ -237,6 +261,12 @@ class SSHLink(device_types.DeviceLink):
   def Shell(self, command, stdin=None, stdout=None, stderr=None, cwd=None,
             encoding='utf-8'):
     """See DeviceLink.Shell"""
+    if self._agent:
+      proc = self._agent.TryPopen(command, stdin=stdin, stdout=stdout,
+                                  stderr=stderr, cwd=cwd)
+      if proc:
+        return proc
+
     remote_sig, options = self._signature(False)
 
     if not isinstance(command, str):
@@ -252,6 +282,10 @@ class SSHLink(device_types.DeviceLink):
     self._StartWatcher(proc)
     return proc
 
+  def GetAgent(self):
+    """See DeviceLink.GetAgent"""
+    return self._agent
+
   def IsReady(self):
     """See DeviceLink.IsReady"""
     try:
@@ -245,12 +245,27 @@ class SysfsPowerInfoMixin(PowerInfoMixinBase):
     Returns:
       String for the first line of file contents.
     """
+    return self._GetFirstLine(self._device.ReadSpecialFile(file_path))
+
+  @staticmethod
+  def _GetFirstLine(contents):
     # splitlines() does not work on empty string so we have to check.
-    contents = self._device.ReadSpecialFile(file_path)
     if contents:
       return contents.splitlines()[0].strip()
     return ''
 
+  def ReadLines(self, file_paths):
+    """Reads one stripped line from many files on DUT in one round trip.
+
+    Args:
+      file_paths: A list of file paths on DUT.
+
+    Returns:
+      A dict {path: first line of file contents} of files that can be read.
+    """
+    return {path: self._GetFirstLine(contents)
+            for path, contents in self._device.ReadFiles(file_paths).items()}
+
   def FindPowerPath(self, power_source):
     """Find battery path in sysfs.
 
@@ -263,14 +278,14 @@ class SysfsPowerInfoMixin(PowerInfoMixinBase):
     For devices in early stage, you probably want to extend FindPowerPath by
     reading voltage_now from all power_supply entries.
     """
-    def GetValue(path, sub_path):
-      full_path = self._device.path.join(path, sub_path)
-      if not self._device.path.exists(full_path):
-        return None
-      return self.ReadOneLine(full_path)
-
     all_power_supplies = self._device.Glob(
         self._device.path.join(self._sys, 'class/power_supply/*'))
+    values = self.ReadLines(
+        [self._device.path.join(p, sub_path) for p in all_power_supplies
+         for sub_path in ('type', 'scope', 'online')])
+
+    def GetValue(path, sub_path):
+      return values.get(self._device.path.join(path, sub_path))
 
     if power_source == self.PowerSource.BATTERY:
       # Some HID peripherals, for example Stylus, may has its own battery and
@@ -347,6 +362,20 @@ class SysfsPowerInfoMixin(PowerInfoMixinBase):
       # Battery driver is not fully initialized
       return None
 
+  def GetBatteryAttributes(self, attribute_names):
+    """Get many battery attributes in one round trip.
+
+    Args:
+      attribute_names: A list of attribute names in sysfs.
+
+    Returns:
+      A dict {name: content in str, or None if it can't be read}.
+    """
+    paths = {name: self._device.path.join(self._battery_path, name)
+             for name in attribute_names}
+    values = self.ReadLines(list(paths.values()))
+    return {name: values.get(path) for name, path in paths.items()}
+
   def GetCharge(self):
     """See PowerInfoMixinBase.GetCharge"""
     charge_now = self.GetBatteryAttribute('charge_now')
@@ -363,11 +392,13 @@ class SysfsPowerInfoMixin(PowerInfoMixinBase):
 
   def GetChargePct(self, get_float=False):
     """See PowerInfoMixinBase.GetChargePct"""
-    now = self.GetBatteryAttribute('charge_now')
-    full = self.GetBatteryAttribute('charge_full')
+    attributes = self.GetBatteryAttributes(
+        ['charge_now', 'charge_full', 'energy_now', 'energy_full'])
+    now = attributes['charge_now']
+    full = attributes['charge_full']
     if now is None or full is None:
-      now = self.GetBatteryAttribute('energy_now')
-      full = self.GetBatteryAttribute('energy_full')
+      now = attributes['energy_now']
+      full = attributes['energy_full']
       if now is None or full is None:
         return None
 
@@ -415,8 +446,9 @@ class SysfsPowerInfoMixin(PowerInfoMixinBase):
 
   def GetBatteryCurrent(self):
     """See PowerInfoMixinBase.GetBatteryCurrent"""
-    charging = (self.GetBatteryAttribute('status') == 'Charging')
-    current = self.GetBatteryAttribute('current_now')
+    attributes = self.GetBatteryAttributes(['status', 'current_now'])
+    charging = (attributes['status'] == 'Charging')
+    current = attributes['current_now']
     if current is None:
       raise self.Error('Cannot find %s/current_now' % self._battery_path)
     current_ma = abs(int(current)) // 1000
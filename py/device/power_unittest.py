@@ -97,6 +97,38 @@ class SysfsPowerInfoTest(unittest.TestCase):
     self.power.ReadOneLine = mock.MagicMock(return_value='LGC')
     self.assertEqual(self.power.GetBatteryManufacturer(), 'LGC')
 
+  def testFindPowerPath(self):
+    files = {
+        '/sys/class/power_supply/AC/type': 'Mains\n',
+        '/sys/class/power_supply/AC/online': '1\n',
+        '/sys/class/power_supply/hid-stylus/type': 'Battery\n',
+        '/sys/class/power_supply/hid-stylus/scope': 'Device\n',
+        '/sys/class/power_supply/BAT0/type': 'Battery\n'}
+    self.board.Glob = mock.MagicMock(return_value=[
+        '/sys/class/power_supply/AC', '/sys/class/power_supply/hid-stylus',
+        '/sys/class/power_supply/BAT0'])
+    self.board.ReadFiles = mock.MagicMock(side_effect=lambda paths: {
+        path: files[path] for path in paths if path in files})
+    self.assertEqual('/sys/class/power_supply/BAT0',
+                     self.power.FindPowerPath(self.power.PowerSource.BATTERY))
+    self.assertEqual('/sys/class/power_supply/AC',
+                     self.power.FindPowerPath(self.power.PowerSource.AC))
+    self.assertEqual(2, self.board.ReadFiles.call_count)
+
+  def testGetChargePctBatched(self):
+    # pylint: disable=protected-access
+    type(self.power)._battery_path = mock.PropertyMock(
+        return_value='/sys/class/power_supply/BAT0')
+    self.board.ReadFiles = mock.MagicMock(return_value={
+        '/sys/class/power_supply/BAT0/energy_now': '3000\n',
+        '/sys/class/power_supply/BAT0/energy_full': '4000\n'})
+    self.assertEqual(75, self.power.GetChargePct())
+    self.board.ReadFiles.assert_called_once_with([
+        '/sys/class/power_supply/BAT0/charge_now',
+        '/sys/class/power_supply/BAT0/charge_full',
+        '/sys/class/power_supply/BAT0/energy_now',
+        '/sys/class/power_supply/BAT0/energy_full'])
+
 
 class ECToolPowerInfoTest(unittest.TestCase):
   """Unittest for power.ECToolPowerInfoMixin."""
@@ -25,21 +25,27 @@ def FindDevice(dut, path_pattern, **attr_filter):
   Raises:
     DeviceException if not exactly one device found.
   """
+  paths = dut.Glob(path_pattern)
+  # Reads attributes of all candidates in one round trip.
+  attr_paths = [dut.path.join(path, name) for path in paths
+                for name, value in attr_filter.items() if value is not None]
+  exist_paths = [dut.path.join(path, name) for path in paths
+                 for name, value in attr_filter.items() if value is None]
+  attr_values = dut.ReadFiles(attr_paths) if attr_paths else {}
+  exist_stats = dut.StatMany(exist_paths) if exist_paths else {}
+
   devices = []
-  for path in dut.Glob(path_pattern):
+  for path in paths:
     match = True
     for name, value in attr_filter.items():
-      try:
-        attr_path = dut.path.join(path, name)
-        if value is None:
-          if not dut.path.exists(attr_path):
-            match = False
-            break
-        elif dut.ReadSpecialFile(attr_path).strip() != value:
+      attr_path = dut.path.join(path, name)
+      if value is None:
+        if attr_path not in exist_stats:
           match = False
           break
-      except Exception:
+      elif attr_values.get(attr_path, '').strip() != value:
         match = False
+        break
     if match:
       devices.append(path)
 
@@ -90,6 +96,27 @@ class BasicSensorController(device_types.DeviceComponent):
     except Exception:
       pass
 
+  def _GetSysfsValues(self, filenames, path=None):
+    """Read the content of many files in one round trip.
+
+    Args:
+      filenames: A list of names of the files to read.
+      path: Path to read the given filenames, default to the path of
+        current iio device.
+
+    Returns:
+      A dict {filename: stripped contents, or None if error}.
+    """
+    if path is None:
+      path = self._iio_path
+    paths = {filename: os.path.join(path, filename) for filename in filenames}
+    contents = self._device.ReadFiles(list(paths.values()))
+    values = dict.fromkeys(filenames)
+    for filename, file_path in paths.items():
+      if file_path in contents:
+        values[filename] = contents[file_path].strip()
+    return values
+
   def _SetSysfsValue(self, filename, value, check_call=True, path=None):
     """Assigns corresponding values to a list of sysfs.
 
@@ -120,8 +147,10 @@ class BasicSensorController(device_types.DeviceComponent):
     ret = {signal: 0 for signal in self.signal_names}
     for unused_i in range(capture_count):
       time.sleep(1.0 / sample_rate)
+      values = self._GetSysfsValues(
+          [signal_name + '_raw' for signal_name in ret])
       for signal_name in ret:
-        ret[signal_name] += float(self._GetSysfsValue(signal_name + '_raw'))
+        ret[signal_name] += float(values[signal_name + '_raw'])
     for signal_name in ret:
       ret[signal_name] *= self.scale
       ret[signal_name] /= capture_count
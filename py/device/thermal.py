@@ -100,10 +100,21 @@ class SensorSource(device_types.DeviceComponent):
   def GetAllValues(self):
     """Gets all available sensor values.
 
+    All sensor nodes are read by one `ReadFiles` call.
+
     Returns:
       A dictionary {name: value} that is the name and value from sensor.
     """
-    return {name: self.GetValue(name) for name in self.GetSensors()}
+    sensors = self.GetSensors()
+    contents = self._device.ReadFiles(list(sensors.values()))
+    values = {}
+    for name, sensor_path in sensors.items():
+      if sensor_path in contents:
+        values[name] = self._ConvertRawValue(contents[sensor_path])
+      else:
+        logging.warning("Failed to get temperature from %s", sensor_path)
+        values[name] = -1
+    return values
 
 
 class ThermalSensorSource(SensorSource):
@@ -135,22 +146,35 @@ class CoreTempSensors(ThermalSensorSource):
 
   def _Probe(self):
     """Probes coretemp sensors."""
-    def _GetSensorName(coretemp_path, input_path):
-      label_path = input_path.rpartition('_')[0] + '_label'
-      return (self._device.path.basename(coretemp_path) + ' ' +
-              self._device.ReadFile(label_path).strip())
+    def _GetLabelPath(input_path):
+      return input_path.rpartition('_')[0] + '_label'
+
+    coretemp_bases = self._device.Glob('/sys/devices/platform/coretemp.*')
+    # For newer version of linux kernel, CoreTemp is integrated with hwmon.
+    patterns = {
+        coretemp_base: [
+            self._device.path.join(coretemp_base, median_dirs, 'temp*_input')
+            for median_dirs in ['', 'hwmon/hwmon*']]
+        for coretemp_base in coretemp_bases}
+    matches = self._device.GlobMany(
+        [pattern for base in coretemp_bases for pattern in patterns[base]])
+
+    input_paths = {}
+    for coretemp_base in coretemp_bases:
+      for pattern in patterns[coretemp_base]:
+        if matches[pattern]:
+          input_paths[coretemp_base] = matches[pattern]
+          break
+    labels = self._device.ReadFiles(
+        [_GetLabelPath(input_path)
+         for paths in input_paths.values() for input_path in paths])
 
     result = {}
-    for coretemp_base in self._device.Glob('/sys/devices/platform/coretemp.*'):
-      # For newer version of linux kernel, CoreTemp is integrated with hwmon.
-      for median_dirs in ['', 'hwmon/hwmon*']:
-        curr_result = dict(
-            (_GetSensorName(coretemp_base, input_path), input_path)
-            for input_path in self._device.Glob(self._device.path.join(
-                coretemp_base, median_dirs, 'temp*_input')))
-        if curr_result:
-          result.update(curr_result)
-          break
+    for coretemp_base, paths in input_paths.items():
+      for input_path in paths:
+        name = (self._device.path.basename(coretemp_base) + ' ' +
+                labels[_GetLabelPath(input_path)].strip())
+        result[name] = input_path
     return result
 
   def _ConvertRawValue(self, value):
@@ -181,11 +205,14 @@ class ThermalZoneSensors(ThermalSensorSource):
     # TODO(hungte) Some systems may have sensors disabled (mode='disabled') and
     # reading 'value' form them will fail. We may need to support that in future
     # if needed.
+    nodes = self._device.Glob('/sys/class/thermal/thermal_zone*')
+    types = self._device.ReadFiles(
+        [self._device.path.join(node, 'type') for node in nodes])
     return dict(
         (self._device.path.basename(node) + ' ' +
-         self._device.ReadFile(self._device.path.join(node, 'type')).strip(),
+         types[self._device.path.join(node, 'type')].strip(),
          self._device.path.join(node, 'temp'))
-        for node in self._device.Glob('/sys/class/thermal/thermal_zone*'))
+        for node in nodes)
 
   def _ConvertRawValue(self, value):
     """Converts thermal zone raw values (milli-Celsius) to Celsius."""
@@ -38,6 +38,9 @@ class _FakeGlob:
     return [path for path in self._paths
             if self._Match(path.split('/'), pattern_parts)]
 
+  def GlobMany(self, patterns):
+    return {pattern: self.Glob(pattern) for pattern in patterns}
+
   def _Match(self, fnames, patterns):
     if (len(fnames) != len(patterns) or
         not all(fnmatch.fnmatch(fname, pattern)
@@ -68,12 +71,18 @@ class CoreTempSensorTest(unittest.TestCase):
         _CORETEMP_PREFIX + '0/temp2_label': 'Core 0',
         _CORETEMP_PREFIX + '1/hwmon/hwmon0/temp1_label': 'Core X'}
     self.board.Glob = self._glob.Glob
+    self.board.GlobMany = self._glob.GlobMany
 
   def mockProbe(self):
     def ReadFileSideEffect(*args, **unused_kwargs):
       return self.mock_files[args[0]]
 
+    def ReadFilesSideEffect(paths):
+      return {path: self.mock_files[path] for path in paths
+              if path in self.mock_files}
+
     self.board.ReadFile.side_effect = ReadFileSideEffect
+    self.board.ReadFiles.side_effect = ReadFilesSideEffect
 
   def testGetSensors(self):
     self.mockProbe()
@@ -103,6 +112,16 @@ class CoreTempSensorTest(unittest.TestCase):
     self.assertEqual(self.sensor.GetAllValues(), {'coretemp.0 Package 0': 52,
                                                   'coretemp.0 Core 0': 37,
                                                   'coretemp.1 Core X': 47})
+    self.board.ReadFile.assert_not_called()
+    # One call to probe labels, and one call to read values.
+    self.assertEqual(2, self.board.ReadFiles.call_count)
+
+  def testGetAllValuesFailed(self):
+    self.mock_files[_CORETEMP_PREFIX + '0/temp1_input'] = '52000'
+    self.mockProbe()
+    self.assertEqual(self.sensor.GetAllValues(), {'coretemp.0 Package 0': 52,
+                                                  'coretemp.0 Core 0': -1,
+                                                  'coretemp.1 Core X': -1})
 
   def testGetCriticalValue(self):
     self.mock_files[_CORETEMP_PREFIX + '0/temp2_crit'] = '97000'
@@ -121,21 +140,23 @@ class ThermalZoneSensors(unittest.TestCase):
     self.mock_glob = ['/sys/class/thermal/thermal_zone0']
 
   def testAll(self):
-    self.board.ReadFile.side_effect = ['CPU', '37000', '38000']
+    self.board.ReadFiles.side_effect = [
+        {'/sys/class/thermal/thermal_zone0/type': 'CPU'},
+        {'/sys/class/thermal/thermal_zone0/temp': '38000'}]
+    self.board.ReadFile.side_effect = ['37000']
     self.board.Glob.return_value = self.mock_glob
 
     self.assertEqual(self.sensor.GetMainSensorName(), 'thermal_zone0 CPU')
-    self.board.ReadFile.assert_called_with(
-        '/sys/class/thermal/thermal_zone0/type')
+    self.board.ReadFiles.assert_called_with(
+        ['/sys/class/thermal/thermal_zone0/type'])
 
     self.assertEqual(self.sensor.GetValue('thermal_zone0 CPU'), 37)
     self.board.ReadFile.assert_called_with(
         '/sys/class/thermal/thermal_zone0/temp')
-    self.board.ReadFile.reset_mock()
 
     self.assertEqual(self.sensor.GetAllValues(), {'thermal_zone0 CPU': 38})
-    self.board.ReadFile.assert_called_with(
-        '/sys/class/thermal/thermal_zone0/temp')
+    self.board.ReadFiles.assert_called_with(
+        ['/sys/class/thermal/thermal_zone0/temp'])
 
     self.board.Glob.assert_called_once_with(self.glob_input)
 
@@ -214,6 +235,7 @@ class ThermalTest(unittest.TestCase):
 
   def mockSetup(self):
     self.board.Glob = self.glob.Glob
+    self.board.GlobMany = self.glob.GlobMany
 
   def testNewDictAPIs(self):
     self.mockSetup()
@@ -227,16 +249,18 @@ class ThermalTest(unittest.TestCase):
       return call_output_mapping[args[0]]
 
     self.board.CallOutput.side_effect = CallOutputSideEffect
-    self.board.ReadFile.side_effect = [
-        'Package 0', '37000', '38000', '34000', '104000']
+    self.board.ReadFiles.side_effect = [
+        {_CORETEMP_PREFIX + '0/temp1_label': 'Package 0'},
+        {self.coretemp1_path: '34000'}]
+    self.board.ReadFile.side_effect = ['37000', '38000', '104000']
 
     self.assertEqual(self.thermal.GetMainSensorName(), 'coretemp.0 Package 0')
     self.assertCountEqual(
         self.thermal.GetAllSensorNames(),
         ['coretemp.0 Package 0', 'ectool ECInternal'])
-    self.board.ReadFile.assert_called_once_with(
-        _CORETEMP_PREFIX + '0/temp1_label')
-    self.board.ReadFile.reset_mock()
+    self.board.ReadFiles.assert_called_once_with(
+        [_CORETEMP_PREFIX + '0/temp1_label'])
+    self.board.ReadFiles.reset_mock()
 
     self.assertEqual(self.thermal.GetTemperature(), 37)
     self.board.ReadFile.assert_called_once_with(self.coretemp1_path)
@@ -253,7 +277,7 @@ class ThermalTest(unittest.TestCase):
         self.thermal.GetAllTemperatures(),
         {'coretemp.0 Package 0': 34,
          'ectool ECInternal': 58})
-    self.board.ReadFile.assert_called_once_with(self.coretemp1_path)
+    self.board.ReadFiles.assert_called_once_with([self.coretemp1_path])
     self.board.ReadFile.reset_mock()
 
     self.assertEqual(
@@ -73,7 +73,8 @@ class Gooftool:
       self._project = project or hwid_utils.ProbeProject()
       self._hwdb_path = hwdb_path or hwid_utils.GetDefaultDataPath()
       self._db_creator = lambda: Database.LoadFile(
-          os.path.join(self._hwdb_path, self._project.upper()))
+          os.path.join(self._hwdb_path, self._project.upper()),
+          cache_dir=Database.GetDefaultCacheDir())
     else:
       raise ValueError('Invalid HWID version: %r' % hwid_version)
 
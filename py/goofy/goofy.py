@@ -608,8 +608,17 @@ class Goofy:
       else:
         # Starts a new test run; reset iterations and retries.
         self._RunTest(test, test.iterations, test.retries)
+      self._PrespawnUpcomingTests()
       return  # to leave while
 
+  def _PrespawnUpcomingTests(self):
+    """Lets the pytest prespawner preload the pytests expected to run next."""
+    upcoming_paths = self.test_list_iterator.GetUpcomingTests(
+        self.test_list.options.max_prespawned_pytests)
+    tests = [self.test_list.LookupPath(path) for path in upcoming_paths]
+    self.pytest_prespawner.SetUpcoming(
+        [test.pytest_name for test in tests if test and test.pytest_name])
+
   def _RunTest(self, test, iterations_left=None, retries_left=None,
                set_layout=True):
     """Invokes the test.
@@ -1354,7 +1363,8 @@ class Goofy:
               state=test_state.ToStruct()))
     self.test_list.state_change_callback = state_change_callback
 
-    self.pytest_prespawner = prespawner.PytestPrespawner()
+    self.pytest_prespawner = prespawner.PytestPrespawner(
+        max_processes=self.test_list.options.max_prespawned_pytests)
     self.pytest_prespawner.start()
 
     tests_after_shutdown = self.state_instance.DataShelfGetValue(
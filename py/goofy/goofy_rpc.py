@@ -436,6 +436,23 @@ class GoofyRPC:
             'run_id': self.goofy.run_id,
             'status': self.goofy.status}
 
+  def GetPytestStartupMetrics(self):
+    """Returns the metrics of the pytest prespawner.
+
+    Returns:
+      A dict with the size of the pool of prespawned processes, the numbers of
+      tests started in processes that did or did not preload their pytest,
+      the predicted upcoming pytests, and the startup latency of recent tests.
+      Each item of 'startups' contains the test path ('name'), seconds waiting
+      for a prespawned process ('wait_secs'), seconds the process had been
+      idle ('idle_secs'), whether the pytest was preloaded ('preloaded'),
+      and the seconds from starting the test to running the test case
+      ('startup_secs').
+    """
+    if not self.goofy.pytest_prespawner:
+      return None
+    return self.goofy.pytest_prespawner.GetMetrics()
+
   def GetActiveRunID(self):
     """Gets the id of the current active test run."""
     return self.goofy.run_id
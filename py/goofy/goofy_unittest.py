@@ -50,7 +50,8 @@ def MockPytest(pytest_info_mapping, spawn_mock):
         sequentially by each call.
     spawn_mock: Mock object for `cros.factory.goofy.prespawner.Prespawner.spawn`
   """
-  def SideEffect(info, unused_env):
+  def SideEffect(info, unused_env, preload=None):
+    del preload  # Unused.
     assert info.pytest_name in pytest_info_mapping
 
     pytest_info = pytest_info_mapping[info.pytest_name].pop(0)
@@ -274,7 +274,7 @@ class TestInvocation:
                          args=self.resolved_dargs,
                          results_path=results_path,
                          dut_options=self._dut_options),
-              self._env_additions)
+              self._env_additions, preload=pytest_name)
 
         def _LineCallback(line):
           log.write(line.encode('utf-8') + b'\n')
@@ -301,6 +301,8 @@ class TestInvocation:
       with open(results_path, 'rb') as f:
         result = pickle.load(f)
         assert isinstance(result, pytest_utils.PytestExecutionResult)
+        self.goofy.pytest_prespawner.RecordStartup(
+            self.test.path, self._process, getattr(result, 'start_time', None))
         # TODO(yhong): Record the the detail failure reason for advanced
         #     analysis.
         return result.status, '; '.join(f.exc_repr for f in result.failures)
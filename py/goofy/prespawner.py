@@ -30,73 +30,263 @@ There are several possible ways to run pytest in a clean environment:
 
 See https://crbug.com/733545, https://chromium-review.googlesource.com/c/603507
 for discussions.
+
+The prespawned processes are kept in a pool.  The size of the pool follows the
+recent rate of starting tests: it is the most tests started within
+_DEFAULT_WARMUP_SECS (about the time a process takes to be ready) in the last
+_DEFAULT_RATE_WINDOW_SECS, bounded by the minimum and maximum number of
+processes.  Each new process may also preload the module of an upcoming test
+(see SetUpcoming), which spawn() prefers when starting that test.
 """
 
+import collections
 import logging
 import os
 import pickle
-import queue
 import subprocess
+import threading
+import time
 
 from cros.factory.test.env import paths
 from cros.factory.utils import process_utils
 
 
 NUM_PRESPAWNED_PROCESSES = 1
+MAX_PRESPAWNED_PROCESSES = 4
 PYTEST_PRESPAWNER_PATH = os.path.join(paths.FACTORY_DIR,
                                       'py/test/pytest_runner.py')
 
+# Seconds of recent spawn() calls considered to size the pool.
+_DEFAULT_RATE_WINDOW_SECS = 60
+# Estimated seconds for a prespawned process to finish its imports.
+_DEFAULT_WARMUP_SECS = 2
+# Number of startup records kept for the metrics.
+_DEFAULT_MAX_STARTUP_RECORDS = 100
+
+
+class _PrespawnedProcess:
+
+  def __init__(self, process, preload, spawn_time):
+    self.process = process
+    self.preload = preload
+    self.spawn_time = spawn_time
+
 
 class Prespawner:
+  """Keeps a pool of prespawned processes.
+
+  Args:
+    prespawner_path: Path of the program to prespawn.
+    prespawner_args: A list of arguments to the program.  The module to
+        preload, if any, is appended.
+    pipe_stdout: Whether to pipe stdout and stderr of the processes.
+    min_processes: Minimum number of processes in the pool.
+    max_processes: Maximum number of processes in the pool.
+    time_func: Function returning the current time, for testing.
+  """
 
-  def __init__(self, prespawner_path, prespawner_args, pipe_stdout=False):
-    self.prespawned = queue.Queue(NUM_PRESPAWNED_PROCESSES)
+  def __init__(self, prespawner_path, prespawner_args, pipe_stdout=False,
+               min_processes=NUM_PRESPAWNED_PROCESSES,
+               max_processes=MAX_PRESPAWNED_PROCESSES, time_func=time.time):
+    assert 1 <= min_processes <= max_processes
     self.thread = None
     self.terminated = False
     self.prespawner_path = prespawner_path
     assert isinstance(prespawner_args, list)
     self.prespawner_args = prespawner_args
     self.pipe_stdout = pipe_stdout
+    self.min_processes = min_processes
+    self.max_processes = max_processes
+    self._time_func = time_func
+    # Protects all fields below, and notifies the prespawn thread when the pool
+    # needs to change, or spawn() when a process is added.
+    self._condition = threading.Condition()
+    self._pool = []
+    self._upcoming = []
+    self._spawn_times = collections.deque()
+    self._spawned = {}
+    self._startups = collections.deque(maxlen=_DEFAULT_MAX_STARTUP_RECORDS)
+    self._counts = collections.Counter()
 
-  def spawn(self, args, env_additions=None):
+  def _GetTargetSize(self):
+    """Returns the number of processes the pool should have."""
+    now = self._time_func()
+    while (self._spawn_times and
+           self._spawn_times[0] < now - _DEFAULT_RATE_WINDOW_SECS):
+      self._spawn_times.popleft()
+    # The most spawns within any _DEFAULT_WARMUP_SECS.
+    peak = 0
+    times = list(self._spawn_times)
+    begin = 0
+    for end, end_time in enumerate(times):
+      while times[begin] <= end_time - _DEFAULT_WARMUP_SECS:
+        begin += 1
+      peak = max(peak, end - begin + 1)
+    return min(self.max_processes, max(self.min_processes, peak))
+
+  def _GetNextPreload(self):
+    """Returns the upcoming module that no process in the pool preloads."""
+    preloaded = collections.Counter(item.preload for item in self._pool)
+    for preload in self._upcoming:
+      if preloaded[preload]:
+        preloaded[preload] -= 1
+      else:
+        return preload
+    return None
+
+  def _RemoveExited(self):
+    self._pool = [item for item in self._pool if item.process.poll() is None]
+
+  def _TakeProcess(self, preload):
+    """Takes the best process to run `preload` from the pool, or None."""
+    self._RemoveExited()
+    if not self._pool:
+      return None
+    for item in self._pool:
+      if preload is not None and item.preload == preload:
+        break
+    else:
+      # Take a process whose preloaded module is not needed soon.
+      upcoming = set(self._upcoming)
+      item = next((item for item in self._pool
+                   if item.preload not in upcoming), self._pool[0])
+    self._pool.remove(item)
+    return item
+
+  def spawn(self, args, env_additions=None, preload=None):
     """Spawns a new process (reusing an prespawned process if available).
 
     @param args: A list of arguments (sys.argv)
     @param env_additions: Items to add to the current environment
+    @param preload: The module the process will need, to choose a process that
+        preloaded it.
     """
     new_env = dict(os.environ)
     if env_additions:
       new_env.update(env_additions)
 
-    process = self.prespawned.get()
+    with self._condition:
+      start_time = self._time_func()
+      self._spawn_times.append(start_time)
+      self._condition.notify_all()
+      item = self._TakeProcess(preload)
+      while item is None:
+        self._condition.wait()
+        item = self._TakeProcess(preload)
+      if preload in self._upcoming:
+        self._upcoming.remove(preload)
+      self._condition.notify_all()
+      preloaded = preload is not None and item.preload == preload
+      self._counts['preloaded' if preloaded else 'not_preloaded'] += 1
+      self._spawned[item.process.pid] = {
+          'spawn_time': start_time,
+          'wait_secs': self._time_func() - start_time,
+          'idle_secs': start_time - item.spawn_time,
+          'preloaded': preloaded}
+      if len(self._spawned) > _DEFAULT_MAX_STARTUP_RECORDS:
+        # Drop the oldest record never passed to RecordStartup.
+        self._spawned.pop(next(iter(self._spawned)))
+
     # Write the environment and argv to the process's stdin; it will launch
     # test once these are received.
-    pickle.dump((new_env, args), process.stdin)
-    process.stdin.close()
-    return process
+    pickle.dump((new_env, args), item.process.stdin)
+    item.process.stdin.close()
+    return item.process
+
+  def SetUpcoming(self, preloads):
+    """Sets the modules of the upcoming spawn() calls, in order.
+
+    New prespawned processes preload these modules.
+    """
+    with self._condition:
+      self._upcoming = list(preloads)
+      self._condition.notify_all()
+
+  def RecordStartup(self, name, process, start_time):
+    """Records the startup latency of a process returned by spawn().
+
+    Args:
+      name: The name of what the process runs, e.g. the test path.
+      process: The process returned by spawn().
+      start_time: The time when the process started to run, or None if
+          unknown.
+    """
+    with self._condition:
+      record = self._spawned.pop(process.pid, None)
+      if record is None:
+        return
+      record['name'] = name
+      record['startup_secs'] = (
+          None if start_time is None else start_time - record['spawn_time'])
+      self._startups.append(record)
+
+  def GetMetrics(self):
+    """Returns a dict of the pool and recent startup latencies."""
+    with self._condition:
+      startups = [dict(record) for record in self._startups]
+      return {
+          'pool_size': len(self._pool),
+          'target_size': self._GetTargetSize(),
+          'preloaded': self._counts['preloaded'],
+          'not_preloaded': self._counts['not_preloaded'],
+          'upcoming': list(self._upcoming),
+          'startups': startups}
+
+  def _Spawn(self, preload):
+    if self.pipe_stdout:
+      pipe_stdout_args = {'stdout': subprocess.PIPE,
+                          'stderr': subprocess.STDOUT}
+    else:
+      pipe_stdout_args = {}
+
+    process = process_utils.Spawn(
+        ['python3', '-u', self.prespawner_path] + self.prespawner_args +
+        ([preload] if preload else []),
+        cwd=os.path.dirname(self.prespawner_path),
+        stdin=subprocess.PIPE,
+        encoding=None,
+        **pipe_stdout_args)
+    logging.debug('Pre-spawned a test process %d preloading %r', process.pid,
+                  preload)
+    return _PrespawnedProcess(process, preload, self._time_func())
+
+  @staticmethod
+  def _Exit(item):
+    if item.process.poll() is None:
+      # Send a 'None' environment and arg list to tell the prespawner
+      # processes to exit.
+      pickle.dump((None, None), item.process.stdin)
+      item.process.stdin.close()
+      item.process.wait()
 
   def start(self):
     """Starts a thread to pre-spawn pytests.
     """
     def run():
-      while not self.terminated:
-        if self.pipe_stdout:
-          pipe_stdout_args = {'stdout': subprocess.PIPE,
-                              'stderr': subprocess.STDOUT}
-        else:
-          pipe_stdout_args = {}
-
-        process = process_utils.Spawn(
-            ['python3', '-u', self.prespawner_path] + self.prespawner_args,
-            cwd=os.path.dirname(self.prespawner_path),
-            stdin=subprocess.PIPE,
-            encoding=None,
-            **pipe_stdout_args)
-        logging.debug('Pre-spawned a test process %d', process.pid)
-        self.prespawned.put(process)
-
-      # Let stop() know that we are done
-      self.prespawned.put(None)
+      while True:
+        with self._condition:
+          while not self.terminated:
+            self._RemoveExited()
+            target_size = self._GetTargetSize()
+            if len(self._pool) != target_size:
+              break
+            # Wake up to shrink the pool when spawn times leave the window.
+            self._condition.wait(_DEFAULT_RATE_WINDOW_SECS)
+          if self.terminated:
+            return
+          excess = None
+          preload = None
+          if len(self._pool) > target_size:
+            excess = self._TakeProcess(None)
+          else:
+            preload = self._GetNextPreload()
+        if excess:
+          self._Exit(excess)
+          continue
+        item = self._Spawn(preload)
+        with self._condition:
+          self._pool.append(item)
+          self._condition.notify_all()
 
     if not self.thread and os.path.exists(self.prespawner_path):
       self.thread = process_utils.StartDaemonThread(
@@ -105,25 +295,22 @@ class Prespawner:
   def stop(self):
     """Stops the pre-spawn thread gracefully.
     """
-    self.terminated = True
+    with self._condition:
+      self.terminated = True
+      self._condition.notify_all()
     if self.thread:
-      # Wait for any existing prespawned processes.
-      while True:
-        process = self.prespawned.get()
-        if not process:
-          break
-        if process.poll() is None:
-          # Send a 'None' environment and arg list to tell the prespawner
-          # processes to exit.
-          pickle.dump((None, None), process.stdin)
-          process.stdin.close()
-          process.wait()
       self.thread.join()
       self.thread = None
+    with self._condition:
+      pool, self._pool = self._pool, []
+    # Wait for any existing prespawned processes.
+    for item in pool:
+      self._Exit(item)
 
 
 class PytestPrespawner(Prespawner):
 
-  def __init__(self):
+  def __init__(self, max_processes=MAX_PRESPAWNED_PROCESSES):
     super(PytestPrespawner, self).__init__(
-        PYTEST_PRESPAWNER_PATH, [], pipe_stdout=True)
+        PYTEST_PRESPAWNER_PATH, [], pipe_stdout=True,
+        max_processes=max_processes)
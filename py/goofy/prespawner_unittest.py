@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from cros.factory.goofy import prespawner
+from cros.factory.utils import file_utils
+from cros.factory.utils import sync_utils
+
+
+# Prints the preloaded modules and the arguments it receives.
+_FAKE_RUNNER = """
+import json
+import pickle
+import sys
+
+env, args = pickle.load(sys.stdin.buffer)
+if env:
+  print(json.dumps([sys.argv[1:], args]))
+"""
+
+
+class FakeTime:
+
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+
+class PrespawnerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    runner_path = os.path.join(self.temp_dir, 'runner.py')
+    file_utils.WriteFile(runner_path, _FAKE_RUNNER)
+    self.time = FakeTime()
+    self.prespawner = prespawner.Prespawner(
+        runner_path, [], pipe_stdout=True, max_processes=3,
+        time_func=self.time)
+
+  def tearDown(self):
+    self.prespawner.stop()
+    shutil.rmtree(self.temp_dir)
+
+  def _WaitForPool(self, size):
+    sync_utils.WaitFor(
+        lambda: self.prespawner.GetMetrics()['pool_size'] == size, 10)
+
+  def _Spawn(self, args, preload=None):
+    process = self.prespawner.spawn(args, preload=preload)
+    stdout = process.stdout.read()
+    process.wait()
+    self.prespawner.RecordStartup(args, process, None)
+    return json.loads(stdout.decode('utf-8'))
+
+  def testPreload(self):
+    self.prespawner.SetUpcoming(['a', 'b'])
+    self.prespawner.start()
+    self._WaitForPool(1)
+    self.assertEqual([['a'], 'test_a'], self._Spawn('test_a', 'a'))
+    self._WaitForPool(1)
+    self.assertEqual(['b'], self.prespawner.GetMetrics()['upcoming'])
+    # Not preloaded by the process in the pool.
+    self.assertEqual([['b'], 'test_c'], self._Spawn('test_c', 'c'))
+
+    metrics = self.prespawner.GetMetrics()
+    self.assertEqual(1, metrics['preloaded'])
+    self.assertEqual(1, metrics['not_preloaded'])
+    self.assertEqual(['test_a', 'test_c'],
+                     [record['name'] for record in metrics['startups']])
+    self.assertEqual([True, False],
+                     [record['preloaded'] for record in metrics['startups']])
+
+  def testPoolSizeFollowsStartRate(self):
+    # pylint: disable=protected-access
+    self.prespawner.start()
+    self._WaitForPool(1)
+    for unused_i in range(4):
+      self._Spawn('test')
+    # At most max_processes.
+    self.assertEqual(3, self.prespawner.GetMetrics()['target_size'])
+    self._WaitForPool(3)
+
+    self.time.now += prespawner._DEFAULT_WARMUP_SECS
+    self._Spawn('test')
+    self.assertEqual(3, self.prespawner.GetMetrics()['target_size'])
+    # Spawns leave the window.
+    self.time.now += prespawner._DEFAULT_RATE_WINDOW_SECS
+    self.assertEqual(1, self.prespawner.GetMetrics()['target_size'])
+    self.prespawner.SetUpcoming([])  # Wakes up the thread.
+    self._WaitForPool(1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -261,6 +261,26 @@ class TestListIterator:
     root = self._GetTestFromFrame(self.stack[0])
     return [test.path for test in root.Walk() if test.IsLeaf()]
 
+  def GetUpcomingTests(self, max_count):
+    """Predicts the leaf tests to run after the current test.
+
+    The prediction ignores run_if, iterations, retries, and the status filter.
+
+    Returns:
+      A list of at most `max_count` paths of leaf tests.
+    """
+    if not self.stack:
+      return []
+    root = self._GetTestFromFrame(self.stack[0])
+    current = self._GetTestFromFrame(self.Top())
+    leaves = [test for test in root.Walk() if test.IsLeaf()]
+    # Skip the current test, or all subtests of the current parallel test.
+    start = 0
+    for index, test in enumerate(leaves):
+      if test.HasAncestor(current):
+        start = index + 1
+    return [test.path for test in leaves[start:start + max_count]]
+
   def RestartLastTest(self):
     # if next step is not CheckContinue, then there are something wrong during
     # the shutdown / reboot process.  For example, the iterator state is not
@@ -306,6 +306,18 @@ class TestListIteratorBaseTest(TestListIteratorTest):
     # Get() shall return None when we reach the end (StopIteration).
     self.assertIsNone(iterator.Get())
 
+  def testGetUpcomingTests(self):
+    self._SetStubStateInstance(self.test_list)
+    iterator = test_list_iterator.TestListIterator(
+        self.test_list, test_list=self.test_list)
+    self.assertEqual('test:a', next(iterator))
+    self.assertListEqual(['test:b', 'test:G.a', 'test:G.b'],
+                         iterator.GetUpcomingTests(3))
+    for unused_i in range(5):
+      next(iterator)
+    self.assertEqual('test:G.G.b', iterator.Get())
+    self.assertListEqual(['test:c'], iterator.GetUpcomingTests(3))
+
   def testRunIf(self):
     test_list = self._BuildTestList(
         {
@@ -39,17 +39,27 @@ import collections
 import copy
 import hashlib
 import logging
+import os
+import pickle
 import re
+import stat
+import tempfile
 
 from cros.factory.hwid.v3 import common
 from cros.factory.hwid.v3.rule import Rule
 from cros.factory.hwid.v3.rule import Value
 from cros.factory.hwid.v3 import yaml_wrapper as yaml
+from cros.factory.test.l10n import regions
 from cros.factory.utils import file_utils
 from cros.factory.utils import schema
 from cros.factory.utils import type_utils
 
 
+# Version of the compiled databases in the cache.  Increase it when the classes
+# in this module are changed so the pickled objects can't be loaded correctly.
+_COMPILED_DATABASE_VERSION = 2
+
+
 class Database:
   """A class for reading in, parsing, and obtaining information of the given
   device-specific component database.
@@ -96,13 +106,20 @@ class Database:
     return not self == rhs
 
   @staticmethod
-  def LoadFile(file_name, verify_checksum=True):
+  def GetDefaultCacheDir():
+    """Returns the default directory to cache compiled databases of the user."""
+    return os.path.join(tempfile.gettempdir(),
+                        'hwid_db_cache.%d' % os.geteuid())
+
+  @staticmethod
+  def LoadFile(file_name, verify_checksum=True, cache_dir=None):
     """Loads a device-specific component database from the given file and
     parses it to a Database object.
 
     Args:
       file_name: A path to a device-specific component database.
       verify_checksum: Whether to verify the checksum of the database.
+      cache_dir: A directory to cache the compiled database, see LoadData.
 
     Returns:
       A Database object containing all the settings in the database file.
@@ -110,9 +127,12 @@ class Database:
     Raises:
       HWIDException if there is missing field in the database.
     """
-    return Database.LoadData(file_utils.ReadFile(file_name),
-                             expected_checksum=(Database.Checksum(file_name)
-                                                if verify_checksum else None))
+    raw_data = file_utils.ReadFile(file_name)
+    return Database.LoadData(
+        raw_data,
+        expected_checksum=(Database.ChecksumForText(raw_data)
+                           if verify_checksum else None),
+        cache_dir=cache_dir)
 
   @staticmethod
   def Checksum(file_name):
@@ -141,13 +161,20 @@ class Database:
     return hashlib.sha1(db_text.encode('utf-8')).hexdigest()
 
   @staticmethod
-  def LoadData(raw_data, expected_checksum=None):
+  def LoadData(raw_data, expected_checksum=None, cache_dir=None):
     """Loads a device-specific component database from the given database data.
 
+    Parsing a large database takes seconds, so the parsed Database object can
+    be cached in cache_dir, named by the checksum of the database.  The cached
+    object is used only if it was compiled from exactly the same data, with
+    the same regions.
+
     Args:
       raw_data: The database in string.
       expected_checksum: The checksum value to verify the loaded data with.
           A value of None disables checksum verification.
+      cache_dir: A directory to cache the compiled database, or None to always
+          parse raw_data.
 
     Returns:
       A Database object containing all the settings in the database file.
@@ -156,6 +183,15 @@ class Database:
       HWIDException if there is missing field in the database, or database
       integrity verification fails.
     """
+    compiled_key = None
+    if cache_dir:
+      compiled_key = Database._GetCompiledKey(raw_data)
+      database = Database._LoadCompiled(cache_dir, compiled_key)
+      if database is not None:
+        Database._VerifyChecksum(
+            database.project, database.checksum, expected_checksum)
+        return database
+
     yaml_obj = yaml.load(raw_data)
 
     if not isinstance(yaml_obj, dict):
@@ -175,20 +211,95 @@ class Database:
       logging.warning('The project name should be in upper cases, but got %r.',
                       yaml_obj['project'])
 
-    # Verify database integrity.
-    if (expected_checksum is not None and
-        yaml_obj['checksum'] != expected_checksum):
+    Database._VerifyChecksum(project, yaml_obj['checksum'], expected_checksum)
+
+    database = Database(project,
+                        EncodingPatterns(yaml_obj['encoding_patterns']),
+                        ImageId(yaml_obj['image_id']),
+                        Pattern(yaml_obj['pattern']),
+                        EncodedFields(yaml_obj['encoded_fields']),
+                        Components(yaml_obj['components']),
+                        Rules(yaml_obj['rules']),
+                        yaml_obj.get('checksum'))
+    if compiled_key:
+      Database._SaveCompiled(cache_dir, compiled_key, database)
+    return database
+
+  @staticmethod
+  def _VerifyChecksum(project, checksum, expected_checksum):
+    """Verifies database integrity."""
+    if expected_checksum is not None and checksum != expected_checksum:
       raise common.HWIDException(
           'HWID database %r checksum verification failed' % project)
 
-    return Database(project,
-                    EncodingPatterns(yaml_obj['encoding_patterns']),
-                    ImageId(yaml_obj['image_id']),
-                    Pattern(yaml_obj['pattern']),
-                    EncodedFields(yaml_obj['encoded_fields']),
-                    Components(yaml_obj['components']),
-                    Rules(yaml_obj['rules']),
-                    yaml_obj.get('checksum'))
+  @staticmethod
+  def _GetCompiledKey(raw_data):
+    """Returns (file name, digest) to find the compiled database in cache.
+
+    The file name is the checksum of the database, and the digest covers all
+    data the compiled database depends on, including the checksum line and the
+    regions for region fields and components.
+    """
+    region_codes = sorted(regions.BuildRegionsDict(include_all=True))
+    digest = hashlib.sha1(repr(
+        (_COMPILED_DATABASE_VERSION, raw_data, region_codes,
+         sorted(regions.REGIONS))).encode('utf-8')).hexdigest()
+    return Database.ChecksumForText(raw_data) + '.pickle', digest
+
+  @staticmethod
+  def _CheckCacheDir(cache_dir):
+    """Returns True if cache_dir can be trusted to load pickles from.
+
+    The directory must be a real directory, not a symlink, owned by the current
+    user and accessible only by the user, since it's usually in /tmp.
+    """
+    try:
+      st = os.lstat(cache_dir)
+    except OSError:
+      return False
+    if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.geteuid() or
+        stat.S_IMODE(st.st_mode) != 0o700):
+      logging.warning('Ignore HWID database cache %s which is not a private '
+                      'directory.', cache_dir)
+      return False
+    return True
+
+  @staticmethod
+  def _LoadCompiled(cache_dir, compiled_key):
+    file_name, digest = compiled_key
+    if not Database._CheckCacheDir(cache_dir):
+      return None
+    try:
+      with open(os.path.join(cache_dir, file_name), 'rb') as f:
+        compiled = pickle.load(f)
+    except FileNotFoundError:
+      return None
+    except Exception:
+      logging.debug('Failed to load compiled HWID database %s.', file_name,
+                    exc_info=True)
+      return None
+    if compiled.get('digest') != digest:
+      logging.debug('Compiled HWID database %s is outdated.', file_name)
+      return None
+    return compiled['database']
+
+  @staticmethod
+  def _SaveCompiled(cache_dir, compiled_key, database):
+    file_name, digest = compiled_key
+    try:
+      try:
+        os.mkdir(cache_dir, 0o700)
+      except FileExistsError:
+        pass
+      if not Database._CheckCacheDir(cache_dir):
+        return
+      with file_utils.AtomicWrite(os.path.join(cache_dir, file_name),
+                                  binary=True, fsync=False) as f:
+        pickle.dump({'digest': digest, 'database': database}, f,
+                    pickle.HIGHEST_PROTOCOL)
+    except Exception:
+      logging.debug('Failed to cache compiled HWID database %s.', file_name,
+                    exc_info=True)
 
   def DumpData(self, include_checksum=False):
     all_parts = [
@@ -280,6 +391,9 @@ class Database:
   def GetEncodedField(self, encoded_field_name):
     return self._encoded_fields.GetField(encoded_field_name)
 
+  def GetEncodedFieldIndex(self, encoded_field_name, components):
+    return self._encoded_fields.GetFieldIndex(encoded_field_name, components)
+
   def GetComponentClasses(self, encoded_field_name=None):
     """Returns a set of component class names with optional conditions.
 
@@ -343,6 +457,9 @@ class Database:
   def GetDefaultComponent(self, comp_cls):
     return self._components.GetDefaultComponent(comp_cls)
 
+  def MatchComponents(self, comp_cls, probed_values):
+    return self._components.MatchComponents(comp_cls, probed_values)
+
   def AddComponent(self, comp_cls, comp_name, value, status,
                    information=None):
     return self._components.AddComponent(comp_cls, comp_name, value, status,
@@ -692,6 +809,8 @@ class EncodedFields:
     # because all checks are implemented in the manipulating methods.
     self._fields = yaml.Dict()
     self._field_to_comp_classes = {}
+    # Maps each field name to a dict of combination keys to indices.
+    self._combination_indices = {}
     self._can_encode = True
     self._region_field_legacy_info = {}
 
@@ -750,6 +869,23 @@ class EncodedFields:
       ret[index] = {c: self._StandardlizeList(n) for c, n in comps.items()}
     return ret
 
+  def GetFieldIndex(self, field_name, components):
+    """Gets the index of a components combination in the specific field.
+
+    Args:
+      field_name: A string of the name of the encoded field.
+      components: A dictionary which maps the component class to a sorted list
+          of component names, may include classes not in the field.
+
+    Returns:
+      None if not found; otherwise the first index of the combination.
+    """
+    if field_name not in self._fields:
+      raise common.HWIDException('The field name %r is invalid.' % field_name)
+
+    return self._combination_indices[field_name].get(self._GetCombinationKey(
+        {c: components[c] for c in self._field_to_comp_classes[field_name]}))
+
   def GetComponentClasses(self, field_name):
     """Gets the related component classes of a specific field.
 
@@ -800,19 +936,27 @@ class EncodedFields:
       raise common.HWIDException('Each encoded field should encode a fixed set '
                                  'of component classes.')
 
-    counters = {c: collections.Counter(n) for c, n in components.items()}
-    for existing_index, existing_comps in self.GetField(field_name).items():
-      if all(counter == collections.Counter(existing_comps[comp_cls])
-             for comp_cls, counter in counters.items()):
-        self._can_encode = False
-        logging.warning(
-            'The components combination %r already exists (at index %r).',
-            components, existing_index)
+    key = self._GetCombinationKey(
+        {c: self._StandardlizeList(n) for c, n in components.items()})
+    existing_index = self._combination_indices[field_name].get(key)
+    if existing_index is not None:
+      self._can_encode = False
+      logging.warning(
+          'The components combination %r already exists (at index %r).',
+          components, existing_index)
 
     index = (_index if _index is not None
              else max(self._fields[field_name].keys() or [-1]) + 1)
+    replaced = index in self._fields[field_name]
     self._fields[field_name][index] = yaml.Dict(
         sorted([(c, self._SimplifyList(n)) for c, n in components.items()]))
+    if replaced:
+      self._combination_indices[field_name] = {}
+      for i, comps in self.GetField(field_name).items():
+        self._combination_indices[field_name].setdefault(
+            self._GetCombinationKey(comps), i)
+    else:
+      self._combination_indices[field_name].setdefault(key, index)
 
   def AddNewField(self, field_name, components):
     """Adds a new field.
@@ -842,6 +986,11 @@ class EncodedFields:
 
     self._fields[field_name] = yaml.Dict()
     self._field_to_comp_classes[field_name] = set(comp_classes)
+    self._combination_indices[field_name] = {}
+
+  @staticmethod
+  def _GetCombinationKey(components):
+    return tuple(sorted((c, tuple(n)) for c, n in components.items()))
 
   @classmethod
   def _SimplifyList(cls, data):
@@ -863,6 +1012,65 @@ class ComponentInfo(type_utils.Obj):
                                         information=information)
 
 
+class _ComponentMatchIndex:
+  """An index to find the components matching the probed values.
+
+  A component matches if all of its values match the probed values, so each
+  component is indexed by one of its values which is not a regular
+  expression, the one shared by the fewest components.  Only the components
+  indexed by the probed values, and those with only regular expressions, are
+  checked.
+  """
+
+  def __init__(self, components):
+    """Constructor.
+
+    Args:
+      components: A dict of component names to `ComponentInfo` objects.
+        Default and duplicate components are not indexed.
+    """
+    self._index = collections.defaultdict(dict)
+    self._unindexed = []
+    self._all = []
+
+    counts = collections.Counter()
+    for order, (comp_name, comp_info) in enumerate(components.items()):
+      if (comp_info.values is None or
+          comp_info.status == common.COMPONENT_STATUS.duplicate):
+        continue
+      values = [(key, value if isinstance(value, Value) else Value(value))
+                for key, value in comp_info.values.items()]
+      keys = [(key, value.raw_value) for key, value in values
+              if not value.is_re and isinstance(value.raw_value, str)]
+      counts.update(keys)
+      self._all.append((order, comp_name, values, keys))
+
+    for entry in self._all:
+      keys = entry[3]
+      if keys:
+        key, value = min(keys, key=counts.__getitem__)
+        self._index[key].setdefault(value, []).append(entry)
+      else:
+        self._unindexed.append(entry)
+
+  def Match(self, probed_values):
+    """Returns names of the components matching probed_values in order."""
+    candidates = list(self._unindexed)
+    for key, entries in self._index.items():
+      probed_value = probed_values.get(key)
+      if isinstance(probed_value, Value):
+        candidates = self._all
+        break
+      try:
+        candidates += entries.get(probed_value, [])
+      except TypeError:  # Unhashable probed values match no strings.
+        pass
+    return [comp_name for unused_order, comp_name, values, unused_keys
+            in sorted(candidates, key=lambda entry: entry[0])
+            if all(key in probed_values and value.Matches(probed_values[key])
+                   for key, value in values)]
+
+
 class Components:
   """Class for holding `components` part in a HWID database.
 
@@ -1013,6 +1221,8 @@ class Components:
     self._can_encode = True
     self._default_components = set()
     self._non_probeable_component_classes = set()
+    # _ComponentMatchIndex of each component class, created when needed.
+    self._match_indices = {}
 
     for comp_cls, comps_data in self._components_expr.items():
       self._components[comp_cls] = {}
@@ -1097,6 +1307,23 @@ class Components:
     """
     return self._components.get(comp_cls, {})
 
+  def MatchComponents(self, comp_cls, probed_values):
+    """Finds the components matching the probed values.
+
+    Args:
+      comp_cls: A string of the name of the component class.
+      probed_values: A dict of the probed values of a component.
+
+    Returns:
+      A list of names of the components whose values all match probed_values,
+      in the order of the database.  Default and duplicate components are not
+      included.
+    """
+    if comp_cls not in self._match_indices:
+      self._match_indices[comp_cls] = _ComponentMatchIndex(
+          self.GetComponents(comp_cls))
+    return self._match_indices[comp_cls].Match(probed_values)
+
   def GetDefaultComponent(self, comp_cls):
     """Gets the default components of the specific component class if exists.
 
@@ -1144,6 +1371,7 @@ class Components:
                                  (comp_cls, comp_name))
 
     self._components[comp_cls][comp_name].status = status
+    self._match_indices.pop(comp_cls, None)
 
   def _AddComponent(self, comp_cls, comp_name, values, status, information):
     self._SCHEMA.value_type.items[
@@ -1184,6 +1412,7 @@ class Components:
     self._components.setdefault(comp_cls, yaml.Dict())
     self._components[comp_cls][comp_name] = ComponentInfo(values, status,
                                                           information)
+    self._match_indices.pop(comp_cls, None)
 
 
 _PatternDatum = collections.namedtuple('_PatternDatum',
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for loading a HWID database by Database.LoadFile.
+
+The largest database that can be loaded in testdata/ is used, with --components
+generated components added to each component class, to look like the
+databases of real projects.  The database is loaded --rounds times by:
+
+ - python: parsing with the pure Python V3Loader, like the old LoadFile.
+ - libyaml: parsing with V3CLoader if PyYAML is built with libyaml.
+ - cold: with an empty cache directory, so it's parsed and compiled.
+ - cached: loading the compiled database from the cache directory.
+
+Example:
+
+  database_benchmark.py --components 1000 --rounds 5
+"""
+
+import argparse
+import functools
+import glob
+import os
+import time
+from unittest import mock
+
+import yaml as pyyaml
+
+from cros.factory.hwid.v3 import common
+from cros.factory.hwid.v3.database import Database
+from cros.factory.hwid.v3 import yaml_wrapper as yaml
+from cros.factory.utils import file_utils
+
+
+_TEST_DATA_PATH = os.path.join(os.path.dirname(__file__), 'testdata')
+
+
+def _FindLargestDatabase():
+  """Returns the path of the largest database that can be loaded."""
+  for path in sorted(glob.glob(os.path.join(_TEST_DATA_PATH, '*')),
+                     key=lambda p: -os.path.getsize(p)):
+    try:
+      return path, Database.LoadFile(path, verify_checksum=False)
+    except Exception:
+      continue
+  raise RuntimeError('No HWID database can be loaded.')
+
+
+def _Bench(func, rounds):
+  """Returns seconds per call of func."""
+  start_time = time.time()
+  for unused_i in range(rounds):
+    func()
+  return (time.time() - start_time) / rounds
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--components', type=int, default=1000,
+                      help='Number of components added to each class.')
+  parser.add_argument('--rounds', type=int, default=5,
+                      help='Number of times the database is loaded.')
+  args = parser.parse_args()
+
+  path, db = _FindLargestDatabase()
+  for comp_cls in db.GetComponentClasses():
+    if comp_cls == 'region':
+      continue
+    for i in range(args.components):
+      db.AddComponent(comp_cls, 'generated_%s_%d' % (comp_cls, i),
+                      {'id': str(i), 'name': '%s #%d' % (comp_cls, i),
+                       'vendor': 'vendor %d' % (i % 7)},
+                      common.COMPONENT_STATUS.supported)
+
+  with file_utils.TempDirectory(prefix='database_benchmark_') as tmp_dir:
+    db_path = os.path.join(tmp_dir, os.path.basename(path))
+    db_text = db.DumpData()
+    file_utils.WriteFile(db_path, db_text.replace(
+        'checksum: null', 'checksum: %s' % Database.ChecksumForText(db_text),
+        1))
+    print('Database: %s with %d components, %d KB' % (
+        os.path.basename(path),
+        sum(len(db.GetComponents(c)) for c in db.GetComponentClasses()),
+        os.path.getsize(db_path) // 1024))
+
+    cache_dir = os.path.join(tmp_dir, 'cache')
+
+    def _Python():
+      with mock.patch.object(yaml, 'load', functools.partial(
+          pyyaml.load, Loader=yaml.V3Loader)):
+        Database.LoadFile(db_path)
+
+    def _Cold():
+      file_utils.TryUnlink(os.path.join(
+          cache_dir, Database.Checksum(db_path) + '.pickle'))
+      Database.LoadFile(db_path, cache_dir=cache_dir)
+
+    cases = [('python', _Python),
+             ('libyaml', lambda: Database.LoadFile(db_path)),
+             ('cold', _Cold),
+             ('cached', lambda: Database.LoadFile(db_path,
+                                                  cache_dir=cache_dir))]
+    if yaml.FastLoader is yaml.V3Loader:
+      print('PyYAML is built without libyaml.')
+    for name, func in cases:
+      print('%-8s %8.1f ms' % (name, _Bench(func, args.rounds) * 1000))
+
+
+if __name__ == '__main__':
+  main()
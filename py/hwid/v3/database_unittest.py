@@ -4,7 +4,9 @@
 # found in the LICENSE file.
 
 import os
+import stat
 import unittest
+from unittest import mock
 
 from cros.factory.hwid.v3.common import HWIDException
 from cros.factory.hwid.v3.database import Components
@@ -13,6 +15,7 @@ from cros.factory.hwid.v3.database import EncodedFields
 from cros.factory.hwid.v3.database import ImageId
 from cros.factory.hwid.v3.database import Pattern
 from cros.factory.hwid.v3.database import Rules
+from cros.factory.hwid.v3.rule import Value
 from cros.factory.utils import file_utils
 
 
@@ -59,6 +62,50 @@ class DatabaseTest(unittest.TestCase):
       db.DumpFile(path, include_checksum=True)
       Database.LoadFile(path, verify_checksum=False)
 
+  def testLoadCompiled(self):
+    path = os.path.join(_TEST_DATA_PATH, 'test_database_db.yaml')
+    bad_checksum_path = os.path.join(_TEST_DATA_PATH,
+                                     'test_database_db_bad_checksum.yaml')
+    with file_utils.TempDirectory() as cache_dir:
+      db = Database.LoadFile(path, cache_dir=cache_dir)
+      self.assertEqual(1, len(os.listdir(cache_dir)))
+      with mock.patch('cros.factory.hwid.v3.yaml_wrapper.load') as load:
+        self.assertEqual(db, Database.LoadFile(path, cache_dir=cache_dir))
+        load.assert_not_called()
+
+      # The checksum is still verified for compiled databases.
+      Database.LoadFile(bad_checksum_path, verify_checksum=False,
+                        cache_dir=cache_dir)
+      self.assertRaises(HWIDException, Database.LoadFile, bad_checksum_path,
+                        cache_dir=cache_dir)
+
+      # Outdated or broken compiled databases are ignored.
+      for name in os.listdir(cache_dir):
+        file_utils.WriteFile(os.path.join(cache_dir, name), 'broken')
+      self.assertEqual(db, Database.LoadFile(path, cache_dir=cache_dir))
+      with mock.patch('cros.factory.hwid.v3.database.'
+                      '_COMPILED_DATABASE_VERSION', -1):
+        self.assertEqual(db, Database.LoadFile(path, cache_dir=cache_dir))
+
+      # Compiled databases in a symlink or accessible by others are not
+      # trusted.
+      link = os.path.join(cache_dir, 'link')
+      os.symlink(cache_dir, link)
+      with mock.patch('pickle.load') as load:
+        self.assertEqual(db, Database.LoadFile(path, cache_dir=link))
+        load.assert_not_called()
+      os.chmod(cache_dir, 0o755)
+      with mock.patch('pickle.load') as load:
+        self.assertEqual(db, Database.LoadFile(path, cache_dir=cache_dir))
+        load.assert_not_called()
+
+    # The cache directory is created accessible only by the user.
+    with file_utils.TempDirectory() as temp_dir:
+      cache_dir = os.path.join(temp_dir, 'cache')
+      Database.LoadFile(path, cache_dir=cache_dir)
+      self.assertEqual(0o700, stat.S_IMODE(os.lstat(cache_dir).st_mode))
+      self.assertEqual(1, len(os.listdir(cache_dir)))
+
 
 class ImageIdTest(unittest.TestCase):
   def testExport(self):
@@ -223,6 +270,25 @@ class ComponentsTest(unittest.TestCase):
     self.assertEqual(c.GetComponents('cls2')['comp4'].information['comp_group'],
                      'comp5')
 
+  def testMatchComponents(self):
+    c = Components({'cls1': {'items': {
+        'comp1': {'values': {'a': 'b', 'c': 'd'}},
+        'comp2': {'values': {'a': 'b'}},
+        'comp3': {'values': {'a': Value('b.*', is_re=True)}},
+        'comp4': {'values': {'a': 'b'}, 'status': 'duplicate'},
+        'comp5': {'values': None}}}})
+    self.assertEqual(c.MatchComponents('cls1', {'a': 'b', 'c': 'd'}),
+                     ['comp1', 'comp2', 'comp3'])
+    self.assertEqual(c.MatchComponents('cls1', {'a': 'bx'}), ['comp3'])
+    self.assertEqual(c.MatchComponents('cls1', {'c': 'd'}), [])
+    self.assertEqual(c.MatchComponents('cls2', {'a': 'b'}), [])
+
+    # The index is updated with the components.
+    c.AddComponent('cls1', 'comp6', {'c': 'd'}, 'supported')
+    c.SetComponentStatus('cls1', 'comp2', 'duplicate')
+    self.assertEqual(c.MatchComponents('cls1', {'a': 'b', 'c': 'd'}),
+                     ['comp1', 'comp3', 'comp6'])
+
 
 class EncodedFieldsTest(unittest.TestCase):
   def testExport(self):
@@ -293,6 +359,19 @@ class EncodedFieldsTest(unittest.TestCase):
     self.assertEqual(e.GetFieldForComponent('c'), 'e2')
     self.assertEqual(e.GetFieldForComponent('x'), None)
 
+  def testGetFieldIndex(self):
+    e = EncodedFields({'e1': {0: {'a': 'A', 'b': None},
+                              1: {'a': ['AA', 'AAA'], 'b': 'B'},
+                              2: {'a': ['AAA', 'AA'], 'b': 'B'}}})
+    self.assertEqual(e.GetFieldIndex('e1', {'a': ['A'], 'b': []}), 0)
+    self.assertEqual(e.GetFieldIndex('e1', {'a': ['AA', 'AAA'], 'b': ['B'],
+                                            'c': ['C']}), 1)
+    self.assertEqual(e.GetFieldIndex('e1', {'a': ['A'], 'b': ['B']}), None)
+    self.assertRaises(HWIDException, e.GetFieldIndex, 'e2', {})
+
+    e.AddFieldComponents('e1', {'a': ['A'], 'b': ['B']})
+    self.assertEqual(e.GetFieldIndex('e1', {'a': ['A'], 'b': ['B']}), 3)
+
 
 class PatternTest(unittest.TestCase):
   def testExport(self):
@@ -0,0 +1,186 @@
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Enumerator of all the possible HWIDs of a HWID database."""
+
+import functools
+import itertools
+import multiprocessing
+import operator
+
+from cros.factory.hwid.v3 import common
+from cros.factory.hwid.v3.identity import Identity
+from cros.factory.utils import type_utils
+
+
+# Number of shards for each process, so the processes are kept busy even if
+# some shards are much smaller than others.
+_SHARDS_PER_JOB = 8
+
+
+class HWIDEnumerator:
+  """Enumerates the HWIDs of a database without building BOMs.
+
+  The indices of each encoded field are selected first, and each selected
+  index is converted to the bits it sets in the components bitset, so a HWID
+  is encoded by OR-ing the bits of one index of each field.  Different
+  combinations of indices always set different bits, so the HWIDs are
+  enumerated without duplication.
+
+  The HWIDs are generated lazily in the order of the indices, with the first
+  encoded field in the pattern as the most significant one.  They can be
+  generated by a pool of processes, each of which enumerates the HWIDs
+  starting with some indices of the leading fields.
+  """
+
+  def __init__(self, database, image_id=None, status='supported', comps=None,
+               brand_code=None):
+    """Constructor.
+
+    Args:
+      database: A Database object to be used.
+      image_id: The image ID to use.  Defaults to the latest image ID.
+      status: By default only 'supported' components are enumerated.  Set this
+          to 'released' will include 'supported' and 'deprecated'. Set this to
+          'all' if you want to include 'deprecated', 'unsupported' and
+          'unqualified' components.
+      comps: None or a dict of list of string as the limit to specified
+          components.
+      brand_code: None or a string of Chromebook brand code.
+    """
+    if not database.can_encode:
+      raise common.HWIDException(
+          'The given HWID database is a legacy one and not works for '
+          'encoding.')
+
+    limited_comps = comps or {}
+
+    if image_id is None:
+      image_id = database.max_image_id
+
+    if status == 'supported':
+      acceptable_status = set([common.COMPONENT_STATUS.supported])
+    elif status == 'released':
+      acceptable_status = set([common.COMPONENT_STATUS.supported,
+                               common.COMPONENT_STATUS.deprecated])
+    elif status == 'all':
+      acceptable_status = set(common.COMPONENT_STATUS)
+    else:
+      raise ValueError('The argument `status` must be one of "supported", '
+                       '"released", "all", but got %r.' % status)
+
+    def _IsComponentsSetValid(comps):
+      for comp_cls, comp_names in comps.items():
+        if (comp_cls in limited_comps and
+            sorted(limited_comps[comp_cls]) != sorted(comp_names)):
+          return False
+        for comp_name in comp_names:
+          status = database.GetComponents(comp_cls)[comp_name].status
+          if status not in acceptable_status:
+            return False
+      return True
+
+    self._project = database.project
+    self._encoding_scheme = database.GetEncodingScheme(image_id)
+    self._image_id = image_id
+    self._brand_code = brand_code
+
+    # Position 0 of the bitset is the most significant bit of the integer.
+    bit_mapping = database.GetBitMapping(image_id)
+    self._bitset_format = '{:0%db}1' % len(bit_mapping)
+    field_bits = {}
+    for position, (field_name, bit_offset) in enumerate(bit_mapping):
+      field_bits.setdefault(field_name, []).append(
+          (len(bit_mapping) - 1 - position, bit_offset))
+
+    # A list of the choices of each encoded field, each of which is a tuple
+    # of the bits of the index in the bitset, and the components.
+    self._fields = []
+    for field_name, bit_length in database.GetEncodedFieldsBitLength(
+        image_id).items():
+      max_index = (1 << bit_length) - 1
+      choices = []
+      for index, comps_set in database.GetEncodedField(field_name).items():
+        if index <= max_index and _IsComponentsSetValid(comps_set):
+          bits = 0
+          for position, bit_offset in field_bits.get(field_name, []):
+            bits |= ((index >> bit_offset) & 1) << position
+          choices.append((bits, {
+              comp_cls: type_utils.MakeList(comp_names)
+              for comp_cls, comp_names in comps_set.items()}))
+      self._fields.append(choices)
+
+  def Count(self):
+    """Returns the number of HWIDs without enumerating them."""
+    return functools.reduce(operator.mul, map(len, self._fields), 1)
+
+  def Iterate(self, with_components=False, jobs=1):
+    """Enumerates the HWIDs.
+
+    Args:
+      with_components: True to generate the components of each HWID as well.
+      jobs: Number of processes to enumerate the HWIDs.
+
+    Yields:
+      The encoded strings of the HWIDs, or tuples of the encoded string and a
+      dict of component classes to lists of component names if
+      `with_components` is True.
+    """
+    if jobs <= 1:
+      yield from self._IterateShard((), with_components)
+      return
+
+    # Shard by the leading fields, just enough to feed all the processes.
+    depth = 0
+    num_shards = 1
+    while depth < len(self._fields) and num_shards < jobs * _SHARDS_PER_JOB:
+      num_shards *= len(self._fields[depth])
+      depth += 1
+    shards = itertools.product(*[range(len(choices))
+                                 for choices in self._fields[:depth]])
+
+    pool = multiprocessing.Pool(jobs, _InitWorker, (self,))
+    try:
+      for results in pool.imap(
+          functools.partial(_EnumerateShard, with_components), shards):
+        yield from results
+    finally:
+      pool.terminate()
+
+  def _IterateShard(self, prefix, with_components):
+    """Enumerates the HWIDs with the given indices of the leading fields.
+
+    Args:
+      prefix: A tuple of the positions in the choices of the leading fields.
+      with_components: See `Iterate`.
+    """
+    leading = [self._fields[i][j] for i, j in enumerate(prefix)]
+    for selected in itertools.product(*self._fields[len(prefix):]):
+      bits = 0
+      for choice_bits, unused_comps in itertools.chain(leading, selected):
+        bits |= choice_bits
+      encoded_string = Identity.GenerateFromBinaryString(
+          self._encoding_scheme, self._project, 0, self._image_id,
+          self._bitset_format.format(bits), self._brand_code).encoded_string
+      if not with_components:
+        yield encoded_string
+        continue
+      components = {}
+      for unused_bits, comps in itertools.chain(leading, selected):
+        components.update(comps)
+      yield encoded_string, components
+
+
+# The enumerator of the worker process, sent once when the process starts.
+_worker_enumerator = None
+
+
+def _InitWorker(enumerator):
+  global _worker_enumerator  # pylint: disable=global-statement
+  _worker_enumerator = enumerator
+
+
+def _EnumerateShard(with_components, prefix):
+  # pylint: disable=protected-access
+  return list(_worker_enumerator._IterateShard(prefix, with_components))
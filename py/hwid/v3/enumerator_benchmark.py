@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for enumerating all the HWIDs of a HWID database.
+
+--fields encoded fields of --choices indices each are added to
+testdata/test_transformer_db.yaml, so there are about choices ** fields HWIDs
+of the latest image.  They are enumerated by:
+
+ - legacy: recursively building a BOM of each HWID and encoding it by
+   transformer.BOMToIdentity into a dict, like the old
+   hwid_utils.EnumerateHWID.
+ - stream: HWIDEnumerator.Iterate, only the encoded strings.
+ - components: HWIDEnumerator.Iterate with the components of each HWID.
+ - parallel: HWIDEnumerator.Iterate by --jobs processes.
+
+The time of each case is measured, and then the peak memory allocated by
+Python in the main process is measured by tracemalloc in another round.
+
+Example:
+
+  enumerator_benchmark.py --fields 4 --choices 16 --jobs 4
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+
+from cros.factory.hwid.v3.bom import BOM
+from cros.factory.hwid.v3 import common
+from cros.factory.hwid.v3.database import Database
+from cros.factory.hwid.v3.enumerator import HWIDEnumerator
+from cros.factory.hwid.v3 import transformer
+
+
+_TEST_DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'testdata',
+                                   'test_transformer_db.yaml')
+
+
+def _LegacyEnumerateHWID(database, image_id):
+  combinations = []
+  for field_name, bit_length in database.GetEncodedFieldsBitLength(
+      image_id).items():
+    combinations.append(
+        [comps for index, comps in database.GetEncodedField(field_name).items()
+         if index < (1 << bit_length)])
+
+  results = {}
+  def _RecursivelyEnumerateCombinations(i, selected_combinations):
+    if i >= len(combinations):
+      components = {}
+      for selected_combination in selected_combinations:
+        components.update(selected_combination)
+      bom = BOM(0, image_id, components)
+      identity = transformer.BOMToIdentity(database, bom)
+      results[identity.encoded_string] = bom
+      return
+
+    for combination in combinations[i]:
+      selected_combinations[i] = combination
+      _RecursivelyEnumerateCombinations(i + 1, selected_combinations)
+
+  _RecursivelyEnumerateCombinations(0, [None] * len(combinations))
+  return results
+
+
+def _CreateDatabase(num_fields, num_choices):
+  database = Database.LoadFile(_TEST_DATABASE_PATH, verify_checksum=False)
+  for i in range(num_fields):
+    comp_cls = 'generated_%d' % i
+    field_name = comp_cls + '_field'
+    for j in range(num_choices):
+      comp_name = '%s_%d' % (comp_cls, j)
+      database.AddComponent(comp_cls, comp_name, {'id': str(j)},
+                            common.COMPONENT_STATUS.supported)
+      if j == 0:
+        database.AddNewEncodedField(field_name, {comp_cls: [comp_name]})
+      else:
+        database.AddEncodedFieldComponents(field_name, {comp_cls: [comp_name]})
+    database.AppendEncodedFieldBit(field_name,
+                                   max(1, (num_choices - 1).bit_length()))
+  return database
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--fields', type=int, default=4,
+                      help='Number of encoded fields added to the database.')
+  parser.add_argument('--choices', type=int, default=16,
+                      help='Number of indices of each added field.')
+  parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                      help='Number of processes of the parallel case.')
+  args = parser.parse_args()
+
+  database = _CreateDatabase(args.fields, args.choices)
+  image_id = database.max_image_id
+  hwid_enumerator = HWIDEnumerator(database, status='all')
+  print('Database: %d HWIDs' % hwid_enumerator.Count())
+
+  def _Stream(with_components=False, jobs=1):
+    count = 0
+    for unused_result in hwid_enumerator.Iterate(
+        with_components=with_components, jobs=jobs):
+      count += 1
+    return count
+
+  cases = [('legacy', lambda: len(_LegacyEnumerateHWID(database, image_id))),
+           ('stream', _Stream),
+           ('components', lambda: _Stream(with_components=True)),
+           ('parallel', lambda: _Stream(jobs=args.jobs))]
+  for name, func in cases:
+    start_time = time.time()
+    count = func()
+    elapsed = time.time() - start_time
+    assert count == hwid_enumerator.Count(), 'Wrong number of HWIDs.'
+
+    tracemalloc.start()
+    func()
+    unused_current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('%-12s %8.2fs %10.0f HWIDs/s %10d KB' % (
+        name, elapsed, count / elapsed, peak // 1024))
+
+
+if __name__ == '__main__':
+  main()
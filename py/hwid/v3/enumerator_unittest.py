@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import unittest
+
+from cros.factory.hwid.v3.bom import BOM
+from cros.factory.hwid.v3.common import HWIDException
+from cros.factory.hwid.v3.database import Database
+from cros.factory.hwid.v3.enumerator import HWIDEnumerator
+from cros.factory.hwid.v3 import transformer
+
+
+_TEST_DATABASE_FILENAME = os.path.join(
+    os.path.dirname(__file__), 'testdata', 'test_transformer_db.yaml')
+
+
+class HWIDEnumeratorTest(unittest.TestCase):
+  def setUp(self):
+    self.database = Database.LoadFile(_TEST_DATABASE_FILENAME,
+                                      verify_checksum=False)
+
+  def _CheckEncodedStrings(self, image_id, results, brand_code=None):
+    for encoded_string, components in results:
+      identity = transformer.BOMToIdentity(
+          self.database, BOM(0, image_id, components), brand_code=brand_code)
+      self.assertEqual(encoded_string, identity.encoded_string)
+
+  def testIterate(self):
+    for image_id in self.database.image_ids:
+      hwid_enumerator = HWIDEnumerator(self.database, image_id=image_id,
+                                       status='all', brand_code='BRAND')
+      results = list(hwid_enumerator.Iterate(with_components=True))
+      self.assertEqual(len(results), hwid_enumerator.Count())
+      self.assertEqual(len(set(r[0] for r in results)), len(results))
+      self._CheckEncodedStrings(image_id, results, brand_code='BRAND')
+      self.assertEqual(list(hwid_enumerator.Iterate()),
+                       [r[0] for r in results])
+
+    # Image 3 has 1 choice of cpu_field, 8 of audio_and_video_field and 3 of
+    # battery_field.
+    self.assertEqual(HWIDEnumerator(self.database, status='all').Count(), 24)
+
+  def testLimitedComponents(self):
+    hwid_enumerator = HWIDEnumerator(self.database, status='all',
+                                     comps={'video': ['video_0']})
+    results = list(hwid_enumerator.Iterate(with_components=True))
+    self.assertTrue(results)
+    for unused_encoded_string, components in results:
+      self.assertEqual(components['video'], ['video_0'])
+    self._CheckEncodedStrings(3, results)
+
+    hwid_enumerator = HWIDEnumerator(self.database, status='all',
+                                     comps={'video': ['video_x']})
+    self.assertEqual(hwid_enumerator.Count(), 0)
+    self.assertEqual(list(hwid_enumerator.Iterate()), [])
+
+  def testParallel(self):
+    hwid_enumerator = HWIDEnumerator(self.database, status='all')
+    self.assertEqual(list(hwid_enumerator.Iterate(with_components=True,
+                                                  jobs=2)),
+                     list(hwid_enumerator.Iterate(with_components=True)))
+
+  def testInvalidStatus(self):
+    self.assertRaises(ValueError, HWIDEnumerator, self.database,
+                      status='unknown')
+
+  def testCannotEncode(self):
+    self.database.AddEncodedFieldComponents('cpu_field', {'cpu': ['cpu_0']})
+    self.assertRaises(HWIDException, HWIDEnumerator, self.database)
+
+
+if __name__ == '__main__':
+  unittest.main()
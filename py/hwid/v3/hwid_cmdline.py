@@ -12,9 +12,11 @@ import os
 import shutil
 import sys
 
+from cros.factory.hwid.v3.bom import BOM
 from cros.factory.hwid.v3 import builder
 from cros.factory.hwid.v3 import converter
 from cros.factory.hwid.v3.database import Database
+from cros.factory.hwid.v3 import enumerator
 from cros.factory.hwid.v3 import hwid_utils
 from cros.factory.hwid.v3 import probe
 from cros.factory.hwid.v3 import yaml_wrapper as yaml
@@ -358,6 +360,10 @@ def ListComponentsWrapper(options):
                  '"<comp_cls>=<comp_name>[,<comp_name>[,<comp_name>...]]"')),
     CmdArg('--no-bom', action='store_true',
            help='Print the encoded string only.'),
+    CmdArg('--count', action='store_true',
+           help='Print the number of HWIDs only.'),
+    CmdArg('--jobs', type=int, default=1,
+           help='Number of processes to enumerate HWIDs.'),
     CmdArg('--brand-code', default=None, help='The brand code.'))
 def EnumerateHWIDWrapper(options):
   """Enumerates possible HWIDs."""
@@ -369,23 +375,29 @@ def EnumerateHWIDWrapper(options):
       comp_cls, _, comp_names = comp.partition('=')
       comps[comp_cls] = comp_names.split(',')
 
-  # Enumerating may take a very long time so we want to verbosely make logs.
-  logging.debug('Enumerating all HWIDs...')
   if options.image_id:
     image_id = options.database.GetImageIdByName(options.image_id)
   else:
-    image_id = None
-  hwids = hwid_utils.EnumerateHWID(
+    image_id = options.database.max_image_id
+  hwid_enumerator = enumerator.HWIDEnumerator(
       options.database, image_id=image_id, status=options.status,
       comps=comps, brand_code=options.brand_code)
 
-  logging.debug('Printing %d sorted HWIDs...', len(hwids))
+  if options.count:
+    Output('%d' % hwid_enumerator.Count())
+    return
+
+  # Enumerating may take a very long time so we want to verbosely make logs.
+  # The HWIDs are printed as they are generated instead of sorted, so a large
+  # number of HWIDs are never kept in memory.
+  logging.debug('Enumerating %d HWIDs...', hwid_enumerator.Count())
   if options.no_bom:
-    for k in sorted(hwids):
-      Output(k)
+    for encoded_string in hwid_enumerator.Iterate(jobs=options.jobs):
+      Output(encoded_string)
   else:
-    for k, v in sorted(hwids.items()):
-      Output('%s: %s' % (k, v))
+    for encoded_string, components in hwid_enumerator.Iterate(
+        with_components=True, jobs=options.jobs):
+      Output('%s: %s' % (encoded_string, BOM(0, image_id, components)))
 
 
 @Command('verify-database')
@@ -445,7 +457,8 @@ def InitializeDefaultOptions(options):
                 options.project.upper())
   options.database = Database.LoadFile(
       os.path.join(options.hwid_db_path, options.project.upper()),
-      verify_checksum=(not options.no_verify_checksum))
+      verify_checksum=(not options.no_verify_checksum),
+      cache_dir=Database.GetDefaultCacheDir())
 
   phase.OverridePhase(options.phase)
 
@@ -236,31 +236,56 @@ class ListComponentsWrapperTest(TestCaseBaseWithMockedOutputObject):
 
 
 class EnumerateHWIDWrapperTest(TestCaseBaseWithFakeOutput):
-  @mock.patch('cros.factory.hwid.v3.hwid_utils.EnumerateHWID',
-              return_value={'HWID1': 'bbb', 'HWID2': 'aaa'})
-  def testDefault(self, unused_enumerate_hwid_mock):
-    hwid_cmdline.EnumerateHWIDWrapper(mock.MagicMock(comp=None, no_bom=False))
+  def setUp(self):
+    super(EnumerateHWIDWrapperTest, self).setUp()
+    patcher = mock.patch('cros.factory.hwid.v3.enumerator.HWIDEnumerator')
+    self.enumerator_mock = patcher.start()
+    self.addCleanup(patcher.stop)
+    instance = self.enumerator_mock.return_value
+    instance.Count.return_value = 2
+
+    def _Iterate(with_components=False, jobs=1):
+      del jobs  # Unused.
+      if with_components:
+        return iter([('HWID2', {'aaa': ['bbb']}), ('HWID1', {})])
+      return iter(['HWID2', 'HWID1'])
+    instance.Iterate.side_effect = _Iterate
+
+  def testDefault(self):
+    options = mock.MagicMock(comp=None, image_id=None, no_bom=False,
+                             count=False, jobs=1)
+    options.database.max_image_id = 3
+    hwid_cmdline.EnumerateHWIDWrapper(options)
 
-    self.assertEqual(hwid_cmdline.Output.data, 'HWID1: bbb\nHWID2: aaa\n')
+    self.assertEqual(
+        hwid_cmdline.Output.data,
+        "HWID2: BOM(encoding_pattern_index=0, image_id=3, "
+        "components={'aaa': ['bbb']})\n"
+        "HWID1: BOM(encoding_pattern_index=0, image_id=3, components={})\n")
 
-  @mock.patch('cros.factory.hwid.v3.hwid_utils.EnumerateHWID', return_value={})
-  def testComp(self, enumerate_hwid_mock):
-    options = mock.MagicMock(comp=['aaa=bbb', 'ccc=ddd,eee'])
+  def testComp(self):
+    options = mock.MagicMock(comp=['aaa=bbb', 'ccc=ddd,eee'], count=True)
     hwid_cmdline.EnumerateHWIDWrapper(options)
 
-    enumerate_hwid_mock.assert_called_once_with(
+    self.enumerator_mock.assert_called_once_with(
         options.database,
         image_id=options.database.GetImageIdByName.return_value,
         status=options.status,
         comps={'aaa': ['bbb'], 'ccc': ['ddd', 'eee']},
         brand_code=options.brand_code)
 
-  @mock.patch('cros.factory.hwid.v3.hwid_utils.EnumerateHWID',
-              return_value={'HWID1': 'bbb', 'HWID2': 'aaa'})
-  def testOutputWithoutBOM(self, unused_enumerate_hwid_mock):
-    hwid_cmdline.EnumerateHWIDWrapper(mock.MagicMock(no_bom=True))
+  def testOutputWithoutBOM(self):
+    hwid_cmdline.EnumerateHWIDWrapper(
+        mock.MagicMock(no_bom=True, count=False, jobs=2))
+
+    self.assertEqual(hwid_cmdline.Output.data, 'HWID2\nHWID1\n')
+    self.enumerator_mock.return_value.Iterate.assert_called_once_with(jobs=2)
+
+  def testCount(self):
+    hwid_cmdline.EnumerateHWIDWrapper(mock.MagicMock(count=True))
 
-    self.assertEqual(hwid_cmdline.Output.data, 'HWID1\nHWID2\n')
+    self.assertEqual(hwid_cmdline.Output.data, '2\n')
+    self.enumerator_mock.return_value.Iterate.assert_not_called()
 
 
 if __name__ == '__main__':
@@ -11,6 +11,7 @@ import os
 from cros.factory.hwid.v3.bom import BOM
 from cros.factory.hwid.v3 import common
 from cros.factory.hwid.v3.database import Database
+from cros.factory.hwid.v3 import enumerator
 from cros.factory.hwid.v3 import identity as identity_utils
 from cros.factory.hwid.v3.identity import Identity
 from cros.factory.hwid.v3.rule import Context
@@ -191,6 +192,9 @@ def EnumerateHWID(database, image_id=None, status='supported', comps=None,
                   brand_code=None):
   """Enumerates all the possible HWIDs.
 
+  It keeps all the HWIDs in memory; use `enumerator.HWIDEnumerator` to
+  enumerate the HWIDs of a large database.
+
   Args:
     database: A Database object to be used.
     image_id: The image ID to use.  Defaults to the latest image ID.
@@ -204,72 +208,14 @@ def EnumerateHWID(database, image_id=None, status='supported', comps=None,
   Returns:
     A dict of all enumetated HWIDs to their list of components.
   """
-  limited_comps = comps or {}
-
+  hwid_enumerator = enumerator.HWIDEnumerator(
+      database, image_id=image_id, status=status, comps=comps,
+      brand_code=brand_code)
   if image_id is None:
     image_id = database.max_image_id
-
-  if status == 'supported':
-    acceptable_status = set([common.COMPONENT_STATUS.supported])
-  elif status == 'released':
-    acceptable_status = set([common.COMPONENT_STATUS.supported,
-                             common.COMPONENT_STATUS.deprecated])
-  elif status == 'all':
-    acceptable_status = set(common.COMPONENT_STATUS)
-  else:
-    raise ValueError('The argument `status` must be one of "supported", '
-                     '"released", "all", but got %r.' % status)
-
-  def _IsComponentsSetValid(comps):
-    for comp_cls, comp_names in comps.items():
-      comp_names = type_utils.MakeList(comp_names)
-      if (comp_cls in limited_comps and
-          sorted(list(limited_comps[comp_cls])) != sorted(comp_names)):
-        return False
-      for comp_name in comp_names:
-        status = database.GetComponents(comp_cls)[comp_name].status
-        if status not in acceptable_status:
-          return False
-    return True
-
-  results = {}
-  def _RecordResult(components):
-    bom = BOM(0, image_id, components)
-    identity = transformer.BOMToIdentity(database, bom, brand_code=brand_code)
-    results[identity.encoded_string] = bom
-
-  def _RecursivelyEnumerateCombinations(combinations, i,
-                                        selected_combinations):
-    if i >= len(combinations):
-      components = {}
-      for selected_combination in selected_combinations:
-        components.update(selected_combination)
-
-      _RecordResult(components)
-      return
-
-    for combination in combinations[i]:
-      selected_combinations[i] = combination
-      _RecursivelyEnumerateCombinations(
-          combinations, i + 1, selected_combinations)
-
-  combinations = []
-  for field_name, bit_length in database.GetEncodedFieldsBitLength(
-      image_id).items():
-    max_index = (1 << bit_length) - 1
-    last_combinations = []
-    for index, comps_set in database.GetEncodedField(field_name).items():
-      if index <= max_index and _IsComponentsSetValid(comps_set):
-        last_combinations.append(
-            {comp_cls: type_utils.MakeList(comp_names)
-             for comp_cls, comp_names in comps_set.items()})
-
-    if not last_combinations:
-      return {}
-    combinations.append(last_combinations)
-
-  _RecursivelyEnumerateCombinations(combinations, 0, [None] * len(combinations))
-  return results
+  return {encoded_string: BOM(0, image_id, components)
+          for encoded_string, components
+          in hwid_enumerator.Iterate(with_components=True)}
 
 
 def GetProbedResults(infile=None, raw_data=None, project=None):
@@ -5,7 +5,6 @@
 from cros.factory.hwid.v3.bom import BOM
 from cros.factory.hwid.v3 import common
 from cros.factory.hwid.v3.rule import Context
-from cros.factory.hwid.v3.rule import Value
 from cros.factory.probe import probe_utils
 
 
@@ -48,14 +47,6 @@ def GenerateBOMFromProbedResults(database, probed_results, device_info, vpd,
     A instance of BOM class and a sub-dictionary of the probed results contains
         the mismatched components.
   """
-  def _IsValuesMatch(probed_values, comp_values):
-    for key, value in comp_values.items():
-      if not isinstance(value, Value):
-        value = Value(value)
-      if key not in probed_values or not value.Matches(probed_values[key]):
-        return False, None
-    return True, -len(comp_values)
-
   def _GetDefaultComponent(comp_cls):
     if allow_mismatched_components:
       return None
@@ -107,19 +98,16 @@ def GenerateBOMFromProbedResults(database, probed_results, device_info, vpd,
     for comp_cls in component_classes:
       default_comp = _GetDefaultComponent(comp_cls)
 
+      comps = database.GetComponents(comp_cls)
       for probed_comp in probed_results.get(comp_cls, []):
         matched_comp_name = []
         matched_comp_score = float('-inf')
-        for comp_name, comp_info in database.GetComponents(
-            comp_cls, include_default=False).items():
-          if comp_info.status == common.COMPONENT_STATUS.duplicate:
-            # A component that is 'duplicate' is covered by another component.
-            # Therefore, the duplicate one should not be used for encoding.
-            continue
-          is_matched, score = _IsValuesMatch(probed_comp['values'],
-                                             comp_info.values)
-          if not is_matched:
-            continue
+        # Components that are 'duplicate' are covered by other components, so
+        # they are not matched for encoding.
+        for comp_name in database.MatchComponents(comp_cls,
+                                                  probed_comp['values']):
+          # Prefer the component with the fewest values; ties are ambiguous.
+          score = -len(comps[comp_name].values)
           if score > matched_comp_score:
             matched_comp_score = score
             matched_comp_name = [comp_name]
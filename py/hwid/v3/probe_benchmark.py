@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for matching probed components and encoding BOMs of HWID.
+
+--components components, every tenth of which has a regular expression value,
+are added to a new component class of testdata/test_probe_db.yaml, and each of
+them is added as a combination of a new encoded field.  Then --lookups random
+components are looked up by:
+
+ - match: finding the components matching the probed values, like
+   probe.GenerateBOMFromProbedResults.
+ - encode: finding the index of a combination in the encoded field, like
+   transformer.BOMToIdentity.
+
+Each of them is done by scanning all components or combinations, like the old
+code (legacy), and by the indices of Database (indexed).  The time to build
+the index of the component class is printed as well.
+
+Example:
+
+  probe_benchmark.py --components 5000 --lookups 1000
+"""
+
+import argparse
+import os
+import random
+import time
+
+from cros.factory.hwid.v3 import common
+from cros.factory.hwid.v3.database import Database
+from cros.factory.hwid.v3.rule import Value
+
+
+_TEST_DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'testdata',
+                                   'test_probe_db.yaml')
+_COMP_CLS = 'generated'
+_FIELD_NAME = 'generated_field'
+
+
+def _LegacyMatch(database, comp_cls, probed_values):
+  def _IsValuesMatch(comp_values):
+    for key, value in comp_values.items():
+      if not isinstance(value, Value):
+        value = Value(value)
+      if key not in probed_values or not value.Matches(probed_values[key]):
+        return False
+    return True
+
+  return [comp_name for comp_name, comp_info in database.GetComponents(
+      comp_cls, include_default=False).items()
+          if comp_info.status != common.COMPONENT_STATUS.duplicate and
+          _IsValuesMatch(comp_info.values)]
+
+
+def _LegacyFieldIndex(database, field_name, components):
+  for index, field_comps in database.GetEncodedField(field_name).items():
+    if all(comp_names == components[comp_cls]
+           for comp_cls, comp_names in field_comps.items()):
+      return index
+  return None
+
+
+def _CreateDatabase(num_components):
+  database = Database.LoadFile(_TEST_DATABASE_PATH, verify_checksum=False)
+  probed_values = []
+  for i in range(num_components):
+    values = {'id': '0x%04x' % i, 'vendor': 'vendor %d' % (i % 7),
+              'name': 'component #%d' % i}
+    probed_values.append(dict(values, revision='rev%d' % (i % 3)))
+    if i % 10 == 0:
+      values['revision'] = Value(r'rev\d+', is_re=True)
+    comp_name = '%s_%d' % (_COMP_CLS, i)
+    database.AddComponent(_COMP_CLS, comp_name, values,
+                          common.COMPONENT_STATUS.supported)
+    if i == 0:
+      database.AddNewEncodedField(_FIELD_NAME, {_COMP_CLS: [comp_name]})
+    else:
+      database.AddEncodedFieldComponents(_FIELD_NAME, {_COMP_CLS: [comp_name]})
+  return database, probed_values
+
+
+def _Bench(func, args_list):
+  """Returns microseconds per call of func, and the results."""
+  start_time = time.time()
+  results = [func(*args) for args in args_list]
+  return (time.time() - start_time) * 1e6 / len(args_list), results
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--components', type=int, default=5000,
+                      help='Number of components in the generated class.')
+  parser.add_argument('--lookups', type=int, default=1000,
+                      help='Number of components looked up.')
+  args = parser.parse_args()
+
+  start_time = time.time()
+  database, probed_values = _CreateDatabase(args.components)
+  print('Database: %d components created in %.2fs' % (
+      args.components, time.time() - start_time))
+
+  start_time = time.time()
+  database.MatchComponents(_COMP_CLS, {})
+  print('%-16s %10.1f ms' % ('index build', (time.time() - start_time) * 1000))
+
+  lookups = random.sample(range(args.components),
+                          min(args.lookups, args.components))
+  match_args = [(database, _COMP_CLS, probed_values[i]) for i in lookups]
+  encode_args = [(database, _FIELD_NAME,
+                  {_COMP_CLS: ['%s_%d' % (_COMP_CLS, i)]}) for i in lookups]
+  for name, legacy_func, indexed_func, args_list in [
+      ('match', _LegacyMatch, Database.MatchComponents, match_args),
+      ('encode', _LegacyFieldIndex, Database.GetEncodedFieldIndex,
+       encode_args)]:
+    legacy_time, legacy_results = _Bench(legacy_func, args_list)
+    indexed_time, indexed_results = _Bench(indexed_func, args_list)
+    assert legacy_results == indexed_results, 'Results are different.'
+    print('%-16s %10.1f us' % (name + ' legacy', legacy_time))
+    print('%-16s %10.1f us' % (name + ' indexed', indexed_time))
+
+
+if __name__ == '__main__':
+  main()
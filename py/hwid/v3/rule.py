@@ -19,6 +19,7 @@ import re
 import threading
 import time
 
+from cros.factory.utils import expression_utils
 from cros.factory.utils import type_utils
 
 
@@ -336,6 +337,7 @@ class Value:
   def __init__(self, raw_value, is_re=False):
     self.raw_value = raw_value
     self.is_re = is_re
+    self._regexp = None
 
   def Matches(self, operand):
     """Matches the value of operand.
@@ -360,11 +362,17 @@ class Value:
         return self.__eq__(operand)
       operand = operand.raw_value
     if self.is_re:
-      return re.match(self.raw_value, operand) is not None
+      # Compile once; a database may have more regular expressions than the
+      # cache of the re module.
+      if self._regexp is None:
+        self._regexp = re.compile(self.raw_value)
+      return self._regexp.match(operand) is not None
     return self.raw_value == operand
 
   def __eq__(self, operand):
-    return isinstance(operand, Value) and self.__dict__ == operand.__dict__
+    return (isinstance(operand, Value) and
+            self.raw_value == operand.raw_value and
+            self.is_re == operand.is_re)
 
   def __ne__(self, operand):
     return not self == operand
@@ -381,4 +389,5 @@ def _Eval(expr, local):
   # pylint: disable=unused-import,unused-variable
   import cros.factory.hwid.v3.common_rule_functions
   import cros.factory.hwid.v3.hwid_rule_functions
-  return eval(expr, _rule_functions, local)  # pylint: disable=eval-used
+  code_object = expression_utils.Compile(expr).code
+  return eval(code_object, _rule_functions, local)  # pylint: disable=eval-used
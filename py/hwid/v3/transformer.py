@@ -38,15 +38,11 @@ def BOMToIdentity(database, bom, brand_code=None, encoded_configless=None):
   encoded_fields = {}
   for field_name, bit_length in database.GetEncodedFieldsBitLength(
       bom.image_id).items():
-    for index, components in database.GetEncodedField(field_name).items():
-      if all(comp_names == bom.components[comp_cls]
-             for comp_cls, comp_names in components.items()):
-        encoded_fields[field_name] = index
-        break
-
-    else:
+    index = database.GetEncodedFieldIndex(field_name, bom.components)
+    if index is None:
       raise common.HWIDException(
           'Encoded field %s has unknown indices' % field_name)
+    encoded_fields[field_name] = index
 
     if encoded_fields[field_name] >= (2 ** bit_length):
       raise common.HWIDException('Index overflow in field %r' % field_name)
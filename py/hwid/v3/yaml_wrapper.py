@@ -16,6 +16,11 @@ from yaml import constructor
 from yaml import nodes
 from yaml import resolver
 
+try:
+  from yaml import CSafeLoader as _CSafeLoader
+except ImportError:
+  _CSafeLoader = None
+
 from cros.factory.hwid.v3 import common
 from cros.factory.hwid.v3 import rule
 from cros.factory.test.l10n import regions
@@ -26,6 +31,23 @@ class V3Loader(SafeLoader):
   """A HWID v3 yaml Loader for patch separation."""
 
 
+# The constructors of V3Loader are shared with V3CLoader, so all constructors
+# registered below are available in both loaders.
+V3Loader.yaml_constructors = SafeLoader.yaml_constructors.copy()
+
+if _CSafeLoader:
+  class V3CLoader(_CSafeLoader):
+    """A HWID v3 yaml Loader which parses with libyaml.
+
+    Only the parser is in C; the documents are constructed by the same
+    constructors as V3Loader, so both loaders return the same objects.
+    """
+    yaml_constructors = V3Loader.yaml_constructors
+  FastLoader = V3CLoader
+else:
+  FastLoader = V3Loader
+
+
 class V3Dumper(SafeDumper):
   """A HWID v3 yaml Dumper for patch separation."""
 
@@ -51,9 +73,9 @@ def _RemoveDummyStringWrapper(func):
 Loader = V3Loader
 Dumper = V3Dumper
 
-# Patch functions to use V3Loader and V3Dumper
-load = functools.partial(load, Loader=Loader)
-load_all = functools.partial(load_all, Loader=Loader)
+# Patch functions to use V3Loader (or V3CLoader if available) and V3Dumper
+load = functools.partial(load, Loader=FastLoader)
+load_all = functools.partial(load_all, Loader=FastLoader)
 add_constructor = functools.partial(add_constructor, Loader=Loader)
 dump = _RemoveDummyStringWrapper(functools.partial(dump, Dumper=Dumper))
 dump_all = _RemoveDummyStringWrapper(functools.partial(dump_all, Dumper=Dumper))
@@ -64,6 +64,7 @@ class Instalog(plugin_sandbox.CoreAPI):
 
     # Create plugin sandboxes.
     self._PreprocessConfigEntries(input_plugins, output_plugins)
+    self._output_policies = {}
     self._buffer = self._ConfigEntryToSandbox(
         plugin_base.BufferPlugin, 'buffer', buffer_plugin)
     self._plugins = {}
@@ -71,6 +72,7 @@ class Instalog(plugin_sandbox.CoreAPI):
         plugin_base.InputPlugin, input_plugins))
     self._plugins.update(self._ConfigEntriesToSandboxes(
         plugin_base.OutputPlugin, output_plugins))
+    self._router = flow_policy.Router(self._output_policies)
 
     # Start the RPC server.
     self._rpc_server = SimpleJSONRPCServer.SimpleJSONRPCServer(
@@ -153,6 +155,8 @@ class Instalog(plugin_sandbox.CoreAPI):
       policy.deny.append(
           flow_policy.HistoryRule(plugin_id=plugin_id,
                                   node_id=self._node_id))
+    if superclass is plugin_base.OutputPlugin:
+      self._output_policies[plugin_id] = policy
 
     # Make sure we have a store_path and data_dir for the plugin.
     store_path = os.path.join(self._data_dir, '%s.json' % plugin_id)
@@ -346,6 +350,10 @@ class Instalog(plugin_sandbox.CoreAPI):
     Raises:
       PluginCallError if Buffer fails unexpectedly.
     """
+    # Find the output plugins for each event once here, instead of checking
+    # the FlowPolicy of every output plugin when it reads the event.
+    for event in events:
+      event.routes = [self._router.version, self._router.Route(event)]
     return self._buffer.CallPlugin('Produce', events)
 
   def NewStream(self, plugin):
@@ -377,6 +385,15 @@ class Instalog(plugin_sandbox.CoreAPI):
     """
     return self._buffer.CallPlugin('ListConsumers')[plugin.plugin_id]
 
+  def GetRoutingVersion(self):
+    """Returns the version of routes set on emitted events.
+
+    Returns:
+      A string which changes whenever the FlowPolicy of any output plugin
+      changes.
+    """
+    return self._router.version
+
   def GetNodeID(self):
     """Returns the ID of this Instalog node.
 
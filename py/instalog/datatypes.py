@@ -75,12 +75,17 @@ class Event(json_utils.Serializable):
     history: A list representing the processing history of this Event.  A list
              of ProcessStage objects.  The first ProcessStage object represents
              the InputPlugin from which the Event originates.
+    routes: Set by Instalog core when the Event is emitted.  A list of
+            [routing version, list of IDs of output plugins accepting the
+            Event], or None.  See flow_policy.Router.  Only meaningful within
+            this Instalog node, so it is not serialized.
   """
 
   def __init__(self, payload, attachments=None, history=None):
     self.payload = payload
     self.attachments = {} if attachments is None else attachments
     self.history = [] if history is None else history
+    self.routes = None
     if not isinstance(self.payload, dict):
       raise TypeError('Provided payload argument must be of type `dict`')
     if not isinstance(self.attachments, dict):
@@ -223,6 +223,13 @@ class TestEvent(unittest.TestCase):
     dct = event.ToDict()
     self.assertEqual(event, datatypes.Event.FromDict(dct))
 
+  def testRoutes(self):
+    """Checks that routes are never serialized."""
+    event = datatypes.Event({'a': 1})
+    event.routes = ['01234567', ['output_a', 'output_b']]
+    self.assertNotIn('routes', event.ToDict())
+    self.assertIsNone(datatypes.Event.Deserialize(event.Serialize()).routes)
+
 
 class TestEventStream(unittest.TestCase):
   """Tests for the EventStream class."""
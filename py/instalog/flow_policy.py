@@ -5,9 +5,15 @@
 """Instalog Event flow policy.
 
 Decides whether or not a plugin should process an Event.
+
+Rules are compiled into plain functions the first time they are used, so that
+the arguments of a rule are not walked again for every Event.  Router compiles
+the policies of all output plugins together, and finds every plugin accepting
+an Event in one pass.
 """
 
-import logging
+import operator
+import zlib
 
 # Name of the key used to specify the rule type in the config dictionary.
 _RULE_TYPE_KEY = 'rule'
@@ -15,6 +21,13 @@ _RULE_TYPE_KEY = 'rule'
 # Registry to store a NAME => CLASS mapping of all the possible rules.
 _rule_registry = {}
 
+# Dispatch keys used by Router.  See Rule.GetDispatchKey.
+DISPATCH_TYPE = 'type'
+DISPATCH_LAST_PLUGIN_ID = 'last_plugin_id'
+
+# Maximum number of entries in the dispatch table of Router before it is reset.
+_MAX_DISPATCH_ENTRIES = 4096
+
 
 class FlowPolicy:
   """A flow policy defines a set of allow and deny rules for Events.
@@ -35,16 +48,57 @@ class FlowPolicy:
     """
     self.allow = [Rule.FromDict(dct) for dct in allow or []]
     self.deny = [Rule.FromDict(dct) for dct in deny or []]
+    self._matcher = None
+    self._matcher_key = None
+
+  def Compile(self):
+    """Returns a function which checks an Event against this policy."""
+    if any(isinstance(rule, AllRule) for rule in self.allow) and not self.deny:
+      return lambda event: True
+    allow = [rule.Compile() for rule in self.allow]
+    deny = [rule.Compile() for rule in self.deny]
+    if not allow:
+      return lambda event: False
+
+    def Match(event):
+      for match in allow:
+        if match(event):
+          break
+      else:
+        return False
+      for match in deny:
+        if match(event):
+          return False
+      return True
+    return Match
 
   def MatchEvent(self, event):
     """Checks an Event against allow and deny rules."""
-    allow = False
+    # Rules may be appended to allow and deny after construction, so compile
+    # again if the number of rules changes.
+    key = (len(self.allow), len(self.deny))
+    if self._matcher_key != key:
+      self._matcher = self.Compile()
+      self._matcher_key = key
+    return self._matcher(event)
+
+  def GetDispatchKeys(self):
+    """Returns dispatch keys, one of which an Event must have to match.
+
+    Returns:
+      A set of (dimension, value) tuples, or None if the policy may match
+      Events without any specific dispatch key.
+    """
+    keys = set()
     for rule in self.allow:
-      allow = allow or rule.MatchEvent(event)
-    deny = False
-    for rule in self.deny:
-      deny = deny or rule.MatchEvent(event)
-    return allow and not deny
+      key = rule.GetDispatchKey()
+      try:
+        keys.add(key)
+      except TypeError:  # Unhashable value in the rule.
+        return None
+      if key is None:
+        return None
+    return keys
 
   def __repr__(self):
     """Implements repr function for debugging."""
@@ -70,7 +124,8 @@ class Rule(metaclass=RuleMeta):
   """Superclass for rules which may or may not match an Event.
 
   Subclasses should define the constants NAME, KEYS, as well as the
-  function MatchEvent.
+  function Compile, which MatchEvent calls once and caches.  Subclasses may
+  also override GetDispatchKey to let FlowPolicy index the rule.
 
   Properties:
     NAME: Defines the name of this rule.
@@ -81,6 +136,7 @@ class Rule(metaclass=RuleMeta):
   def __init__(self, **kwargs):
     """Collects arguments into `args' member."""
     self.args = {}
+    self._matcher = None
     for key in self.KEYS:
       # All arguments are optional.  Ignore any missing ones.
       if key in kwargs:
@@ -107,9 +163,24 @@ class Rule(metaclass=RuleMeta):
       raise ValueError('FlowPolicy: No rule called `%s\'' % rule_name)
     return _rule_registry[rule_name](**dct)
 
+  def Compile(self):
+    """Returns a function which checks whether an event matches this rule."""
+    raise NotImplementedError
+
   def MatchEvent(self, event):
     """Checks whether the provided event matches this rule."""
-    raise NotImplementedError
+    if self._matcher is None:
+      self._matcher = self.Compile()
+    return self._matcher(event)
+
+  def GetDispatchKey(self):
+    """Returns a (dimension, value) tuple every matching event has, or None.
+
+    The dimension is either DISPATCH_TYPE, for the 'type' field of a Testlog
+    event, or DISPATCH_LAST_PLUGIN_ID, for the plugin ID of the last stage in
+    the history of an event.
+    """
+    return None
 
 
 class AllRule(Rule):
@@ -118,9 +189,9 @@ class AllRule(Rule):
   NAME = 'all'
   KEYS = []
 
-  def MatchEvent(self, event):
-    """Checks whether the provided event matches this rule."""
-    return True
+  def Compile(self):
+    """See Rule.Compile."""
+    return lambda event: True
 
 
 class HistoryRule(Rule):
@@ -130,36 +201,40 @@ class HistoryRule(Rule):
   KEYS = ['node_id', 'time', 'plugin_id',
           'plugin_type', 'target', 'position']
 
-  def MatchEvent(self, event):
-    """Checks whether the provided event matches this rule."""
-    for position, process_stage in enumerate(event.history):
-      logging.debug('%s: %r', position, process_stage)
-
-      valid = True
-      for key, operation in self.args.items():
-        # Special case for the 'position' key.
-        if key == 'position':
-          lhs = position
-          # If the specified position is negative, we need to
-          # check against the negated index.
-          if operation.rhs < 0:
-            lhs -= len(event.history)
-        else:
-          lhs = getattr(process_stage, key)
-
-        # Apply the operation to check the lhs.
-        logging.debug('Checking %s %s...', lhs, operation)
-        valid = valid and operation.Apply(lhs)
-        if not valid:
-          logging.debug('Short-circuit break')
-          break
-
-      if valid:
-        logging.debug('Checked all arguments, matches')
-        return True
-
-    logging.debug('All history stages failed, no match')
-    return False
+  def Compile(self):
+    """See Rule.Compile."""
+    # Currently only the '==' operator is supported, so a stage matches when
+    # the tuple of its attributes equals the tuple of expected values.
+    keys = [key for key in self.args if key != 'position']
+    expected = tuple(self.args[key].rhs for key in keys)
+    if keys:
+      get_attrs = operator.attrgetter(*keys)
+      if len(keys) == 1:
+        expected = expected[0]
+      def MatchStage(process_stage):
+        return get_attrs(process_stage) == expected
+    else:
+      MatchStage = lambda process_stage: True
+
+    if 'position' not in self.args:
+      return lambda event: any(map(MatchStage, event.history))
+
+    # A negative position counts from the end of the history, the same as a
+    # negative index of the list.
+    position = self.args['position'].rhs
+    def Match(event):
+      history = event.history
+      if -len(history) <= position < len(history):
+        return MatchStage(history[position])
+      return False
+    return Match
+
+  def GetDispatchKey(self):
+    """See Rule.GetDispatchKey."""
+    if 'plugin_id' in self.args and 'position' in self.args:
+      if self.args['position'].rhs == -1:
+        return (DISPATCH_LAST_PLUGIN_ID, self.args['plugin_id'].rhs)
+    return None
 
 
 class TestlogRule(Rule):
@@ -170,20 +245,23 @@ class TestlogRule(Rule):
   NAME = 'testlog'
   KEYS = ['type']
 
-  def MatchEvent(self, event):
-    """Checks whether the provided event matches this rule."""
-    for key, operation in self.args.items():
-      lhs = event.get(key, None)
-      if not lhs:
-        logging.debug('The %s is not in the event', key)
-        return False
-
-      # Apply the operation to check the lhs.
-      logging.debug('Checking %s %s...', lhs, operation)
-      if not operation.Apply(lhs):
-        return False
-
-    return True
+  def Compile(self):
+    """See Rule.Compile."""
+    items = [(key, operation.rhs) for key, operation in self.args.items()]
+    def Match(event):
+      for key, rhs in items:
+        lhs = event.get(key, None)
+        # Missing and empty fields never match.
+        if not lhs or lhs != rhs:
+          return False
+      return True
+    return Match
+
+  def GetDispatchKey(self):
+    """See Rule.GetDispatchKey."""
+    if 'type' in self.args:
+      return (DISPATCH_TYPE, self.args['type'].rhs)
+    return None
 
 
 class RHSOperation:
@@ -207,3 +285,56 @@ class RHSOperation:
   def __eq__(self, other):
     """Implements == operator."""
     return self.rhs == other.rhs
+
+
+class Router:
+  """Finds all output plugins whose FlowPolicy matches an Event in one pass.
+
+  Policies are compiled once.  For each combination of Testlog type and last
+  history plugin ID seen, the plugins which may accept such events are stored
+  in a dispatch table, so that only their policies are checked.
+  """
+
+  def __init__(self, policies):
+    """Constructor.
+
+    Args:
+      policies: A dict mapping plugin IDs to FlowPolicy objects.
+    """
+    # The version changes whenever any policy changes, so that routes set on
+    # events are ignored after the configuration is changed.
+    self.version = '%08x' % zlib.crc32(repr(sorted(
+        (plugin_id, repr(policy))
+        for plugin_id, policy in policies.items())).encode('utf-8'))
+    self._plugins = []
+    for plugin_id, policy in sorted(policies.items()):
+      if not policy.allow:
+        continue
+      self._plugins.append(
+          (plugin_id, policy.Compile(), policy.GetDispatchKeys()))
+    self._table = {}
+
+  def _GetCandidates(self, dispatch_keys):
+    """Returns (plugin ID, matcher) of plugins which may match the keys."""
+    return [(plugin_id, matcher)
+            for plugin_id, matcher, keys in self._plugins
+            if keys is None or not keys.isdisjoint(dispatch_keys)]
+
+  def Route(self, event):
+    """Returns a sorted list of plugin IDs whose FlowPolicy matches event."""
+    history = event.history
+    dispatch_keys = (
+        (DISPATCH_TYPE, event.get('type')),
+        (DISPATCH_LAST_PLUGIN_ID, history[-1].plugin_id if history else None))
+    try:
+      candidates = self._table.get(dispatch_keys)
+      if candidates is None:
+        if len(self._table) >= _MAX_DISPATCH_ENTRIES:
+          self._table.clear()
+        candidates = self._table[dispatch_keys] = self._GetCandidates(
+            dispatch_keys)
+    except TypeError:
+      # The type field is unhashable, so check all policies.
+      candidates = [(plugin_id, matcher)
+                    for plugin_id, matcher, unused_keys in self._plugins]
+    return [plugin_id for plugin_id, matcher in candidates if matcher(event)]
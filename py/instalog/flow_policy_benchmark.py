@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for routing events to output plugins by FlowPolicy.
+
+Compares checking the FlowPolicy of every output plugin for every event (what
+each output plugin does without routes) against one Router.Route call per event
+(what Instalog core does on Emit).
+
+Events are read from a recorded stream if given, either a file with one
+serialized event per line, or the data file of a file-based buffer.  Otherwise
+a stream of Testlog-like events is generated.
+
+Example:
+
+  flow_policy_benchmark.py --outputs 12 --events-file /path/to/data.json
+"""
+
+import argparse
+import json
+import logging
+import random
+import time
+
+from cros.factory.instalog import datatypes
+from cros.factory.instalog import flow_policy
+
+
+_NODE_ID = 'benchmark_node'
+_INPUT_PLUGIN_IDS = ['input_testlog', 'input_http', 'input_log_file']
+_TESTLOG_TYPES = ['station.test_run', 'station.message', 'station.status',
+                  'station.init']
+
+
+def _LoadEvents(path):
+  """Loads events from a file of serialized events or buffer records."""
+  events = []
+  with open(path) as f:
+    for line in f:
+      line = line.strip()
+      if not line:
+        continue
+      if line.startswith('['):
+        # A record of file-based buffers: [SEQ, {EVENT}, "CRC"]
+        record = json.loads(line)
+        if len(record) == 3 and isinstance(record[0], int):
+          line = json.dumps(record[1])
+      events.append(datatypes.Event.Deserialize(line))
+  return events
+
+
+def _GenerateEvents(count):
+  """Generates Testlog-like events emitted by a few input plugins."""
+  rand = random.Random(0)
+  events = []
+  for unused_i in range(count):
+    event = datatypes.Event({'type': rand.choice(_TESTLOG_TYPES),
+                             'stationDeviceId': 'station'})
+    plugin_id = rand.choice(_INPUT_PLUGIN_IDS)
+    event.AppendStage(datatypes.ProcessStage(
+        node_id=_NODE_ID, time=time.time(), plugin_id=plugin_id,
+        plugin_type=plugin_id, target=datatypes.ProcessStage.BUFFER))
+    events.append(event)
+  return events
+
+
+def _CreatePolicies(count):
+  """Creates policies like core does for a typical configuration."""
+  policies = {}
+  for i in range(count):
+    plugin_id = 'output_%d' % i
+    kind = i % 3
+    if kind == 0:
+      # Targeted by an input plugin.
+      allow = [{'rule': 'history', 'plugin_id': _INPUT_PLUGIN_IDS[
+          i % len(_INPUT_PLUGIN_IDS)], 'position': -1}]
+    elif kind == 1:
+      allow = [{'rule': 'testlog', 'type': _TESTLOG_TYPES[i % 2]}]
+    else:
+      allow = [{'rule': 'all'}]
+    deny = [{'rule': 'testlog', 'type': 'station.status'}] if kind == 2 else []
+    policy = flow_policy.FlowPolicy(allow, deny)
+    # Disallow recursion, like core does.
+    policy.deny.append(
+        flow_policy.HistoryRule(plugin_id=plugin_id, node_id=_NODE_ID))
+    policies[plugin_id] = policy
+  return policies
+
+
+def _Measure(func, events, repeat):
+  start_time = time.time()
+  for unused_i in range(repeat):
+    for event in events:
+      func(event)
+  return len(events) * repeat / (time.time() - start_time)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--outputs', type=int, default=12,
+                      help='Number of output plugins.')
+  parser.add_argument('--events', type=int, default=50000,
+                      help='Number of events to generate.')
+  parser.add_argument('--events-file',
+                      help='Recorded stream of events to use instead.')
+  parser.add_argument('--repeat', type=int, default=3,
+                      help='Times to go through the stream.')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.WARNING)
+
+  if args.events_file:
+    events = _LoadEvents(args.events_file)
+  else:
+    events = _GenerateEvents(args.events)
+  policies = _CreatePolicies(args.outputs)
+  router = flow_policy.Router(policies)
+
+  def MatchEveryPolicy(event):
+    return [plugin_id for plugin_id, policy in policies.items()
+            if policy.MatchEvent(event)]
+
+  for event in events:
+    assert sorted(MatchEveryPolicy(event)) == router.Route(event)
+
+  print('%d events, %d outputs' % (len(events), len(policies)))
+  print('%-28s %10.0f events/s' % (
+      'FlowPolicy per output:', _Measure(MatchEveryPolicy, events,
+                                         args.repeat)))
+  print('%-28s %10.0f events/s' % (
+      'Router.Route:', _Measure(router.Route, events, args.repeat)))
+
+
+if __name__ == '__main__':
+  main()
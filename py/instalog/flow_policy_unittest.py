@@ -156,6 +156,69 @@ class TestTestlogRule(unittest.TestCase):
         datatypes.Event({'type': 'station.test_run'})))
 
 
+class TestRouter(unittest.TestCase):
+
+  def _CreatePolicies(self):
+    return {
+        'all': flow_policy.FlowPolicy(allow=[{'rule': 'all'}]),
+        'nothing': flow_policy.FlowPolicy(),
+        'test_run': flow_policy.FlowPolicy(
+            allow=[{'rule': 'testlog', 'type': 'station.test_run'}]),
+        'not_message': flow_policy.FlowPolicy(
+            allow=[{'rule': 'all'}],
+            deny=[{'rule': 'testlog', 'type': 'station.message'}]),
+        'target': flow_policy.FlowPolicy(
+            allow=[{'rule': 'history', 'plugin_id': 'plugin_id2',
+                    'position': -1},
+                   {'rule': 'testlog', 'type': 'station.status'}]),
+        'node': flow_policy.FlowPolicy(
+            allow=[{'rule': 'history', 'node_id': 'node_id1'}]),
+    }
+
+  def _CreateEvents(self):
+    events = []
+    for event_type in [None, 'station.test_run', 'station.message',
+                       'station.status', ['unhashable']]:
+      for history in [[], [_SAMPLE_PROCESS_STAGE1],
+                      [_SAMPLE_PROCESS_STAGE1, _SAMPLE_PROCESS_STAGE2]]:
+        payload = {} if event_type is None else {'type': event_type}
+        events.append(datatypes.Event(payload, history=list(history)))
+    return events
+
+  def testRouteSameAsMatchEvent(self):
+    policies = self._CreatePolicies()
+    router = flow_policy.Router(policies)
+    # Route twice to check results from the dispatch table.
+    for unused_i in range(2):
+      for event in self._CreateEvents():
+        expected = sorted(plugin_id for plugin_id, policy in policies.items()
+                          if policy.MatchEvent(event))
+        self.assertEqual(expected, router.Route(event))
+
+  def testDispatchKeys(self):
+    policies = self._CreatePolicies()
+    self.assertIsNone(policies['all'].GetDispatchKeys())
+    self.assertEqual(set(), policies['nothing'].GetDispatchKeys())
+    self.assertEqual({(flow_policy.DISPATCH_LAST_PLUGIN_ID, 'plugin_id2'),
+                      (flow_policy.DISPATCH_TYPE, 'station.status')},
+                     policies['target'].GetDispatchKeys())
+    self.assertIsNone(policies['node'].GetDispatchKeys())
+
+  def testVersion(self):
+    version = flow_policy.Router(self._CreatePolicies()).version
+    self.assertEqual(version,
+                     flow_policy.Router(self._CreatePolicies()).version)
+    policies = self._CreatePolicies()
+    policies['all'].deny.append(flow_policy.HistoryRule(plugin_id='a'))
+    self.assertNotEqual(version, flow_policy.Router(policies).version)
+
+  def testPolicyRecompiledAfterAppend(self):
+    policy = flow_policy.FlowPolicy(allow=[{'rule': 'all'}])
+    self.assertTrue(policy.MatchEvent(_SAMPLE_EVENT))
+    policy.deny.append(flow_policy.HistoryRule(plugin_id='plugin_id1'))
+    self.assertFalse(policy.MatchEvent(_SAMPLE_EVENT))
+
+
 if __name__ == '__main__':
   log_utils.InitLogging(log_utils.GetStreamHandler(logging.INFO))
   unittest.main()
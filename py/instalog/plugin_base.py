@@ -289,6 +289,20 @@ class BufferEventStream:
     """Returns the next available Event."""
     raise NotImplementedError
 
+  def NextBatch(self, count):
+    """Returns a list of up to `count` next available Events.
+
+    Buffers may override this to retrieve Events more efficiently than with
+    repeated Next calls.  An empty list means no Events are available.
+    """
+    events = []
+    while len(events) < count:
+      event = self.Next()
+      if event is None:
+        break
+      events.append(event)
+    return events
+
   def Commit(self):
     """Marks this batch of Events as successfully processed.
 
@@ -63,6 +63,10 @@ class CoreAPI:
     """See Core.GetNodeID."""
     raise NotImplementedError
 
+  def GetRoutingVersion(self):
+    """See Core.GetRoutingVersion."""
+    return None
+
 
 class PluginSandbox(plugin_base.PluginAPI, log_utils.LoggerMixin):
   """Represents a running instance of a particular plugin.
@@ -619,6 +623,8 @@ class PluginSandbox(plugin_base.PluginAPI, log_utils.LoggerMixin):
           plugin_type=self.plugin_type,
           target=datatypes.ProcessStage.EXTERNAL)
       ret.AppendStage(process_stage)
+      # Routes are only meaningful within this Instalog node.
+      ret.routes = None
     return ret
 
   def _NextMatchingEvent(self, plugin_stream, timeout):
@@ -631,9 +637,17 @@ class PluginSandbox(plugin_base.PluginAPI, log_utils.LoggerMixin):
     Returns:
       None if timeout or no events are available.
     """
+    routing_version = self._core_api.GetRoutingVersion()
     try:
       def CheckEvent(event):
-        return event is None or self._policy.MatchEvent(event)
+        if event is None:
+          return True
+        # Use the routes found by Instalog core when the event was emitted, if
+        # they were found with the current policies.
+        if (routing_version is not None and event.routes and
+            event.routes[0] == routing_version):
+          return self.plugin_id in event.routes[1]
+        return self._policy.MatchEvent(event)
 
       return sync_utils.PollForCondition(
           poll_method=self._event_stream_map[plugin_stream].Next,
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Microbenchmark for the read path of file-based buffer consumers.
+
+Fills a BufferSimpleFile once, then drains it with a fresh consumer for each
+configuration: the default 4 KB read-ahead with one Next call per event, and
+each given read-ahead size with NextBatch.  Reports events per second.
+
+Example:
+
+  buffer_consumer_benchmark.py --events 200000 --read-ahead-mb 1 4 16
+"""
+
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+
+from cros.factory.instalog import datatypes
+from cros.factory.instalog.plugins import buffer_simple_file
+
+
+_PRODUCE_BATCH_SIZE = 1000
+
+
+def _CreateBuffer(data_dir, read_ahead_bytes, segment_size):
+  buf = buffer_simple_file.BufferSimpleFile(
+      config={'read_ahead_bytes': read_ahead_bytes,
+              'segment_size': segment_size,
+              'enable_fsync': False},
+      logger_name='buffer_consumer_benchmark',
+      store={},
+      plugin_api=None)
+  buf.GetDataDir = lambda: data_dir
+  buf.SetUp()
+  return buf
+
+
+def _Drain(buf, consumer_id, batch_size):
+  """Consumes all events, and returns (event_count, seconds)."""
+  buf.AddConsumer(consumer_id)
+  count = 0
+  start_time = time.time()
+  stream = buf.Consume(consumer_id)
+  while True:
+    if batch_size:
+      events = stream.NextBatch(batch_size)
+    else:
+      event = stream.Next()
+      events = [event] if event else []
+    if not events:
+      break
+    count += len(events)
+  stream.Commit()
+  return count, time.time() - start_time
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--events', type=int, default=100000,
+                      help='Number of events in the buffer.')
+  parser.add_argument('--payload-size', type=int, default=512,
+                      help='Payload size of each event in bytes.')
+  parser.add_argument('--batch-size', type=int, default=1000,
+                      help='Number of events to retrieve with NextBatch.')
+  parser.add_argument('--read-ahead-mb', type=int, nargs='+',
+                      default=[1, 4, 16],
+                      help='Read-ahead sizes to compare with the default.')
+  parser.add_argument('--segment-size', type=int, default=0,
+                      help='segment_size of the buffer.')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.WARNING)
+
+  data_dir = tempfile.mkdtemp(prefix='buffer_consumer_benchmark_')
+  try:
+    buf = _CreateBuffer(data_dir, 0, args.segment_size)
+    event = datatypes.Event({'payload': 'x' * args.payload_size})
+    for unused_i in range(0, args.events, _PRODUCE_BATCH_SIZE):
+      buf.Produce([event.Copy() for unused_j in range(_PRODUCE_BATCH_SIZE)])
+
+    configs = [('4 KB read-ahead, Next', 0, 0)]
+    configs.extend(('%d MB read-ahead, NextBatch(%d)' % (mb, args.batch_size),
+                    mb * 1024 * 1024, args.batch_size)
+                   for mb in args.read_ahead_mb)
+    for i, (name, read_ahead_bytes, batch_size) in enumerate(configs):
+      buf.buffer_file.read_ahead_bytes = read_ahead_bytes
+      count, seconds = _Drain(buf, 'consumer_%d' % i, batch_size)
+      print('%-36s %8d events in %6.2fs: %9.0f events/s' % (
+          name, count, seconds, count / seconds))
+  finally:
+    shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for file-based buffers while truncation is running.
+
+Prefills a BufferSimpleFile, then runs one producer thread, one consumer thread
+and one truncating thread against it for a fixed duration.  Throughput of the
+producer and consumer is sampled every interval, so that stalls caused by
+Truncate show up as dips in the minimum.  Both the single data file and the
+segmented storage modes are measured by default.
+
+Example:
+
+  buffer_file_benchmark.py --prefill-mb 512 --duration 30
+"""
+
+import argparse
+import logging
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from cros.factory.instalog import datatypes
+from cros.factory.instalog.plugins import buffer_simple_file
+
+
+_CONSUMER_ID = 'benchmark'
+_PRODUCE_BATCH_SIZE = 100
+_CONSUME_BATCH_SIZE = 1000
+
+
+def _MakeEvent(payload_size):
+  return datatypes.Event({'payload': 'x' * payload_size})
+
+
+def _CreateBuffer(data_dir, segment_size):
+  buf = buffer_simple_file.BufferSimpleFile(
+      config={'segment_size': segment_size, 'enable_fsync': False},
+      logger_name='buffer_file_benchmark',
+      store={},
+      plugin_api=None)
+  buf.GetDataDir = lambda: data_dir
+  buf.SetUp()
+  buf.AddConsumer(_CONSUMER_ID)
+  return buf
+
+
+def _Prefill(buf, prefill_bytes, payload_size):
+  """Fills the buffer, and marks most of it as consumed."""
+  event_count = prefill_bytes // payload_size
+  for unused_i in range(0, event_count, _PRODUCE_BATCH_SIZE):
+    buf.Produce([_MakeEvent(payload_size)
+                 for unused_j in range(_PRODUCE_BATCH_SIZE)])
+  # Consume 90% of the prefilled data, so that each Truncate has plenty to
+  # remove and plenty to keep.
+  stream = buf.Consume(_CONSUMER_ID)
+  for unused_i in range(event_count * 9 // 10):
+    stream.Next()
+  stream.Commit()
+  return event_count
+
+
+def RunBenchmark(segment_size, prefill_bytes, payload_size, duration,
+                 interval):
+  """Runs the benchmark against one storage mode.
+
+  Returns:
+    A dict of results, with per-interval produce and consume rates in events
+    per second, and the durations of each Truncate call in seconds.
+  """
+  data_dir = tempfile.mkdtemp(prefix='buffer_file_benchmark_')
+  try:
+    buf = _CreateBuffer(data_dir, segment_size)
+    _Prefill(buf, prefill_bytes, payload_size)
+
+    stop_event = threading.Event()
+    counters = {'produced': 0, 'consumed': 0}
+    truncate_durations = []
+
+    def Producer():
+      while not stop_event.is_set():
+        buf.Produce([_MakeEvent(payload_size)
+                     for unused_i in range(_PRODUCE_BATCH_SIZE)])
+        counters['produced'] += _PRODUCE_BATCH_SIZE
+
+    def Consumer():
+      while not stop_event.is_set():
+        stream = buf.Consume(_CONSUMER_ID)
+        count = 0
+        while count < _CONSUME_BATCH_SIZE and stream.Next():
+          count += 1
+        stream.Commit()
+        counters['consumed'] += count
+
+    def Truncater():
+      while not stop_event.is_set():
+        start_time = time.time()
+        buf.buffer_file.Truncate()
+        truncate_durations.append(time.time() - start_time)
+        stop_event.wait(interval)
+
+    threads = [threading.Thread(target=target)
+               for target in (Producer, Consumer, Truncater)]
+    for t in threads:
+      t.start()
+
+    produce_rates = []
+    consume_rates = []
+    last = dict(counters)
+    end_time = time.time() + duration
+    while time.time() < end_time:
+      time.sleep(interval)
+      produce_rates.append((counters['produced'] - last['produced']) / interval)
+      consume_rates.append((counters['consumed'] - last['consumed']) / interval)
+      last = dict(counters)
+    stop_event.set()
+    for t in threads:
+      t.join()
+    return {'produce_rates': produce_rates,
+            'consume_rates': consume_rates,
+            'truncate_durations': truncate_durations}
+  finally:
+    shutil.rmtree(data_dir)
+
+
+def _FormatRates(rates):
+  return 'min=%8.0f median=%8.0f max=%8.0f events/s' % (
+      min(rates), statistics.median(rates), max(rates))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--prefill-mb', type=int, default=256,
+                      help='Size of data in the buffer before starting.')
+  parser.add_argument('--payload-size', type=int, default=1024,
+                      help='Payload size of each event in bytes.')
+  parser.add_argument('--duration', type=float, default=20,
+                      help='Seconds to run each storage mode for.')
+  parser.add_argument('--interval', type=float, default=0.5,
+                      help='Seconds between throughput samples.')
+  parser.add_argument('--segment-size', type=int, default=16 * 1024 * 1024,
+                      help='segment_size to use for the segmented mode.')
+  parser.add_argument('--mode', choices=('single', 'segmented', 'both'),
+                      default='both')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.WARNING)
+
+  modes = []
+  if args.mode in ('single', 'both'):
+    modes.append(('single data file', 0))
+  if args.mode in ('segmented', 'both'):
+    modes.append(('segmented', args.segment_size))
+  for name, segment_size in modes:
+    results = RunBenchmark(segment_size, args.prefill_mb * 1024 * 1024,
+                           args.payload_size, args.duration, args.interval)
+    print('%s:' % name)
+    print('  produce:  %s' % _FormatRates(results['produce_rates']))
+    print('  consume:  %s' % _FormatRates(results['consume_rates']))
+    durations = results['truncate_durations']
+    print('  truncate: %d calls, median=%.3fs max=%.3fs' % (
+        len(durations), statistics.median(durations), max(durations)))
+
+
+if __name__ == '__main__':
+  main()
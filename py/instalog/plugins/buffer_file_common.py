@@ -69,13 +69,45 @@ Versioning:
   Thus, if a failure occurs *before* writing the main data file, the "old"
   metadata can be used.  If a failure occurs *after* writing the main data file,
   the "new" metadata can be used.
+
+
+Segmented mode:
+
+  When `segment_size` is set, data.json is replaced by a directory of segment
+  files, so that Truncate never needs to rewrite data that is still pending:
+
+    segments/<START_POS>.json:
+
+      Stores records in exactly the same format as data.json.  START_POS is the
+      absolute position of the segment's first byte, so a cursor position is
+      resolved by finding the last segment starting at or before it.  Records
+      are appended to the last segment until it grows beyond `segment_size`,
+      after which a new segment is started at the current end position.
+
+    segments/<START_POS>.json.index:
+
+      A sparse index of the segment, with one "SEQ OFFSET" line written every
+      _INDEX_INTERVAL_BYTES.  The index is advisory: each entry is verified
+      against the CRC of the record it points to before being trusted, and it
+      is only used to find the first record of a segment and to bound the scan
+      when recovering metadata.
+
+  Truncate only unlinks segments which lie entirely before the first
+  unconsumed record.  The versioning scheme stays the same, except that the
+  version is the CRC of the first line of the first segment on disk.  If a
+  failure occurs while unlinking several segments, neither version will match
+  and metadata is recovered from the remaining segments.
 """
 
+import bisect
+import collections
 import copy
 import json
 import logging
 import os
 import shutil
+import threading
+import time
 import zlib
 
 from cros.factory.instalog import datatypes
@@ -85,8 +117,17 @@ from cros.factory.instalog import plugin_base
 from cros.factory.instalog.utils import file_utils
 
 
-# The number of bytes to buffer when retrieving events from a file.
+# The number of bytes to buffer when retrieving events from a file, unless
+# read_ahead_bytes is configured.
 _BUFFER_SIZE_BYTES = 4 * 1024  # 4kb
+# The minimum number of bytes to read from a file at once.
+_MIN_READ_CHUNK_BYTES = 4 * 1024  # 4kb
+
+# Segment files are named after the absolute position of their first byte.
+_SEGMENT_NAME_FORMAT = '%020d.json'
+_SEGMENT_INDEX_SUFFIX = '.index'
+# The number of bytes written to a segment between two sparse index entries.
+_INDEX_INTERVAL_BYTES = 64 * 1024  # 64kb
 
 
 class SimpleFileException(Exception):
@@ -126,17 +167,18 @@ def ParseRecord(line, logger_name=None):
   Returns:
     A tuple of (seq_number, record), or None on failure.
   """
-  logger = logging.getLogger(logger_name)
   line_inner = line.rstrip()[1:-1]  # Strip [] and newline
   data, _, checksum = line_inner.rpartition(', ')
   # TODO(chuntsen): Change this method after a long time.
   checksum = checksum.strip('"')
   seq, _, record = data.partition(', ')
   if not seq or not record:
-    logger.warning('Parsing error for record %s', line.rstrip())
+    logging.getLogger(logger_name).warning(
+        'Parsing error for record %s', line.rstrip())
     return None, None
   if checksum != GetChecksum(data) and checksum != GetChecksumLegacy(data):
-    logger.warning('Checksum error for record %s', line.rstrip())
+    logging.getLogger(logger_name).warning(
+        'Checksum error for record %s', line.rstrip())
     return None, None
   return int(seq), record
 
@@ -163,8 +205,29 @@ def TryLoadJSON(path, logger_name=None):
     raise
 
 
-def CopyAttachmentsToTempDir(att_paths, tmp_dir, logger_name=None):
-  """Copys attachments to the temporary directory."""
+def _CopyFile(src_path, dst_path):
+  """Copies a file with os.sendfile, without passing data through Python."""
+  with open(src_path, 'rb') as src_f, open(dst_path, 'wb') as dst_f:
+    size = os.fstat(src_f.fileno()).st_size
+    offset = 0
+    while offset < size:
+      sent = os.sendfile(dst_f.fileno(), src_f.fileno(), offset, size - offset)
+      if sent == 0:
+        break
+      offset += sent
+
+
+def CopyAttachmentsToTempDir(att_paths, tmp_dir, logger_name=None, link=False):
+  """Copys attachments to the temporary directory.
+
+  Args:
+    att_paths: List of paths of attachments.
+    tmp_dir: The temporary directory to put the attachments in.
+    logger_name: Name of the logger to use.
+    link: Try to hard link the attachments instead of copying them.  Only safe
+          when the source files are removed afterwards.  Falls back to copying
+          when the source is on another filesystem.
+  """
   logger = logging.getLogger(logger_name)
   try:
     for att_path in att_paths:
@@ -173,15 +236,21 @@ def CopyAttachmentsToTempDir(att_paths, tmp_dir, logger_name=None):
         raise ValueError('Attachment path `%s` specified in event does not '
                          'exist' % att_path)
       target_path = os.path.join(tmp_dir, att_path.replace('/', '_'))
-      logger.debug('Copying attachment: %s --> %s',
-                   att_path, target_path)
-      with open(target_path, 'w') as dst_f:
-        with open(att_path, 'r') as src_f:
-          shutil.copyfileobj(src_f, dst_f)
-        # Fsync the file and the containing directory to make sure it
-        # is flushed to disk.
-        dst_f.flush()
-        os.fdatasync(dst_f)
+      linked = False
+      if link:
+        try:
+          os.link(att_path, target_path)
+          linked = True
+        except OSError:
+          pass
+      if linked:
+        logger.debug('Linking attachment: %s --> %s', att_path, target_path)
+      else:
+        logger.debug('Copying attachment: %s --> %s', att_path, target_path)
+        _CopyFile(att_path, target_path)
+      # Fsync the file to make sure it is flushed to disk.
+      with open(target_path, 'rb') as f:
+        os.fdatasync(f.fileno())
     # Fsync the containing directory to make sure all attachments are flushed
     # to disk.
     dirfd = os.open(tmp_dir, os.O_DIRECTORY)
@@ -193,8 +262,124 @@ def CopyAttachmentsToTempDir(att_paths, tmp_dir, logger_name=None):
     return False
 
 
+def IsSegmented(config_dct):
+  """Returns whether the buffer stores its data in segment files."""
+  return bool(config_dct.get('segment_size'))
+
+
+def SegmentPath(config_dct, seg_start):
+  """Returns the path of the segment starting at absolute position seg_start."""
+  return os.path.join(config_dct['segments_dir'],
+                      _SEGMENT_NAME_FORMAT % seg_start)
+
+
+def SegmentIndexPath(config_dct, seg_start):
+  """Returns the path of the sparse index of the given segment."""
+  return SegmentPath(config_dct, seg_start) + _SEGMENT_INDEX_SUFFIX
+
+
+def ListSegments(config_dct):
+  """Returns a sorted list of the start positions of segments on disk."""
+  return sorted(int(fname[:-5])
+                for fname in os.listdir(config_dct['segments_dir'])
+                if fname.endswith('.json') and fname[:-5].isdigit())
+
+
+def LocateSegment(seg_starts, pos):
+  """Returns the index of the segment containing pos, or -1 if none does."""
+  return bisect.bisect_right(seg_starts, pos) - 1
+
+
+def ReadSegmentIndex(config_dct, seg_start, max_offset=None):
+  """Returns the (seq, offset) entries of a segment's sparse index.
+
+  Unparsable entries, and entries pointing at or beyond max_offset, are
+  ignored.  A missing index file is treated as an empty index.
+  """
+  entries = []
+  try:
+    with open(SegmentIndexPath(config_dct, seg_start), 'r') as f:
+      for line in f:
+        seq, _, offset = line.strip().partition(' ')
+        if not seq.isdigit() or not offset.isdigit():
+          continue
+        if max_offset is not None and int(offset) >= max_offset:
+          continue
+        entries.append((int(seq), int(offset)))
+  except IOError:
+    pass
+  return entries
+
+
+def ScanSegment(config_dct, seg_start, offset=0, max_offset=None):
+  """Yields (seq, offset, size) for each line of a segment.
+
+  seq is None for lines which fail to parse.  Scanning stops before any line
+  which would extend beyond max_offset.
+  """
+  with open(SegmentPath(config_dct, seg_start), 'r') as f:
+    f.seek(offset)
+    for line in f:
+      size = len(line)
+      if max_offset is not None and offset + size > max_offset:
+        return
+      seq, _unused_record = ParseRecord(line, config_dct['logger_name'])
+      yield seq, offset, size
+      offset += size
+
+
+def _ReadFirstLine(config_dct, seg_starts):
+  """Returns the first line of data on disk, used to compute the version.
+
+  Raises:
+    IOError if the data file is missing in single-file mode.
+  """
+  if not IsSegmented(config_dct):
+    with open(config_dct['data_path'], 'r') as f:
+      return f.readline()
+  if not seg_starts:
+    return ''
+  with open(SegmentPath(config_dct, seg_starts[0]), 'r') as f:
+    return f.readline()
+
+
+def _GetStoredEndPos(config_dct, metadata_dct, seg_starts):
+  """Returns the absolute position of the last byte of data on disk."""
+  if not IsSegmented(config_dct):
+    return (metadata_dct['start_pos'] +
+            os.path.getsize(config_dct['data_path']))
+  if not seg_starts:
+    return metadata_dct['start_pos']
+  return seg_starts[-1] + os.path.getsize(
+      SegmentPath(config_dct, seg_starts[-1]))
+
+
+def _HasDataFile(config_dct, seg_starts):
+  """Returns whether any data file exists on disk."""
+  if not IsSegmented(config_dct):
+    return os.path.isfile(config_dct['data_path'])
+  return bool(seg_starts)
+
+
+def _RelocateAttachments(config_dct, event, seq):
+  """Moves the attachments of an event into the attachments directory."""
+  logger = logging.getLogger(config_dct['logger_name'])
+  for att_id, att_path in event.attachments.items():
+    target_name = '%s_%s' % (seq, att_id)
+    target_path = os.path.join(config_dct['attachments_dir'], target_name)
+    event.attachments[att_id] = target_name
+    logger.debug('Relocating attachment %s: %s --> %s',
+                 att_id, att_path, target_path)
+    # Note: This could potentially overwrite an existing file that got
+    # written just before Instalog process stopped unexpectedly.
+    os.rename(att_path, target_path)
+
+
 def MoveAndWrite(config_dct, events):
   """Moves the atts, serializes the events and writes them to the data_path."""
+  if IsSegmented(config_dct):
+    MoveAndWriteSegments(config_dct, events)
+    return
   logger = logging.getLogger(config_dct['logger_name'])
   metadata_dct = RestoreMetadata(config_dct)
   cur_seq = metadata_dct['last_seq'] + 1
@@ -211,15 +396,7 @@ def MoveAndWrite(config_dct, events):
     f.seek(0, 2)  # 2 means use EOF as the reference point.
     assert f.tell() == cur_pos
     for event in events:
-      for att_id, att_path in event.attachments.items():
-        target_name = '%s_%s' % (cur_seq, att_id)
-        target_path = os.path.join(config_dct['attachments_dir'], target_name)
-        event.attachments[att_id] = target_name
-        logger.debug('Relocating attachment %s: %s --> %s',
-                     att_id, att_path, target_path)
-        # Note: This could potentially overwrite an existing file that got
-        # written just before Instalog process stopped unexpectedly.
-        os.rename(att_path, target_path)
+      _RelocateAttachments(config_dct, event, cur_seq)
 
       logger.debug('Writing event with cur_seq=%d, cur_pos=%d',
                    cur_seq, cur_pos)
@@ -247,6 +424,108 @@ def MoveAndWrite(config_dct, events):
   SaveMetadata(config_dct, metadata_dct)
 
 
+def _DiscardUncommittedSegments(config_dct, metadata_dct):
+  """Removes data written after end_pos by a previously unfinished transaction.
+
+  Returns:
+    A sorted list of the start positions of the remaining segments.
+  """
+  logger = logging.getLogger(config_dct['logger_name'])
+  end_pos = metadata_dct['end_pos']
+  seg_starts = ListSegments(config_dct)
+  while seg_starts and seg_starts[-1] >= end_pos:
+    seg_start = seg_starts.pop()
+    logger.warning('Removing uncommitted segment at pos=%d', seg_start)
+    os.unlink(SegmentPath(config_dct, seg_start))
+    file_utils.TryUnlink(SegmentIndexPath(config_dct, seg_start))
+  if seg_starts:
+    seg_start = seg_starts[-1]
+    committed_size = end_pos - seg_start
+    with open(SegmentPath(config_dct, seg_start), 'a') as f:
+      f.truncate(committed_size)
+    entries = ReadSegmentIndex(config_dct, seg_start)
+    valid_entries = [(seq, offset) for seq, offset in entries
+                     if offset < committed_size]
+    if valid_entries != entries:
+      with file_utils.AtomicWrite(SegmentIndexPath(config_dct, seg_start),
+                                  fsync=False) as f:
+        for seq, offset in valid_entries:
+          f.write('%d %d\n' % (seq, offset))
+  return seg_starts
+
+
+def MoveAndWriteSegments(config_dct, events):
+  """Segmented version of MoveAndWrite.
+
+  Appends to the last segment until it reaches segment_size, then rolls over
+  to a new segment starting at the current end position.
+  """
+  logger = logging.getLogger(config_dct['logger_name'])
+  metadata_dct = RestoreMetadata(config_dct)
+  cur_seq = metadata_dct['last_seq'] + 1
+  cur_pos = metadata_dct['end_pos']
+  seg_starts = _DiscardUncommittedSegments(config_dct, metadata_dct)
+  seg_start = seg_starts[-1] if seg_starts else None
+  enable_fsync = config_dct['args'].enable_fsync
+
+  f = index_f = None
+  next_index_offset = 0
+  try:
+    for event in events:
+      if seg_start is None or (
+          cur_pos - seg_start >= config_dct['segment_size']):
+        if f is not None:
+          if enable_fsync:
+            f.flush()
+            os.fdatasync(f)
+          f.close()
+          index_f.close()
+          f = index_f = None
+        seg_start = cur_pos
+      if f is None:
+        logger.debug('Appending to segment at pos=%d', seg_start)
+        f = open(SegmentPath(config_dct, seg_start), 'a')
+        f.seek(0, 2)  # 2 means use EOF as the reference point.
+        assert f.tell() == cur_pos - seg_start
+        index_f = open(SegmentIndexPath(config_dct, seg_start), 'a')
+        entries = ReadSegmentIndex(config_dct, seg_start)
+        next_index_offset = (
+            entries[-1][1] + _INDEX_INTERVAL_BYTES if entries else 0)
+
+      _RelocateAttachments(config_dct, event, cur_seq)
+
+      logger.debug('Writing event with cur_seq=%d, cur_pos=%d',
+                   cur_seq, cur_pos)
+      output = FormatRecord(cur_seq, event.Serialize())
+
+      # Store the version for SaveMetadata to use.
+      if cur_pos == metadata_dct['start_pos']:
+        metadata_dct['version'] = GetChecksum(output)
+
+      offset = cur_pos - seg_start
+      if offset >= next_index_offset:
+        index_f.write('%d %d\n' % (cur_seq, offset))
+        next_index_offset = offset + _INDEX_INTERVAL_BYTES
+
+      f.write(output)
+      cur_seq += 1
+      cur_pos += len(output)
+
+    if f is not None and enable_fsync:
+      # Fsync the file and the containing directory to make sure it
+      # is flushed to disk.  The index is advisory and not synced.
+      f.flush()
+      os.fdatasync(f)
+      file_utils.SyncDirectory(config_dct['segments_dir'])
+  finally:
+    if f is not None:
+      f.close()
+      index_f.close()
+  metadata_dct['last_seq'] = cur_seq - 1
+  metadata_dct['end_pos'] = cur_pos
+  SaveMetadata(config_dct, metadata_dct)
+
+
 def SaveMetadata(config_dct, metadata_dct, old_metadata_dct=None):
   """Writes metadata of main database to disk."""
   if not metadata_dct['version']:
@@ -271,10 +550,11 @@ def RestoreMetadata(config_dct):
                   'start_pos': 0, 'end_pos': 0,
                   'version': '00000000'}
   data = TryLoadJSON(config_dct['metadata_path'], logger.name)
+  seg_starts = ListSegments(config_dct) if IsSegmented(config_dct) else None
   if data is not None:
     try:
-      with open(config_dct['data_path'], 'r') as f:
-        metadata_dct['version'] = GetChecksum(f.readline())
+      metadata_dct['version'] = GetChecksum(
+          _ReadFirstLine(config_dct, seg_starts))
     except Exception:
       logger.error('Data file unexpectedly missing; resetting metadata')
       return metadata_dct
@@ -289,19 +569,20 @@ def RestoreMetadata(config_dct):
                   ', '.join(data.keys()), metadata_dct['version'])
     metadata_dct.update(data[metadata_dct['version']])
     if (metadata_dct['end_pos'] >
-        metadata_dct['start_pos'] + os.path.getsize(config_dct['data_path'])):
+        _GetStoredEndPos(config_dct, metadata_dct, seg_starts)):
       logger.error('end_pos in restored metadata is larger than start_pos + '
                    'data file; recovering metadata from data file')
       RecoverMetadata(config_dct, metadata_dct)
   else:
-    if os.path.isfile(config_dct['data_path']):
+    if _HasDataFile(config_dct, seg_starts):
       logger.error('Could not find metadata file, but we have data file; '
                    'recovering metadata from data file')
       RecoverMetadata(config_dct, metadata_dct)
     else:
       logger.info('Creating metadata file and data file')
       SaveMetadata(config_dct, metadata_dct)
-      file_utils.TouchFile(config_dct['data_path'])
+      if not IsSegmented(config_dct):
+        file_utils.TouchFile(config_dct['data_path'])
   return metadata_dct
 
 
@@ -311,6 +592,9 @@ def RecoverMetadata(config_dct, metadata_dct):
   Uses the first valid record for first_seq and start_pos, and the last
   valid record for last_seq and end_pos.
   """
+  if IsSegmented(config_dct):
+    RecoverSegmentsMetadata(config_dct, metadata_dct)
+    return
   logger = logging.getLogger(config_dct['logger_name'])
   first_record = True
   cur_pos = 0
@@ -330,6 +614,76 @@ def RecoverMetadata(config_dct, metadata_dct):
   SaveMetadata(config_dct, metadata_dct)
 
 
+def FindFirstRecordOfSegment(config_dct, seg_start):
+  """Returns (seq, offset) of the first valid record of a segment.
+
+  The segment's sparse index is consulted first; its entry is only trusted if
+  the record at that offset passes its CRC check.
+
+  Returns:
+    A tuple of (seq, offset), or (None, None) if no valid record exists.
+  """
+  entries = ReadSegmentIndex(config_dct, seg_start)
+  if entries and entries[0][1] == 0:
+    for seq, unused_offset, unused_size in ScanSegment(config_dct, seg_start):
+      if seq == entries[0][0]:
+        return entries[0]
+      break
+  for seq, offset, unused_size in ScanSegment(config_dct, seg_start):
+    if seq:
+      return seq, offset
+  return None, None
+
+
+def _FindLastRecordOfSegment(config_dct, seg_start):
+  """Returns (seq, end_offset) of the last valid record of a segment.
+
+  Scanning starts at the last sparse index entry, so that recovering a large
+  segment only reads its tail.  The whole segment is scanned if no valid
+  record follows that entry.
+
+  Returns:
+    A tuple of (seq, end_offset), or (None, None) if no valid record exists.
+  """
+  size = os.path.getsize(SegmentPath(config_dct, seg_start))
+  entries = ReadSegmentIndex(config_dct, seg_start, max_offset=size)
+  scan_offsets = [entries[-1][1], 0] if entries and entries[-1][1] else [0]
+  for scan_offset in scan_offsets:
+    last_seq = last_end = None
+    for seq, offset, line_size in ScanSegment(
+        config_dct, seg_start, scan_offset):
+      if seq:
+        last_seq, last_end = seq, offset + line_size
+    if last_seq:
+      return last_seq, last_end
+  return None, None
+
+
+def RecoverSegmentsMetadata(config_dct, metadata_dct):
+  """Segmented version of RecoverMetadata.
+
+  Only reads up to the first valid record, and the tail of the last segment
+  containing a valid record.
+  """
+  logger = logging.getLogger(config_dct['logger_name'])
+  seg_starts = ListSegments(config_dct)
+  for seg_start in seg_starts:
+    seq, offset = FindFirstRecordOfSegment(config_dct, seg_start)
+    if seq:
+      metadata_dct['first_seq'] = seq
+      metadata_dct['start_pos'] = seg_start + offset
+      break
+  for seg_start in reversed(seg_starts):
+    seq, end_offset = _FindLastRecordOfSegment(config_dct, seg_start)
+    if seq:
+      metadata_dct['last_seq'] = seq
+      metadata_dct['end_pos'] = seg_start + end_offset
+      break
+  logger.info('Finished recovering metadata; sequence range found: %d to %d',
+              metadata_dct['first_seq'], metadata_dct['last_seq'])
+  SaveMetadata(config_dct, metadata_dct)
+
+
 def TruncateAttachments(config_dct, metadata_dct):
   """Deletes attachments of events no longer stored within data.json."""
   logger = logging.getLogger(config_dct['logger_name'])
@@ -351,6 +705,9 @@ def Truncate(config_dct, min_seq, min_pos):
 
   See file-level docstring for more information about versions.
   """
+  if IsSegmented(config_dct):
+    TruncateSegments(config_dct, min_seq, min_pos)
+    return
   logger = logging.getLogger(config_dct['logger_name'])
   metadata_dct = RestoreMetadata(config_dct)
   # Does the buffer already have data in it?
@@ -395,6 +752,62 @@ def Truncate(config_dct, min_seq, min_pos):
     raise
 
 
+def TruncateSegments(config_dct, min_seq, min_pos):
+  """Segmented version of Truncate.
+
+  Unlinks every segment lying entirely before min_pos.  The segment containing
+  min_pos, and therefore the last segment, is always kept.
+  """
+  logger = logging.getLogger(config_dct['logger_name'])
+  metadata_dct = RestoreMetadata(config_dct)
+  seg_starts = ListSegments(config_dct)
+  keep_index = LocateSegment(seg_starts, min_pos)
+  if keep_index <= 0:
+    logger.info('No need to truncate')
+    return
+  try:
+    new_start = seg_starts[keep_index]
+    logger.debug('Will truncate up until seq=%d, pos=%d by removing %d '
+                 'segments', min_seq, min_pos, keep_index)
+
+    # Prepare the old vs. new metadata to write to disk.
+    old_metadata_dct = copy.deepcopy(metadata_dct)
+    first_seq, unused_offset = FindFirstRecordOfSegment(config_dct, new_start)
+    metadata_dct['first_seq'] = first_seq or min_seq
+    metadata_dct['start_pos'] = new_start
+    with open(SegmentPath(config_dct, new_start), 'r') as f:
+      metadata_dct['version'] = GetChecksum(f.readline())
+
+    # Save both versions before unlinking anything, in case of disk failure.
+    SaveMetadata(config_dct, metadata_dct, old_metadata_dct)
+    for seg_start in seg_starts[:keep_index]:
+      os.unlink(SegmentPath(config_dct, seg_start))
+      file_utils.TryUnlink(SegmentIndexPath(config_dct, seg_start))
+    file_utils.SyncDirectory(config_dct['segments_dir'])
+
+    # After the segments are gone, we can remove old metadata.
+    SaveMetadata(config_dct, metadata_dct)
+
+  except Exception:
+    logger.exception('Exception occurred during Truncate operation')
+    raise
+
+
+class _PendingProduce:
+  """A ProduceEvents call waiting for its events to be written.
+
+  Properties:
+    events: The list of events to write.
+    done: Whether a group commit has processed this call.
+    exception: The exception raised while writing, if any.
+  """
+
+  def __init__(self, events):
+    self.events = events
+    self.done = False
+    self.exception = None
+
+
 class BufferFile(log_utils.LoggerMixin):
 
   def __init__(self, args, logger_name, data_dir):
@@ -415,11 +828,23 @@ class BufferFile(log_utils.LoggerMixin):
         data_dir, 'attachments')
     if not os.path.exists(self.attachments_dir):
       os.makedirs(self.attachments_dir)
+    self.segments_dir = os.path.join(
+        data_dir, 'segments')
+    self.segment_size = args.segment_size
+    self.read_ahead_bytes = args.read_ahead_bytes
+    self._CheckStorageMode()
 
     # Lock for writing to the self.data_path file.  Used by
     # Produce and Truncate.
     self.data_write_lock = lock_utils.Lock(logger_name)
 
+    # ProduceEvents calls waiting for a group commit, and the condition
+    # protecting them.
+    self.group_commit_max_latency = args.group_commit_max_latency
+    self.group_commit_max_events = args.group_commit_max_events
+    self._pending = collections.deque()
+    self._pending_cond = threading.Condition()
+
     # Lock for modifying the self.consumers variable or for
     # preventing other threads from changing it.
     self._consumer_lock = lock_utils.Lock(logger_name)
@@ -447,6 +872,25 @@ class BufferFile(log_utils.LoggerMixin):
   def version(self):
     return RestoreMetadata(self.ConfigToDict())['version']
 
+  def _CheckStorageMode(self):
+    """Makes sure existing data on disk matches the configured storage mode.
+
+    Raises:
+      SimpleFileException if data was written in the other storage mode.
+    """
+    has_segments = (os.path.isdir(self.segments_dir) and
+                    ListSegments(self.ConfigToDict()))
+    if self.segment_size:
+      if os.path.isfile(self.data_path) and os.path.getsize(self.data_path):
+        raise SimpleFileException(
+            'Cannot enable segment_size on a buffer with existing data in %s'
+            % self.data_path)
+      file_utils.TryMakeDirs(self.segments_dir)
+    elif has_segments:
+      raise SimpleFileException(
+          'Cannot disable segment_size on a buffer with existing data in %s'
+          % self.segments_dir)
+
   def _SaveConsumers(self):
     """Saves the current list of active Consumers to disk."""
     with file_utils.AtomicWrite(self.consumers_list_path, fsync=True) as f:
@@ -478,35 +922,94 @@ class BufferFile(log_utils.LoggerMixin):
             'metadata_path': self.metadata_path,
             'consumers_list_path': self.consumers_list_path,
             'consumer_path_format': self.consumer_path_format,
-            'attachments_dir': self.attachments_dir}
+            'attachments_dir': self.attachments_dir,
+            'segments_dir': self.segments_dir,
+            'segment_size': self.segment_size}
 
   def ProduceEvents(self, events, process_pool=None):
-    """Moves attachments, serializes events and writes them to the data_path."""
+    """Moves attachments, serializes events and writes them to the data_path.
+
+    Concurrent calls are merged into a single write (group commit): whichever
+    caller acquires data_write_lock writes the events of every waiting call
+    with one append and one metadata save.  Each call still only returns once
+    its own events are on disk, and raises if their write failed.
+    """
+    request = _PendingProduce(events)
+    with self._pending_cond:
+      self._pending.append(request)
+      self._pending_cond.notify_all()
     with self.data_write_lock:
-      # If we are going to write the first line which will change the version,
-      # we should prevent the data and metadata from being read by consumers.
-      metadata_dct = RestoreMetadata(self.ConfigToDict())
-      first_line = (metadata_dct['start_pos'] == metadata_dct['end_pos'])
-      try:
-        if first_line:
-          self._consumer_lock.acquire()
-          for consumer in self.consumers.values():
-            consumer.read_lock.acquire()
+      while not request.done:
+        self._GroupCommit(process_pool)
+    if request.exception is not None:
+      raise request.exception
 
-        if process_pool is None:
-          MoveAndWrite(self.ConfigToDict(), events)
-        else:
-          process_pool.apply(MoveAndWrite, (self.ConfigToDict(), events))
+  def _TakePendingGroup(self):
+    """Removes and returns the next group of pending requests to write.
 
-      except Exception:
-        self.exception('Exception occurred during ProduceEvents operation')
-        raise
-      finally:
-        # Ensure that regardless of any errors, locks are released.
-        if first_line:
-          for consumer in self.consumers.values():
-            consumer.read_lock.CheckAndRelease()
-          self._consumer_lock.CheckAndRelease()
+    Waits up to group_commit_max_latency for the group to fill up.  A group
+    holds at least one request, and otherwise no more than
+    group_commit_max_events events.  Must be called with _pending_cond held.
+    """
+    if self.group_commit_max_latency:
+      deadline = time.time() + self.group_commit_max_latency
+      while (sum(len(request.events) for request in self._pending) <
+             self.group_commit_max_events):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          break
+        self._pending_cond.wait(remaining)
+    group = [self._pending.popleft()]
+    event_count = len(group[0].events)
+    while (self._pending and event_count + len(self._pending[0].events) <=
+           self.group_commit_max_events):
+      event_count += len(self._pending[0].events)
+      group.append(self._pending.popleft())
+    return group
+
+  def _GroupCommit(self, process_pool):
+    """Writes a group of pending requests.  Must hold data_write_lock."""
+    with self._pending_cond:
+      group = self._TakePendingGroup()
+    events = [event for request in group for event in request.events]
+    self.debug('Group commit of %d events from %d calls',
+               len(events), len(group))
+    try:
+      self._WriteEvents(events, process_pool)
+    except Exception as e:
+      for request in group:
+        request.exception = e
+    finally:
+      for request in group:
+        request.done = True
+
+  def _WriteEvents(self, events, process_pool):
+    """Writes events to disk.  Must hold data_write_lock."""
+    # If we are going to write the first line which will change the version,
+    # we should prevent the data and metadata from being read by consumers.
+    metadata_dct = RestoreMetadata(self.ConfigToDict())
+    first_line = (metadata_dct['start_pos'] == metadata_dct['end_pos'])
+    try:
+      if first_line:
+        self._consumer_lock.acquire()
+        for consumer in self.consumers.values():
+          consumer.read_lock.acquire()
+
+      if process_pool is None:
+        MoveAndWrite(self.ConfigToDict(), events)
+      else:
+        process_pool.apply(MoveAndWrite, (self.ConfigToDict(), events))
+
+    except Exception:
+      self.exception('Exception occurred during ProduceEvents operation')
+      raise
+    finally:
+      # Ensure that regardless of any errors, locks are released.
+      if first_line:
+        for consumer in self.consumers.values():
+          consumer.ResetReadCache()
+          consumer.read_lock.CheckAndRelease()
+        self._consumer_lock.CheckAndRelease()
 
   def _GetFirstUnconsumedRecord(self):
     """Returns the seq and pos of the first unprocessed record.
@@ -553,12 +1056,20 @@ class BufferFile(log_utils.LoggerMixin):
       finally:
         # Ensure that regardless of any errors, locks are released.
         for consumer in self.consumers.values():
+          consumer.ResetReadCache()
           consumer.read_lock.CheckAndRelease()
     # Now that we have written the new data and metadata to disk, remove any
     # unused attachments.
     if truncate_attachments:
       TruncateAttachments(self.ConfigToDict(), new_metadata_dct)
 
+  def Close(self):
+    """Releases data file handles cached by Consumers."""
+    with self._consumer_lock:
+      for consumer in self.consumers.values():
+        with consumer.read_lock:
+          consumer.ResetReadCache()
+
   def _CreateConsumer(self, name):
     """Returns a new Consumer object with the given name."""
     return Consumer(
@@ -579,6 +1090,8 @@ class BufferFile(log_utils.LoggerMixin):
     with self.data_write_lock, self._consumer_lock:
       if name not in self.consumers:
         raise SimpleFileException('Consumer %s does not exist' % name)
+      with self.consumers[name].read_lock:
+        self.consumers[name].ResetReadCache()
       del self.consumers[name]
       self._SaveConsumers()
 
@@ -619,7 +1132,11 @@ class Consumer(log_utils.LoggerMixin, plugin_base.BufferEventStream):
 
     self._stream_lock = lock_utils.Lock(logger_name)
     self.read_lock = lock_utils.Lock(logger_name)
-    self.read_buf = []
+    self.read_buf = collections.deque()
+    self._read_file = None
+    self._read_file_path = None
+    self._metadata_dct = None
+    self._seg_starts = None
 
     with self.read_lock:
       metadata_dct = RestoreMetadata(self.simple_file.ConfigToDict())
@@ -682,54 +1199,143 @@ class Consumer(log_utils.LoggerMixin, plugin_base.BufferEventStream):
       self.new_seq = self.cur_seq
       self.new_pos = self.cur_pos
 
+  def ResetReadCache(self):
+    """Closes the cached data file handle and drops the metadata snapshot.
+
+    Must be called with read_lock held whenever data files on disk are
+    rewritten or removed, so that the next refill re-reads them.
+    """
+    if self._read_file is not None:
+      self._read_file.close()
+    self._read_file = None
+    self._read_file_path = None
+    self._metadata_dct = None
+    self._seg_starts = None
+
+  def _RefreshMetadata(self):
+    """Takes a new snapshot of buffer metadata and segments on disk."""
+    config_dct = self.simple_file.ConfigToDict()
+    self._metadata_dct = RestoreMetadata(config_dct)
+    if IsSegmented(config_dct):
+      self._seg_starts = ListSegments(config_dct)
+
+  def _GetReadRange(self, pos):
+    """Returns the data file containing pos, according to the snapshot.
+
+    Returns:
+      A tuple of (path, file_start, limit), where file_start is the absolute
+      position of the file's first byte, and limit is the absolute position
+      which no record may extend beyond.  (None, None, None) if there is
+      nothing left to read.
+    """
+    end_pos = self._metadata_dct['end_pos']
+    if pos >= end_pos:
+      return None, None, None
+    if self._seg_starts is None:
+      return (self.simple_file.data_path, self._metadata_dct['start_pos'],
+              end_pos)
+    seg_index = max(LocateSegment(self._seg_starts, pos), 0)
+    if seg_index + 1 < len(self._seg_starts):
+      limit = min(self._seg_starts[seg_index + 1], end_pos)
+    else:
+      limit = end_pos
+    seg_start = self._seg_starts[seg_index]
+    return (SegmentPath(self.simple_file.ConfigToDict(), seg_start), seg_start,
+            limit)
+
+  def _GetReadFile(self, path):
+    """Returns a binary file handle for path, reusing the cached one."""
+    if self._read_file_path != path:
+      if self._read_file is not None:
+        self._read_file.close()
+      self._read_file = open(path, 'rb')
+      self._read_file_path = path
+    return self._read_file
+
+  def _FillBuffer(self):
+    """Reads records starting at self.new_pos into self.read_buf.
+
+    Reads whole chunks of the configured read-ahead size, and stops after the
+    records read add up to more than the read-ahead size.
+    """
+    read_ahead = self.simple_file.read_ahead_bytes or _BUFFER_SIZE_BYTES
+    chunk_size = max(read_ahead, _MIN_READ_CHUNK_BYTES)
+    pos = self.new_pos
+    total_bytes = 0
+    skipped_bytes = 0
+    while total_bytes <= read_ahead:
+      path, file_start, limit = self._GetReadRange(pos)
+      if path is None:
+        break
+      f = self._GetReadFile(path)
+      f.seek(pos - file_start)
+      data = f.read(min(chunk_size, limit - pos))
+      # Make sure that the chunk holds at least one complete line.
+      while b'\n' not in data and pos + len(data) < limit:
+        more = f.read(min(chunk_size, limit - pos - len(data)))
+        if not more:
+          break
+        data += more
+
+      line_start = 0
+      while total_bytes <= read_ahead and line_start < len(data):
+        line_end = data.find(b'\n', line_start) + 1
+        if not line_end:
+          if pos + len(data) < limit:
+            # A partial line; it is read again with the next chunk.
+            break
+          line_end = len(data)
+        line = data[line_start:line_end]
+        line_start = line_end
+        size = len(line)
+        seq, record = ParseRecord(line.decode('utf-8', 'replace'),
+                                  self.logger.name)
+        if seq is None:
+          # Parsing of this line failed for some reason.
+          skipped_bytes += size
+          continue
+        # Only add to total_bytes for a valid line.
+        total_bytes += size
+        # Include any skipped bytes from previously skipped records in the
+        # "size" of this record, in order to allow the consumer to skip to the
+        # proper offset.
+        self.read_buf.append((seq, record, size + skipped_bytes))
+        skipped_bytes = 0
+      if not line_start:
+        # The data file is shorter than metadata claims.
+        break
+      pos += line_start
+
   def _Buffer(self):
-    """Returns a list of pending records.
+    """Returns a deque of pending records.
 
     Stores the current buffer internally at self.read_buf.  If it already has
     data in it, self.read_buf will be returned as-is.  It will be "refilled"
     when it is empty.
 
-    Reads up to _BUFFER_SIZE_BYTES from the file on each "refill".
+    Reads up to the read-ahead size from the file on each "refill".  The data
+    file handle and the metadata snapshot are kept across refills; metadata is
+    only re-read once the snapshot has been fully consumed.
 
     Returns:
-      A list of records, where each is a three-element tuple:
+      A deque of records, where each is a three-element tuple:
         (record_seq, record_data, line_bytes).
     """
     if self.read_buf:
       return self.read_buf
     # Does the buffer already have data in it?
-    if not os.path.exists(self.simple_file.data_path):
+    if (not IsSegmented(self.simple_file.ConfigToDict()) and
+        not os.path.exists(self.simple_file.data_path)):
       return self.read_buf
     self.debug('_Buffer: waiting for read_lock')
     try:
       # When the buffer is truncating, we can't get the read_lock.
       if not self.read_lock.acquire(timeout=0.5):
-        return []
-      metadata_dct = RestoreMetadata(self.simple_file.ConfigToDict())
-      with open(self.simple_file.data_path, 'r') as f:
-        cur = self.new_pos - metadata_dct['start_pos']
-        f.seek(cur)
-        total_bytes = 0
-        skipped_bytes = 0
-        for line in f:
-          if total_bytes > _BUFFER_SIZE_BYTES:
-            break
-          size = len(line)
-          cur += size
-          if cur > (metadata_dct['end_pos'] - metadata_dct['start_pos']):
-            break
-          seq, record = ParseRecord(line, self.logger.name)
-          if seq is None:
-            # Parsing of this line failed for some reason.
-            skipped_bytes += size
-            continue
-          # Only add to total_bytes for a valid line.
-          total_bytes += size
-          # Include any skipped bytes from previously skipped records in the
-          # "size" of this record, in order to allow the consumer to skip to the
-          # proper offset.
-          self.read_buf.append((seq, record, size + skipped_bytes))
-          skipped_bytes = 0
+        return self.read_buf
+      if (self._metadata_dct is None or
+          self.new_pos >= self._metadata_dct['end_pos']):
+        self._RefreshMetadata()
+      self._FillBuffer()
     finally:
       self.read_lock.CheckAndRelease()
     return self.read_buf
@@ -745,7 +1351,7 @@ class Consumer(log_utils.LoggerMixin, plugin_base.BufferEventStream):
     buf = self._Buffer()
     if not buf:
       return None, None
-    seq, record, size = buf.pop(0)
+    seq, record, size = buf.popleft()
     self.new_seq = seq + 1
     self.new_pos += size
     return seq, record
@@ -758,6 +1364,23 @@ class Consumer(log_utils.LoggerMixin, plugin_base.BufferEventStream):
     event = datatypes.Event.Deserialize(record)
     return self.simple_file.ExternalizeEvent(event)
 
+  def NextBatch(self, count):
+    """See BufferEventStream.NextBatch."""
+    if not self._stream_lock.IsHolder():
+      raise plugin_base.EventStreamExpired
+    events = []
+    while len(events) < count:
+      buf = self._Buffer()
+      if not buf:
+        break
+      for unused_i in range(min(count - len(events), len(buf))):
+        seq, record, size = buf.popleft()
+        self.new_seq = seq + 1
+        self.new_pos += size
+        events.append(self.simple_file.ExternalizeEvent(
+            datatypes.Event.Deserialize(record)))
+    return events
+
   def Commit(self):
     """See BufferEventStream.Commit."""
     if not self._stream_lock.IsHolder():
@@ -786,7 +1409,7 @@ class Consumer(log_utils.LoggerMixin, plugin_base.BufferEventStream):
       raise plugin_base.EventStreamExpired
     self.new_seq = self.cur_seq
     self.new_pos = self.cur_pos
-    self.read_buf = []
+    self.read_buf.clear()
     try:
       self._stream_lock.release()
     except Exception:
@@ -42,6 +42,10 @@ _TEMPORARY_ATTACHMENT_DIR = 'attachments_tmp_dir'
 _DEFAULT_TRUNCATE_INTERVAL = 0  # truncating disabled
 _DEFAULT_COPY_ATTACHMENTS = False  # use move instead of copy by default
 _DEFAULT_ENABLE_FSYNC = True  # fsync when it receives events
+_DEFAULT_SEGMENT_SIZE = 0  # segmenting disabled
+_DEFAULT_READ_AHEAD_BYTES = 0  # use the 4kb default
+_DEFAULT_GROUP_COMMIT_MAX_LATENCY = 0  # only merge already waiting calls
+_DEFAULT_GROUP_COMMIT_MAX_EVENTS = 10000
 
 
 class BufferPriorityFile(plugin_base.BufferPlugin):
@@ -58,7 +62,28 @@ class BufferPriorityFile(plugin_base.BufferPlugin):
       Arg('enable_fsync', bool,
           'Synchronize the buffer file when it receives events.  '
           'Default is True.',
-          default=_DEFAULT_ENABLE_FSYNC)
+          default=_DEFAULT_ENABLE_FSYNC),
+      Arg('segment_size', int,
+          'Store events in segment files of roughly this many bytes instead '
+          'of a single data file, so that truncating only needs to remove '
+          'fully consumed segments.  If set to 0, a single data file is used '
+          '(default).  Cannot be changed once the buffer holds data.',
+          default=_DEFAULT_SEGMENT_SIZE),
+      Arg('read_ahead_bytes', int,
+          'How many bytes each consumer reads from disk at once.  Larger '
+          'values (1-16 MB) speed up output plugins which pull large batches, '
+          'at the cost of memory per consumer.  If set to 0, 4 KB is used '
+          '(default).',
+          default=_DEFAULT_READ_AHEAD_BYTES),
+      Arg('group_commit_max_latency', (int, float),
+          'Concurrent Produce calls are merged into one write.  This is how '
+          'many seconds a write may wait for more calls to merge.  If set to '
+          '0, only calls which are already waiting are merged (default).',
+          default=_DEFAULT_GROUP_COMMIT_MAX_LATENCY),
+      Arg('group_commit_max_events', int,
+          'The maximum number of events merged into one write.  A single '
+          'Produce call larger than this is still written at once.',
+          default=_DEFAULT_GROUP_COMMIT_MAX_EVENTS)
   ]
 
   def __init__(self, *args, **kwargs):
@@ -118,6 +143,9 @@ class BufferPriorityFile(plugin_base.BufferPlugin):
     self.info('Joining the processes in the process pool')
     self.process_pool.join()
     self.info('Finished joining the processes')
+    for pri_level in range(_PRIORITY_LEVEL):
+      for file_num in range(_PARTITION):
+        self.buffer_file[pri_level][file_num].Close()
 
   def Main(self):
     """Main thread of the plugin."""
@@ -252,7 +280,8 @@ class BufferPriorityFile(plugin_base.BufferPlugin):
                 tmp_dir, att_path.replace('/', '_'))
         if not self.process_pool.apply(
             buffer_file_common.CopyAttachmentsToTempDir,
-            (source_paths, tmp_dir, self.logger.name)):
+            (source_paths, tmp_dir, self.logger.name,
+             not self.args.copy_attachments)):
           return False
 
         # Step 2: Acquire a lock.
@@ -391,6 +420,25 @@ class Consumer(log_utils.LoggerMixin, plugin_base.BufferEventStream):
     # If there's no more event in any buffer file, we can return None now.
     return self._Next()
 
+  def _NextBatch(self, count):
+    """Helper for NextBatch."""
+    events = []
+    while self.streams_index < len(self.streams) and len(events) < count:
+      batch = self.streams[self.streams_index].NextBatch(count - len(events))
+      if not batch:
+        self.streams_index += 1
+      events.extend(batch)
+    return events
+
+  def NextBatch(self, count):
+    """See BufferEventStream.NextBatch."""
+    events = self._NextBatch(count)
+    if len(events) < count:
+      # Like Next, check all buffer files again once the end is reached.
+      self.streams_index = 0
+      events.extend(self._NextBatch(count - len(events)))
+    return events
+
   def Commit(self):
     """See BufferEventStream.Commit."""
     for stream in self.streams:
@@ -108,6 +108,19 @@ class TestBufferPriorityFile(unittest.TestCase):
     self.assertEqual(None, stream.Next())
     stream.Commit()
 
+  def testNextBatch(self):
+    self.sf.AddConsumer('a')
+
+    self._ProducePriorityEvent(3, 0)
+    self._ProducePriorityEvent(0, 1)
+    self._ProducePriorityEvent(1, 2)
+    stream = self.sf.Consume('a')
+    self.assertEqual([self.e[0], self.e[1]], stream.NextBatch(2))
+    self._ProducePriorityEvent(0, 3)
+    self.assertEqual([self.e[3], self.e[0]], stream.NextBatch(10))
+    self.assertEqual([], stream.NextBatch(10))
+    stream.Commit()
+
   def testMultithreadOrder(self):
     self.sf.AddConsumer('a')
     stream = self.sf.Consume('a')
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for concurrent Produce calls into a file-based buffer.
+
+Runs several emitter threads, each repeatedly producing a small batch of
+events into a BufferSimpleFile with fsync enabled, and reports events per
+second.  Writing each call separately (group_commit_max_events=1, equivalent
+to the previous write path) is compared against group commit.
+
+Example:
+
+  buffer_produce_benchmark.py --emitters 8 --duration 10
+"""
+
+import argparse
+import logging
+import shutil
+import tempfile
+import threading
+import time
+
+from cros.factory.instalog import datatypes
+from cros.factory.instalog.plugins import buffer_simple_file
+
+
+def _CreateBuffer(data_dir, config):
+  buf = buffer_simple_file.BufferSimpleFile(
+      config=config,
+      logger_name='buffer_produce_benchmark',
+      store={},
+      plugin_api=None)
+  buf.GetDataDir = lambda: data_dir
+  buf.SetUp()
+  return buf
+
+
+def RunBenchmark(config, emitters, batch_size, payload_size, duration):
+  """Returns (events produced, calls made) within the duration."""
+  data_dir = tempfile.mkdtemp(prefix='buffer_produce_benchmark_')
+  try:
+    buf = _CreateBuffer(data_dir, config)
+    stop_event = threading.Event()
+    counts = [0] * emitters
+
+    def Emitter(index):
+      while not stop_event.is_set():
+        events = [datatypes.Event({'payload': 'x' * payload_size})
+                  for unused_i in range(batch_size)]
+        if not buf.Produce(events):
+          raise RuntimeError('Produce failed')
+        counts[index] += 1
+
+    threads = [threading.Thread(target=Emitter, args=(i,))
+               for i in range(emitters)]
+    for t in threads:
+      t.start()
+    time.sleep(duration)
+    stop_event.set()
+    for t in threads:
+      t.join()
+    return sum(counts) * batch_size, sum(counts)
+  finally:
+    shutil.rmtree(data_dir)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--emitters', type=int, default=8,
+                      help='Number of concurrent emitter threads.')
+  parser.add_argument('--batch-size', type=int, default=10,
+                      help='Number of events in each Produce call.')
+  parser.add_argument('--payload-size', type=int, default=256,
+                      help='Payload size of each event in bytes.')
+  parser.add_argument('--duration', type=float, default=10,
+                      help='Seconds to run each configuration for.')
+  parser.add_argument('--max-latency', type=float, default=0.005,
+                      help='group_commit_max_latency for the last run.')
+  parser.add_argument('--segment-size', type=int, default=0,
+                      help='segment_size of the buffer.')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.WARNING)
+
+  configs = [
+      ('one write per call', {'group_commit_max_events': 1}),
+      ('group commit', {}),
+      ('group commit, %gs max latency' % args.max_latency,
+       {'group_commit_max_latency': args.max_latency}),
+  ]
+  for name, config in configs:
+    config.update({'enable_fsync': True, 'segment_size': args.segment_size})
+    events, calls = RunBenchmark(config, args.emitters, args.batch_size,
+                                 args.payload_size, args.duration)
+    print('%-36s %9.0f events/s (%d calls)' % (
+        name, events / args.duration, calls))
+
+
+if __name__ == '__main__':
+  main()
@@ -23,6 +23,10 @@ _TEMPORARY_ATTACHMENT_DIR = 'attachments_tmp_dir'
 _DEFAULT_TRUNCATE_INTERVAL = 0  # truncating disabled
 _DEFAULT_COPY_ATTACHMENTS = False  # use move instead of copy by default
 _DEFAULT_ENABLE_FSYNC = True  # fsync when it receives events
+_DEFAULT_SEGMENT_SIZE = 0  # segmenting disabled
+_DEFAULT_READ_AHEAD_BYTES = 0  # use the 4kb default
+_DEFAULT_GROUP_COMMIT_MAX_LATENCY = 0  # only merge already waiting calls
+_DEFAULT_GROUP_COMMIT_MAX_EVENTS = 10000
 
 
 class BufferSimpleFile(plugin_base.BufferPlugin):
@@ -39,7 +43,28 @@ class BufferSimpleFile(plugin_base.BufferPlugin):
       Arg('enable_fsync', bool,
           'Synchronize the buffer file when it receives events.  '
           'Default is True.',
-          default=_DEFAULT_ENABLE_FSYNC)
+          default=_DEFAULT_ENABLE_FSYNC),
+      Arg('segment_size', int,
+          'Store events in segment files of roughly this many bytes instead '
+          'of a single data file, so that truncating only needs to remove '
+          'fully consumed segments.  If set to 0, a single data file is used '
+          '(default).  Cannot be changed once the buffer holds data.',
+          default=_DEFAULT_SEGMENT_SIZE),
+      Arg('read_ahead_bytes', int,
+          'How many bytes each consumer reads from disk at once.  Larger '
+          'values (1-16 MB) speed up output plugins which pull large batches, '
+          'at the cost of memory per consumer.  If set to 0, 4 KB is used '
+          '(default).',
+          default=_DEFAULT_READ_AHEAD_BYTES),
+      Arg('group_commit_max_latency', (int, float),
+          'Concurrent Produce calls are merged into one write.  This is how '
+          'many seconds a write may wait for more calls to merge.  If set to '
+          '0, only calls which are already waiting are merged (default).',
+          default=_DEFAULT_GROUP_COMMIT_MAX_LATENCY),
+      Arg('group_commit_max_events', int,
+          'The maximum number of events merged into one write.  A single '
+          'Produce call larger than this is still written at once.',
+          default=_DEFAULT_GROUP_COMMIT_MAX_EVENTS)
   ]
 
   def __init__(self, *args, **kwargs):
@@ -59,6 +84,10 @@ class BufferSimpleFile(plugin_base.BufferPlugin):
       shutil.rmtree(self.attachments_tmp_dir)
     file_utils.TryMakeDirs(self.attachments_tmp_dir)
 
+  def TearDown(self):
+    """Tears down the plugin."""
+    self.buffer_file.Close()
+
   def Main(self):
     """Main thread of the plugin."""
     while not self.IsStopping():
@@ -95,7 +124,8 @@ class BufferSimpleFile(plugin_base.BufferPlugin):
             event.attachments[att_id] = os.path.join(
                 tmp_dir, att_path.replace('/', '_'))
         if not buffer_file_common.CopyAttachmentsToTempDir(
-            source_paths, tmp_dir, self.logger.name):
+            source_paths, tmp_dir, self.logger.name,
+            link=not self.args.copy_attachments):
           return False
         # Step 2: Write the new events to the file.
         self.buffer_file.ProduceEvents(events)
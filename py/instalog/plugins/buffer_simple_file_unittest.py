@@ -27,6 +27,7 @@
 # TODO(kitching): Add tests for failure during Truncate operation.
 
 import collections
+import copy
 import functools
 import logging
 import os
@@ -323,6 +324,51 @@ class TestBufferSimpleFile(unittest.TestCase):
     self.assertEqual(self.e3, stream2.Next())
     stream2.Commit()
 
+  def testReadAhead(self):
+    """Tests that read_ahead_bytes controls how much each refill reads."""
+    self._CreateBuffer({'read_ahead_bytes': 1024 * 1024})
+    self.sf.Produce([self.e1, self.e2, self.e3] * 100)
+    self.sf.AddConsumer('a')
+    stream = self.sf.Consume('a')
+    self.assertEqual(300, len(stream._Buffer()))
+    for unused_i in range(100):
+      self.assertEqual([self.e1, self.e2, self.e3], stream.NextBatch(3))
+    self.assertEqual([], stream.NextBatch(3))
+    stream.Commit()
+
+  @_WithBufferSize(0)  # Force only keeping one record in buffer.
+  def testNextBatch(self):
+    """Tests that NextBatch refills the buffer as needed."""
+    self.sf.AddConsumer('a')
+    self.sf.Produce([self.e1, self.e2, self.e3])
+    stream = self.sf.Consume('a')
+    self.assertEqual([self.e1, self.e2], stream.NextBatch(2))
+    self.sf.Produce([self.e4, self.e5])
+    self.assertEqual([self.e3, self.e4, self.e5], stream.NextBatch(10))
+    self.assertEqual([], stream.NextBatch(10))
+    stream.Abort()
+    stream = self.sf.Consume('a')
+    self.assertEqual([self.e1], stream.NextBatch(1))
+    stream.Commit()
+    with self.assertRaises(plugin_base.EventStreamExpired):
+      stream.NextBatch(1)
+
+  @_WithBufferSize(0)  # Force only keeping one record in buffer.
+  def testCachedReadFileAfterTruncate(self):
+    """Tests that the cached data file handle is reopened after Truncate."""
+    self.sf.AddConsumer('a')
+    self.sf.Produce([self.e1, self.e2, self.e3, self.e4])
+    stream = self.sf.Consume('a')
+    self.assertEqual([self.e1, self.e2], stream.NextBatch(2))
+    stream.Commit()
+    stream = self.sf.Consume('a')
+    self.assertEqual(self.e3, stream.Next())
+    self.sf.buffer_file.Truncate()
+    self.assertEqual(3, self.sf.buffer_file.first_seq)
+    self.sf.Produce([self.e5])
+    self.assertEqual([self.e4, self.e5], stream.NextBatch(10))
+    stream.Commit()
+
   def testRecreateConsumer(self):
     """Tests for same position after removing and recreating Consumer."""
     self.sf.Produce([self.e1, self.e2, self.e3])
@@ -394,6 +440,64 @@ class TestBufferSimpleFile(unittest.TestCase):
     self.assertEqual(3, len(record_count))
     self.assertTrue(all([x == 100 for x in record_count.values()]))
 
+  def _ProduceConcurrently(self, batches):
+    """Produces each batch in its own thread, and returns their results."""
+    results = queue.Queue()
+    threads = [threading.Thread(target=lambda b=batch: results.put(
+        self.sf.Produce(b))) for batch in batches]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    return [results.get() for unused_t in threads]
+
+  def _CountWrites(self):
+    """Counts the number of group commits written to disk."""
+    writes = []
+    write_events = self.sf.buffer_file._WriteEvents
+    def WriteEvents(events, process_pool):
+      writes.append(len(events))
+      return write_events(events, process_pool)
+    self.sf.buffer_file._WriteEvents = WriteEvents
+    return writes
+
+  def testGroupCommit(self):
+    """Tests that concurrent Produce calls are merged into one write."""
+    self._CreateBuffer({'group_commit_max_latency': 10,
+                        'group_commit_max_events': 6})
+    writes = self._CountWrites()
+    self.assertEqual([True] * 3, self._ProduceConcurrently(
+        [[self.e1, self.e2], [self.e3, self.e4], [self.e5, self.e1]]))
+    self.assertEqual([6], writes)
+    self.sf.AddConsumer('a')
+    stream = self.sf.Consume('a')
+    self.assertEqual(6, len(stream.NextBatch(10)))
+
+  def testGroupCommitMaxEvents(self):
+    """Tests that a group commit holds at most group_commit_max_events."""
+    self._CreateBuffer({'group_commit_max_latency': 0.1,
+                        'group_commit_max_events': 2})
+    writes = self._CountWrites()
+    self.assertEqual([True] * 3, self._ProduceConcurrently(
+        [[self.e1, self.e2], [self.e3, self.e4], [self.e5]]))
+    self.assertEqual(5, sum(writes))
+    self.assertTrue(all(count <= 2 for count in writes))
+    # A single call which is too large is still written at once.
+    self.assertTrue(self.sf.Produce([self.e1, self.e2, self.e3]))
+    self.assertEqual(3, writes[-1])
+
+  def testGroupCommitFailure(self):
+    """Tests that every call in a failed group commit fails."""
+    self._CreateBuffer({'group_commit_max_latency': 10,
+                        'group_commit_max_events': 4})
+    def WriteEvents(events, process_pool):
+      del events, process_pool
+      raise IOError('disk failure')
+    self.sf.buffer_file._WriteEvents = WriteEvents
+    self.assertEqual([False] * 2, self._ProduceConcurrently(
+        [[self.e1, self.e2], [self.e3, self.e4]]))
+    self.assertEqual(0, self.sf.buffer_file.last_seq)
+
   @_WithBufferSize(80)  # Each line is around ~35 characters.
   def testMultiThreadConsumeTruncate(self):
     """Tests multiple Consumers reading simultaneously when Truncate occurs."""
@@ -427,7 +531,7 @@ class TestBufferSimpleFile(unittest.TestCase):
       t.start()
 
     for t in threads:
-      while t.isAlive():
+      while t.is_alive():
         # Add a small sleep to prevent occupying read_lock
         time.sleep(0.01)
         self.sf.buffer_file.Truncate()
@@ -474,6 +578,33 @@ class TestBufferSimpleFile(unittest.TestCase):
     """Tests that an attachment is properly moved into the buffer state."""
     self._TestAttachment(False)
 
+  def testLinkAttachment(self):
+    """Tests that a moved attachment on the same filesystem is not copied."""
+    self._CreateBuffer({'copy_attachments': False})
+    path = os.path.join(self.data_dir, 'attachment')
+    with open(path, 'wb') as f:
+      f.write(os.urandom(1024))
+    inode = os.stat(path).st_ino
+    self.assertEqual(True, self.sf.Produce([datatypes.Event({}, {'a': path})]))
+    self.assertFalse(os.path.exists(path))
+    self.sf.AddConsumer('a')
+    event = self.sf.Consume('a').Next()
+    self.assertEqual(inode, os.stat(event.attachments['a']).st_ino)
+
+    # A copied attachment must not share data with its source.
+    self._CreateBuffer({'copy_attachments': True})
+    path = os.path.join(self.data_dir, 'attachment')
+    with open(path, 'wb') as f:
+      f.write(os.urandom(1024))
+    self.assertEqual(True, self.sf.Produce([datatypes.Event({}, {'a': path})]))
+    self.sf.AddConsumer('a')
+    event = self.sf.Consume('a').Next()
+    self.assertNotEqual(os.stat(path).st_ino,
+                        os.stat(event.attachments['a']).st_ino)
+    self.assertEqual(file_utils.ReadFile(path, encoding=None),
+                     file_utils.ReadFile(event.attachments['a'],
+                                         encoding=None))
+
   def testNonExistentAttachment(self):
     """Tests behaviour when a non-existent attachment is provided."""
     event = datatypes.Event({}, {'a': '/tmp/non_existent_file'})
@@ -520,6 +651,192 @@ class TestBufferSimpleFile(unittest.TestCase):
     self.assertEqual(0, self._CountAttachmentsInBuffer(self.sf))
 
 
+class TestBufferSimpleFileSegmented(unittest.TestCase):
+
+  # Each record is around ~100 characters, so each segment holds 3 records.
+  SEGMENT_SIZE = 250
+
+  def _CreateBuffer(self, config=None):
+    config = dict(config or {})
+    config.setdefault('segment_size', self.SEGMENT_SIZE)
+    self.sf = buffer_simple_file.BufferSimpleFile(
+        config=config,
+        logger_name=self.logger.name,
+        store={},
+        plugin_api=None)
+    self.sf.GetDataDir = lambda: self.data_dir
+    self.sf.SetUp()
+
+  def setUp(self):
+    self.logger = logging.getLogger('simple_file')
+    self.data_dir = tempfile.mkdtemp(prefix='buffer_simple_file_unittest_')
+    self._CreateBuffer()
+    self.events = [datatypes.Event({'test%d' % i: 'event'}) for i in range(10)]
+
+  def tearDown(self):
+    shutil.rmtree(self.data_dir)
+
+  def _ListSegments(self):
+    return buffer_file_common.ListSegments(
+        self.sf.buffer_file.ConfigToDict())
+
+  def _ConsumeAll(self, consumer_id):
+    stream = self.sf.Consume(consumer_id)
+    events = []
+    while True:
+      event = stream.Next()
+      if not event:
+        break
+      events.append(event)
+    stream.Commit()
+    return events
+
+  def testWriteReadAcrossSegments(self):
+    """Tests reading back events which span several segments."""
+    self.sf.Produce(self.events[:4])
+    self.sf.Produce(self.events[4:])
+    self.assertFalse(os.path.exists(self.sf.buffer_file.data_path))
+    self.assertEqual(4, len(self._ListSegments()))
+    self.sf.AddConsumer('a')
+    self.assertEqual(self.events, self._ConsumeAll('a'))
+
+  @_WithBufferSize(0)  # Force only keeping one record in buffer.
+  def testNextAcrossSegmentBoundary(self):
+    """Tests refilling the read buffer at each segment boundary."""
+    self.sf.Produce(self.events)
+    self.sf.AddConsumer('a')
+    stream = self.sf.Consume('a')
+    for expected_seq in range(1, 11):
+      seq, _ = stream._Next()
+      self.assertEqual(expected_seq, seq)
+    self.assertEqual((None, None), stream._Next())
+
+  def testTruncateRemovesConsumedSegments(self):
+    """Tests that Truncate only unlinks fully consumed segments."""
+    self.sf.Produce(self.events)
+    self.sf.AddConsumer('a')
+    stream = self.sf.Consume('a')
+    for unused_i in range(4):
+      stream.Next()
+    stream.Commit()
+
+    seg_starts = self._ListSegments()
+    self.sf.buffer_file.Truncate()
+    # Seq 5 lives in the second segment, which holds seqs 4 to 6.
+    self.assertEqual(seg_starts[1:], self._ListSegments())
+    self.assertEqual(4, self.sf.buffer_file.first_seq)
+    self.assertEqual(seg_starts[1], self.sf.buffer_file.start_pos)
+    self.assertEqual(10, self.sf.buffer_file.last_seq)
+    self.assertEqual(self.events[4:], self._ConsumeAll('a'))
+
+    # The last segment is never removed, even when fully consumed.
+    self.sf.buffer_file.Truncate()
+    self.assertEqual(seg_starts[-1:], self._ListSegments())
+    self.assertEqual(10, self.sf.buffer_file.first_seq)
+
+  def testTruncateAttachments(self):
+    """Tests that attachments are only removed with their segment."""
+    with file_utils.UnopenedTemporaryFile() as path:
+      file_utils.WriteFile(path, 'Hello World!')
+      self.sf.Produce([datatypes.Event({}, {'a': path})])
+    self.sf.Produce(self.events)
+    self.sf.AddConsumer('a')
+    self._ConsumeAll('a')
+    self.sf.buffer_file.Truncate()
+    self.assertEqual(
+        [], os.listdir(self.sf.buffer_file.attachments_dir))
+
+  def testReloadAfterTruncate(self):
+    """Tests that metadata and cursors survive re-creating the buffer."""
+    self.sf.Produce(self.events)
+    self.sf.AddConsumer('a')
+    stream = self.sf.Consume('a')
+    for unused_i in range(7):
+      stream.Next()
+    stream.Commit()
+    self.sf.buffer_file.Truncate()
+    self._CreateBuffer()
+    self.assertEqual(7, self.sf.buffer_file.first_seq)
+    self.assertEqual(self.events[7:], self._ConsumeAll('a'))
+
+  def testRecoverMetadata(self):
+    """Tests recovering metadata from segments when metadata is missing."""
+    self.sf.Produce(self.events)
+    self.sf.AddConsumer('a')
+    stream = self.sf.Consume('a')
+    for unused_i in range(4):
+      stream.Next()
+    stream.Commit()
+    self.sf.buffer_file.Truncate()
+    os.unlink(self.sf.buffer_file.metadata_path)
+    self.assertEqual(4, self.sf.buffer_file.first_seq)
+    self.assertEqual(10, self.sf.buffer_file.last_seq)
+    self.assertEqual(self.events[4:], self._ConsumeAll('a'))
+
+  def testInterruptedTruncate(self):
+    """Tests recovery when a failure occurs while unlinking segments."""
+    self.sf.Produce(self.events)
+    self.sf.AddConsumer('a')
+    self._ConsumeAll('a')
+    config_dct = self.sf.buffer_file.ConfigToDict()
+    old_metadata_dct = buffer_file_common.RestoreMetadata(config_dct)
+    new_metadata_dct = copy.deepcopy(old_metadata_dct)
+    new_metadata_dct['version'] = 'ffffffff'
+    buffer_file_common.SaveMetadata(
+        config_dct, new_metadata_dct, old_metadata_dct)
+    # Only the first of three segments has been removed.
+    os.unlink(buffer_file_common.SegmentPath(
+        config_dct, self._ListSegments()[0]))
+    self.assertEqual(4, self.sf.buffer_file.first_seq)
+    self.assertEqual(10, self.sf.buffer_file.last_seq)
+    self.sf.Produce(self.events[:1])
+    self.assertEqual(self.events[:1], self._ConsumeAll('a'))
+
+  def testDiscardUncommittedData(self):
+    """Tests that data written after end_pos is discarded on next write."""
+    self.sf.Produce(self.events[:4])
+    config_dct = self.sf.buffer_file.ConfigToDict()
+    end_pos = self.sf.buffer_file.end_pos
+    # Simulate a write which was interrupted before saving metadata.
+    with open(buffer_file_common.SegmentPath(config_dct, end_pos), 'w') as f:
+      f.write(buffer_file_common.FormatRecord(5, 'garbage'))
+    self.sf.AddConsumer('a')
+    self.assertEqual(self.events[:4], self._ConsumeAll('a'))
+    self.sf.Produce(self.events[4:5])
+    self.assertEqual(self.events[4:5], self._ConsumeAll('a'))
+    self.assertEqual(5, self.sf.buffer_file.last_seq)
+
+  def testSparseIndex(self):
+    """Tests that index entries point at valid records."""
+    old_interval = buffer_file_common._INDEX_INTERVAL_BYTES
+    buffer_file_common._INDEX_INTERVAL_BYTES = 150
+    try:
+      self.sf.Produce(self.events)
+    finally:
+      buffer_file_common._INDEX_INTERVAL_BYTES = old_interval
+    config_dct = self.sf.buffer_file.ConfigToDict()
+    indexed_seqs = []
+    for seg_start in self._ListSegments():
+      entries = buffer_file_common.ReadSegmentIndex(config_dct, seg_start)
+      indexed_seqs.extend(seq for seq, unused_offset in entries)
+      with open(buffer_file_common.SegmentPath(config_dct, seg_start)) as f:
+        data = f.read()
+      for seq, offset in entries:
+        line = data[offset:data.index('\n', offset) + 1]
+        self.assertEqual(seq, buffer_file_common.ParseRecord(line)[0])
+      self.assertEqual(
+          entries[0],
+          buffer_file_common.FindFirstRecordOfSegment(config_dct, seg_start))
+    # Records at offsets 0 and ~208 of each segment are indexed.
+    self.assertEqual([1, 3, 4, 6, 7, 9, 10], indexed_seqs)
+
+  def testStorageModeMismatch(self):
+    """Tests that the storage mode cannot change once data is written."""
+    self.sf.Produce(self.events)
+    with self.assertRaises(buffer_file_common.SimpleFileException):
+      self._CreateBuffer({'segment_size': 0})
+
+
 if __name__ == '__main__':
   log_utils.InitLogging(log_utils.GetStreamHandler(logging.INFO))
   unittest.main()
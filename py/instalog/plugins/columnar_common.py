@@ -0,0 +1,297 @@
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Columnar output plugin common file.
+
+Flattens events into rows of named columns, and infers and evolves the schema
+of these columns, so that they can be written by a columnar file format.
+
+Flattening rules:
+  - Nested dictionaries become dotted column names.  For example,
+    serialNumbers.serial_number and arguments.timeout.value.
+  - Testlog parameters become one list column per data field, e.g.
+    parameters.voltage.numericValue holds the numericValue of every data point
+    of the "voltage" parameter, in order.
+  - Testlog timing fields (time, startTime, endTime) become timestamps.
+  - Lists of scalars become list columns.  Anything else that cannot be
+    represented, like a list of dictionaries, is serialized into JSON.
+
+Schema evolution:
+  A schema only grows.  New columns are appended, and an existing column is
+  widened when a value does not fit its type: INT64 widens to DOUBLE, and
+  anything else to STRING.  Values are always coerced to the current type of
+  their column, so every row written after a change has the same schema.
+"""
+
+import collections
+import datetime
+import json
+import os
+
+from cros.factory.instalog.plugins import output_classify
+from cros.factory.instalog.utils import type_utils
+
+
+BOOL = 'bool'
+INT64 = 'int64'
+DOUBLE = 'double'
+STRING = 'string'
+TIMESTAMP = 'timestamp'
+LIST_PREFIX = 'list<'
+LIST_SUFFIX = '>'
+
+TIMESTAMP_FIELDS = ('time', 'startTime', 'endTime')
+PARAMETER_DATA_FIELDS = ('numericValue', 'textValue', 'status',
+                         'expectedMinimum', 'expectedMaximum', 'expectedRegex',
+                         'serializedValue')
+UNKNOWN_PARTITION = '__UNKNOWN__'
+_HISTORY_COLUMN = 'history'
+
+
+def ListType(item_type):
+  """Returns the type of a list column with the given item type."""
+  return LIST_PREFIX + item_type + LIST_SUFFIX
+
+
+def GetItemType(column_type):
+  """Returns the item type of a list column, or None if it is not a list."""
+  if column_type.startswith(LIST_PREFIX):
+    return column_type[len(LIST_PREFIX):-len(LIST_SUFFIX)]
+  return None
+
+
+def _GetScalarType(value):
+  # bool is a subclass of int, so it must be checked first.
+  if isinstance(value, bool):
+    return BOOL
+  if isinstance(value, int):
+    return INT64
+  if isinstance(value, float):
+    return DOUBLE
+  if isinstance(value, str):
+    return STRING
+  return None
+
+
+def _MergeScalarTypes(a, b):
+  if a == b:
+    return a
+  if {a, b} == {INT64, DOUBLE}:
+    return DOUBLE
+  return STRING
+
+
+def MergeTypes(a, b):
+  """Returns the narrowest type which can hold values of both types."""
+  if a is None:
+    return b
+  if b is None or a == b:
+    return a
+  item_a, item_b = GetItemType(a), GetItemType(b)
+  if item_a and item_b:
+    return ListType(_MergeScalarTypes(item_a, item_b))
+  if item_a or item_b:
+    return STRING
+  return _MergeScalarTypes(a, b)
+
+
+def GetValueType(value):
+  """Infers the column type of a flattened value.
+
+  None, and lists without any item other than None, have no type, so they
+  don't add or widen columns.
+  """
+  if value is None:
+    return None
+  if isinstance(value, list):
+    item_type = None
+    for item in value:
+      if item is not None:
+        item_type = _MergeScalarTypes(item_type or _GetScalarType(item),
+                                      _GetScalarType(item))
+    return ListType(item_type) if item_type else None
+  return _GetScalarType(value) or STRING
+
+
+def _ToJSON(value):
+  if isinstance(value, str):
+    return value
+  return json.dumps(value, sort_keys=True)
+
+
+def CoerceValue(value, column_type):
+  """Converts a flattened value to fit the given column type."""
+  if value is None:
+    return None
+  item_type = GetItemType(column_type)
+  if item_type:
+    return [CoerceValue(item, item_type) for item in value]
+  if column_type == STRING:
+    return _ToJSON(value)
+  if isinstance(value, list):
+    # A list without typed items in a column of other scalars.
+    return None
+  if column_type in (DOUBLE, TIMESTAMP):
+    return float(value)
+  return value
+
+
+def _IsScalar(value):
+  return value is None or _GetScalarType(value) is not None
+
+
+def _FlattenParameters(parameters, row):
+  for name, parameter in parameters.items():
+    if not isinstance(parameter, dict):
+      row['parameters.%s' % name] = _ToJSON(parameter)
+      continue
+    prefix = 'parameters.%s.' % name
+    for key, value in parameter.items():
+      if key != 'data':
+        _FlattenValue(prefix + key, value, row)
+    data = parameter.get('data') or []
+    for field in PARAMETER_DATA_FIELDS:
+      if any(field in item for item in data):
+        values = [item.get(field) for item in data]
+        if all(_IsScalar(value) for value in values):
+          row[prefix + field] = values
+        else:
+          row[prefix + field] = _ToJSON(values)
+
+
+def _FlattenValue(name, value, row):
+  if value is None:
+    return
+  if isinstance(value, dict):
+    for key, sub_value in value.items():
+      _FlattenValue('%s.%s' % (name, key), sub_value, row)
+  elif isinstance(value, list):
+    if all(_IsScalar(item) for item in value):
+      row[name] = value
+    else:
+      row[name] = _ToJSON(value)
+  elif _IsScalar(value):
+    row[name] = value
+  else:
+    row[name] = _ToJSON(value)
+
+
+def FlattenEvent(event, include_history=False):
+  """Flattens an event into a row.
+
+  Args:
+    event: The datatypes.Event to flatten.
+    include_history: Whether to keep the history of the event, as a JSON
+        string column.
+
+  Returns:
+    A tuple (row, types), where row is a dictionary from column names to
+    values, and types a dictionary from column names to their inferred types.
+  """
+  row = {}
+  types = {}
+  for key, value in event.payload.items():
+    if key.startswith('__'):
+      continue
+    if key == 'parameters' and isinstance(value, dict):
+      _FlattenParameters(value, row)
+    elif key in TIMESTAMP_FIELDS and isinstance(value, (int, float)):
+      row[key] = float(value)
+      types[key] = TIMESTAMP
+    else:
+      _FlattenValue(key, value, row)
+  if include_history and event.history:
+    row[_HISTORY_COLUMN] = _ToJSON(
+        [stage.ToDict() for stage in event.history])
+  for name, value in row.items():
+    if name not in types:
+      types[name] = GetValueType(value)
+  return row, types
+
+
+class Schema:
+  """The evolving schema of one kind of events.
+
+  Properties:
+    fields: An OrderedDict from column names to their types.
+    version: Incremented on every change to fields.
+    changes: A list of (version, column name, old type, new type).
+  """
+
+  def __init__(self, fields=None, version=0, changes=None):
+    self.fields = collections.OrderedDict(fields or [])
+    self.version = version
+    self.changes = [tuple(change) for change in changes or []]
+
+  def Update(self, types):
+    """Adds new columns and widens existing ones to hold the given types.
+
+    Returns:
+      A list of the changes made, each (column name, old type, new type).  The
+      old type of a new column is None.
+    """
+    changes = []
+    for name, column_type in types.items():
+      old_type = self.fields.get(name)
+      new_type = MergeTypes(old_type, column_type)
+      if new_type != old_type:
+        self.fields[name] = new_type
+        changes.append((name, old_type, new_type))
+    if changes:
+      self.version += 1
+      self.changes.extend((self.version,) + change for change in changes)
+    return changes
+
+  def Coerce(self, row):
+    """Returns the values of a row in column order, with None for missing."""
+    return [CoerceValue(row.get(name), column_type)
+            for name, column_type in self.fields.items()]
+
+  def ToDict(self):
+    return {'fields': list(self.fields.items()),
+            'version': self.version,
+            'changes': self.changes}
+
+  @classmethod
+  def FromDict(cls, dct):
+    return cls(dct['fields'], dct['version'], dct['changes'])
+
+  def __eq__(self, other):
+    return isinstance(other, Schema) and self.ToDict() == other.ToDict()
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    return 'Schema(fields=%r, version=%r)' % (list(self.fields.items()),
+                                               self.version)
+
+
+def ClassifierOfEventDay(event):
+  """Gets the local date of an event, or of today if it has no time."""
+  event_time = event.get('time')
+  if isinstance(event_time, (int, float)):
+    return datetime.date.fromtimestamp(event_time).strftime('%Y%m%d')
+  return output_classify.ClassifierOfDay()
+
+
+def GetPartitionPath(event, partitions):
+  """Returns the relative directory of an event by the given classifiers.
+
+  Args:
+    event: The datatypes.Event to classify.
+    partitions: A list of classifiers.  A classifier is either "__DAY__", the
+        day of the event, or a dictionary path of the event.
+  """
+  path = []
+  for classifier_name in partitions:
+    if classifier_name == '__DAY__':
+      subdir_name = ClassifierOfEventDay(event)
+    else:
+      subdir_name = str(
+          type_utils.GetDict(event, classifier_name, UNKNOWN_PARTITION))
+    # Never escape from the target directory.
+    subdir_name = subdir_name.replace(os.sep, '_').lstrip('.')
+    path.append(subdir_name or UNKNOWN_PARTITION)
+  return os.path.join(*path) if path else ''
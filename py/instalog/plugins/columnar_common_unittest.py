@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for columnar output plugin common file."""
+
+import datetime
+import json
+import logging
+import time
+import unittest
+from unittest import mock
+
+from cros.factory.instalog import datatypes
+from cros.factory.instalog import log_utils
+from cros.factory.instalog.plugins import columnar_common
+
+
+_STRING = columnar_common.STRING
+_INT64 = columnar_common.INT64
+_DOUBLE = columnar_common.DOUBLE
+_TIMESTAMP = columnar_common.TIMESTAMP
+_ListType = columnar_common.ListType
+SAMPLE_TODAY = datetime.date(1989, 12, 12)
+
+
+def _TestRunEvent(**kwargs):
+  payload = {
+      '__testlog__': True,
+      'type': 'station.test_run',
+      'time': 1600000000.5,
+      'seq': 1,
+      'stationDeviceId': 'station_1',
+      'testRunId': 'run_1',
+      'startTime': 1600000000.0,
+      'duration': 2.5,
+      'status': 'PASS',
+      'serialNumbers': {'serial_number': 'SN001', 'mlb_serial_number': 'MLB'},
+      'parameters': {
+          'voltage': {
+              'valueUnit': 'V',
+              'data': [
+                  {'numericValue': 3, 'status': 'PASS'},
+                  {'numericValue': 3.2, 'status': 'PASS',
+                   'expectedMinimum': 3.0},
+              ]},
+          'firmware': {
+              'data': [{'textValue': 'v1.0', 'status': 'PASS'}]},
+      },
+      'failures': [{'code': 'E1', 'details': 'bad'}],
+  }
+  payload.update(kwargs)
+  return datatypes.Event(payload)
+
+
+class FlattenEventTest(unittest.TestCase):
+
+  def testTestRun(self):
+    row, types = columnar_common.FlattenEvent(_TestRunEvent())
+    self.assertEqual({
+        'type': 'station.test_run',
+        'time': 1600000000.5,
+        'seq': 1,
+        'stationDeviceId': 'station_1',
+        'testRunId': 'run_1',
+        'startTime': 1600000000.0,
+        'duration': 2.5,
+        'status': 'PASS',
+        'serialNumbers.serial_number': 'SN001',
+        'serialNumbers.mlb_serial_number': 'MLB',
+        'parameters.voltage.valueUnit': 'V',
+        'parameters.voltage.numericValue': [3, 3.2],
+        'parameters.voltage.status': ['PASS', 'PASS'],
+        'parameters.voltage.expectedMinimum': [None, 3.0],
+        'parameters.firmware.textValue': ['v1.0'],
+        'parameters.firmware.status': ['PASS'],
+        'failures': '[{"code": "E1", "details": "bad"}]',
+    }, row)
+    self.assertEqual(_TIMESTAMP, types['time'])
+    self.assertEqual(_TIMESTAMP, types['startTime'])
+    self.assertEqual(_DOUBLE, types['duration'])
+    self.assertEqual(_INT64, types['seq'])
+    self.assertEqual(_ListType(_DOUBLE),
+                     types['parameters.voltage.numericValue'])
+    self.assertEqual(_ListType(_DOUBLE),
+                     types['parameters.voltage.expectedMinimum'])
+    self.assertEqual(_ListType(_STRING), types['parameters.voltage.status'])
+    self.assertEqual(_STRING, types['failures'])
+
+  def testHistory(self):
+    event = _TestRunEvent()
+    event.AppendStage(datatypes.ProcessStage(
+        'node', 1.0, 'input', 'input_http', datatypes.ProcessStage.BUFFER))
+    row, unused_types = columnar_common.FlattenEvent(event)
+    self.assertNotIn('history', row)
+    row, types = columnar_common.FlattenEvent(event, include_history=True)
+    self.assertEqual('input', json.loads(row['history'])[0]['plugin_id'])
+    self.assertEqual(_STRING, types['history'])
+
+
+class SchemaTest(unittest.TestCase):
+
+  def testMergeTypes(self):
+    self.assertEqual(_INT64, columnar_common.MergeTypes(None, _INT64))
+    self.assertEqual(_DOUBLE, columnar_common.MergeTypes(_INT64, _DOUBLE))
+    self.assertEqual(_STRING, columnar_common.MergeTypes(_DOUBLE, _STRING))
+    self.assertEqual(_STRING, columnar_common.MergeTypes(
+        columnar_common.BOOL, _INT64))
+    self.assertEqual(_ListType(_DOUBLE), columnar_common.MergeTypes(
+        _ListType(_INT64), _ListType(_DOUBLE)))
+    self.assertEqual(_STRING, columnar_common.MergeTypes(
+        _ListType(_INT64), _INT64))
+
+  def testEvolution(self):
+    schema = columnar_common.Schema()
+    unused_row, types = columnar_common.FlattenEvent(_TestRunEvent(seq=1))
+    schema.Update(types)
+    self.assertEqual(1, schema.version)
+    self.assertEqual([], schema.Update(types))
+    self.assertEqual(1, schema.version)
+
+    # A new parameter and a wider type.
+    row, types = columnar_common.FlattenEvent(_TestRunEvent(
+        seq=2.5, parameters={'current': {'data': [{'numericValue': 1}]}}))
+    changes = schema.Update(types)
+    self.assertEqual(2, schema.version)
+    self.assertEqual(
+        [('seq', _INT64, _DOUBLE),
+         ('parameters.current.numericValue', None, _ListType(_INT64))],
+        changes)
+    self.assertEqual(list(schema.fields)[-1],
+                     'parameters.current.numericValue')
+
+    # Rows are coerced to the latest schema and null-filled.
+    values = dict(zip(schema.fields, schema.Coerce(row)))
+    self.assertEqual(2.5, values['seq'])
+    self.assertIsNone(values['parameters.voltage.numericValue'])
+    self.assertEqual([1], values['parameters.current.numericValue'])
+
+    # Incompatible values widen to string.
+    row, types = columnar_common.FlattenEvent(_TestRunEvent(seq='3'))
+    schema.Update(types)
+    self.assertEqual(_STRING, schema.fields['seq'])
+    row, types = columnar_common.FlattenEvent(_TestRunEvent(seq=4))
+    self.assertEqual([], schema.Update(types))
+    self.assertEqual('4', dict(zip(schema.fields, schema.Coerce(row)))['seq'])
+
+    # Empty lists don't widen columns.
+    row, types = columnar_common.FlattenEvent(_TestRunEvent(
+        seq=[], parameters={'current': {'data': [{'numericValue': None}]}}))
+    self.assertIsNone(types['seq'])
+    self.assertIsNone(types['parameters.current.numericValue'])
+    self.assertEqual([], schema.Update(types))
+    values = dict(zip(schema.fields, schema.Coerce(row)))
+    self.assertEqual('[]', values['seq'])
+    self.assertEqual([None], values['parameters.current.numericValue'])
+
+    # Serializable.
+    self.assertEqual(schema, columnar_common.Schema.FromDict(
+        json.loads(json.dumps(schema.ToDict()))))
+
+
+class GetPartitionPathTest(unittest.TestCase):
+
+  def testPartition(self):
+    event_time = time.mktime((2020, 12, 8, 12, 0, 0, 0, 0, -1))
+    event = _TestRunEvent(time=event_time)
+    self.assertEqual(
+        '20201208/station_1',
+        columnar_common.GetPartitionPath(
+            event, ['__DAY__', 'stationDeviceId']))
+    self.assertEqual(
+        'station.test_run/SN001',
+        columnar_common.GetPartitionPath(
+            event, ['type', 'serialNumbers.serial_number']))
+    self.assertEqual(
+        columnar_common.UNKNOWN_PARTITION,
+        columnar_common.GetPartitionPath(event, ['dutDeviceId']))
+
+  def testUnsafePartition(self):
+    event = _TestRunEvent(stationDeviceId='../../etc')
+    self.assertEqual('_.._etc', columnar_common.GetPartitionPath(
+        event, ['stationDeviceId']))
+
+  @mock.patch('datetime.date')
+  def testDayWithoutTime(self, mock_date):
+    mock_date.today.return_value = SAMPLE_TODAY
+    event = datatypes.Event({'type': 'station.message'})
+    self.assertEqual('19891212', columnar_common.GetPartitionPath(
+        event, ['__DAY__']))
+
+
+if __name__ == '__main__':
+  log_utils.InitLogging(log_utils.GetStreamHandler(logging.INFO))
+  unittest.main()
@@ -24,6 +24,8 @@ from cros.factory.instalog.utils import net_utils
 
 class TestHTTP(unittest.TestCase):
 
+  STREAMING = False
+
   def _CreatePlugin(self):
     self.core = testing.MockCore()
     self.hostname = 'localhost'
@@ -34,7 +36,8 @@ class TestHTTP(unittest.TestCase):
         'hostname': 'localhost',
         'port': self.port,
         'batch_size': 4,
-        'timeout': 10}
+        'timeout': 10,
+        'enable_streaming': self.STREAMING}
     self.output_sandbox = plugin_sandbox.PluginSandbox(
         'output_http', config=output_config, core_api=self.core)
 
@@ -128,8 +131,15 @@ class TestHTTP(unittest.TestCase):
       self.assertEqual(0, len(self.core.emit_calls))
 
 
+class TestHTTPStreaming(TestHTTP):
+
+  STREAMING = True
+
+
 class TestHTTPAE(unittest.TestCase):
 
+  STREAMING = False
+
   def _CreateKeys(self):
     """Sets the keys for both input HTTP plugin and output HTTP plugin
 
@@ -213,6 +223,7 @@ class TestHTTPAE(unittest.TestCase):
         'port': self.port,
         'batch_size': 4,
         'timeout': 10,
+        'enable_streaming': self.STREAMING,
         'enable_gnupg': True,
         'gnupg_home': self.gpg_output_homedir,
         'target_key': self._target_key}
@@ -277,6 +288,11 @@ class TestHTTPAE(unittest.TestCase):
         self.assertEqual(event3, self.core.emit_calls[0][2])
 
 
+class TestHTTPAEStreaming(TestHTTPAE):
+
+  STREAMING = True
+
+
 if __name__ == '__main__':
   log_utils.InitLogging(log_utils.GetStreamHandler(logging.INFO))
   unittest.main()
@@ -23,13 +23,19 @@ $ curl -i -X POST \
        -H 'Multi-Event: True' \
        TARGET_HOSTNAME:TARGET_PORT
 (See datatypes.py Event.Deserialize for details of event format.)
+
+The request body may also be sent with "Transfer-Encoding: chunked" instead of
+Content-Length, which is what output HTTP plugin does with enable_streaming.
+The body is parsed incrementally, and attachments are written to disk while
+being received.
 """
 
-import cgi
+import email.parser
+import email.utils
 import http.server
-from io import StringIO
 from io import BytesIO
 import logging
+import os
 import shutil
 import tempfile
 import threading
@@ -46,52 +52,168 @@ from cros.factory.instalog.external import gnupg
 
 
 _DEFAULT_HOSTNAME = '0.0.0.0'
+_READ_BLOCK_BYTES = 256 * 1024
+_MAX_LINE_BYTES = 1024
+_MAX_HEADER_BYTES = 64 * 1024
+_ATTACHMENTS_TMP_DIR = 'attachments_tmp'
+
 
+class RequestTooLargeError(Exception):
+  """The request body is bigger than the maximum size."""
 
-class InstalogFieldStorage(cgi.FieldStorage):
-  """A special version of FieldStorage dedicated for Instalog plugins.
 
-  This class always reads 'events' into memory, and attachments into disk.
+class RequestBodyReader(object):
+  """Reads the body of a request, with Content-Length or chunked encoding.
+
+  Raises RequestTooLargeError as soon as more than max_bytes bytes have been
+  read, so a chunked request without Content-Length can't exceed the limit.
+  """
 
-  Note curreny implementation is using few internal functions and variables from
-  Python 2.7 cgi module, and may not work for different Python versions.
+  def __init__(self, rfile, content_length, max_bytes):
+    self._rfile = rfile
+    self._chunked = content_length is None
+    self._remaining = 0 if self._chunked else content_length
+    self._max_bytes = max_bytes
+    self._eof = False
+    self.total_bytes = 0
+
+  def _ReadChunkSize(self):
+    line = self._rfile.readline(_MAX_LINE_BYTES)
+    if not line.endswith(b'\r\n'):
+      raise ValueError('Invalid chunk size line: %r' % line)
+    size = int(line.split(b';', 1)[0].strip(), 16)
+    if size == 0:
+      # Skip the trailer part.
+      while self._rfile.readline(_MAX_LINE_BYTES) not in (b'\r\n', b'\n', b''):
+        pass
+    return size
+
+  def read(self, size):
+    """Reads at most size bytes, and returns b'' at the end of the body."""
+    if self._eof:
+      return b''
+    if self._chunked and self._remaining == 0:
+      self._remaining = self._ReadChunkSize()
+    if self._remaining == 0:
+      self._eof = True
+      return b''
+    data = self._rfile.read(min(size, self._remaining))
+    if not data:
+      raise ValueError('Unexpected end of request body')
+    self._remaining -= len(data)
+    if self._chunked and self._remaining == 0:
+      self._rfile.readline(_MAX_LINE_BYTES)  # The CRLF after chunk data.
+    self.total_bytes += len(data)
+    if self.total_bytes > self._max_bytes:
+      raise RequestTooLargeError
+    return data
+
+
+class MultipartParser(object):
+  """Incremental parser of multipart/form-data request bodies.
+
+  The body is read block by block.  Fields named 'event' are kept in memory,
+  and all other fields (attachments) are written directly into files under
+  tmp_dir while being received, so the memory used doesn't depend on the size
+  of the request.  Keeping tmp_dir on the same filesystem as the buffer lets
+  the buffer take the attachments with a hard link instead of a copy.
   """
 
-  def __init__(self, tmp_dir, *args, **kargs):
-    self.tmp_dir = tmp_dir
-    self.FieldStorageClass = lambda *args, **kargs: InstalogFieldStorage(
-        self.tmp_dir, *args, **kargs)
-    cgi.FieldStorage.__init__(self, *args, **kargs)
-
-  def read_lines(self):
-    # Never use fast cache (__file) and always use make_file.
-    # pylint: disable=attribute-defined-outside-init
-    self._FieldStorage__file = None
-    self.file = self.make_file()
-    if self.outerboundary:
-      self.read_lines_to_outerboundary()
+  def __init__(self, reader, boundary, tmp_dir):
+    self._reader = reader
+    # The first boundary doesn't need the leading CRLF, so pretend it is there.
+    self._buf = bytearray(b'\r\n')
+    self._delimiter = b'\r\n--' + boundary.encode('utf-8')
+    self._tmp_dir = tmp_dir
+
+  def _Read(self):
+    data = self._reader.read(_READ_BLOCK_BYTES)
+    if not data:
+      raise ValueError('Unexpected end of multipart body')
+    self._buf.extend(data)
+
+  def _ReadUntil(self, separator):
+    """Removes and returns the data in buffer before the separator."""
+    start = 0
+    while True:
+      index = self._buf.find(separator, start)
+      if index >= 0:
+        data = bytes(self._buf[:index])
+        del self._buf[:index + len(separator)]
+        return data
+      if len(self._buf) > _MAX_HEADER_BYTES:
+        raise ValueError('Multipart headers are too long')
+      start = max(0, len(self._buf) - len(separator) + 1)
+      self._Read()
+
+  def _CopyUntilDelimiter(self, output):
+    """Writes the data before next delimiter to output, and removes both."""
+    keep = len(self._delimiter) - 1
+    while True:
+      index = self._buf.find(self._delimiter)
+      if index >= 0:
+        output.write(self._buf[:index])
+        del self._buf[:index + len(self._delimiter)]
+        return
+      if len(self._buf) > keep:
+        output.write(self._buf[:-keep])
+        del self._buf[:-keep]
+      self._Read()
+
+  def _ParseHeaders(self):
+    """Parses headers of a part, and returns the name of the field."""
+    while len(self._buf) < 2:
+      self._Read()
+    if self._buf[:2] == b'\r\n':
+      del self._buf[:2]
+      header_bytes = b''
     else:
-      self.read_lines_to_eof()
+      header_bytes = self._ReadUntil(b'\r\n\r\n')
+    headers = email.parser.BytesHeaderParser().parsebytes(header_bytes)
+    name = headers.get_param('name', header='content-disposition')
+    if name is None:
+      raise ValueError('Missing name in Content-Disposition of a field')
+    return email.utils.collapse_rfc2231_value(name)
 
-  def make_file(self):
-    """Always use memory.
+  def Parse(self):
+    """Parses the whole body.
 
-    When the content is larger than 1k, FieldStorage will call make_file to
-    create a real file on disk for. For Instalog, we want to always use
-    in-memory buffer. Note there will still be one copy in __write, but
-    there won't be system calls for creating or deleting files (and no fd used).
+    Returns:
+      A list of (name, value) tuples in the order of the body.  The value is
+      the content string for 'event' fields, and the path of the received file
+      for other fields.
     """
-    if not self.name or self.name == 'event':
-      if self._binary_file:
-        return BytesIO()
-      return StringIO()
-
-    # Save attachments.
-    mode = 'w'
-    if self._binary_file:
-      mode = 'wb'
-    return tempfile.NamedTemporaryFile(
-        mode, prefix=self.name + '_', dir=self.tmp_dir, delete=False)
+    fields = []
+    # Skip the preamble.
+    self._CopyUntilDelimiter(_NullWriter())
+    while True:
+      while len(self._buf) < 2:
+        self._Read()
+      if self._buf[:2] == b'--':
+        break
+      # Skip the transport padding after the boundary.
+      self._ReadUntil(b'\r\n')
+      name = self._ParseHeaders()
+      if name == 'event':
+        output = BytesIO()
+        self._CopyUntilDelimiter(output)
+        fields.append((name, output.getvalue().decode('utf-8', 'replace')))
+      else:
+        with tempfile.NamedTemporaryFile(
+            'wb', prefix=name + '_', dir=self._tmp_dir, delete=False) as f:
+          self._CopyUntilDelimiter(f)
+        fields.append((name, f.name))
+    # Drain the epilogue, so the connection could be reused.
+    while self._reader.read(_READ_BLOCK_BYTES):
+      pass
+    return fields
+
+
+class _NullWriter(object):
+  """A file-like object which discards everything."""
+
+  def write(self, data):
+    del data  # Unused.
 
 
 class HTTPHandler(http.server.BaseHTTPRequestHandler, log_utils.LoggerMixin):
@@ -103,6 +225,7 @@ class HTTPHandler(http.server.BaseHTTPRequestHandler, log_utils.LoggerMixin):
     self._max_bytes = server.context['max_bytes']
     self._gpg = server.context['gpg']
     self._check_format = server.context['check_format']
+    self._tmp_dir = server.context['tmp_dir']
     self._enable_multi_event = False
     self.content_length = 0
     self.client_node_id = 'NoNodeID'
@@ -125,6 +248,7 @@ class HTTPHandler(http.server.BaseHTTPRequestHandler, log_utils.LoggerMixin):
     """Processes when receiving POST request."""
     content_type = self.headers.get('Content-Type', '')
     self.content_length = self.headers.get('Content-Length', None)
+    chunked = 'chunked' in self.headers.get('Transfer-Encoding', '').lower()
     self.client_node_id = self.headers.get('Node-ID', 'NoNodeID')
     # Need to reject other Content-Type, because Content-Type =
     # 'application/x-www-form-urlencoded' may use about 81 times of data size
@@ -134,18 +258,23 @@ class HTTPHandler(http.server.BaseHTTPRequestHandler, log_utils.LoggerMixin):
                               'multipart/form-data, please use output HTTP '
                               'plugin or curl command')
       return
-    if not self.content_length:
-      self._SendResponse(411, 'Length Required: Need header Content-Length')
+    if chunked:
+      # The size is checked while reading the body.
+      self.content_length = None
+    elif not self.content_length:
+      self._SendResponse(411, 'Length Required: Need header Content-Length or '
+                              'Transfer-Encoding: chunked')
       return
     # Content-Length may be wrong, and may cause some security issue.
-    if int(self.content_length) > self._max_bytes:
+    elif int(self.content_length) > self._max_bytes:
       self._SendResponse(413, 'Request Entity Too Large: The request is bigger '
                               'than %d bytes' % self._max_bytes)
       return
     if self.headers.get('Multi-Event', 'False') == 'True':
       self._enable_multi_event = True
     # Create the temporary directory for attachments.
-    with file_utils.TempDirectory(prefix='input_http_') as tmp_dir:
+    with file_utils.TempDirectory(prefix='input_http_',
+                                  dir=self._tmp_dir) as tmp_dir:
       self.debug('Temporary directory for attachments: %s', tmp_dir)
       status_code, resp_reason = self._ProcessRequest(tmp_dir)
       self._SendResponse(status_code, resp_reason)
@@ -161,19 +290,28 @@ class HTTPHandler(http.server.BaseHTTPRequestHandler, log_utils.LoggerMixin):
     events = []
     ignore_count = 0
     try:
-      form = InstalogFieldStorage(
-          tmp_dir=tmp_dir,
-          fp=self.rfile,
-          headers=self.headers,
-          environ={'REQUEST_METHOD': 'POST'}
-      )
+      boundary = self.headers.get_param('boundary')
+      if not boundary:
+        raise ValueError('Missing boundary in Content-Type')
+      reader = RequestBodyReader(
+          self.rfile,
+          None if self.content_length is None else int(self.content_length),
+          self._max_bytes)
+      fields = MultipartParser(reader, boundary, tmp_dir).Parse()
+      if self.content_length is None:
+        self.content_length = reader.total_bytes
 
       receive_time = time.time() - start_time
       start_time = time.time()
 
-      remaining_att = set(form.keys())
-      event_list = form.getlist('event')
-      remaining_att.remove('event')
+      event_list = []
+      form = {}
+      for name, value in fields:
+        if name == 'event':
+          event_list.append(value)
+        else:
+          form.setdefault(name, []).append(value)
+      remaining_att = set(form)
       # To avoid confusion, we only allow processing one event per request.
       if not self._enable_multi_event and len(event_list) > 1:
         raise ValueError('One request should not exceed one event')
@@ -186,20 +324,18 @@ class HTTPHandler(http.server.BaseHTTPRequestHandler, log_utils.LoggerMixin):
         if not self._enable_multi_event:
           if event.attachments:
             raise ValueError('Please follow the format: event={Payload}')
-          requests_keys = form.keys()
-          for key in requests_keys:
-            if key != 'event':
-              event.attachments[key] = key
+          for key in form:
+            event.attachments[key] = key
 
         for att_id, att_key in event.attachments.items():
-          if att_key not in form or isinstance(form[att_key], list):
+          if att_key not in form or len(form[att_key]) != 1:
             raise ValueError('Attachment(%s) should have exactly one in the '
                              'request' % att_key)
           if att_key not in remaining_att:
             raise ValueError('Attachment(%s) should be used by one event' %
                              att_key)
           remaining_att.remove(att_key)
-          event.attachments[att_id] = form[att_key].file.name
+          event.attachments[att_id] = form[att_key][0]
           if self._gpg:
             self._DecryptFile(event.attachments[att_id], tmp_dir)
 
@@ -207,9 +343,13 @@ class HTTPHandler(http.server.BaseHTTPRequestHandler, log_utils.LoggerMixin):
           events.append(event)
         else:
           ignore_count += 1
-      del form  # Free memory earlier.
       if remaining_att:
         raise ValueError('Additional fields: %s' % list(remaining_att))
+    except RequestTooLargeError:
+      # The rest of the body is not read, so don't reuse the connection.
+      self.close_connection = True  # pylint: disable=attribute-defined-outside-init
+      return 413, ('Request Entity Too Large: The request is bigger than %d '
+                   'bytes' % self._max_bytes)
     except Exception as e:
       self.exception('Bad request with exception: %s', repr(e))
       return 400, 'Bad request: ' + repr(e)
@@ -354,6 +494,14 @@ class InputHTTP(plugin_base.InputPlugin):
       if len(gpg.list_keys(True)) < 1:
         raise Exception('Need at least one GnuPG secret key in gnupghome')
 
+    # Receive attachments into the data directory, which is usually on the same
+    # filesystem as the buffer, so they can be linked instead of copied.
+    tmp_dir = None
+    if self.GetDataDir():
+      tmp_dir = os.path.join(self.GetDataDir(), _ATTACHMENTS_TMP_DIR)
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+      file_utils.TryMakeDirs(tmp_dir)
+
     self._http_server = ThreadedHTTPServer(
         self.logger.name, (self.args.hostname, self.args.port), HTTPHandler)
     self._http_server.context = {
@@ -361,7 +509,8 @@ class InputHTTP(plugin_base.InputPlugin):
         'gpg': gpg,
         'logger_name': self.logger.name,
         'plugin_api': self,
-        'check_format': self._CheckFormat}
+        'check_format': self._CheckFormat,
+        'tmp_dir': tmp_dir}
     self._http_server.StartServer()
     self.info('http now listening on %s:%d...',
               self.args.hostname, self.args.port)
@@ -241,6 +241,47 @@ class TestInputHTTP(unittest.TestCase):
     self.assertEqual(406, client.getresponse().status)
     self.assertEqual(0, len(self.core.emit_calls))
 
+  def _ChunkedPost(self, fields, chunk_size=1000):
+    boundary = 'chunkedboundary'
+    body = b''
+    for name, data in fields:
+      body += (b'--%s\r\nContent-Disposition: form-data; name="%s"; '
+               b'filename="%s"\r\n\r\n%s\r\n' % (
+                   boundary.encode(), name.encode(), name.encode(), data))
+    body += b'--%s--\r\n' % boundary.encode()
+    client = http.client.HTTPConnection('localhost', self.port, timeout=180)
+    client.request(
+        'POST', '/',
+        (body[i:i + chunk_size] for i in range(0, len(body), chunk_size)),
+        {'Content-Type': 'multipart/form-data; boundary=%s' % boundary,
+         'Multi-Event': 'True'},
+        encode_chunked=True)
+    return client.getresponse().status
+
+  def testChunkedRequest(self):
+    event = datatypes.Event({'AA': 'BB'}, {'att_id': 'att'})
+    # Make the attachment contain something similar to the boundary.
+    att = os.urandom(100 * 1024) + b'\r\n--chunked' + os.urandom(1024)
+    status = self._ChunkedPost(
+        [('att', att),
+         ('event', datatypes.Event.Serialize(event).encode('utf-8'))])
+    self.assertEqual(200, status)
+    self.assertEqual(1, len(self.core.emit_calls))
+    self.assertEqual(event.payload, self.core.emit_calls[0][0].payload)
+    with open(self.core.emit_calls[0][0].attachments['att_id'], 'rb') as f:
+      self.assertEqual(att, f.read())
+
+  def testChunkedRequestTooLarge(self):
+    # pylint: disable=protected-access
+    self.plugin._http_server.context['max_bytes'] = 1024
+    event = datatypes.Event({'AA': 'BB'}, {'att_id': 'att'})
+    status = self._ChunkedPost(
+        [('att', os.urandom(2048)),
+         ('event', datatypes.Event.Serialize(event).encode('utf-8'))],
+        chunk_size=100)
+    self.assertEqual(413, status)
+    self.assertEqual(0, len(self.core.emit_calls))
+
   def testMultiEvent(self):
     event1 = datatypes.Event({}, {'att_id': 'att1'})
     event2 = datatypes.Event({'CC': 'DD'}, {})
@@ -12,15 +12,34 @@ any data loss when the application writing into a log file locks the log file
 during writes.  Otherwise, some data loss may occur between the call to
 os.getsize and the truncate write operation.
 
+Directories of the log files are watched with inotify, so that a log file is
+read soon after it is written to, and new log files are found without waiting
+for the next scan.  Without inotify, or when it runs out of watches, each log
+file is polled every poll_interval seconds instead.  Up to max_workers log files
+are read and parsed concurrently.
+
+Offsets of all log files are written together into one checkpoint file at most
+every checkpoint_interval seconds.  After a crash, up to checkpoint_interval
+seconds of events may be emitted again.  The inode of each log file is kept
+along with its offset, so that a log file replaced by a new one (rotated) is
+read from the start, and a log file renamed to another path matching the glob
+continues from its old offset.
+
 Default implementation assumes log files contain lines of JSON.  Can be
 subclassed with different implementation of either ParseEvents or ParseLine.
 """
 
+import collections
+from concurrent import futures
+import fnmatch
 import glob
+import heapq
+import itertools
 import json
 import logging
 import os
 import queue
+import threading
 import zlib
 
 from cros.factory.instalog import datatypes
@@ -28,6 +47,7 @@ from cros.factory.instalog import log_utils
 from cros.factory.instalog import plugin_base
 from cros.factory.instalog.utils.arg_utils import Arg
 from cros.factory.instalog.utils import file_utils
+from cros.factory.instalog.utils import inotify_utils
 from cros.factory.instalog.utils import time_utils
 
 
@@ -38,6 +58,19 @@ _DEFAULT_BATCH_PAUSE_TIME = 0.1
 _DEFAULT_BATCH_MAX_COUNT = 500
 _DEFAULT_BATCH_MAX_BYTES = 1 * 1024 * 1024  # 1mb
 _DEFAULT_MAX_BYTES = 0  # truncating disabled
+_DEFAULT_MAX_WORKERS = 4
+_DEFAULT_CHECKPOINT_INTERVAL = 1
+_OFFSETS_FILE_NAME = 'offsets.json'
+# Delay a scan triggered by inotify, so that a burst of new files only causes
+# one scan.
+_INOTIFY_SCAN_DELAY = 0.1
+_INOTIFY_MASK = (inotify_utils.IN_MODIFY | inotify_utils.IN_CREATE |
+                 inotify_utils.IN_DELETE | inotify_utils.IN_MOVED_FROM |
+                 inotify_utils.IN_MOVED_TO | inotify_utils.IN_ONLYDIR)
+_INOTIFY_SCAN_MASK = (inotify_utils.IN_CREATE | inotify_utils.IN_MOVED_TO |
+                      inotify_utils.IN_DELETE | inotify_utils.IN_MOVED_FROM)
+# The longest time the main loop blocks before checking IsStopping.
+_MAX_WAIT_TIME = 1
 
 
 class InputLogFile(plugin_base.InputPlugin):
@@ -46,10 +79,13 @@ class InputLogFile(plugin_base.InputPlugin):
       Arg('path', str,
           'Path to the set of log files on disk.  Uses glob syntax.'),
       Arg('new_file_poll_interval', (int, float),
-          'Interval in seconds to check for new paths that match the glob.',
+          'Interval in seconds to check for new paths that match the glob.  '
+          'With inotify, it is also the interval to check each log file for '
+          'updates that inotify might have missed.',
           default=_DEFAULT_NEW_FILE_POLL_INTERVAL),
       Arg('poll_interval', (int, float),
-          'Interval in seconds when the log file is checked for updates.',
+          'Interval in seconds when the log file is checked for updates, if '
+          'inotify is not used.',
           default=_DEFAULT_POLL_INTERVAL),
       Arg('error_pause_time', (int, float),
           'Time in seconds to wait when an error occurs reading a file.',
@@ -67,13 +103,45 @@ class InputLogFile(plugin_base.InputPlugin):
       Arg('max_bytes', int,
           'Maximum size of the log file in bytes before being truncated.  '
           'If set to 0, truncating functionality will be disabled (default).',
-          default=_DEFAULT_MAX_BYTES)
+          default=_DEFAULT_MAX_BYTES),
+      Arg('use_inotify', bool,
+          'Watch log files with inotify if available.  Otherwise, poll every '
+          'log file.',
+          default=True),
+      Arg('max_workers', int,
+          'Maximum number of log files to read and parse concurrently.',
+          default=_DEFAULT_MAX_WORKERS),
+      Arg('checkpoint_interval', (int, float),
+          'Interval in seconds to write offsets of log files to disk.  If set '
+          'to 0, offsets are written after every batch.',
+          default=_DEFAULT_CHECKPOINT_INTERVAL),
   ]
 
   def __init__(self, *args, **kwargs):
     self.log_files = {}
+    self.checkpoint = None
+    self._store_lock = threading.Lock()
+    # Offsets of log files which were replaced, by their inodes.
+    self._rotated_offsets = {}
+    self._rotated_lock = threading.Lock()
+    self._inotify = None
+    self._watch_thread = None
+    # Directories watched by inotify, by their watch descriptors.
+    self._watched_dirs = {}
+    self._watched_lock = threading.Lock()
+    # Messages from workers and the inotify thread to the main thread.
+    self._messages = queue.Queue()
     super(InputLogFile, self).__init__(*args, **kwargs)
 
+  def SetUp(self):
+    """Sets up the plugin."""
+    if self.args.max_workers < 1:
+      raise ValueError('max_workers must be at least 1')
+    self.checkpoint = OffsetCheckpoint(
+        logger_name=self.logger.name,
+        path=os.path.join(self.GetDataDir(), _OFFSETS_FILE_NAME),
+        interval=self.args.checkpoint_interval)
+
   def ScanLogFiles(self):
     """Updates the internal LogFile objects based on glob results.
 
@@ -81,6 +149,12 @@ class InputLogFile(plugin_base.InputPlugin):
       List of new LogFile objects.
     """
     new_log_files = []
+    # Offsets of replaced log files are only kept until the next scan, since
+    # their inodes may be reused by unrelated files later.
+    with self._rotated_lock:
+      rotated_offsets = self._rotated_offsets
+      self._rotated_offsets = {}
+    inodes = None
     paths = glob.glob(self.args.path)
     for path in paths:
       if path not in self.log_files:
@@ -97,91 +171,301 @@ class InputLogFile(plugin_base.InputPlugin):
         #
         #   /some/file/a => _some_file_a_0744b918
         #   /some/file_a => _some_file_a_287bc0ee
+        #
+        # Offsets are kept in the checkpoint file now, and these offset files
+        # are only read for log files which are not in the checkpoint yet.
         crc = '{:08x}'.format(abs(zlib.crc32(path.encode('utf-8'))))
         offset_file = '%s_%s' % (path.replace(os.sep, '_'), crc)
         log_file = LogFile(
             logger_name=self.logger.name,
             args=self.args,
             path=path,
-            offset_path=os.path.join(self.GetDataDir(), offset_file),
-            parse_and_emit_fn=self.ParseAndEmit)
+            checkpoint=self.checkpoint,
+            parse_and_emit_fn=self.ParseAndEmit,
+            rotate_fn=self.OnRotate,
+            offset_path=os.path.join(self.GetDataDir(), offset_file))
+        if log_file.inode is None:
+          if inodes is None:
+            inodes = {old_log_file.inode: old_log_file
+                      for old_log_file in self.log_files.values()
+                      if old_log_file.inode is not None}
+          self._InheritRotatedOffset(log_file, rotated_offsets, inodes)
         self.log_files[path] = log_file
         new_log_files.append(log_file)
     return new_log_files
 
-  def ScanLogFilesTask(self):
-    """Task to check the glob path for new log files.
+  def OnRotate(self, inode, offset):
+    """Remembers the offset of a log file which has been replaced."""
+    with self._rotated_lock:
+      self._rotated_offsets[inode] = offset
 
-    Returns:
-      A list of tasks to run (see Main for explanation).  Will include the next
-      ScanLogFilesTask, as well as any ProcessLogFileTasks of any newly-detected
-      log files.
+  def _InheritRotatedOffset(self, log_file, rotated_offsets, inodes):
+    """Continues from the old offset of a log file renamed to a new path.
+
+    Args:
+      log_file: A new LogFile.
+      rotated_offsets: A dict of offsets of replaced log files by inodes.
+      inodes: A dict of existing LogFile objects by their inodes.
     """
-    self.debug('Scanning for log files after %d seconds elapsed...',
-               self.args.new_file_poll_interval)
-    new_log_files = self.ScanLogFiles()
-    if new_log_files:
-      self.info('Scanned for log files, %d new files detected',
-                len(new_log_files))
-    next_scan = time_utils.MonotonicTime() + self.args.new_file_poll_interval
-    new_process_tasks = [
-        (0, self.ProcessLogFileTask, [log_file]) for log_file in new_log_files]
-    return [(next_scan, self.ScanLogFilesTask, [])] + new_process_tasks
-
-  def ProcessLogFileTask(self, log_file):
-    """Task to check a LogFile for new data.
+    try:
+      inode = os.stat(log_file.path).st_ino
+    except OSError:
+      return
+    offset = rotated_offsets.pop(inode, None)
+    if offset is None and inode in inodes:
+      # The rename might not be noticed by the old LogFile yet.
+      offset = inodes[inode].cur_offset
+    if offset is not None:
+      self.info('%s was renamed from another log file, continue from %d',
+                log_file.path, offset)
+      log_file.SetOffset(offset, inode)
+
+  def ProcessLogFile(self, log_file):
+    """Checks a LogFile for new data.
 
     Returns:
-      A list of tasks to run (see Main for explanation).  The only task will be
-      the next ProcessLogFileTask for this LogFile.
+      Time in seconds to wait before checking the LogFile again.
     """
     self.debug('Processing log file %s...', log_file.path)
     try:
       log_file.AttemptTruncate()
       more_data_available = log_file.ProcessBatch()
-      # If we still have more data to process right away, only pause for
-      # batch_pause_time.  Otherwise, pause for poll_interval.
-      pause_time = (self.args.batch_pause_time if more_data_available
-                    else self.args.poll_interval)
     except IOError:
       # We might not have permission to access this file, or there could be
       # some other IO problem.
       self.exception('Exception while accessing file, check permissions')
-      pause_time = self.args.error_pause_time
-    return [(time_utils.MonotonicTime() + pause_time, self.ProcessLogFileTask,
-             [log_file])]
+      return self.args.error_pause_time
+    # If we still have more data to process right away, only pause for
+    # batch_pause_time.  Otherwise, wait for the next update.
+    if more_data_available:
+      return self.args.batch_pause_time
+    if self._inotify:
+      return max(self.args.poll_interval, self.args.new_file_poll_interval)
+    return self.args.poll_interval
+
+  def _StartWatching(self):
+    """Starts the inotify thread if inotify is enabled and available."""
+    if not self.args.use_inotify:
+      return
+    if not inotify_utils.IsAvailable():
+      self.info('inotify is not available, polling log files instead')
+      return
+    try:
+      self._inotify = inotify_utils.Inotify()
+    except OSError:
+      self.exception('Failed to initialize inotify, polling log files instead')
+      return
+    self._watch_thread = threading.Thread(target=self._WatchThread,
+                                          name='input_log_file_inotify')
+    self._watch_thread.daemon = True
+    self._watch_thread.start()
+
+  def _StopWatching(self):
+    inotify = self._inotify
+    self._inotify = None
+    if self._watch_thread:
+      self._watch_thread.join()
+      self._watch_thread = None
+    if inotify:
+      inotify.Close()
+    with self._watched_lock:
+      self._watched_dirs = {}
+
+  def _UpdateWatches(self):
+    """Watches the directories of all log files for changes."""
+    if not self._inotify:
+      return
+    # Directories are kept as glob returns them, so that paths of inotify
+    # events match the paths of log files.
+    dirs = {os.path.dirname(path) for path in self.log_files}
+    # New log files may show up in the deepest directory without wildcards.
+    static_parts = []
+    for part in os.path.dirname(self.args.path).split(os.sep):
+      if glob.has_magic(part):
+        break
+      static_parts.append(part)
+    static_dir = os.sep.join(static_parts)
+    if self.args.path.startswith(os.sep):
+      static_dir = static_dir or os.sep
+    if os.path.isdir(static_dir or os.curdir):
+      dirs.add(static_dir)
+
+    with self._watched_lock:
+      watched = set(self._watched_dirs.values())
+    for dir_path in dirs - watched:
+      # Hold the lock, so the events of the new watch are not ignored by the
+      # inotify thread before the directory is recorded.
+      with self._watched_lock:
+        try:
+          wd = self._inotify.AddWatch(dir_path or os.curdir, _INOTIFY_MASK)
+        except OSError:
+          wd = None
+        else:
+          self._watched_dirs[wd] = dir_path
+      if wd is None:
+        if not os.path.isdir(dir_path or os.curdir):
+          continue
+        # Most likely max_user_watches is reached.
+        self.exception('Failed to watch %s, polling log files instead',
+                       dir_path)
+        self._StopWatching()
+        return
+
+  def _WatchThread(self):
+    """Forwards inotify events to the main thread."""
+    while not self.IsStopping():
+      inotify = self._inotify
+      if not inotify:
+        return
+      try:
+        events = inotify.Read(timeout=_MAX_WAIT_TIME)
+      except (OSError, ValueError):
+        # The inotify instance has been closed.
+        return
+      # Coalesce events of each path, since appending to a log file usually
+      # causes many IN_MODIFY events.
+      changes = {}
+      for event in events:
+        if event.mask & inotify_utils.IN_Q_OVERFLOW:
+          self._messages.put(('overflow', None, None))
+          continue
+        with self._watched_lock:
+          dir_path = self._watched_dirs.get(event.wd)
+          if dir_path is not None and event.mask & inotify_utils.IN_IGNORED:
+            self._watched_dirs.pop(event.wd)
+        if dir_path is None:
+          continue
+        if event.mask & inotify_utils.IN_IGNORED:
+          self._messages.put(('scan', None, None))
+        elif event.name:
+          path = os.path.join(dir_path, event.name)
+          changes[path] = changes.get(path, 0) | event.mask
+      if changes:
+        self._messages.put(('changed', None, changes))
 
   def Main(self):
     """Main thread of the plugin.
 
-    Runs off a task queue with 3-tuple elements in the format:
-      (scheduled_time, task_function, args_list)
-
-    task_function should return a list of tasks, which will be added back onto
-    the task queue after running.
+    Schedules each LogFile to be processed by a pool of max_workers threads.
+    A LogFile is processed by one thread at a time.  After being processed, the
+    LogFile is scheduled again after the time returned by ProcessLogFile, or
+    right away if inotify reports a change to it.
     """
-    # Kick the task queue off with the initial ScanLogFilesTask.
-    task_queue = queue.PriorityQueue()
-    task_queue.put((0, self.ScanLogFilesTask, []))
+    self._StartWatching()
+    executor = futures.ThreadPoolExecutor(
+        max_workers=self.args.max_workers,
+        thread_name_prefix='input_log_file')
+    try:
+      self._Schedule(executor)
+    finally:
+      executor.shutdown(wait=True)
+      self._StopWatching()
+      self._WriteCheckpoint(force=True)
+
+  def _Schedule(self, executor):
+    counter = itertools.count()
+    # Heap of (scheduled_time, counter, path).
+    tasks = []
+    # The earliest scheduled time of each path in tasks.
+    due_times = {}
+    ready = collections.deque()
+    ready_paths = set()
+    busy_paths = set()
+    # Paths which have changed while they are being processed.
+    pending_paths = set()
+    next_scan = 0
+
+    def ScheduleLogFile(path, delay):
+      if path in busy_paths:
+        if delay == 0:
+          pending_paths.add(path)
+        return
+      if path in ready_paths:
+        return
+      scheduled_time = time_utils.MonotonicTime() + delay
+      if due_times.get(path, float('inf')) <= scheduled_time:
+        return
+      due_times[path] = scheduled_time
+      heapq.heappush(tasks, (scheduled_time, next(counter), path))
+
+    def ProcessLogFileTask(log_file):
+      try:
+        pause_time = self.ProcessLogFile(log_file)
+      except Exception:
+        self.exception('Unexpected exception while processing %s',
+                       log_file.path)
+        pause_time = self.args.error_pause_time
+      self._messages.put(('done', log_file.path, pause_time))
 
     while not self.IsStopping():
-      # Retrieve and run the next scheduled task in the queue.  Add any
-      # tasks that the function generates back into the queue.
-      _, fn, args = task_queue.get()
-      # Remove the '[]' brackets from args list.
-      self.debug('Running task %s(%s)...', fn.__name__, str(args)[1:-1])
-      for task in fn(*args):
-        task_queue.put(task)
-
-      # Retrieve the scheduled time for the next task in the priority queue.
-      # Sleep until that task is scheduled.
-      next_time, next_fn, next_args = task_queue.queue[0]
-      wait_time = max(0, next_time - time_utils.MonotonicTime())
-      if wait_time > 0:
-        # Remove the '[]' brackets from next_args list.
-        self.debug('Need to wait %f sec before running task %s(%s)...',
-                   wait_time, next_fn.__name__, str(next_args)[1:-1])
-      self.Sleep(wait_time)
+      now = time_utils.MonotonicTime()
+      if now >= next_scan:
+        self.debug('Scanning for log files...')
+        new_log_files = self.ScanLogFiles()
+        if new_log_files:
+          self.info('Scanned for log files, %d new files detected',
+                    len(new_log_files))
+        for log_file in new_log_files:
+          ScheduleLogFile(log_file.path, 0)
+        self._UpdateWatches()
+        next_scan = now + self.args.new_file_poll_interval
+
+      while tasks and tasks[0][0] <= now:
+        scheduled_time, unused_count, path = heapq.heappop(tasks)
+        if due_times.get(path) != scheduled_time:
+          continue
+        del due_times[path]
+        ready.append(path)
+        ready_paths.add(path)
+      while ready and len(busy_paths) < self.args.max_workers:
+        path = ready.popleft()
+        ready_paths.discard(path)
+        busy_paths.add(path)
+        executor.submit(ProcessLogFileTask, self.log_files[path])
+
+      self._WriteCheckpoint()
+
+      next_time = min(next_scan, tasks[0][0] if tasks else next_scan,
+                      self.checkpoint.GetNextWriteTime())
+      wait_time = min(max(0, next_time - time_utils.MonotonicTime()),
+                      _MAX_WAIT_TIME)
+      try:
+        messages = [self._messages.get(timeout=wait_time)]
+      except queue.Empty:
+        continue
+      # Only take what is already there, so that a busy inotify thread cannot
+      # starve the scheduling above.
+      for unused_i in range(self._messages.qsize()):
+        messages.append(self._messages.get_nowait())
+
+      for kind, path, value in messages:
+        if kind == 'done':
+          busy_paths.discard(path)
+          if path in pending_paths:
+            pending_paths.discard(path)
+            value = min(value, self.args.batch_pause_time)
+          ScheduleLogFile(path, value)
+        elif kind == 'changed':
+          for path, mask in value.items():
+            if path in self.log_files:
+              ScheduleLogFile(path, 0)
+            if (mask & _INOTIFY_SCAN_MASK and
+                fnmatch.fnmatch(path, self.args.path)):
+              next_scan = min(next_scan, time_utils.MonotonicTime() +
+                              _INOTIFY_SCAN_DELAY)
+        elif kind == 'overflow':
+          self.warning('inotify queue overflowed, checking all log files')
+          for path in self.log_files:
+            ScheduleLogFile(path, 0)
+          next_scan = 0
+        elif kind == 'scan':
+          next_scan = 0
+
+  def _WriteCheckpoint(self, force=False):
+    """Writes offsets and the store to disk if it is time to."""
+    if self.checkpoint.Write(force=force):
+      with self._store_lock:
+        self.SaveStore()
 
   def ParseAndEmit(self, path, offset):
     """Parses lines starting at the given offset, and emits to Instalog.
@@ -220,8 +504,9 @@ class InputLogFile(plugin_base.InputPlugin):
         break
     self.info('Parsed %d events', len(events))
     if events:
-      self.store['last_event'] = events[-1].payload
-      self.SaveStore()
+      # The store is saved along with the checkpoint.
+      with self._store_lock:
+        self.store['last_event'] = events[-1].payload
     return line_reader.offset, self.Emit(events)
 
   def ParseEvents(self, path, lines):
@@ -266,7 +551,7 @@ class LineReader(log_utils.LoggerMixin):
   """Generates lines of data from the given file starting at the given offset.
 
   Includes trailing characters \r and \n in yielded strings.  Keeps track of
-  the current offset and exposes it as self.offset.
+  the current offset in bytes and exposes it as self.offset.
   """
   def __init__(self, logger_name, path, offset):
     # log_utils.LoggerMixin creates shortcut functions for convenience.
@@ -278,35 +563,114 @@ class LineReader(log_utils.LoggerMixin):
   def Readlines(self):
     """Generates lines of data, keeping track of current offset.
 
-    Returns:
-      A tuple, where the first element is the offset after reading the current
-      line, and the second element is the current line.
+    Lines are read in binary, so that offsets are byte positions even if
+    there are multi-byte characters or '\r\n' line endings, and then decoded
+    as UTF-8.
     """
-    with open(self.path, 'r') as f:
+    with open(self.path, 'rb') as f:
       f.seek(self.offset)
       for line in f:
         self.offset += len(line)
         self.consumed += len(line)
+        line = line.decode('utf-8', 'replace')
         self.debug('new_offset=%d, line=%r', self.offset, line.rstrip())
         yield line
 
 
+class OffsetCheckpoint(log_utils.LoggerMixin):
+  """Offsets and inodes of all log files, written to disk together.
+
+  Offsets are updated by LogFile objects from worker threads, and written to
+  disk from the main thread at most every interval seconds.
+  """
+
+  def __init__(self, logger_name, path, interval):
+    # log_utils.LoggerMixin creates shortcut functions for convenience.
+    self.logger = logging.getLogger(logger_name)
+    self.path = path
+    self.interval = interval
+    self._lock = threading.Lock()
+    self._offsets = {}
+    self._dirty = False
+    self._last_write_time = 0
+    if os.path.exists(self.path):
+      with open(self.path) as f:
+        self._offsets = {path: tuple(value)
+                         for path, value in json.load(f).items()}
+
+  def Get(self, path):
+    """Returns (offset, inode) of a log file, or None if it is not known."""
+    with self._lock:
+      return self._offsets.get(path)
+
+  def Set(self, path, offset, inode, flush=False):
+    """Updates the offset of a log file.
+
+    Args:
+      flush: Whether to write the checkpoint at the next Write call even if
+          interval has not passed.
+    """
+    with self._lock:
+      if self._offsets.get(path) == (offset, inode):
+        return
+      self._offsets[path] = (offset, inode)
+      self._dirty = True
+      if flush:
+        self._last_write_time = 0
+
+  def GetNextWriteTime(self):
+    """Returns the monotonic time when the pending changes should be written."""
+    if not self._dirty:
+      return float('inf')
+    return self._last_write_time + self.interval
+
+  def Write(self, force=False):
+    """Writes the checkpoint to disk if it is time to.
+
+    Returns:
+      True if the checkpoint was written.
+    """
+    now = time_utils.MonotonicTime()
+    if not self._dirty or (not force and now < self.GetNextWriteTime()):
+      return False
+    with self._lock:
+      offsets = dict(self._offsets)
+      self._dirty = False
+    self._last_write_time = now
+    with file_utils.AtomicWrite(self.path) as f:
+      json.dump(offsets, f)
+    self.debug('Wrote offsets of %d log files', len(offsets))
+    return True
+
+
 class LogFile(log_utils.LoggerMixin):
   """Represents a log file on disk."""
 
-  def __init__(self, logger_name, args, path, offset_path, parse_and_emit_fn):
+  def __init__(self, logger_name, args, path, checkpoint, parse_and_emit_fn,
+               rotate_fn=None, offset_path=None):
+    """Constructor.
+
+    Args:
+      checkpoint: The OffsetCheckpoint to keep the offset in.
+      rotate_fn: Called with (inode, offset) of the previous file when the log
+          file is replaced by a new one.
+      offset_path: Path to the offset file written by earlier versions, which
+          is read if checkpoint does not have this log file.
+    """
     # log_utils.LoggerMixin creates shortcut functions for convenience.
     self.logger = logging.getLogger(logger_name)
     self.args = args
     self.path = path
+    self.checkpoint = checkpoint
     self.offset_path = offset_path
     self.ParseAndEmit = parse_and_emit_fn
+    self.OnRotate = rotate_fn
 
-    # Stores the last offset written to disk.
-    self.last_written_offset = None
-
-    self.info('Reading offset from %s', self.offset_path)
-    self.cur_offset = self.ReadOffset()
+    saved = self.checkpoint.Get(self.path)
+    if saved:
+      self.cur_offset, self.inode = saved
+    else:
+      self.cur_offset, self.inode = self.ReadOffset(), None
     self.info('Starting offset for %s at %d', self.path, self.cur_offset)
 
   def __repr__(self):
@@ -316,22 +680,42 @@ class LogFile(log_utils.LoggerMixin):
   def GetSize(self):
     """Returns the current size of the log file.
 
-    Resets current offset to 0 if the file is not found.
+    Resets current offset to 0 if the file is not found, or if it has been
+    replaced by another file.
 
     Returns:
       File size in bytes.
       None if the file doesn't exist.
     """
     try:
-      return os.path.getsize(self.path)
+      stat = os.stat(self.path)
     except OSError:
       # Maybe the file doesn't currently exist, or we don't have access.
       # Reset the offset to zero.
       if self.cur_offset != 0:
         self.info('Input file %s not found, set offset to 0', self.path)
-        self.cur_offset = 0
-        self.WriteOffset(self.cur_offset)
+        self._Rotate(None)
       return None
+    if self.inode != stat.st_ino:
+      if self.inode is not None:
+        self.info('Input file %s was replaced (inode %d => %d), resetting '
+                  'from %d to 0', self.path, self.inode, stat.st_ino,
+                  self.cur_offset)
+        self._Rotate(stat.st_ino)
+      else:
+        self.SetOffset(self.cur_offset, stat.st_ino)
+    return stat.st_size
+
+  def _Rotate(self, new_inode):
+    if self.OnRotate and self.inode is not None:
+      self.OnRotate(self.inode, self.cur_offset)
+    self.SetOffset(0, new_inode)
+
+  def SetOffset(self, offset, inode):
+    """Sets the offset and the inode of the log file."""
+    self.cur_offset = offset
+    self.inode = inode
+    self.WriteOffset(offset)
 
   def ProcessBatch(self):
     """If this log file has grown, process the next batch of its data.
@@ -412,29 +796,35 @@ class LogFile(log_utils.LoggerMixin):
     else:
       self.info('Truncate successful')
       self.cur_offset = 0
-      self.WriteOffset(self.cur_offset)
+      # Write the new offset right away, since the file may grow past the old
+      # offset before the next checkpoint.
+      self.WriteOffset(self.cur_offset, flush=True)
       # There is a slight possibility that a power failure will occur in between
       # the truncate and here, leaving the offset in a position past the end of
       # the file size.
       return True
 
-  def WriteOffset(self, offset):
-    """Writes the current offset to disk."""
-    if offset == self.last_written_offset:
-      return
-    self.last_written_offset = offset
-    with file_utils.AtomicWrite(self.offset_path) as f:
-      f.write(str(offset))
+  def WriteOffset(self, offset, flush=None):
+    """Updates the current offset in the checkpoint.
+
+    Args:
+      flush: Whether to write the checkpoint soon regardless of
+          checkpoint_interval.  Defaults to True if checkpoint_interval is 0.
+    """
+    if flush is None:
+      flush = not self.args.checkpoint_interval
+    self.checkpoint.Set(self.path, offset, self.inode, flush=flush)
 
   def ReadOffset(self):
-    """Retrieves the current offset from disk.
+    """Retrieves the offset from the offset file of earlier versions.
 
     Returns:
       0 if the offset file does not exist.  Otherwise, the integer contained
       within the offset file.
     """
-    if not os.path.exists(self.offset_path):
+    if not self.offset_path or not os.path.exists(self.offset_path):
       return 0
+    self.info('Reading offset from %s', self.offset_path)
     with open(self.offset_path) as f:
       return int(f.read())
 
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for tailing many log files with InputLogFile.
+
+Creates a directory of log files, and runs writer processes appending lines of
+JSON to random files while InputLogFile reads them.  Reports events emitted
+per second while writing at a fixed rate, and the lag after writing stops until
+every line has been emitted.  Polling with one worker and offsets written after
+every batch (like the previous implementation) is compared against the worker
+pool with polling and with inotify.
+
+Example:
+
+  input_log_file_benchmark.py --files 5000 --writers 8 --duration 20
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from cros.factory.instalog import plugin_sandbox
+from cros.factory.instalog import testing
+
+
+class _CountingCore(testing.MockCore):
+  """Counts emitted events instead of keeping them."""
+
+  def __init__(self):
+    super(_CountingCore, self).__init__()
+    self.count = 0
+    self._lock = threading.Lock()
+
+  def Emit(self, plugin, events):
+    del plugin
+    with self._lock:
+      self.count += len(events)
+    return True
+
+
+def _Writer(index, paths, line_size, rate, stop_event, counts):
+  """Appends lines to random files at the given rate in lines per second."""
+  rand = random.Random(index)
+  line = json.dumps({'payload': 'x' * line_size}) + '\n'
+  count = 0
+  start_time = time.time()
+  while not stop_event.is_set():
+    with open(rand.choice(paths), 'a') as f:
+      f.write(line)
+    count += 1
+    delay = start_time + count / rate - time.time()
+    if delay > 0:
+      time.sleep(delay)
+  counts[index] = count
+
+
+def RunBenchmark(config, files, writers, rate, duration, line_size):
+  """Returns (lines written, events emitted while writing, lag in seconds)."""
+  tmp_dir = tempfile.mkdtemp(prefix='input_log_file_benchmark_')
+  core = _CountingCore()
+  try:
+    log_dir = os.path.join(tmp_dir, 'logs')
+    data_dir = os.path.join(tmp_dir, 'data')
+    os.mkdir(log_dir)
+    os.mkdir(data_dir)
+    paths = [os.path.join(log_dir, '%05d.log' % i) for i in range(files)]
+    for path in paths:
+      open(path, 'w').close()
+
+    config = dict(config, path=os.path.join(log_dir, '*.log'))
+    sandbox = plugin_sandbox.PluginSandbox(
+        'input_log_file', config=config, data_dir=data_dir,
+        store_path=os.path.join(data_dir, 'store'), core_api=core)
+    sandbox.Start(True)
+
+    stop_event = multiprocessing.Event()
+    counts = multiprocessing.Array('l', writers)
+    processes = [
+        multiprocessing.Process(target=_Writer,
+                                args=(i, paths, line_size, rate / writers,
+                                      stop_event, counts))
+        for i in range(writers)]
+    for p in processes:
+      p.start()
+    time.sleep(duration)
+    stop_event.set()
+    for p in processes:
+      p.join()
+    emitted = core.count
+    written = sum(counts)
+
+    stop_time = time.time()
+    while core.count < written:
+      time.sleep(0.05)
+    lag = time.time() - stop_time
+    sandbox.Stop(True)
+    return written, emitted, lag
+  finally:
+    core.Close()
+    shutil.rmtree(tmp_dir)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--files', type=int, default=5000,
+                      help='Number of log files.')
+  parser.add_argument('--writers', type=int, default=8,
+                      help='Number of concurrent writer processes.')
+  parser.add_argument('--rate', type=float, default=20000,
+                      help='Total lines written per second.')
+  parser.add_argument('--duration', type=float, default=20,
+                      help='Seconds to write for in each configuration.')
+  parser.add_argument('--line-size', type=int, default=200,
+                      help='Payload size of each line in bytes.')
+  parser.add_argument('--workers', type=int, default=4,
+                      help='max_workers of the worker pool.')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.WARNING)
+
+  configs = [
+      ('poll, 1 worker, sync offsets',
+       {'use_inotify': False, 'max_workers': 1, 'checkpoint_interval': 0}),
+      ('poll, %d workers' % args.workers,
+       {'use_inotify': False, 'max_workers': args.workers}),
+      ('inotify, %d workers' % args.workers,
+       {'use_inotify': True, 'max_workers': args.workers}),
+  ]
+  for name, config in configs:
+    written, emitted, lag = RunBenchmark(
+        config, args.files, args.writers, args.rate, args.duration,
+        args.line_size)
+    print('%-32s %9d lines written, %9.0f events/s, %6.2fs lag' % (
+        name, written, emitted / args.duration, lag))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for input log file plugin."""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zlib
+
+from cros.factory.instalog import log_utils
+from cros.factory.instalog import plugin_sandbox
+from cros.factory.instalog import testing
+from cros.factory.instalog.utils import inotify_utils
+
+
+_TIMEOUT = 5
+
+
+class TestInputLogFile(unittest.TestCase):
+
+  def setUp(self):
+    self.core = testing.MockCore()
+    self.tmp_dir = tempfile.mkdtemp(prefix='input_log_file_unittest_')
+    self.log_dir = os.path.join(self.tmp_dir, 'logs')
+    self.data_dir = os.path.join(self.tmp_dir, 'data')
+    os.mkdir(self.log_dir)
+    os.mkdir(self.data_dir)
+    self.sandbox = None
+
+  def tearDown(self):
+    if self.sandbox:
+      self.sandbox.Stop(True)
+    self.core.Close()
+    shutil.rmtree(self.tmp_dir)
+
+  def _Start(self, **config):
+    config.setdefault('path', os.path.join(self.log_dir, '*.log*'))
+    config.setdefault('poll_interval', 0.1)
+    self.sandbox = plugin_sandbox.PluginSandbox(
+        'input_log_file', config=config, data_dir=self.data_dir,
+        store_path=os.path.join(self.data_dir, 'store'), core_api=self.core)
+    self.sandbox.Start(True)
+
+  def _Stop(self):
+    self.sandbox.Stop(True)
+    self.sandbox = None
+
+  def _Append(self, name, *values, newline='\n'):
+    with open(os.path.join(self.log_dir, name), 'a', newline='') as f:
+      for value in values:
+        f.write(json.dumps({'value': value}, ensure_ascii=False) + newline)
+
+  def _GetValues(self):
+    return sorted(event['value'] for events in self.core.emit_calls
+                  for event in events)
+
+  def _WaitForValues(self, expected):
+    expected = sorted(expected)
+    end_time = time.time() + _TIMEOUT
+    while time.time() < end_time:
+      if self._GetValues() == expected:
+        return
+      time.sleep(0.02)
+    self.assertEqual(expected, self._GetValues())
+
+  def testMultipleFiles(self):
+    for i in range(10):
+      self._Append('%d.log' % i, *range(i * 100, i * 100 + 20))
+    self._Start()
+    self._WaitForValues([i * 100 + j for i in range(10) for j in range(20)])
+
+  def testPolling(self):
+    self._Start(use_inotify=False, new_file_poll_interval=0.1)
+    self._Append('a.log', 1, 2)
+    self._WaitForValues([1, 2])
+    self._Append('a.log', 3)
+    self._Append('b.log', 4)
+    self._WaitForValues([1, 2, 3, 4])
+
+  @unittest.skipUnless(inotify_utils.IsAvailable(), 'inotify is not available')
+  def testInotify(self):
+    # Only inotify can find the changes in time.
+    self._Append('a.log', 1)
+    self._Start(poll_interval=100, new_file_poll_interval=100)
+    self._WaitForValues([1])
+    self._Append('a.log', 2)
+    self._WaitForValues([1, 2])
+    self._Append('b.log', 3)
+    self._WaitForValues([1, 2, 3])
+
+  def testResume(self):
+    self._Append('a.log', 1, 2)
+    self._Start(checkpoint_interval=100)
+    self._WaitForValues([1, 2])
+    self._Stop()
+    with open(os.path.join(self.data_dir, 'offsets.json')) as f:
+      offsets = json.load(f)
+    self.assertEqual(
+        [[os.path.getsize(os.path.join(self.log_dir, 'a.log')),
+          os.stat(os.path.join(self.log_dir, 'a.log')).st_ino]],
+        list(offsets.values()))
+
+    self._Append('a.log', 3)
+    self._Start()
+    self._WaitForValues([1, 2, 3])
+
+  def testLegacyOffsetFile(self):
+    self._Append('a.log', 1)
+    path = os.path.join(self.log_dir, 'a.log')
+    offset = os.path.getsize(path)
+    self._Append('a.log', 2)
+    crc = '{:08x}'.format(abs(zlib.crc32(path.encode('utf-8'))))
+    with open(os.path.join(self.data_dir, '%s_%s' % (
+        path.replace(os.sep, '_'), crc)), 'w') as f:
+      f.write(str(offset))
+    self._Start()
+    self._WaitForValues([2])
+
+  def testRotation(self):
+    self._Append('a.log', 1, 2)
+    self._Start(use_inotify=False, new_file_poll_interval=0.1)
+    self._WaitForValues([1, 2])
+    # Rotated to a path which also matches the glob.
+    self._Append('a.log', 3)
+    os.rename(os.path.join(self.log_dir, 'a.log'),
+              os.path.join(self.log_dir, 'a.log.1'))
+    self._Append('a.log', 4)
+    self._WaitForValues([1, 2, 3, 4])
+    time.sleep(0.3)
+    self._WaitForValues([1, 2, 3, 4])
+
+  def testReplacedAndShrunk(self):
+    self._Append('a.log', 1, 2, 3)
+    self._Start()
+    self._WaitForValues([1, 2, 3])
+    os.unlink(os.path.join(self.log_dir, 'a.log'))
+    self._Append('a.log', 4)
+    self._WaitForValues([1, 2, 3, 4])
+    # Truncated in place.
+    with open(os.path.join(self.log_dir, 'a.log'), 'w'):
+      pass
+    time.sleep(0.3)
+    self._Append('a.log', 5)
+    self._WaitForValues([1, 2, 3, 4, 5])
+
+  def testByteOffsets(self):
+    self._Append('a.log', 'café', 'naïve', newline='\r\n')
+    self._Start()
+    self._WaitForValues(['café', 'naïve'])
+    self._Append('a.log', 'x', newline='\r\n')
+    self._WaitForValues(['café', 'naïve', 'x'])
+    time.sleep(0.3)
+    self._WaitForValues(['café', 'naïve', 'x'])
+
+
+if __name__ == '__main__':
+  log_utils.InitLogging(log_utils.GetStreamHandler(logging.INFO))
+  unittest.main()
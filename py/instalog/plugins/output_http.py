@@ -11,7 +11,11 @@ Sends events to input HTTP plugin.
 
 import logging
 import os
+import subprocess
+import tempfile
+import threading
 import time
+import uuid
 
 import requests
 
@@ -29,14 +33,35 @@ _DEFAULT_BATCH_SIZE = 1024
 _DEFAULT_URL_PATH = ''
 _DEFAULT_TIMEOUT = 5
 _FAILED_CONNECTION_INTERVAL = 60
+_STREAM_CHUNK_BYTES = 256 * 1024
+_DEFAULT_MAX_INFLIGHT = 1
+_DEFAULT_TARGET_LATENCY = 10
+# The batch size grows by batch_size / _BATCH_SIZE_INCREASE_STEPS after each
+# fast and full batch.
+_BATCH_SIZE_INCREASE_STEPS = 4
+# Keep requests below this ratio of the maximum request size of the target.
+_MAX_BYTES_RATIO = 0.5
+# Weight of the newest sample in the moving averages of statistics.
+_STATS_SMOOTHING = 0.2
 
 
 class OutputHTTP(plugin_base.OutputPlugin):
 
   ARGS = [
       Arg('batch_size', int,
-          'How many events to queue before transmitting.',
+          'How many events to queue before transmitting.  This is the initial '
+          'value, and is adjusted by the observed size and latency of '
+          'requests.',
           default=_DEFAULT_BATCH_SIZE),
+      Arg('max_batch_size', int,
+          'Upper bound of the adjusted batch size.  Defaults to batch_size.',
+          default=None),
+      Arg('target_latency', (int, float),
+          'Requests slower than this many seconds halve the batch size.',
+          default=_DEFAULT_TARGET_LATENCY),
+      Arg('max_inflight', int,
+          'How many batches can be transmitted at the same time.',
+          default=_DEFAULT_MAX_INFLIGHT),
       Arg('timeout', (int, float),
           'Timeout to transmit without full batch.',
           default=_DEFAULT_TIMEOUT),
@@ -56,7 +81,12 @@ class OutputHTTP(plugin_base.OutputPlugin):
           default=None),
       Arg('target_key', str,
           'The fingerprint of target GnuPG public key in this machine.',
-          default=None)
+          default=None),
+      Arg('enable_streaming', bool,
+          'Stream the request body with chunked transfer encoding instead of '
+          'building it in memory.  Attachments are read and encrypted while '
+          'sending, so memory usage does not depend on the batch size.',
+          default=False),
   ]
 
   def __init__(self, *args, **kwargs):
@@ -83,6 +113,9 @@ class OutputHTTP(plugin_base.OutputPlugin):
       self._EncryptData('Checks the target public key is valid.')
       self.info('Finished checking the target public key')
 
+    if self.args.max_inflight < 1:
+      raise ValueError('max_inflight should be at least 1')
+
     self._target_url = 'http://%s:%d/%s' % (self.args.hostname,
                                             self.args.port,
                                             self.args.url_path)
@@ -105,75 +138,223 @@ class OutputHTTP(plugin_base.OutputPlugin):
         continue
       target_available = True
 
-      # We need to know the size of request to avoid too big request, so we
-      # cache events in memory before making the connection.
-      events = []
       event_stream = self.NewStream()
       if not event_stream:
         self.Sleep(1)
         continue
 
-      for event in event_stream.iter(timeout=self.args.timeout,
-                                     count=self._batch_size):
-        events.append(event)
+      # We need to know the size of request to avoid too big request, so we
+      # cache events in memory before making the connection.  Up to
+      # max_inflight batches are read from the stream, and each of them is
+      # sent in its own thread while the next one is being read.
+      start_time = time.time()
+      batches = []
+      results = []
+      threads = []
+      while len(batches) < self.args.max_inflight:
+        events = list(event_stream.iter(timeout=self.args.timeout,
+                                        count=self._batch_size))
+        if not events:
+          break
+        batches.append(events)
+        results.append(None)
+        if self.args.max_inflight == 1:
+          self._SendBatch(events, results, 0)
+        else:
+          t = threading.Thread(target=self._SendBatch,
+                               args=(events, results, len(batches) - 1))
+          t.start()
+          threads.append(t)
+        # Don't wait for another batch if the buffer is already drained.
+        if len(events) < self._batch_size:
+          break
+      for t in threads:
+        t.join()
 
       # If no events are available, don't bother sending an empty transmission.
-      if not events:
+      if not batches:
         self.debug('No events available for transmission')
         event_stream.Commit()
-        self._batch_size = self.args.batch_size
         continue
 
-      try:
+      # Batches after a failed one may be accepted already, and would be sent
+      # again if the stream is aborted from the failed batch, so the failed
+      # batches before the last accepted one are sent again first.
+      last_accepted = max((i for i, result in enumerate(results)
+                           if _IsAccepted(result)), default=-1)
+      for i in range(last_accepted):
+        if not _IsAccepted(results[i]) and not _IsTooLarge(results[i]):
+          self.info('Sending batch %d of %d again', i + 1, len(batches))
+          self._SendBatch(batches[i], results, i)
+
+      # Find the batches accepted by the target before the first failed one.
+      accepted = 0
+      error = None
+      too_large = False
+      for result in results:
+        if isinstance(result, Exception):
+          error = result
+          break
+        status_code, reason, unused_clen, unused_elapsed_time = result
+        if status_code == 413:  # Request Entity Too Large
+          too_large = True
+          break
+        if status_code != 200:  # Bad Request
+          self.error(reason)
+          error = Exception(reason)
+          break
+        accepted += 1
+
+      if accepted == len(batches):
+        event_stream.Commit()
+      else:
+        # The stream can only be committed as a whole, so the accepted batches
+        # are committed again from a new stream without sending them, and the
+        # others are sent again in the next round.
+        event_stream.Abort()
+        self._CommitSentEvents(
+            sum(len(events) for events in batches[:accepted]))
+      self._UpdateStats(batches[:accepted], results[:accepted],
+                        len(batches) - accepted, time.time() - start_time)
+
+      if too_large:
+        events = batches[accepted]
+        if len(events) == 1:
+          self.error('One event is bigger than input HTTP plugin\'s '
+                     'maximum request limit (event size = %dbytes, input '
+                     'plugin maximum size = %dbytes)',
+                     results[accepted][2], self._max_bytes)
+          return
+        self.info('Request entity too large, and trying to send a half of '
+                  'the request')
+        self._DecreaseBatchSize()
+      elif error:
+        if isinstance(error, requests.ConnectionError):
+          self.warning('Connection failed: Is input HTTP plugin running?')
+          self.debug('Connection error: %s', error)
+        else:
+          self.error('Connection or transfer failed: %s', error)
+        self._DecreaseBatchSize()
+        target_available = False
+        self.Sleep(1)
+
+  def _CommitSentEvents(self, count):
+    """Commits the first count events of the buffer, which are already sent.
+
+    The events are read again from a new stream in the same order as the
+    aborted stream returned them.  If fewer events are read, the stream is
+    aborted, and the events are sent again rather than lost.
+    """
+    if not count:
+      return
+    event_stream = self.NewStream()
+    if not event_stream:
+      self.warning('Failed to commit %d sent events, which will be sent '
+                   'again', count)
+      return
+    events = list(event_stream.iter(timeout=self.args.timeout, count=count))
+    if len(events) == count:
+      event_stream.Commit()
+    else:
+      self.warning('Only %d of %d sent events are read again, which will be '
+                   'sent again', len(events), count)
+      event_stream.Abort()
+
+  def _SendBatch(self, events, results, index):
+    """Sends a batch of events, and stores the result in results[index].
+
+    The result is a tuple (HTTP status code, reason of responded, size of the
+    request, elapsed seconds), or the exception raised.
+    """
+    # The attachments are renamed in the request, so the events are kept intact
+    # in case they are sent again.
+    events = [datatypes.Event(event.payload, dict(event.attachments),
+                              event.history) for event in events]
+    try:
+      start_time = time.time()
+      if self.args.enable_streaming:
+        status_code, reason, clen = self._PostStreamRequest(events)
+      else:
         # Create the temporary directory for attachments.
         with file_utils.TempDirectory(prefix='output_http_') as tmp_dir:
           self.debug('Temporary directory for attachments: %s', tmp_dir)
-
-          start_time = time.time()
           request_body = self._PrepareRequestData(events, tmp_dir)
           status_code, reason, clen = self._PostRequest(request_body)
+      results[index] = (status_code, reason, clen, time.time() - start_time)
+    except Exception as e:
+      results[index] = e
 
-          if status_code == 413:  # Request Entity Too Large
-            event_stream.Abort()
-            if len(events) == 1:
-              self.error('One event is bigger than input HTTP plugin\'s '
-                         'maximum request limit (event size = %dbytes, input '
-                         'plugin maximum size = %dbytes)',
-                         clen, self._max_bytes)
-              return
-
-            self.info('Request entity too large, and trying to send a half of '
-                      'the request')
-            # This won't be 0 since it will stop on above when
-            # self._batch_size=1.
-            self._batch_size //= 2
-            continue
-
-          if status_code != 200:  # Bad Request
-            self.error(reason)
-            raise Exception
-
-          event_stream.Commit()
-          self._batch_size = self.args.batch_size
-          elapsed_time = time.time() - start_time
-
-          # Size and speed information.
-          total_kbytes = clen / 1024
-          self.info(
-              'Transmitted %d events, total %.2f kB in %.1f sec (%.2f kB/sec)',
-              len(events), total_kbytes, elapsed_time,
-              total_kbytes / elapsed_time)
-      except requests.ConnectionError as e:
-        self.warning('Connection failed: Is input HTTP plugin running?')
-        self.debug('Connection error: %s', e)
-        event_stream.Abort()
-        target_available = False
-        self.Sleep(1)
-      except Exception as e:
-        self.exception('Connection or transfer failed: %s', e)
-        event_stream.Abort()
-        target_available = False
-        self.Sleep(1)
+  def _DecreaseBatchSize(self):
+    """Multiplicatively decreases the batch size."""
+    self._batch_size = max(1, self._batch_size // 2)
+
+  def _IncreaseBatchSize(self, event_count, clen, elapsed_time):
+    """Adjusts the batch size after a successful request.
+
+    The batch size grows additively after full batches which are transmitted
+    within target_latency, and is halved after slow ones.  It is also capped
+    so that requests with the observed average event size stay below a ratio
+    of the maximum request size of input HTTP plugin.
+    """
+    if elapsed_time > self.args.target_latency:
+      self.info('Request took %.1f sec, and trying to send a half of the '
+                'request', elapsed_time)
+      self._DecreaseBatchSize()
+      return
+    batch_size = self._batch_size
+    if event_count >= self._batch_size:
+      batch_size += max(1, self.args.batch_size // _BATCH_SIZE_INCREASE_STEPS)
+    if clen and event_count:
+      bytes_per_event = clen / event_count
+      batch_size = min(
+          batch_size,
+          int(self._max_bytes * _MAX_BYTES_RATIO / bytes_per_event))
+    max_batch_size = self.args.max_batch_size or self.args.batch_size
+    self._batch_size = max(1, min(batch_size, max_batch_size))
+
+  def _UpdateStats(self, batches, results, failed_count, elapsed_time):
+    """Updates the batch size and the statistics of the target.
+
+    The statistics are kept in the store of the plugin, which can be checked
+    with `instalog inspect`.  They are not saved to disk on their own.
+
+    Args:
+      batches: A list of lists of events accepted by the target.
+      results: A list of results from _SendBatch for each accepted batch.
+      failed_count: Number of batches sent in the round but not accepted.
+      elapsed_time: Seconds spent on sending all batches.
+    """
+    stats = self.store.setdefault('stats', {}).setdefault(self._target_url, {
+        'requests': 0, 'failed_requests': 0, 'events': 0, 'bytes': 0,
+        'latency': None, 'throughput': None})
+    stats['failed_requests'] += failed_count
+    total_bytes = 0
+    max_latency = 0
+    for events, (unused_status_code, unused_reason, clen,
+                 latency) in zip(batches, results):
+      stats['requests'] += 1
+      stats['events'] += len(events)
+      stats['bytes'] += clen
+      total_bytes += clen
+      max_latency = max(max_latency, latency)
+      stats['latency'] = _MovingAverage(stats['latency'], latency)
+      # Size and speed information.
+      total_kbytes = clen / 1024
+      self.info(
+          'Transmitted %d events, total %.2f kB in %.1f sec (%.2f kB/sec)',
+          len(events), total_kbytes, latency, total_kbytes / latency)
+    if batches:
+      stats['throughput'] = _MovingAverage(stats['throughput'],
+                                           total_bytes / elapsed_time)
+    if batches and not failed_count:
+      # Adjust the batch size once per round, from the largest batch, the
+      # average event size and the slowest request of the round.
+      max_events = max(len(events) for events in batches)
+      total_events = sum(len(events) for events in batches)
+      self._IncreaseBatchSize(max_events,
+                              total_bytes * max_events // total_events,
+                              max_latency)
+    stats['batch_size'] = self._batch_size
 
   def _PrepareRequestData(self, events, tmp_dir):
     """Converts the list of event to requests' format."""
@@ -193,6 +374,91 @@ class OutputHTTP(plugin_base.OutputPlugin):
       request_body.append(('event', serialized_event))
     return request_body
 
+  def _IterRequestData(self, events, boundary, counter):
+    """Yields the multipart body of the events in chunks.
+
+    Attachments are read, and encrypted if needed, one chunk at a time.  The
+    number of bytes yielded is accumulated in counter[0].
+    """
+    def Part(name, chunks):
+      yield ('--%s\r\nContent-Disposition: form-data; name="%s"; '
+             'filename="%s"\r\n\r\n' % (boundary, name, name)).encode('utf-8')
+      for chunk in chunks:
+        yield chunk
+      yield b'\r\n'
+
+    def Parts():
+      att_seq = 0
+      for event in events:
+        for att_id, att_path in event.attachments.items():
+          att_newname = '%s_%03d' % (os.path.basename(att_path), att_seq)
+          att_seq += 1
+          if self._gpg:
+            chunks = self._EncryptFileStream(att_path)
+          else:
+            chunks = _ReadFileChunks(att_path)
+          for data in Part(att_newname, chunks):
+            yield data
+          event.attachments[att_id] = att_newname
+        serialized_event = datatypes.Event.Serialize(event)
+        if self._gpg:
+          serialized_event = self._EncryptData(serialized_event)
+        else:
+          serialized_event = serialized_event.encode('utf-8')
+        for data in Part('event', [serialized_event]):
+          yield data
+      yield ('--%s--\r\n' % boundary).encode('utf-8')
+
+    # Merge small pieces like part headers and events to reduce the number of
+    # chunks on the wire.
+    buf = bytearray()
+    for data in Parts():
+      buf.extend(data)
+      if len(buf) >= _STREAM_CHUNK_BYTES:
+        counter[0] += len(buf)
+        yield bytes(buf)
+        buf.clear()
+    if buf:
+      counter[0] += len(buf)
+      yield bytes(buf)
+
+  def _EstimateRequestSize(self, events):
+    """Returns the size of the request without multipart and GnuPG overhead."""
+    size = 0
+    for event in events:
+      size += len(datatypes.Event.Serialize(event))
+      for att_path in event.attachments.values():
+        size += os.path.getsize(att_path)
+    return size
+
+  def _PostStreamRequest(self, events):
+    """Sends the events in a streaming post request to input HTTP plugin.
+
+    Returns:
+      A tuple with (HTTP status code,
+                    reason of responded,
+                    size of the request)
+    """
+    # The exact size is unknown before encryption, so an estimation is used to
+    # avoid sending a request which will obviously be rejected.  Input HTTP
+    # plugin still checks the real size while receiving.
+    clen = self._EstimateRequestSize(events)
+    if clen > self._max_bytes:
+      return (413, 'Request Entity Too Large: The request is bigger '
+                   'than %d bytes' % self._max_bytes, clen)
+    boundary = uuid.uuid4().hex
+    counter = [0]
+    resp = requests.post(
+        self._target_url,
+        data=self._IterRequestData(events, boundary, counter),
+        headers={'Content-Type': 'multipart/form-data; boundary=%s' % boundary,
+                 'Multi-Event': 'True',
+                 'Node-ID': str(self.GetNodeID())},
+        timeout=http_common.HTTP_TIMEOUT)
+    if resp.headers.get('Maximum-Bytes'):
+      self._max_bytes = int(resp.headers['Maximum-Bytes'])
+    return resp.status_code, resp.reason, counter[0]
+
   def _CheckConnect(self):
     """Checks the input HTTP plugin with and empty post request."""
     try:
@@ -260,6 +526,67 @@ class OutputHTTP(plugin_base.OutputPlugin):
             'Failed to encrypt file! Log: %s' % encrypted_data.stderr)
     return encrypt_path
 
+  def _EncryptFileStream(self, file_path):
+    """Encrypts and signs the file, and yields the result chunk by chunk.
+
+    python-gnupg can only output to a file or memory, so gpg is run directly
+    with the file as its stdin.  Its stderr goes to a temporary file, so gpg
+    never blocks on a full stderr pipe while stdout is being read.
+    """
+    cmd = [self._gpg.gpgbinary, '--batch', '--no-tty', '--yes']
+    if self._gpg.gnupghome:
+      cmd += ['--homedir', self._gpg.gnupghome]
+    cmd += ['--local-user', self._gpg.list_keys(True)[0]['fingerprint'],
+            '--recipient', self.args.target_key,
+            '--sign', '--encrypt']
+    with tempfile.TemporaryFile() as stderr_file:
+      with open(file_path, 'rb') as plaintext_file:
+        process = subprocess.Popen(cmd, stdin=plaintext_file,
+                                   stdout=subprocess.PIPE,
+                                   stderr=stderr_file)
+      try:
+        while True:
+          chunk = process.stdout.read(_STREAM_CHUNK_BYTES)
+          if not chunk:
+            break
+          yield chunk
+        if process.wait() != 0:
+          stderr_file.seek(0)
+          raise Exception('Failed to encrypt file! Log: %s' %
+                          stderr_file.read())
+      finally:
+        if process.poll() is None:
+          process.kill()
+        process.wait()
+        process.stdout.close()
+
+
+def _IsAccepted(result):
+  """Returns whether a result of _SendBatch is accepted by the target."""
+  return not isinstance(result, Exception) and result[0] == 200
+
+
+def _IsTooLarge(result):
+  """Returns whether a result of _SendBatch is Request Entity Too Large."""
+  return not isinstance(result, Exception) and result[0] == 413
+
+
+def _MovingAverage(average, value):
+  """Returns the exponential moving average with the new value."""
+  if average is None:
+    return value
+  return average * (1 - _STATS_SMOOTHING) + value * _STATS_SMOOTHING
+
+
+def _ReadFileChunks(file_path):
+  """Yields the content of the file chunk by chunk."""
+  with open(file_path, 'rb') as f:
+    while True:
+      chunk = f.read(_STREAM_CHUNK_BYTES)
+      if not chunk:
+        return
+      yield chunk
+
 
 if __name__ == '__main__':
   plugin_base.main()
@@ -13,7 +13,9 @@ import shutil
 import socketserver
 import tempfile
 import threading
+import time
 import unittest
+from unittest import mock
 
 from cros.factory.instalog import datatypes
 from cros.factory.instalog import log_utils
@@ -25,7 +27,7 @@ from cros.factory.instalog.utils import net_utils
 
 class TestOutputHTTP(unittest.TestCase):
 
-  def _CreatePlugin(self):
+  def _CreatePlugin(self, **kwargs):
     self.core = testing.MockCore()
     self.hostname = 'localhost'
     self.port = net_utils.FindUnusedPort()
@@ -37,6 +39,7 @@ class TestOutputHTTP(unittest.TestCase):
         'url_path': 'instalog',
         'batch_size': 3,
         'timeout': 10}
+    output_config.update(kwargs)
     self.output_sandbox = plugin_sandbox.PluginSandbox(
         'output_http', config=output_config, core_api=self.core)
 
@@ -134,6 +137,120 @@ class TestOutputHTTP(unittest.TestCase):
     self.assertEqual(q.get(), [b'@' * 10])
     httpd.shutdown()
 
+  def testPipelinedBatchFailure(self):
+    self.output_sandbox.Stop(True)
+    self.core.Close()
+    self._CreatePlugin(batch_size=2, max_inflight=3, timeout=1)
+    lock = threading.Lock()
+    accepted = []
+    failed = []
+
+    class MyHandler(http.server.BaseHTTPRequestHandler):
+      def _SendResponse(self, status_code, resp_reason):
+        self.send_response(status_code, resp_reason)
+        self.send_header('Maximum-Bytes', 100 * 1024 * 1024)
+        self.end_headers()
+
+      def do_GET(self):
+        self._SendResponse(200, 'OK')
+
+      def do_POST(self):
+        form = cgi.FieldStorage(
+            fp=self.rfile,
+            headers=self.headers,
+            environ={'REQUEST_METHOD': 'POST'}
+        )
+        ids = [datatypes.Event.Deserialize(event)['id']
+               for event in form.getlist('event')]
+        with lock:
+          # Fail the first request of the second batch.
+          fail = 2 in ids and not failed
+          if fail:
+            failed.append(ids)
+          else:
+            accepted.extend(ids)
+        if fail:
+          self._SendResponse(400, 'Failed on purpose')
+        else:
+          self._SendResponse(200, 'OK')
+
+      def log_request(self, code='-', size='-'):
+        del code, size  # Unused.
+
+    httpd = socketserver.ThreadingTCPServer(('', self.port), MyHandler)
+    T = threading.Thread(target=httpd.serve_forever)
+    T.start()
+    try:
+      self.stream.Queue([datatypes.Event({'id': i}) for i in range(6)])
+      for unused_i in range(100):
+        with lock:
+          if len(accepted) >= 6:
+            break
+        time.sleep(0.1)
+      # Let the plugin finish committing the last round.
+      time.sleep(0.5)
+    finally:
+      httpd.shutdown()
+      httpd.server_close()
+    self.assertEqual([[2, 3]], failed)
+    # The batches accepted by the target are never sent again.
+    self.assertEqual(list(range(6)), sorted(accepted))
+    self.assertTrue(self.stream.Empty())
+
+  def testEncryptFileStreamWithLongLog(self):
+    # pylint: disable=protected-access
+    plugin = self.output_sandbox._plugin
+    # A fake gpg which writes more than a pipe can hold to stderr before its
+    # output, and then fails.
+    gpg_path = os.path.join(self._tmp_dir, 'gpg')
+    with open(gpg_path, 'w') as f:
+      f.write('#!/bin/sh\n'
+              'head -c 1000000 /dev/zero | tr "\\0" x >&2\n'
+              'cat\n'
+              'exit 2\n')
+    os.chmod(gpg_path, 0o755)
+    plugin._gpg = mock.Mock(gpgbinary=gpg_path, gnupghome=None)
+    plugin._gpg.list_keys.return_value = [{'fingerprint': 'ABCD'}]
+    plugin.args.target_key = 'EFGH'
+    att_path = os.path.join(self._tmp_dir, 'att')
+    with open(att_path, 'wb') as f:
+      f.write(b'data')
+
+    chunks = []
+    with self.assertRaisesRegex(Exception, 'Failed to encrypt file'):
+      for chunk in plugin._EncryptFileStream(att_path):
+        chunks.append(chunk)
+    self.assertEqual(b'data', b''.join(chunks))
+
+  def testAdaptiveBatchSize(self):
+    # pylint: disable=protected-access
+    plugin = self.output_sandbox._plugin
+    plugin.args.max_batch_size = 5
+    plugin._max_bytes = 1000
+    plugin._batch_size = 3
+
+    # Grows after fast and full batches, up to max_batch_size.
+    plugin._IncreaseBatchSize(3, 30, 0.1)
+    self.assertEqual(4, plugin._batch_size)
+    plugin._IncreaseBatchSize(4, 40, 0.1)
+    plugin._IncreaseBatchSize(5, 50, 0.1)
+    self.assertEqual(5, plugin._batch_size)
+
+    # Doesn't grow when the batch is not full.
+    plugin._batch_size = 3
+    plugin._IncreaseBatchSize(2, 20, 0.1)
+    self.assertEqual(3, plugin._batch_size)
+
+    # Halves after slow requests.
+    plugin._batch_size = 4
+    plugin._IncreaseBatchSize(4, 40, plugin.args.target_latency + 1)
+    self.assertEqual(2, plugin._batch_size)
+
+    # Keeps requests below half of Maximum-Bytes.
+    plugin._batch_size = 4
+    plugin._IncreaseBatchSize(4, 800, 0.1)
+    self.assertEqual(2, plugin._batch_size)
+
 
 if __name__ == '__main__':
   log_utils.InitLogging(log_utils.GetStreamHandler(logging.INFO))
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Output Parquet plugin.
+
+Exports events into Parquet files on a local directory, so that they can be
+queried with columnar tools (pyarrow, pandas, Spark, DuckDB) without any cloud
+service.  Each event type gets its own evolving schema, see columnar_common for
+how events are flattened into columns.  Attachments are not exported.
+
+The default structure:
+  ${target_dir}/
+    ${type}/
+      _schema.json
+      YYYYmmdd/
+        ${stationDeviceId}/
+          ${TIME}_${ID}.parquet
+          ...
+        ...
+      ...
+    ...
+
+Every batch writes one new file to each partition it has events for.  Columns
+of a file are all columns of the schema at that time, with nulls for columns an
+event does not have.  A column widened by a later batch keeps its old type in
+older files; read _schema.json to get the latest schema of all files.
+"""
+
+import json
+import os
+import time
+import uuid
+
+# pylint: disable=import-error
+import pyarrow
+from pyarrow import parquet
+
+from cros.factory.instalog import plugin_base
+from cros.factory.instalog.plugins import columnar_common
+from cros.factory.instalog.utils.arg_utils import Arg
+from cros.factory.instalog.utils import file_utils
+
+
+_DEFAULT_INTERVAL = 5 * 60  # 5min
+_DEFAULT_BATCH_SIZE = 100000
+_DEFAULT_ROW_GROUP_SIZE = 64 * 1024
+_DEFAULT_PARTITIONS = ['__DAY__', 'stationDeviceId']
+_COMPRESSIONS = ['none', 'snappy', 'gzip', 'brotli', 'lz4', 'zstd']
+SCHEMA_FILE_NAME = '_schema.json'
+FILE_EXTENSION = '.parquet'
+
+_ARROW_TYPES = {
+    columnar_common.BOOL: pyarrow.bool_(),
+    columnar_common.INT64: pyarrow.int64(),
+    columnar_common.DOUBLE: pyarrow.float64(),
+    columnar_common.STRING: pyarrow.string(),
+    columnar_common.TIMESTAMP: pyarrow.timestamp('us', tz='UTC'),
+}
+
+
+def GetArrowType(column_type):
+  """Returns the Arrow type of a column type of columnar_common."""
+  item_type = columnar_common.GetItemType(column_type)
+  if item_type:
+    return pyarrow.list_(_ARROW_TYPES[item_type])
+  return _ARROW_TYPES[column_type]
+
+
+def _ToMicroseconds(value):
+  return None if value is None else int(round(value * 1000000))
+
+
+def ToArrowArray(values, column_type):
+  """Converts coerced values of a column to an Arrow array."""
+  if column_type == columnar_common.TIMESTAMP:
+    values = [_ToMicroseconds(value) for value in values]
+  elif column_type == columnar_common.ListType(columnar_common.TIMESTAMP):
+    values = [None if value is None else
+              [_ToMicroseconds(item) for item in value] for value in values]
+  return pyarrow.array(values, type=GetArrowType(column_type))
+
+
+class OutputParquet(plugin_base.OutputPlugin):
+
+  ARGS = [
+      Arg('interval', (int, float),
+          'How long to wait, in seconds, before writing a batch.',
+          default=_DEFAULT_INTERVAL),
+      Arg('batch_size', int,
+          'How many events to write in a batch at most.',
+          default=_DEFAULT_BATCH_SIZE),
+      Arg('target_dir', str,
+          'The directory in which to store files.  Uses the plugin\'s data '
+          'directory by default.',
+          default=None),
+      Arg('partitions', list,
+          'The list of classifiers to partition files of each event type by.  '
+          'A classifier could be a dictionary path of a event (e.g. '
+          '"stationDeviceId") or "__DAY__", the local date of the event.',
+          default=_DEFAULT_PARTITIONS),
+      Arg('compression', str,
+          'The compression codec of column chunks, one of %s.' %
+          ', '.join(_COMPRESSIONS),
+          default='snappy'),
+      Arg('row_group_size', int,
+          'The maximum number of rows in each row group.',
+          default=_DEFAULT_ROW_GROUP_SIZE),
+      Arg('include_history', bool,
+          'Whether to store the history of events as a JSON string column.',
+          default=False),
+  ]
+
+  def __init__(self, *args, **kwargs):
+    super(OutputParquet, self).__init__(*args, **kwargs)
+    self.target_dir = None
+    self._schemas = {}
+
+  def SetUp(self):
+    """Sets up the plugin."""
+    if self.args.compression not in _COMPRESSIONS:
+      raise ValueError('The compression %r is not one of %s' %
+                       (self.args.compression, _COMPRESSIONS))
+    for classifier_name in self.args.partitions:
+      if classifier_name.startswith('__') and classifier_name != '__DAY__':
+        raise ValueError('The classifier %r is not found' % classifier_name)
+
+    if self.args.target_dir is None:
+      self.target_dir = self.GetDataDir()
+    else:
+      file_utils.TryMakeDirs(self.args.target_dir)
+      self.target_dir = self.args.target_dir
+    self._schemas = {}
+
+  def Main(self):
+    """Main thread of the plugin."""
+    while not self.IsStopping():
+      if not self.PrepareAndWrite():
+        self.Sleep(1)
+
+  def GetSchema(self, type_dir):
+    """Returns the schema of an event type, loading it from disk once."""
+    if type_dir not in self._schemas:
+      schema_path = os.path.join(self.target_dir, type_dir, SCHEMA_FILE_NAME)
+      if os.path.isfile(schema_path):
+        with open(schema_path) as f:
+          self._schemas[type_dir] = columnar_common.Schema.FromDict(
+              json.load(f))
+      else:
+        self._schemas[type_dir] = columnar_common.Schema()
+    return self._schemas[type_dir]
+
+  def SaveSchema(self, type_dir):
+    """Writes the schema of an event type to disk."""
+    schema = self._schemas[type_dir]
+    file_utils.TryMakeDirs(os.path.join(self.target_dir, type_dir))
+    with file_utils.AtomicWrite(
+        os.path.join(self.target_dir, type_dir, SCHEMA_FILE_NAME)) as f:
+      json.dump(schema.ToDict(), f)
+
+  def WriteFile(self, path, schema, rows):
+    """Writes rows into a new Parquet file with the given schema."""
+    names = list(schema.fields)
+    columns = list(zip(*(schema.Coerce(row) for row in rows)))
+    arrays = [ToArrowArray(values, schema.fields[name])
+              for name, values in zip(names, columns)]
+    table = pyarrow.Table.from_arrays(arrays, names=names)
+    file_utils.TryMakeDirs(os.path.dirname(path))
+    with file_utils.AtomicWrite(path, binary=True) as f:
+      parquet.write_table(table, f,
+                          row_group_size=self.args.row_group_size,
+                          compression=self.args.compression)
+
+  def PrepareAndWrite(self):
+    """Retrieves a batch of events, and writes them into Parquet files."""
+    event_stream = self.NewStream()
+    if not event_stream:
+      return False
+
+    # Maps (type_dir, partition_dir) to rows.
+    partitions = {}
+    changed_types = set()
+    num_events = 0
+    for event in event_stream.iter(timeout=self.args.interval,
+                                   count=self.args.batch_size):
+      type_dir = columnar_common.GetPartitionPath(event, ['type'])
+      partition_dir = columnar_common.GetPartitionPath(
+          event, self.args.partitions)
+      row, types = columnar_common.FlattenEvent(
+          event, self.args.include_history)
+      changes = self.GetSchema(type_dir).Update(types)
+      if changes:
+        changed_types.add(type_dir)
+        for name, old_type, new_type in changes:
+          if old_type:
+            self.info('Widened column %s of %s from %s to %s',
+                      name, type_dir, old_type, new_type)
+      partitions.setdefault((type_dir, partition_dir), []).append(row)
+      num_events += 1
+
+    if self.IsStopping():
+      self.info('Plugin is stopping! Abort %d events', num_events)
+      event_stream.Abort()
+      # Schemas may have been changed by aborted events.
+      self._schemas = {}
+      return False
+
+    if num_events == 0:
+      self.debug('Commit 0 events')
+      event_stream.Commit()
+      return True
+
+    try:
+      # Schemas are saved first, so that they always cover all files.
+      for type_dir in changed_types:
+        self.SaveSchema(type_dir)
+      file_name = '%d_%s%s' % (time.time(), uuid.uuid4().hex[:8],
+                               FILE_EXTENSION)
+      for (type_dir, partition_dir), rows in partitions.items():
+        self.WriteFile(
+            os.path.join(self.target_dir, type_dir, partition_dir, file_name),
+            self._schemas[type_dir], rows)
+    except Exception:
+      self.exception('Failed to write %d events', num_events)
+      self.info('Abort %d events', num_events)
+      event_stream.Abort()
+      self._schemas = {}
+      return False
+
+    self.info('Commit %d events into %d files', num_events, len(partitions))
+    event_stream.Commit()
+    return True
+
+
+if __name__ == '__main__':
+  plugin_base.main()
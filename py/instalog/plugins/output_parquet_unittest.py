@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for output Parquet plugin."""
+
+import glob
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+# pylint: disable=import-error
+from pyarrow import parquet
+
+from cros.factory.instalog import datatypes
+from cros.factory.instalog import log_utils
+from cros.factory.instalog import plugin_sandbox
+from cros.factory.instalog.plugins import columnar_common
+from cros.factory.instalog.plugins import output_parquet
+from cros.factory.instalog import testing
+
+
+class TestOutputParquet(unittest.TestCase):
+
+  def setUp(self):
+    self.core = testing.MockCore()
+    self.stream = self.core.GetStream(0)
+    self.tmp_dir = tempfile.mkdtemp(prefix='output_parquet_unittest_')
+    self.target_dir = os.path.join(self.tmp_dir, 'target_dir')
+    config = {
+        'interval': 1,
+        'target_dir': self.target_dir,
+        'partitions': []}
+    self.sandbox = plugin_sandbox.PluginSandbox(
+        'output_parquet', config=config,
+        data_dir=self.tmp_dir, core_api=self.core)
+    self.sandbox.Start(True)
+    # pylint: disable=protected-access
+    self.plugin = self.sandbox._plugin
+
+  def tearDown(self):
+    self.sandbox.Stop(True)
+    self.core.Close()
+    shutil.rmtree(self.tmp_dir)
+
+  def _Write(self, payloads):
+    self.stream.Queue([datatypes.Event(payload) for payload in payloads])
+    self.assertTrue(self.plugin.PrepareAndWrite())
+
+  def _ReadSchema(self):
+    with open(os.path.join(self.target_dir, 'test',
+                           output_parquet.SCHEMA_FILE_NAME)) as f:
+      return dict(json.load(f)['fields'])
+
+  def _ReadRows(self):
+    rows = []
+    for path in glob.glob(os.path.join(
+        self.target_dir, 'test', '*' + output_parquet.FILE_EXTENSION)):
+      rows.extend(parquet.read_table(path).to_pylist())
+    return rows
+
+  def testWrite(self):
+    self._Write([{'type': 'test', 'count': 1, 'values': [1, 2]},
+                 {'type': 'test', 'count': 2.5, 'values': [3]}])
+    self.assertEqual({'type': columnar_common.STRING,
+                      'count': columnar_common.DOUBLE,
+                      'values': columnar_common.ListType(
+                          columnar_common.INT64)},
+                     self._ReadSchema())
+    self.assertEqual([{'type': 'test', 'count': 1.0, 'values': [1, 2]},
+                      {'type': 'test', 'count': 2.5, 'values': [3]}],
+                     self._ReadRows())
+
+  def testUntypedLists(self):
+    self._Write([{'type': 'test', 'count': 1, 'values': [1, 2]}])
+    schema = self._ReadSchema()
+    # Empty and all-None lists don't widen the columns.
+    self._Write([{'type': 'test', 'count': [], 'values': []},
+                 {'type': 'test', 'count': [None], 'values': [None]},
+                 {'type': 'test', 'empty': []}])
+    self.assertEqual(schema, self._ReadSchema())
+    self.assertCountEqual([{'type': 'test', 'count': 1, 'values': [1, 2]},
+                           {'type': 'test', 'count': None, 'values': []},
+                           {'type': 'test', 'count': None, 'values': [None]},
+                           {'type': 'test', 'count': None, 'values': None}],
+                          self._ReadRows())
+
+
+if __name__ == '__main__':
+  log_utils.InitLogging(log_utils.GetStreamHandler(logging.INFO))
+  unittest.main()
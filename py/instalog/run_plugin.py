@@ -37,6 +37,9 @@ _MAIN_LOOP_INTERVAL = 1
 # Amount of time that select should be used to poll stdin to check for input.
 _POLL_STDIN_TIMEOUT = 0.1
 
+# Number of events to retrieve at once when flushing a buffer's consumer.
+_FLUSH_BATCH_SIZE = 1000
+
 
 class PluginRunnerBufferEventStream(plugin_base.BufferEventStream,
                                     log_utils.LoggerMixin):
@@ -179,11 +182,12 @@ class PluginRunner(plugin_sandbox.CoreAPI, log_utils.LoggerMixin):
       # TODO(kitching): Wrap calls to returned BufferStream somehow.
       buffer_stream = self._plugin.CallPlugin('Consume', '__instalog__')
       while True:
-        event = buffer_stream.Next()
-        if event is None:
+        events = buffer_stream.NextBatch(_FLUSH_BATCH_SIZE)
+        if not events:
           # No data left.
           break
-        print(event.Serialize())
+        for event in events:
+          print(event.Serialize())
       buffer_stream.Commit()
 
   def PrintStatusUpdate(self):
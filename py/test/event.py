@@ -3,6 +3,7 @@
 # found in the LICENSE file.
 
 import abc
+import collections
 import errno
 import json
 import logging
@@ -10,6 +11,7 @@ import os
 import pickle
 import queue
 import select
+import selectors
 import socket
 import socketserver
 import sys
@@ -40,6 +42,13 @@ _MAX_EVENT_SIZE_FOR_DEBUG_LOG = 512
 # the client.
 _HELLO_MESSAGE = b'\1'
 
+# Type of the event sent by a client to choose the event types it receives.
+# The event has an 'event_types' attribute, and is not broadcast.
+_SUBSCRIBE_EVENT_TYPE = 'event_server:subscribe'
+
+# Maximum number of messages buffered for a client of the event server.
+_DEFAULT_MAX_PENDING_MESSAGES = 1000
+
 
 def json_default_repr(obj):
   """Converts an object into a suitable representation for
@@ -172,35 +181,30 @@ class EventServerRequestHandler(socketserver.BaseRequestHandler):
     socketserver.BaseRequestHandler.setup(self)
     threading.current_thread().name = (
         'EventServerRequestHandler-%d' % get_unique_id())
-    # A thread to be used to send messages that are posted to the queue.
-    self.send_thread = None
-    # A queue containing messages.
-    self.queue = queue.Queue()
+    # The subscriber holding messages to be sent to the client.
+    self.subscriber = None
 
   def handle(self):
     # The handle() methods is run in a separate thread per client
     # (since EventServer has ThreadingMixIn).
     logging.debug('Event server: handling new client')
     try:
-      self.server._subscribe(self.queue)  # pylint: disable=protected-access
+      # pylint: disable=protected-access
+      self.subscriber = self.server._subscribe(self.request)
 
       # Send hello, now that we've subscribed.  Client will wait for
       # it before returning from the constructor.
       self.request.send(_HELLO_MESSAGE)
 
-      self.send_thread = process_utils.StartDaemonThread(
-          target=self._run_send_thread,
-          name='EventServerSendThread-%d' % get_unique_id())
-
       # Process events: continuously read message and broadcast to all
-      # clients' queues.
+      # clients' buffers.
       while True:
         msg = self.request.recv(_MAX_MESSAGE_SIZE + 1)
         if len(msg) > _MAX_MESSAGE_SIZE:
           logging.error('Event server: message too large')
         if not msg:
           break  # EOF
-        self.server._post_message(msg)  # pylint: disable=protected-access
+        self.server._post_message(msg, self.subscriber)
     except socket.error as e:
       if e.errno in [errno.ECONNRESET, errno.ESHUTDOWN, errno.EPIPE]:
         pass  # Client just quit
@@ -208,41 +212,155 @@ class EventServerRequestHandler(socketserver.BaseRequestHandler):
         raise
     finally:
       logging.debug('Event server: client disconnected')
-      self.queue.put(None)  # End of stream; make writer quit
-      self.server._unsubscribe(self.queue)  # pylint: disable=protected-access
+      if self.subscriber:
+        # pylint: disable=protected-access
+        self.server._unsubscribe(self.subscriber)
 
-  def _run_send_thread(self):
-    while True:
-      message = self.queue.get()
-      if message is None:
-        return
+
+class _Subscriber:
+  """A client of the event server, and the messages to be sent to it.
+
+  Messages are kept in a bounded buffer.  All methods except Send must be
+  called with the lock of the server held.
+
+  Properties:
+    request: The socket of the client.
+    event_types: The set of event types the client subscribes to, or None for
+        all events.
+    dropped: Number of messages dropped since the client was too slow.
+  """
+
+  def __init__(self, request, max_pending):
+    self.request = request
+    self.event_types = None
+    self.dropped = 0
+    self.closed = False
+    # Whether the subscriber is waiting for its socket to be writable, and the
+    # file descriptor registered to the selector.
+    self.blocked = False
+    self.fd = None
+    # Held while sending, so the socket is not closed during sending.
+    self.send_lock = threading.Lock()
+    self._max_pending = max_pending
+    # Entries of [event_type, message].
+    self._pending = collections.deque()
+    # The pending entry of each coalesced event type.
+    self._coalesced = {}
+
+  def Push(self, event_type, message, policy):
+    """Adds a message to the buffer.
+
+    Returns:
+      True if the message is added.
+    """
+    if policy == EventServer.POLICY_COALESCE:
+      entry = self._coalesced.get(event_type)
+      if entry:
+        entry[1] = message
+        return True
+    if len(self._pending) >= self._max_pending:
+      self.dropped += 1
+      # Logs when the number is a power of two.
+      if self.dropped & (self.dropped - 1) == 0:
+        logging.warning('Event server: client is too slow; dropped %d '
+                        'messages', self.dropped)
+      if policy == EventServer.POLICY_DROP:
+        return False
+      self.Pop()
+    entry = [event_type, message]
+    self._pending.append(entry)
+    if policy == EventServer.POLICY_COALESCE:
+      self._coalesced[event_type] = entry
+    return True
+
+  def Pop(self):
+    """Removes and returns the first message, or None if empty."""
+    if not self._pending:
+      return None
+    entry = self._pending.popleft()
+    if self._coalesced.get(entry[0]) is entry:
+      del self._coalesced[entry[0]]
+    return entry[1]
+
+  def PushFront(self, message):
+    """Puts back a message which can't be sent yet."""
+    self._pending.appendleft([None, message])
+
+  def GetPendingCount(self):
+    return len(self._pending)
+
+  def Send(self, message):
+    """Sends a message without blocking.
+
+    Returns:
+      False if the socket is not writable, True otherwise.
+    """
+    with self.send_lock:
+      if self.closed:
+        return True
       try:
-        self.request.send(message)
+        self.request.send(message, socket.MSG_DONTWAIT)
+      except BlockingIOError:
+        return False
       except Exception:
-        return
+        # The client will be unsubscribed when its handler finds EOF.
+        logging.debug('Event server: failed to send message', exc_info=True)
+      return True
 
 
 class EventServer(socketserver.ThreadingUnixStreamServer):
   """An event server that broadcasts messages to all clients.
 
-  This class is agnostic to message format (except for logging).
+  Each message is delivered to the clients subscribing its event type (see
+  EventClientBase) by one sending thread, which never blocks on a slow client.
+  Messages waiting for a client are kept in a buffer of max_pending_messages,
+  and when the buffer is full, messages are dropped according to the policy of
+  their event type:
+
+  - POLICY_DROP_OLDEST: The oldest pending message is dropped.  This is the
+    default for event types without a policy.
+  - POLICY_DROP: The new message is dropped.
+  - POLICY_COALESCE: A pending message of the same event type is replaced by
+    the new message, even if the buffer is not full.
+
+  This class is agnostic to message format (except for logging and event
+  types).
   """
   allow_reuse_address = True
   socket_type = socket.SOCK_SEQPACKET
   daemon_threads = True
 
-  def __init__(self, path=None):
+  POLICY_DROP_OLDEST = 'drop_oldest'
+  POLICY_DROP = 'drop'
+  POLICY_COALESCE = 'coalesce'
+
+  def __init__(self, path=None, max_pending_messages=None,
+               event_policies=None):
     """Constructor.
 
     Args:
       path: Path at which to create a UNIX stream socket.
           If None, uses a temporary path and sets the CROS_FACTORY_EVENT
           environment variable for future clients to use.
+      max_pending_messages: Maximum number of messages buffered for each
+          client.  Defaults to _DEFAULT_MAX_PENDING_MESSAGES.
+      event_policies: A dict from event types to their policies, replacing
+          _DEFAULT_EVENT_POLICIES.
     """
     # pylint: disable=super-init-not-called
-    # A set of queues listening to messages.
-    self._queues = set()
-    # A lock guarding the _queues variable.
+    self._max_pending_messages = (
+        max_pending_messages or _DEFAULT_MAX_PENDING_MESSAGES)
+    self._event_policies = (_DEFAULT_EVENT_POLICIES if event_policies is None
+                            else event_policies)
+    # All subscribers, and the subscribers of each event type.  Subscribers of
+    # all events are in _subscribers_by_type[None].
+    self._subscribers = set()
+    self._subscribers_by_type = collections.defaultdict(set)
+    # Subscribers with pending messages, and the unsubscribed ones to be
+    # removed from the selector.
+    self._ready = set()
+    self._closed = []
+    # A lock guarding the variables above and the buffers of subscribers.
     self._lock = threading.Lock()
     self._temp_path = None
     if not path:
@@ -254,47 +372,203 @@ class EventServer(socketserver.ThreadingUnixStreamServer):
     socketserver.UnixStreamServer.__init__(
         self, path, EventServerRequestHandler)
 
+    self._stopped = False
+    self._wake_read_fd, self._wake_write_fd = os.pipe()
+    os.set_blocking(self._wake_read_fd, False)
+    self._send_thread = process_utils.StartDaemonThread(
+        target=self._RunSendThread, name='EventServerSendThread')
+
   def server_close(self):
-    """Cleanup temporary file"""
+    """Stops the sending thread and cleanup temporary file"""
     socketserver.ThreadingUnixStreamServer.server_close(self)
+    if self._send_thread:
+      self._stopped = True
+      self._Wake()
+      self._send_thread.join()
+      self._send_thread = None
+      os.close(self._wake_read_fd)
+      os.close(self._wake_write_fd)
     if self._temp_path is not None:
       file_utils.TryUnlink(self._temp_path)
 
-  def _subscribe(self, q):
-    """Subscribes a queue to receive events.
+  def GetStatus(self):
+    """Returns the numbers of pending and dropped messages of each client."""
+    with self._lock:
+      return [{'event_types': (sorted(subscriber.event_types)
+                               if subscriber.event_types is not None
+                               else None),
+               'pending': subscriber.GetPendingCount(),
+               'dropped': subscriber.dropped}
+              for subscriber in self._subscribers]
+
+  def _subscribe(self, request):
+    """Subscribes a client to receive all events.
 
     Invoked only from the request handler.
     """
+    subscriber = _Subscriber(request, self._max_pending_messages)
     with self._lock:
-      self._queues.add(q)
+      self._subscribers.add(subscriber)
+      self._subscribers_by_type[None].add(subscriber)
+    return subscriber
 
-  def _unsubscribe(self, q):
-    """Unsubscribes a queue to receive events.
+  def _unsubscribe(self, subscriber):
+    """Unsubscribes a client to receive events.
 
     Invoked only from the request handler.
     """
+    with subscriber.send_lock:
+      subscriber.closed = True
     with self._lock:
-      self._queues.discard(q)
-
-  def _post_message(self, message):
-    """Posts a message to all clients.
+      self._subscribers.discard(subscriber)
+      self._SetEventTypes(subscriber, ())
+      self._ready.discard(subscriber)
+      self._closed.append(subscriber)
+    self._Wake()
+
+  def _SetEventTypes(self, subscriber, event_types):
+    for event_type in (subscriber.event_types
+                       if subscriber.event_types is not None else [None]):
+      subscribers = self._subscribers_by_type[event_type]
+      subscribers.discard(subscriber)
+      if not subscribers:
+        del self._subscribers_by_type[event_type]
+    subscriber.event_types = event_types
+    for event_type in (event_types if event_types is not None else [None]):
+      self._subscribers_by_type[event_type].add(subscriber)
+
+  def _post_message(self, message, sender=None):
+    """Posts a message to all clients subscribing its event type.
 
     Invoked only from the request handler.
     """
     try:
+      event = pickle.loads(message)
+      event_type = event.type
       if logging.getLogger().isEnabledFor(logging.DEBUG):
-        logging.debug('Event server: dispatching object %s',
-                      pickle.loads(message))
+        logging.debug('Event server: dispatching object %s', event)
     except Exception:
-      # Message isn't parseable as a pickled object; weird!
+      # Message isn't parseable as a pickled event; weird!
       logging.info(
           'Event server: dispatching message %r', message)
+      event_type = None
+
+    with self._lock:
+      if event_type == _SUBSCRIBE_EVENT_TYPE:
+        if sender and not sender.closed:
+          self._SetEventTypes(sender, frozenset(event.event_types))
+        return
+      policy = self._event_policies.get(event_type)
+      subscribers = self._subscribers_by_type.get(None, set())
+      if event_type is not None and event_type in self._subscribers_by_type:
+        subscribers = subscribers | self._subscribers_by_type[event_type]
+      wake = False
+      for subscriber in subscribers:
+        if (subscriber.Push(event_type, message, policy) and
+            subscriber not in self._ready):
+          self._ready.add(subscriber)
+          wake = True
+    if wake:
+      self._Wake()
+
+  def _Wake(self):
+    try:
+      os.write(self._wake_write_fd, b'\0')
+    except BlockingIOError:
+      pass  # The pipe is full, so the thread will wake up anyway.
+
+  def _RunSendThread(self):
+    """Sends pending messages to the clients whose sockets are writable."""
+    with selectors.DefaultSelector() as selector:
+      selector.register(self._wake_read_fd, selectors.EVENT_READ)
+      while not self._stopped:
+        for key, unused_mask in selector.select():
+          if key.fd == self._wake_read_fd:
+            try:
+              while os.read(self._wake_read_fd, 4096):
+                pass
+            except BlockingIOError:
+              pass
+          else:
+            selector.unregister(key.fd)
+            with self._lock:
+              key.data.blocked = False
+              if not key.data.closed:
+                self._ready.add(key.data)
+
+        with self._lock:
+          closed, self._closed = self._closed, []
+          ready = [subscriber for subscriber in self._ready
+                   if not subscriber.blocked]
+          self._ready.clear()
+        # Unregister the closed subscribers first, since their file descriptors
+        # may be reused by the ready ones.
+        for subscriber in closed:
+          if subscriber.blocked:
+            self._Unregister(subscriber, selector)
+        for subscriber in ready:
+          try:
+            self._Flush(subscriber, selector)
+          except (ValueError, KeyError, OSError):
+            # For example, the socket is closed after it was not writable.
+            logging.warning('Event server: dropped a client which can not be '
+                            'waited for', exc_info=True)
+            self._Drop(subscriber)
+
+  def _Flush(self, subscriber, selector):
+    while True:
+      with self._lock:
+        message = subscriber.Pop()
+      if message is None:
+        return
+      if not subscriber.Send(message):
+        with self._lock:
+          subscriber.PushFront(message)
+          subscriber.blocked = True
+        self._Register(subscriber, selector)
+        return
+
+  def _Register(self, subscriber, selector):
+    """Waits for the socket of a subscriber to be writable."""
+    subscriber.fd = subscriber.request.fileno()
+    try:
+      selector.register(subscriber.fd, selectors.EVENT_WRITE, subscriber)
+    except KeyError:
+      # The file descriptor is still registered by a subscriber whose socket
+      # is closed, and is reused by this one.
+      stale = selector.get_key(subscriber.fd).data
+      if not stale.closed and stale.request.fileno() == subscriber.fd:
+        raise
+      selector.unregister(subscriber.fd)
+      selector.register(subscriber.fd, selectors.EVENT_WRITE, subscriber)
 
+  def _Unregister(self, subscriber, selector):
+    """Stops waiting for the socket of a subscriber."""
+    try:
+      key = selector.get_key(subscriber.fd)
+    except KeyError:
+      return
+    # The file descriptor may be registered again by another subscriber.
+    if key.data is subscriber:
+      selector.unregister(subscriber.fd)
+
+  def _Drop(self, subscriber):
+    """Unsubscribes a client which can't be sent to, and disconnects it."""
     with self._lock:
-      for q in self._queues:
-        # Note that this is nonblocking (even if one of the
-        # clients is dead).
-        q.put(message)
+      subscriber.blocked = False
+    self._unsubscribe(subscriber)
+    try:
+      subscriber.request.shutdown(socket.SHUT_RDWR)
+    except OSError:
+      pass
+
+
+# Policies of high-rate event types, which are fine to lose for slow clients.
+_DEFAULT_EVENT_POLICIES = {
+    Event.Type.UPDATE_SYSTEM_INFO: EventServer.POLICY_COALESCE,
+    Event.Type.UPDATE_NOTES: EventServer.POLICY_COALESCE,
+    Event.Type.LOG: EventServer.POLICY_DROP,
+}
 
 
 class EventClientBase(metaclass=abc.ABCMeta):
@@ -305,12 +579,16 @@ class EventClientBase(metaclass=abc.ABCMeta):
 
   The _process_event() need to be called periodically.
 
+  A client receives all events by default.  If event_types is given, the server
+  only sends events of these types to the client, which saves the cost of
+  sending and unpickling events the client doesn't care about.
+
   Inherit graph:
   EventClientBase:
     |-- ThreadingEventClient: A daemon thread to process events.
     |-- BlockingEventClient: A while-loop on calling thread to process events.
   """
-  def __init__(self, path=None, callback=None):
+  def __init__(self, path=None, callback=None, event_types=None):
     """Constructor.
 
     Args:
@@ -318,8 +596,15 @@ class EventClientBase(metaclass=abc.ABCMeta):
           the CROS_FACTORY_EVENT environment variable.
       callback: A callback to call when events occur. The callback
           takes one argument: the received event.
+      event_types: An iterable of event types to receive, or None to receive
+          all events.
     """
     self.socket = self._ConnectSocket(path)
+    self.event_types = (frozenset(event_types) if event_types is not None
+                        else None)
+    if self.event_types is not None:
+      self.post_event(Event(_SUBSCRIBE_EVENT_TYPE,
+                            event_types=sorted(self.event_types)))
 
     self.callbacks = set()
     logging.debug('Initializing event client')
@@ -423,6 +708,9 @@ class EventClientBase(metaclass=abc.ABCMeta):
 
     try:
       event = pickle.loads(msg_bytes)
+      # Events posted before the server handles our subscription.
+      if self.event_types is not None and event.type not in self.event_types:
+        return True, None
       if logging.getLogger().isEnabledFor(logging.DEBUG):
         logging.debug('Event client: dispatching event %s',
                       self._truncate_event_for_debug_log(event))
@@ -522,15 +810,16 @@ class ThreadingEventClient(EventClientBase):
   A daemon thread is created in constructor to process events. After instance is
   constructed, callbacks will be called from that thread with incoming events.
   """
-  def __init__(self, path=None, callback=None, name=None):
+  def __init__(self, path=None, callback=None, name=None, event_types=None):
     """Constructor.
 
     Args:
       path: See EventClientBase.__init__.
       callback: See EventClientBase.__init__.
       name: An optional name for the receving thread.
+      event_types: See EventClientBase.__init__.
     """
-    super(ThreadingEventClient, self).__init__(path, callback)
+    super(ThreadingEventClient, self).__init__(path, callback, event_types)
 
     self.recv_thread = process_utils.StartDaemonThread(
         target=self._run_recv_thread,
@@ -3,6 +3,7 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import collections
 import json
 import threading
 import time
@@ -11,6 +12,7 @@ import unittest
 from cros.factory.test import event
 from cros.factory.utils import net_utils
 from cros.factory.utils import process_utils
+from cros.factory.utils import sync_utils
 
 
 EventType = event.Event.Type
@@ -147,10 +149,141 @@ class EventServerQueueCleanTest(Tests.EventServerClientTestBase):
     client.post_event(event.Event(PONG, msg='msg'))
     client.wait(lambda ev: ev.type == PONG)
 
+    for status in self.server.GetStatus():
+      self.assertEqual(0, status['pending'])
+      self.assertEqual(0, status['dropped'])
+
+
+class SubscriberTest(unittest.TestCase):
+  # pylint: disable=protected-access
+
+  def setUp(self):
+    self.subscriber = event._Subscriber(None, max_pending=3)
+
+  def _PopAll(self):
+    messages = []
+    while True:
+      message = self.subscriber.Pop()
+      if message is None:
+        return messages
+      messages.append(message)
+
+  def testDropOldest(self):
+    for i in range(5):
+      self.assertTrue(self.subscriber.Push('a', i, None))
+    self.assertEqual([2, 3, 4], self._PopAll())
+    self.assertEqual(2, self.subscriber.dropped)
+
+  def testDrop(self):
+    for i in range(3):
+      self.subscriber.Push('a', i, None)
+    self.assertFalse(
+        self.subscriber.Push('log', 3, event.EventServer.POLICY_DROP))
+    self.assertEqual([0, 1, 2], self._PopAll())
+
+  def testCoalesce(self):
+    coalesce = event.EventServer.POLICY_COALESCE
+    self.subscriber.Push('info', 0, coalesce)
+    self.subscriber.Push('a', 1, None)
+    self.subscriber.Push('info', 2, coalesce)
+    self.assertEqual(2, self.subscriber.GetPendingCount())
+    self.assertEqual([2, 1], self._PopAll())
+    self.subscriber.Push('info', 3, coalesce)
+    self.assertEqual([3], self._PopAll())
+
+
+class EventServerSubscriptionTest(Tests.EventServerClientTestBase):
+  has_pong_client = False
+
+  def setUp(self):
+    super(EventServerSubscriptionTest, self).setUp()
+    self.events = collections.defaultdict(list)
+
+  def _CreateSubscriber(self, event_types=None):
+    """Creates a client recording its events in self.events[name].
+
+    Returns:
+      The name of the client, which is its index in self.clients.
+    """
+    name = len(self.clients)
+    client = event.ThreadingEventClient(
+        callback=self.events[name].append, event_types=event_types)
+    self.clients.append(client)
+    return name
+
+  def _WaitForEvents(self, name, count):
+    sync_utils.WaitFor(lambda: len(self.events[name]) >= count, 10,
+                       poll_interval=0.01)
+
+  def testEventTypes(self):
+    ping_client = self._CreateSubscriber(event_types=[PING])
+    all_client = self._CreateSubscriber()
+    # The subscription is handled in order with events from the same client.
+    self.clients[ping_client].post_event(event.Event(PONG))
+    self.clients[ping_client].post_event(event.Event(PING))
+    self._WaitForEvents(all_client, 2)
+    self._WaitForEvents(ping_client, 1)
+    self.assertEqual([PING], [ev.type for ev in self.events[ping_client]])
+    self.assertEqual([PONG, PING], [ev.type for ev in self.events[all_client]])
+
+  def testManySubscribers(self):
+    num_events = 200
+    names = [self._CreateSubscriber() for unused_i in range(100)]
+    for i in range(num_events):
+      self.clients[0].post_event(event.Event(PING, msg=i))
+    for name in names:
+      self._WaitForEvents(name, num_events)
+      self.assertEqual(list(range(num_events)),
+                       [ev.msg for ev in self.events[name]])
+
+  def testSlowSubscriber(self):
+    self.server._max_pending_messages = 100  # pylint: disable=protected-access
+    # A client which never reads.
+    slow_client = event.BlockingEventClient()
+    self.clients.append(slow_client)
+    name = self._CreateSubscriber()
+
+    num_events = 5000
+    for i in range(num_events):
+      self.clients[name].post_event(event.Event(PING, msg=i))
+      # Don't post faster than the other client reads.
+      if i % 50 == 49:
+        self._WaitForEvents(name, i + 1)
+    self.assertEqual(list(range(num_events)),
+                     [ev.msg for ev in self.events[name]])
+    slow_status = max(self.server.GetStatus(), key=lambda s: s['dropped'])
+    self.assertGreater(slow_status['dropped'], 0)
+    self.assertLessEqual(slow_status['pending'], 100)
+
+  def testClosedBlockedSubscriber(self):
     # pylint: disable=protected-access
-    with self.server._lock:
-      for queue in self.server._queues:
-        self.assertFalse(queue.qsize())
+    # A client which never reads.
+    slow_client = event.BlockingEventClient()
+    self.clients.append(slow_client)
+    sync_utils.WaitFor(lambda: self.server._subscribers, 10,
+                       poll_interval=0.01)
+    slow_subscriber, = self.server._subscribers
+    send = slow_subscriber.Send
+
+    def _SendAndClose(message):
+      if send(message):
+        return True
+      # The socket is closed as soon as the client is blocked.
+      slow_subscriber.request.close()
+      return False
+
+    slow_subscriber.Send = _SendAndClose
+    name = self._CreateSubscriber()
+
+    num_events = 2000
+    for i in range(num_events):
+      self.clients[name].post_event(event.Event(PING, msg=i))
+      if i % 50 == 49:
+        self._WaitForEvents(name, i + 1)
+    self.assertEqual(list(range(num_events)),
+                     [ev.msg for ev in self.events[name]])
+    self.assertTrue(slow_subscriber.closed)
+    self.assertEqual(1, len(self.server.GetStatus()))
 
 
 if __name__ == '__main__':
@@ -10,6 +10,7 @@ import os
 import pickle
 import signal
 import sys
+import time
 
 from cros.factory.device import device_utils
 from cros.factory.test import session
@@ -33,6 +34,7 @@ def RunPytest(test_info):
   Args:
     test_info: A PytestInfo object containing information about what to run.
   """
+  start_time = None
   try:
     os.setpgrp()
     # Register a handler for SIGTERM, so that Python interpreter has
@@ -59,6 +61,7 @@ def RunPytest(test_info):
     if arg_spec:
       test.args = Args(*arg_spec).Parse(test_info.args)
 
+    start_time = time.time()
     test_case_result = pytest_utils.RunTestCase(test)
 
     if test_case_result.failure_details:
@@ -70,12 +73,24 @@ def RunPytest(test_info):
   except Exception:
     logging.exception('Unable to run pytest')
     result = PytestExecutionResult.GenerateFromException(TestState.FAILED)
+  result.start_time = start_time
 
   file_utils.WriteFile(test_info.results_path, pickle.dumps(result),
                        encoding=None)
 
 
+def Preload(pytest_names):
+  """Imports the modules of pytests expected to run, before they are known."""
+  for pytest_name in pytest_names:
+    try:
+      pytest_utils.LoadPytestModule(pytest_name)
+    except Exception:
+      # The error is reported if the pytest runs.
+      pass
+
+
 def main():
+  Preload(sys.argv[1:])
   # Load pickle object from the binary data directly to prevent potential
   # decoding errors.
   env, info = pickle.load(sys.stdin.buffer)
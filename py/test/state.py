@@ -5,7 +5,9 @@
 
 """This module handles factory test states (status) and shared persistent data.
 
-The `state` provides two different data set using shelve_utils.DictShelfView:
+The `state` provides two different data set using
+dict_store_utils.JournaledDictStore, which has the same interface as
+shelve_utils.DictShelfView:
 
  - tests: A shelf storing test states and status.
  - data: A shelf for data to be shared (also known as shared_data), providing:
@@ -13,6 +15,10 @@ The `state` provides two different data set using shelve_utils.DictShelfView:
      shopfloor or barcode scanner). See cros.factory.test.device_data for more
      details.
    - other global or session variables.
+
+Each change is appended to a journal as one transaction, so updating a test
+state costs one small write instead of rewriting a shelf.  Shelves written by
+older versions are migrated when the state is opened for the first time.
 """
 
 import logging
@@ -27,6 +33,7 @@ from cros.factory.test.env import goofy_proxy
 from cros.factory.test.env import paths
 from cros.factory.test.utils.selector_utils import DataShelfSelector
 from cros.factory.utils import config_utils
+from cros.factory.utils import dict_store_utils
 from cros.factory.utils import file_utils
 from cros.factory.utils import shelve_utils
 from cros.factory.utils import sync_utils
@@ -58,7 +65,7 @@ def ClearState(state_file_dir=DEFAULT_FACTORY_STATE_FILE_DIR):
 
 
 class FactoryStateLayer:
-  """Contains two DictShelfView 'tests_shelf' and 'data_shelf'."""
+  """Contains two JournaledDictStore 'tests_shelf' and 'data_shelf'."""
   def __init__(self, state_dir=None):
     """Constructor
 
@@ -68,15 +75,28 @@ class FactoryStateLayer:
     """
     if state_dir:
       file_utils.TryMakeDirs(state_dir)
-      self._tests_shelf = shelve_utils.DictShelfView(
-          shelve_utils.OpenShelfOrBackup(os.path.join(state_dir, 'tests')))
-      self._data_shelf = shelve_utils.DictShelfView(
-          shelve_utils.OpenShelfOrBackup(os.path.join(state_dir, 'data')))
+      self._tests_shelf = self._OpenStore(state_dir, 'tests')
+      self._data_shelf = self._OpenStore(state_dir, 'data')
     else:
-      self._tests_shelf = shelve_utils.DictShelfView(
-          shelve_utils.InMemoryShelf())
-      self._data_shelf = shelve_utils.DictShelfView(
-          shelve_utils.InMemoryShelf())
+      self._tests_shelf = dict_store_utils.JournaledDictStore()
+      self._data_shelf = dict_store_utils.JournaledDictStore()
+
+  @staticmethod
+  def _OpenStore(state_dir, name):
+    """Opens the store `name`, migrating the legacy shelf if there is one."""
+    store = dict_store_utils.JournaledDictStore(
+        os.path.join(state_dir, name + '_store'))
+    legacy_shelf = os.path.join(state_dir, name)
+    if not store.Exists() and shelve_utils.FindShelfFiles(legacy_shelf):
+      logging.info('Migrating shelf %s to %s', legacy_shelf, name + '_store')
+      shelf_view = shelve_utils.DictShelfView(
+          shelve_utils.OpenShelfOrBackup(legacy_shelf, 'r'))
+      try:
+        if shelf_view.HasKey(''):
+          store.SetValue('', shelf_view.GetValue(''))
+      finally:
+        shelf_view.Close()
+    return store
 
   @property
   def tests_shelf(self):
@@ -150,6 +170,7 @@ class FactoryState:
     self.layers = [FactoryStateLayer(state_file_dir)]
 
     self._lock = threading.RLock()
+    self._InitDataShelfRevisions()
 
     if TestState not in jsonclass.SUPPORTED_TYPES:
       jsonclass.SUPPORTED_TYPES = jsonclass.SUPPORTED_TYPES + (TestState, )
@@ -306,11 +327,13 @@ class FactoryState:
   def DataShelfSetValue(self, key, value):
     """Set key to value on top layer."""
     self.layers[-1].data_shelf.SetValue(key, value)
+    self._DataShelfChanged([key])
 
   @sync_utils.Synchronized
   def DataShelfUpdateValue(self, key, value):
     """Update key by value on top layer."""
     self.layers[-1].data_shelf.UpdateValue(key, value)
+    self._DataShelfChanged([key])
 
   @sync_utils.Synchronized
   def DataShelfDeleteKeys(self, keys, optional=False):
@@ -318,7 +341,10 @@ class FactoryState:
     # In case there's only one single key.
     if isinstance(keys, str):
       keys = [keys]
-    self.layers[-1].data_shelf.DeleteKeys(keys, optional=optional)
+    try:
+      self.layers[-1].data_shelf.DeleteKeys(keys, optional=optional)
+    finally:
+      self._DataShelfChanged(keys)
 
   @sync_utils.Synchronized
   def DataShelfHasKey(self, key):
@@ -339,6 +365,57 @@ class FactoryState:
         pass
     return list(ret)
 
+  @sync_utils.Synchronized
+  def DataShelfGetRevision(self, keys=None):
+    """Returns the revision of the last change of the given keys.
+
+    The revision increases whenever the data shelf is changed, so a caller can
+    tell whether the data it read is changed by comparing the revisions.  A
+    change of a key is also a change of its parents and children.  The
+    revisions are kept in memory, so they are only comparable within the same
+    FactoryState object.
+
+    Args:
+      keys: A list of keys, or None for any key.
+
+    Returns:
+      An integer of the revision, which is 0 if the keys are never changed.
+    """
+    if keys is None:
+      return self._data_shelf_revision
+    revision = 0
+    for key in keys:
+      parents = self._GetKeyAndParents(key)
+      revision = max([revision,
+                      self._data_shelf_subtree_revisions.get(parents[0], 0)] +
+                     [self._data_shelf_key_revisions.get(parent, 0)
+                      for parent in parents])
+    return revision
+
+  def _InitDataShelfRevisions(self):
+    self._data_shelf_revision = 0
+    # The revisions of the last change of each key, and of any key under it.
+    self._data_shelf_key_revisions = {}
+    self._data_shelf_subtree_revisions = {}
+
+  def _DataShelfChanged(self, keys):
+    self._data_shelf_revision += 1
+    for key in keys:
+      parents = self._GetKeyAndParents(key)
+      self._data_shelf_key_revisions[parents[0]] = self._data_shelf_revision
+      for parent in parents:
+        self._data_shelf_subtree_revisions[parent] = self._data_shelf_revision
+
+  @staticmethod
+  def _GetKeyAndParents(key):
+    """Returns a list of the normalized key and all its parents."""
+    key = shelve_utils.DictKey.Join(key)
+    ret = [key]
+    while key:
+      key = shelve_utils.DictKey.GetParent(key)
+      ret.append(key)
+    return ret
+
   @sync_utils.Synchronized
   def DataShelfAppendToList(self, key, new_item):
     """Appends data to a list with given key. d[key] += [new_item]."""
@@ -360,12 +437,14 @@ class FactoryState:
     self.layers.append(FactoryStateLayer(None))
     if serialized_data:
       self.layers[-1].Loads(serialized_data)
+    self._DataShelfChanged([''])
 
   @sync_utils.Synchronized
   def PopLayer(self):
     if len(self.layers) == 1:
       raise FactoryStateLayerException('Cannot pop last layer')
     self.layers.pop()
+    self._DataShelfChanged([''])
 
   @sync_utils.Synchronized
   def SerializeLayer(self, layer_index, include_data=True, include_tests=True):
@@ -381,11 +460,10 @@ class FactoryState:
 
     dst = self.layers[layer_index - 1]
     src = self.layers[layer_index]
-    if src.tests_shelf.HasKey(''):
-      dst.tests_shelf.UpdateValue('', src.tests_shelf.GetValue(''))
-    if src.data_shelf.HasKey(''):
-      dst.data_shelf.UpdateValue('', src.data_shelf.GetValue(''))
+    dst.tests_shelf.UpdateFrom(src.tests_shelf)
+    dst.data_shelf.UpdateFrom(src.data_shelf)
     self.layers.pop()
+    self._DataShelfChanged([''])
 
   @sync_utils.Synchronized
   def GetLayerCount(self):
@@ -573,10 +651,8 @@ class StubFactoryStateLayer(FactoryStateLayer):
   def __init__(self, state_dir=None):  # pylint: disable=super-init-not-called
     del state_dir  # unused
     # always create in memory shelf
-    self._tests_shelf = shelve_utils.DictShelfView(
-        shelve_utils.InMemoryShelf())
-    self._data_shelf = shelve_utils.DictShelfView(
-        shelve_utils.InMemoryShelf())
+    self._tests_shelf = dict_store_utils.JournaledDictStore()
+    self._data_shelf = dict_store_utils.JournaledDictStore()
 
 
 class StubFactoryState(FactoryState):
@@ -584,4 +660,5 @@ class StubFactoryState(FactoryState):
     self.layers = [StubFactoryStateLayer()]
 
     self._lock = threading.RLock()
+    self._InitDataShelfRevisions()
     self.data_shelf = DataShelfSelector(self)
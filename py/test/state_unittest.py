@@ -4,11 +4,13 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import os
 import shutil
 import tempfile
 import unittest
 
 from cros.factory.test import state
+from cros.factory.utils import shelve_utils
 
 
 class FactoryStateTest(unittest.TestCase):
@@ -111,6 +113,27 @@ class FactoryStateTest(unittest.TestCase):
     self.assertEqual({'a': 2, 'b': 2, 'c': 4},
                      self.state.DataShelfGetValue('data'))
 
+  def testDataShelfGetRevision(self):
+    self.assertEqual(0, self.state.DataShelfGetRevision())
+    self.state.DataShelfSetValue('data.a', {'b': 1})
+    revision = self.state.DataShelfGetRevision()
+    self.assertEqual(revision, self.state.DataShelfGetRevision(['data.a.b']))
+    self.assertEqual(revision, self.state.DataShelfGetRevision(['data']))
+    self.assertEqual(0, self.state.DataShelfGetRevision(['data.c', 'other']))
+
+    self.state.DataShelfUpdateValue('data.c', 2)
+    self.assertEqual(revision, self.state.DataShelfGetRevision(['data.a']))
+    self.assertLess(revision, self.state.DataShelfGetRevision(['data.a',
+                                                               'data.c']))
+
+    revision = self.state.DataShelfGetRevision()
+    self.state.DataShelfDeleteKeys('data')
+    self.assertLess(revision, self.state.DataShelfGetRevision(['data.a.b']))
+
+    revision = self.state.DataShelfGetRevision()
+    self.state.AppendLayer()
+    self.assertLess(revision, self.state.DataShelfGetRevision(['other']))
+
   def testDataShelfAppendToList(self):
     self.state.DataShelfSetValue('data', [1, 2])
     self.state.DataShelfAppendToList('data', 3)
@@ -184,6 +207,34 @@ class FactoryStateTest(unittest.TestCase):
     self.assertEqual(data, layer.data_shelf.GetValue(''))
     self.assertEqual(tests, layer.tests_shelf.GetValue(''))
 
+  def testReopen(self):
+    self.state.UpdateTestState('a.b', status=state.TestState.PASSED)
+    self.state.DataShelfSetValue('data', {'a': 1})
+    self.state.Close()
+
+    self.state = state.FactoryState()
+    self.assertEqual(state.TestState.PASSED,
+                     self.state.GetTestState('a.b').status)
+    self.assertEqual({'a': 1}, self.state.DataShelfGetValue('data'))
+
+  def testMigrateShelf(self):
+    self.state.Close()
+    shutil.rmtree(state.DEFAULT_FACTORY_STATE_FILE_DIR)
+    os.mkdir(state.DEFAULT_FACTORY_STATE_FILE_DIR)
+    shelf = shelve_utils.DictShelfView(shelve_utils.OpenShelfOrBackup(
+        os.path.join(state.DEFAULT_FACTORY_STATE_FILE_DIR, 'data')))
+    shelf.SetValue('data', {'a': 1, 'b': 2})
+    shelf.Close()
+
+    self.state = state.FactoryState()
+    self.assertEqual({'a': 1, 'b': 2}, self.state.DataShelfGetValue('data'))
+    self.state.DataShelfSetValue('data.a', 3)
+    self.state.Close()
+
+    # Migrated only once.
+    self.state = state.FactoryState()
+    self.assertEqual({'a': 3, 'b': 2}, self.state.DataShelfGetValue('data'))
+
 
 if __name__ == '__main__':
   unittest.main()
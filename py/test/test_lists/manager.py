@@ -5,7 +5,9 @@
 """Loader of test_list.json"""
 
 import collections
+import concurrent.futures
 import logging
+import multiprocessing
 import os
 import zipimport
 
@@ -167,6 +169,9 @@ class Manager:
     self.checker = checker or checker_module.Checker()
 
     self.test_lists = {}
+    # A dict which maps a test list ID to the TestListConfig object checked by
+    # BuildAllTestLists and the error, or None if it's valid.
+    self._checked_configs = {}
 
   def GetTestListByID(self, test_list_id):
     """Get test list by test list ID.
@@ -203,7 +208,26 @@ class Manager:
   def GetTestListIDs(self):
     return list(self.test_lists)
 
-  def BuildAllTestLists(self):
+  def BuildAllTestLists(self, jobs=1):
+    """Loads and checks all test lists.
+
+    The test lists loaded before are only reloaded if any file they depend on
+    is modified, and each loaded config is only checked once.  The new configs
+    can be checked by a pool of processes, and then the test objects of those
+    test lists are built on demand.
+
+    The processes are started by a fork server instead of forking this process,
+    which may have other threads running, and load the test lists again by the
+    same loader and checker.
+
+    Args:
+      jobs: Number of processes to check the test lists.
+
+    Returns:
+      A pair of dicts, the first maps the ID of each valid test list to the
+      test list, and the second maps the ID of each failed test list to the
+      error message.
+    """
     failed_test_lists = {}
     for test_list_id in self.loader.FindTestLists():
       logging.debug('try to load test list: %s', test_list_id)
@@ -213,24 +237,75 @@ class Manager:
         logging.exception('Unable to load the test list %r', test_list_id)
         failed_test_lists[test_list_id] = str(e)
 
-    valid_test_lists = {}  # test lists that will be returned
+    # test lists that will be checked
+    unchecked_test_lists = []
     for test_list_id, test_list in self.test_lists.items():
       if isinstance(test_list, test_list_module.TestList):
         # if the test list does not have subtests, don't return it.
         # (this is a base test list)
-        if 'tests' not in test_list.ToTestListConfig():
+        if 'tests' not in test_list.config:
           continue
-        try:
-          test_list.CheckValid()
-        except Exception as e:
-          logging.exception('Test list %s is invalid', test_list_id)
-          failed_test_lists[test_list_id] = repr(e)
+        checked = self._checked_configs.get(test_list_id)
+        if checked and checked[0] is test_list.config:
+          continue
+        if test_list.built:
+          # The config is reloaded, and checked by building the test list.
+          self._checked_configs[test_list_id] = (test_list.config, None)
+        else:
+          unchecked_test_lists.append(test_list_id)
+
+    errors = None
+    if jobs > 1 and len(unchecked_test_lists) > 1:
+      errors = self._CheckTestListsInPool(unchecked_test_lists, jobs)
+    if errors is None:
+      errors = [self._CheckTestList(test_list_id)
+                for test_list_id in unchecked_test_lists]
+    for test_list_id, error in zip(unchecked_test_lists, errors):
+      self._checked_configs[test_list_id] = (
+          self.test_lists[test_list_id].config, error)
+
+    valid_test_lists = {}  # test lists that will be returned
+    for test_list_id, test_list in self.test_lists.items():
+      if isinstance(test_list, test_list_module.TestList):
+        if 'tests' not in test_list.config:
+          continue
+        error = self._checked_configs[test_list_id][1]
+        if error:
+          failed_test_lists[test_list_id] = error
           continue
       valid_test_lists[test_list_id] = test_list
 
     logging.debug('loaded test lists: %r', list(self.test_lists))
     return valid_test_lists, failed_test_lists
 
+  def _CheckTestListsInPool(self, test_list_ids, jobs):
+    """Checks the test lists by a pool of processes.
+
+    Returns:
+      A list of the error of each test list, or None if the pool fails, e.g.
+      the loader can't be pickled or a worker dies.
+    """
+    try:
+      with concurrent.futures.ProcessPoolExecutor(
+          max_workers=min(jobs, len(test_list_ids)),
+          mp_context=multiprocessing.get_context('forkserver'),
+          initializer=_InitWorker,
+          initargs=(self.loader, self.checker)) as executor:
+        return list(executor.map(_CheckTestList, test_list_ids))
+    except Exception:
+      logging.exception('Failed to check test lists in parallel, '
+                        'fall back to check them one by one.')
+      return None
+
+  def _CheckTestList(self, test_list_id):
+    """Returns the error of a test list, or None if it's valid."""
+    try:
+      self.test_lists[test_list_id].CheckValid()
+      return None
+    except Exception as e:
+      logging.exception('Test list %s is invalid', test_list_id)
+      return repr(e)
+
   @staticmethod
   def GetActiveTestListId():
     """Returns the ID of the active test list.
@@ -283,6 +358,25 @@ class Manager:
       f.write(config_data)
 
 
+# The manager of the worker process, created once when the process starts.
+_worker_manager = None
+
+
+def _InitWorker(loader, checker):
+  global _worker_manager  # pylint: disable=global-statement
+  _worker_manager = Manager(loader, checker)
+
+
+def _CheckTestList(test_list_id):
+  try:
+    _worker_manager.GetTestListByID(test_list_id)
+  except Exception as e:
+    logging.exception('Unable to load the test list %r', test_list_id)
+    return repr(e)
+  # pylint: disable=protected-access
+  return _worker_manager._CheckTestList(test_list_id)
+
+
 def BuildTestListForUnittest(test_list_config, manager=None):
   """Build a test list from loaded config.
 
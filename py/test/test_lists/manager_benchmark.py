@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for loading and checking all test lists by Manager.
+
+The test lists in this directory are copied to a temporary directory, and
+loaded by Manager.BuildAllTestLists, like what Goofy does when it starts or
+reloads the test lists:
+
+ - cold: by a new Manager with the caches of config_utils cleared, like when
+   Goofy starts.
+ - parallel: same as cold, but the test lists are checked by --jobs processes.
+ - unchanged: by the same Manager again, without any change.
+ - leaf: by the same Manager, after --leaf is touched.
+ - common: by the same Manager, after --common, inherited by most of the
+   test lists, is touched.
+
+Example:
+
+  manager_benchmark.py --rounds 3 --jobs 4
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import time
+
+from cros.factory.test.test_lists import manager
+from cros.factory.test.test_lists import test_list_common
+from cros.factory.utils import config_utils
+from cros.factory.utils import file_utils
+
+
+_TEST_LISTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--rounds', type=int, default=3,
+                      help='Number of times each case is run.')
+  parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                      help='Number of processes of the parallel case.')
+  parser.add_argument('--leaf', default='generic_main',
+                      help='ID of the test list touched in the leaf case.')
+  parser.add_argument('--common', default='generic_common',
+                      help='ID of the test list touched in the common case.')
+  args = parser.parse_args()
+
+  with file_utils.TempDirectory(prefix='manager_benchmark_') as tmp_dir:
+    for path in glob.glob(os.path.join(_TEST_LISTS_DIR, '*.json')):
+      shutil.copy(path, tmp_dir)
+    loader = manager.Loader(config_dir=tmp_dir)
+    test_list_manager = None
+
+    def _Touch(test_list_id):
+      os.utime(os.path.join(
+          tmp_dir, test_list_common.GetTestListConfigFile(test_list_id)))
+
+    def _Cold(jobs=1):
+      nonlocal test_list_manager
+      # pylint: disable=protected-access
+      config_utils._CACHED_CONFIGS.clear()
+      config_utils._CACHED_SCHEMA_VALIDATORS.clear()
+      test_list_manager = manager.Manager(loader=loader)
+      return test_list_manager.BuildAllTestLists(jobs=jobs)
+
+    def _Incremental(touched=None):
+      if touched:
+        _Touch(touched)
+      return test_list_manager.BuildAllTestLists()
+
+    cases = [('cold', _Cold),
+             ('parallel', lambda: _Cold(jobs=args.jobs)),
+             ('unchanged', _Incremental),
+             ('leaf', lambda: _Incremental(args.leaf)),
+             ('common', lambda: _Incremental(args.common))]
+    expected = None
+    for name, func in cases:
+      start_time = time.time()
+      for unused_i in range(args.rounds):
+        test_lists, errors = func()
+      elapsed = (time.time() - start_time) / args.rounds
+      if expected is None:
+        expected = (sorted(test_lists), errors)
+        print('Test lists: %d valid, %d failed' % (len(test_lists),
+                                                   len(errors)))
+      assert (sorted(test_lists), errors) == expected, 'Results are different.'
+      print('%-10s %8.1f ms' % (name, elapsed * 1000))
+
+
+if __name__ == '__main__':
+  main()
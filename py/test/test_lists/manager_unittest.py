@@ -19,6 +19,13 @@ from cros.factory.test.test_lists import test_list_common
 from cros.factory.utils import config_utils
 
 
+class _WorkerFailingLoader(manager.Loader):
+  """A loader which fails to initialize the pool workers."""
+
+  def __setstate__(self, unused_state):
+    raise RuntimeError('Failed to initialize the worker.')
+
+
 class TestListConfigTest(unittest.TestCase):
   def testTestListConfig(self):
     json_object = {'a': 1, 'b': 2}
@@ -129,6 +136,50 @@ class TestListLoaderTest(unittest.TestCase):
          'skipped_waived_tests'],
         test_lists)
 
+  def testBuildAllTestListsIncremental(self):
+    test_lists, errors = self.manager.BuildAllTestLists()
+
+    with mock.patch.object(manager.Manager, '_CheckTestList',
+                           autospec=True, return_value=None) as check:
+      self.assertEqual((test_lists, errors),
+                       self.manager.BuildAllTestLists())
+      check.assert_not_called()
+
+      # Only the test lists inheriting the modified one are reloaded, which
+      # are checked while reloading.
+      config = test_lists['b'].config
+      os.utime(self._GetTestListConfigPath('b'), None)
+      self.assertEqual((test_lists, errors),
+                       self.manager.BuildAllTestLists())
+      check.assert_not_called()
+      self.assertIsNot(config, test_lists['b'].config)
+      # pylint: disable=protected-access
+      self.assertIs(test_lists['b'].config,
+                    self.manager._checked_configs['b'][0])
+
+  def testBuildAllTestListsParallel(self):
+    test_lists, errors = self.manager.BuildAllTestLists(jobs=2)
+    expected_test_lists, expected_errors = manager.Manager(
+        loader=self.loader).BuildAllTestLists()
+    self.assertCountEqual(expected_test_lists, test_lists)
+    self.assertEqual(expected_errors, errors)
+    self.assertEqual(['invalid'], list(errors))
+    # The test objects are built on demand.
+    self.assertTrue(test_lists['a'].LookupPath('SMT'))
+
+  def testBuildAllTestListsParallelWorkerFailure(self):
+    expected = manager.Manager(loader=self.loader).BuildAllTestLists()
+    loader = _WorkerFailingLoader(config_dir=self.temp_dir)
+    # The test lists are checked one by one after the pool fails.
+    # pylint: disable=protected-access
+    with mock.patch.object(manager.Manager, '_CheckTestList', autospec=True,
+                           side_effect=manager.Manager._CheckTestList) as check:
+      test_lists, errors = manager.Manager(loader=loader).BuildAllTestLists(
+          jobs=2)
+      check.assert_called()
+    self.assertCountEqual(expected[0], test_lists)
+    self.assertEqual(expected[1], errors)
+
   def testChildActionOnFailure(self):
     """Test if `child_action_on_failure` is properly propagated."""
     test_list = self.manager.GetTestListByID('b')
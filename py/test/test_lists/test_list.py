@@ -5,7 +5,7 @@
 """Test list builder."""
 
 import abc
-import ast
+import collections
 import collections.abc
 import copy
 import json
@@ -21,6 +21,7 @@ from cros.factory.test.test_lists import test_object as test_object_module
 from cros.factory.test.utils import selector_utils
 from cros.factory.utils import config_utils
 from cros.factory.utils import debug_utils
+from cros.factory.utils import expression_utils
 from cros.factory.utils import shelve_utils
 from cros.factory.utils import type_utils
 
@@ -159,6 +160,10 @@ class Options:
   read_device_data_from_vpd_on_init = True
   """Read device data from VPD in goofy._InitStates()."""
 
+  max_prespawned_pytests = 4
+  """Maximum number of pytest processes to prespawn.  The number follows the
+  recent rate of starting tests, e.g. up to the size of parallel groups."""
+
   skipped_tests = {}
   """A list of tests that should be skipped.
   The content of ``skipped_tests`` should be::
@@ -384,14 +389,22 @@ class FactoryTestList(test_object_module.FactoryTest):
     return json.dumps(self.ToTestListConfig(recursive=False), sort_keys=True)
 
 
+_RunIfResult = collections.namedtuple(
+    '_RunIfResult', ['state_instance', 'dependencies', 'revision', 'result'])
+
+
 class ITestList(metaclass=abc.ABCMeta):
   """An interface of test list object."""
 
   # Declare instance variables to make __setattr__ happy.
   _checker = None
 
+  # A dict of run_if to _RunIfResult, cleared when the test list is reloaded.
+  _cached_run_if_results = None
+
   def __init__(self, checker):
     self._checker = checker
+    self._cached_run_if_results = None
 
   @abc.abstractmethod
   def ToFactoryTestList(self):
@@ -565,9 +578,8 @@ class ITestList(metaclass=abc.ABCMeta):
         'state_proxy': state_proxy,
         'device': state_proxy.data_shelf.device, }
 
-    syntax_tree = ast.parse(expression, mode='eval')
-    syntax_tree = NodeTransformer_AddGet(['device']).visit(syntax_tree)
-    code_object = compile(syntax_tree, '<string>', 'eval')
+    code_object = expression_utils.Compile(
+        expression, get_names=('device',)).code
     return eval(code_object, namespace)  # pylint: disable=eval-used
 
   @staticmethod
@@ -593,26 +605,46 @@ class ITestList(metaclass=abc.ABCMeta):
     """Real implementation of EvaluateRunIf.
 
     If anything went wrong, `default` will be returned.
+
+    The result is cached in the test list until the test list is reloaded, or
+    the data shelf keys read by run_if are changed.
     """
+    # pylint: disable=protected-access
     if not isinstance(run_if, str):
       # run_if is not a function, not a string, just return default value
       return default
 
     state_instance = test_list.state_instance
+    # Only a local FactoryState tracks the revisions of the data shelf, and
+    # the constants of an ITestList are only changed when it's reloaded.
+    can_cache = (isinstance(test_list, ITestList) and
+                 isinstance(state_instance, state.FactoryState))
+    if can_cache:
+      if test_list._cached_run_if_results is None:
+        test_list._cached_run_if_results = {}
+      cached = test_list._cached_run_if_results.get(run_if)
+      if (cached and cached.state_instance is state_instance and
+          state_instance.DataShelfGetRevision(cached.dependencies) <=
+          cached.revision):
+        return cached.result
+      revision = state_instance.DataShelfGetRevision()
+
     namespace = {
         'device': selector_utils.DataShelfSelector(
             state_instance, key='device'),
         'constants': selector_utils.DictSelector(value=test_list.constants),
     }
     try:
-      syntax_tree = ast.parse(run_if, mode='eval')
-      syntax_tree = NodeTransformer_AddGet(
-          ['device', 'constants']).visit(syntax_tree)
-      code_object = compile(syntax_tree, '<string>', 'eval')
-      return eval(code_object, namespace)  # pylint: disable=eval-used
+      compiled = expression_utils.Compile(
+          run_if, get_names=('device', 'constants'), tracked_names=('device',))
+      result = eval(compiled.code, namespace)  # pylint: disable=eval-used
     except Exception:
       logging.exception('Unable to evaluate run_if %r for %s', run_if, source)
       return default
+    if can_cache:
+      test_list._cached_run_if_results[run_if] = _RunIfResult(
+          state_instance, compiled.dependencies, revision, result)
+    return result
 
   # the following properties are required by goofy
   @abc.abstractproperty
@@ -632,60 +664,6 @@ class ITestList(metaclass=abc.ABCMeta):
     raise NotImplementedError
 
 
-class NodeTransformer_AddGet(ast.NodeTransformer):
-  """Given a list of names, we will call `Get` function for you.
-
-  For example, name_list=['device']::
-
-    "device.foo.bar"  ==> "device.foo.bar.Get(None)"
-
-  where `None` is the default value for `Get` function.
-  And `device.foo.bar.Get` will still be `device.foo.bar.Get`.
-  """
-  def __init__(self, name_list):
-    super(NodeTransformer_AddGet, self).__init__()
-    if not isinstance(name_list, list):
-      name_list = [name_list]
-    self.name_list = name_list
-
-  def visit_Attribute(self, node):
-    """Convert the attribute.
-
-    An attribute node will be: `var.foo.bar.baz`, and the node we got is the
-    last attribute node (that is, we will visit `var.foo.bar.baz`, not
-    `var.foo.bar` or its prefix).  And NodeTransformer will not recursively
-    process a node if it is processed, so we only need to worry about process a
-    node twice.
-
-    This will fail for code like::
-
-      "eval! any(v.baz.Get() for v in [device.foo, device.bar])"
-
-    But you can always rewrite it to::
-
-      "eval! any(v for v in [device.foo.baz, device.bar.baz])"
-
-    So it should be fine.
-    """
-    if isinstance(node.ctx, ast.Load) and node.attr != 'Get':
-      v = node
-      while isinstance(v, ast.Attribute):
-        v = v.value
-      if isinstance(v, ast.Name) and v.id in self.name_list:
-        new_node = ast.Call(
-            func=ast.Attribute(
-                attr='Get',
-                value=node,
-                ctx=node.ctx),
-            # Use `None` as default value
-            args=[ast.Name(id='None', ctx=ast.Load())],
-            kwargs=None,
-            keywords=[])
-        ast.copy_location(new_node, node)
-        return ast.fix_missing_locations(new_node)
-    return node
-
-
 class TestList(ITestList):
   """A test list object represented by test list config.
 
@@ -731,7 +709,7 @@ class TestList(ITestList):
     # correctly.  Put it in a single line for easier debugging.
     options = self.options
 
-    self._cached_test_list = FactoryTestList(
+    factory_test_list = FactoryTestList(
         subtests, self._state_instance, options,
         test_list_id=self._config.test_list_id,
         label=MayTranslate(self._config['label'], force=True),
@@ -741,12 +719,18 @@ class TestList(ITestList):
     # Handle override_args
     if 'override_args' in self._config:
       for key, override in self._config['override_args'].items():
-        test = self._cached_test_list.LookupPath(key)
+        test = factory_test_list.LookupPath(key)
         if test:
           config_utils.OverrideConfig(test.dargs, override)
 
+    factory_test_list.source_path = self._config.source_path
+    return self._SetFactoryTestList(factory_test_list)
+
+  def _SetFactoryTestList(self, factory_test_list):
+    """Sets the FactoryTestList built from the current config."""
+    self._cached_test_list = factory_test_list
+    self._cached_test_list.state_instance = self._state_instance
     self._cached_test_list.state_change_callback = self._state_change_callback
-    self._cached_test_list.source_path = self._config.source_path
 
     if self._state_instance:
       # Make sure the state server knows about all the tests, defaulting to an
@@ -897,12 +881,19 @@ class TestList(ITestList):
 
       # make sure the new test list is working, if it's not, will raise an
       # exception and self._config will not be changed.
-      TestList(new_config, self._checker, self._loader).CheckValid()
+      new_test_list = TestList(new_config, self._checker, self._loader)
+      new_test_list.CheckValid()
 
       self._config = new_config
       for key in self.__dict__:
         if key.startswith('_cached_'):
           self.__dict__[key] = None
+      # Reuse the test objects built to check the new config, instead of
+      # building them again.
+      # pylint: disable=protected-access
+      self._cached_options = new_test_list._cached_options
+      self._cached_constants = new_test_list._cached_constants
+      self._SetFactoryTestList(new_test_list._cached_test_list)
       self.SetSkippedAndWaivedTests()
       note['level'] = 'INFO'
       note['text'] = ('Test list %s is reloaded.' % self._config.test_list_id)
@@ -946,6 +937,22 @@ class TestList(ITestList):
         return True
     return False
 
+  @property
+  def config(self):
+    """The TestListConfig object which the test list is built from."""
+    return self._config
+
+  @property
+  def built(self):
+    """True if the test objects are built, so the config is valid."""
+    return bool(self._cached_test_list)
+
+  @property
+  def label(self):
+    """The label of the test list, without building the test objects."""
+    self.ReloadIfModified()
+    return MayTranslate(self._config['label'], force=True)
+
   @property
   def constants(self):
     self.ReloadIfModified()
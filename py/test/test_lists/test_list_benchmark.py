@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for evaluating run_if of the tests in a test list.
+
+All tests of --test-list are walked --rounds times, and run_if of each test is
+evaluated, like what Goofy does when it looks for the next test to run, by:
+
+ - legacy: parsing and compiling run_if every time, like the old
+   ITestList.EvaluateRunIf.
+ - compiled: ITestList.EvaluateRunIf, with the cached results dropped before
+   each round, so only the compiled expressions are reused.
+ - cached: ITestList.EvaluateRunIf with nothing changed between rounds.
+ - changed: ITestList.EvaluateRunIf with --key of the data shelf changed
+   before each round, so only the tests reading it are evaluated again.
+
+Example:
+
+  test_list_benchmark.py --test-list generic_main --rounds 100
+"""
+
+import argparse
+import ast
+import time
+
+from cros.factory.test import state
+from cros.factory.test.test_lists import manager
+from cros.factory.test.test_lists import test_list as test_list_module
+from cros.factory.test.utils import selector_utils
+from cros.factory.utils import expression_utils
+
+
+def _LegacyEvaluateRunIf(test, test_list):
+  namespace = {
+      'device': selector_utils.DataShelfSelector(
+          test_list.state_instance, key='device'),
+      'constants': selector_utils.DictSelector(value=test_list.constants),
+  }
+  syntax_tree = ast.parse(test.run_if, mode='eval')
+  syntax_tree = expression_utils.NodeTransformer_AddGet(
+      ['device', 'constants']).visit(syntax_tree)
+  code_object = compile(syntax_tree, '<string>', 'eval')
+  return eval(code_object, namespace)  # pylint: disable=eval-used
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--test-list', default='generic_main',
+                      help='ID of the test list to walk.')
+  parser.add_argument('--rounds', type=int, default=100,
+                      help='Number of times the test list is walked.')
+  parser.add_argument('--key', default='device.component.has_front_camera',
+                      help='Data shelf key changed in the changed case.')
+  args = parser.parse_args()
+
+  test_list = manager.Manager().GetTestListByID(args.test_list)
+  test_list.state_instance = state.StubFactoryState()
+  tests = [test for test in test_list.Walk() if isinstance(test.run_if, str)]
+  print('Test list: %s, %d tests with run_if' % (args.test_list, len(tests)))
+
+  def _Walk(evaluate, before_round=None):
+    results = []
+    start_time = time.time()
+    for i in range(args.rounds):
+      if before_round:
+        before_round(i)
+      results = [evaluate(test, test_list) for test in tests]
+    return (time.time() - start_time) * 1e6 / args.rounds, results
+
+  def _DropResults(unused_i):
+    # pylint: disable=protected-access
+    test_list._cached_run_if_results = None
+
+  def _ChangeKey(i):
+    test_list.state_instance.DataShelfSetValue(args.key, i % 2 == 0)
+
+  evaluate_run_if = test_list_module.ITestList.EvaluateRunIf
+  expected = None
+  for name, evaluate, before_round in [
+      ('legacy', _LegacyEvaluateRunIf, None),
+      ('compiled', evaluate_run_if, _DropResults),
+      ('cached', evaluate_run_if, None),
+      ('changed', evaluate_run_if, _ChangeKey)]:
+    # Both values of the key are evaluated in the changed case.
+    test_list.state_instance.DataShelfDeleteKeys(args.key, optional=True)
+    elapsed, results = _Walk(evaluate, before_round)
+    if expected is None:
+      expected = results
+    assert name == 'changed' or results == expected, 'Results are different.'
+    print('%-10s %10.1f us/walk' % (name, elapsed))
+
+
+if __name__ == '__main__':
+  main()
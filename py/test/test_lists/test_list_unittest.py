@@ -4,6 +4,7 @@
 # found in the LICENSE file.
 
 import unittest
+from unittest import mock
 
 from cros.factory.test import state
 from cros.factory.test.test_lists import manager
@@ -123,5 +124,54 @@ class EvaluateRunIfTest(unittest.TestCase):
     self.assertTrue(self._EvaluateRunIf())
 
 
+
+class CachedRunIfTest(unittest.TestCase):
+  def setUp(self):
+    self.test_list = manager.BuildTestListForUnittest(
+        test_list_config={
+            'constants': {'foo': True},
+            'tests': [
+                {'id': 'a', 'pytest_name': 't_a',
+                 'run_if': 'device.foo.bar and constants.foo'},
+                {'id': 'b', 'pytest_name': 't_b',
+                 'run_if': 'constants.foo'},
+            ]
+        })
+    self.state_instance = state.StubFactoryState()
+    self.test_list.state_instance = self.state_instance
+
+  def _EvaluateRunIf(self, path):
+    return test_list_module.ITestList.EvaluateRunIf(
+        self.test_list.LookupPath(path), self.test_list)
+
+  def testCache(self):
+    with mock.patch.object(self.state_instance, 'DataShelfHasKey',
+                           wraps=self.state_instance.DataShelfHasKey) as (
+                               has_key):
+      self.assertFalse(self._EvaluateRunIf('a'))
+      self.assertTrue(self._EvaluateRunIf('b'))
+      self.assertFalse(self._EvaluateRunIf('a'))
+      self.assertTrue(self._EvaluateRunIf('b'))
+      self.assertEqual(1, has_key.call_count)
+
+      # Changes of other keys don't invalidate the cache.
+      self.state_instance.DataShelfSetValue('device.other', True)
+      self.assertFalse(self._EvaluateRunIf('a'))
+      self.assertEqual(1, has_key.call_count)
+
+      self.state_instance.DataShelfSetValue('device.foo', {'bar': True})
+      self.assertTrue(self._EvaluateRunIf('a'))
+      self.assertEqual(2, has_key.call_count)
+
+      self.state_instance.DataShelfDeleteKeys('device')
+      self.assertFalse(self._EvaluateRunIf('a'))
+
+  def testInvalidRunIf(self):
+    test = self.test_list.LookupPath('b')
+    test.run_if = '!device.foo'
+    self.assertTrue(self._EvaluateRunIf('b'))
+    self.assertTrue(self._EvaluateRunIf('b'))
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -173,6 +173,8 @@ class PytestExecutionResult:
     status: The test status.  See `cros.factory.test.state.TestState` for
         detail.
     failure_details: A list of `ExceptionInfo` instance.
+    start_time: The time when the test case started to run, or None if it did
+        not.
   """
 
   def __init__(self, status, failures=None):
@@ -185,6 +187,7 @@ class PytestExecutionResult:
     """
     self.status = status
     self.failures = failures or []
+    self.start_time = None
 
   @classmethod
   def GenerateFromTestResultFailureDetails(cls, status, failure_details):
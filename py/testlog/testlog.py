@@ -35,6 +35,7 @@ TODO(itspeter): Move to Instalog folder and remove the dependency of
                    └─ testlog_seq
 """
 
+import atexit
 import json
 import logging
 import os
@@ -56,6 +57,8 @@ from .utils import type_utils
 
 TESTLOG_API_VERSION = '0.21'
 TESTLOG_ENV_VARIABLE_NAME = 'TESTLOG'
+# Environment variable to set the flush_delay of Testlog in sub-sessions.
+TESTLOG_FLUSH_DELAY_ENV_VARIABLE_NAME = 'TESTLOG_FLUSH_DELAY'
 
 # Possible values for the `Stationstatus.parameters.type` field.
 PARAM_TYPE = type_utils.Enum(['argument', 'measurement'])
@@ -70,6 +73,8 @@ _DEFAULT_SESSION_FOLDER = 'running'
 _DEFAULT_SESSION_JSON_FILE_TEMPLATE = '%s-session.json'
 # The default path for binary attachments from log_root.
 _DEFAULT_ATTACHMENTS_FOLDER = 'attachments'
+# Maximum number of lines a buffered JSONLogFile keeps before writing them.
+_DEFAULT_MAX_BUFFERED_LINES = 1000
 
 # This directory need to be cleared on each boot.
 # The /run directory (or something writable by us if in the chroot).
@@ -116,6 +121,9 @@ class Testlog:
     uuid: A unique ID for related to the process that using the testlog.
     seq_generator: A sequence file that expected to increase monotonically
         during test.
+    flush_delay: The maximum seconds that events are buffered in memory
+        before written to primary_json, or None to write every event
+        immediately.
   """
 
   FIELDS = type_utils.Enum([
@@ -123,7 +131,8 @@ class Testlog:
       'ATTACHMENTS_FOLDER', 'UUID', '_METADATA'])
 
   def __init__(self, log_root=None, uuid=None,
-               stationDeviceId=None, stationInstallationId=None):
+               stationDeviceId=None, stationInstallationId=None,
+               flush_delay=None):
     """Initializes the Testlog singleton.
 
     Args:
@@ -131,6 +140,10 @@ class Testlog:
       uuid: A unique ID for this process.
       stationDeviceId: To use in saving Python logging calls.
       stationInstallationId: To use in saving Python logging calls.
+      flush_delay: If set, events to primary_json are buffered for at most
+          this many seconds, and written with one fsync.  Defaults to the
+          value of environment variable TESTLOG_FLUSH_DELAY_ENV_VARIABLE_NAME
+          if set.
     """
     global _global_testlog  # pylint: disable=global-statement
     assert _global_testlog is None, (
@@ -171,6 +184,11 @@ class Testlog:
       self.last_test_run[self.FIELDS._METADATA] = metadata
     assert not session_data, 'Not all variable initialized.'
 
+    if flush_delay is None and os.environ.get(
+        TESTLOG_FLUSH_DELAY_ENV_VARIABLE_NAME):
+      flush_delay = float(os.environ[TESTLOG_FLUSH_DELAY_ENV_VARIABLE_NAME])
+    self.flush_delay = flush_delay
+
     # Initialize the sequence generator
     self.seq_generator = testlog_seq.SeqGenerator(
         _SEQUENCE_PATH, self.primary_json)
@@ -189,7 +207,7 @@ class Testlog:
       self.primary_json = JSONLogFile(
           uuid=self.uuid, seq_generator=self.seq_generator,
           path=self.primary_json, thread_data=thread_data, mode='a',
-          check_event=True)
+          check_event=True, flush_delay=flush_delay)
     # Initialize testlog._pylogger
     self.CaptureLogging(stationDeviceId, stationInstallationId)
 
@@ -295,6 +313,7 @@ class Testlog:
     """
     if self.instalog_plugin is None:
       raise FlushException('Flush: No Instalog plugin available')
+    self.primary_json.Flush()
     last_seq_output = self.seq_generator.Current()
     input_success, input_result = self.instalog_plugin.FlushInput(
         last_seq_output, timeout)
@@ -548,7 +567,7 @@ class JSONLogFile(file_utils.FileLockContextManager):
   """Represents a JSON log file on disk."""
 
   def __init__(self, uuid, seq_generator, path, thread_data,
-               mode='a', check_event=False):
+               mode='a', check_event=False, flush_delay=None):
     """Constructor.
 
     Args:
@@ -561,12 +580,24 @@ class JSONLogFile(file_utils.FileLockContextManager):
       mode: A string indicating how the file is to be opened.
       check_event: Boolean to indicate if we should check the validation of
           each event.
+      flush_delay: If set, events are buffered in memory for at most this many
+          seconds (or _DEFAULT_MAX_BUFFERED_LINES events), and then written
+          together with one fsync.  The `seq` of the events are taken when
+          they are written, so the events of all processes are written to the
+          file in the order of their `seq`.
     """
     super(JSONLogFile, self).__init__(path=path, mode=mode)
     self._thread_data = thread_data
     self.test_run_id = uuid
     self.seq_generator = seq_generator
     self.check_event = check_event
+    self.flush_delay = flush_delay
+    # Protects _buffer, which keeps the JSON of the events without `seq`.
+    self._buffer_lock = threading.Lock()
+    self._buffer = []
+    self._flush_timer = None
+    if flush_delay is not None:
+      atexit.register(self.Flush)
 
   def Log(self, event, override=False):
     """Converts event into JSON string and writes into disk.
@@ -585,10 +616,23 @@ class JSONLogFile(file_utils.FileLockContextManager):
       return
 
     self._thread_data.in_log = True
+    try:
+      if self.flush_delay is None or override:
+        self.Flush()
+        self._Prepare(event)
+        with self:
+          # Take `seq` with the file locked, so the lines of all processes are
+          # written in the order of their `seq`.
+          event['seq'] = self.seq_generator.Next()
+          self._WriteUnlocked([event.ToJSON() + '\n'], override)
+      else:
+        self._Buffer(event)
+    finally:
+      self._thread_data.in_log = False
 
-    # Data that should be refreshed on every write operation.
+  def _Prepare(self, event):
+    """Fills the fields refreshed on every write except `seq`."""
     event['uuid'] = time_utils.TimedUUID()
-    event['seq'] = self.seq_generator.Next()
     if 'apiVersion' not in event:
       event['apiVersion'] = TESTLOG_API_VERSION
     if 'time' not in event:
@@ -602,17 +646,62 @@ class JSONLogFile(file_utils.FileLockContextManager):
         logging.exception('Not able to log the event: %s', event.ToJSON())
         raise
 
-    line = event.ToJSON() + '\n'
-    with self:
-      if override:
-        self.file.seek(0)
-      self.file.write(line)
-      if override:
-        self.file.truncate()
-      self.file.flush()
-      os.fsync(self.file.fileno())
+  def _WriteUnlocked(self, lines, override=False):
+    if override:
+      self.file.seek(0)
+    self.file.write(''.join(lines))
+    if override:
+      self.file.truncate()
+    self.file.flush()
+    os.fsync(self.file.fileno())
+
+  def _Buffer(self, event):
+    self._Prepare(event)
+    # The event may be changed and logged again by the caller, so it is
+    # serialized now, and `seq` is added when it is written.
+    data = {key: value for key, value in event.ToDict().items()
+            if key != 'seq'}
+    serialized = json.dumps(data, default=testlog_utils.JSONHandler)
+    with self._buffer_lock:
+      self._buffer.append(serialized)
+      if len(self._buffer) < _DEFAULT_MAX_BUFFERED_LINES:
+        if self._flush_timer is None:
+          self._flush_timer = threading.Timer(self.flush_delay, self.Flush)
+          self._flush_timer.daemon = True
+          self._flush_timer.start()
+        return
+    self.Flush()
+
+  def Flush(self):
+    """Writes the buffered events to disk."""
+    # Flush may run in the timer thread; drop the logs it makes like Log does.
+    in_log = getattr(self._thread_data, 'in_log', False)
+    self._thread_data.in_log = True
+    try:
+      with self._buffer_lock:
+        if self._flush_timer is not None:
+          self._flush_timer.cancel()
+          self._flush_timer = None
+        if not self._buffer:
+          return
+        # Take the `seq` of all buffered events at once with the file locked,
+        # like Log, so the sequence file is locked once per flush.
+        with self:
+          first_seq = self.seq_generator.Next(len(self._buffer))
+          # Each serialized event is a non-empty JSON object.
+          self._WriteUnlocked(
+              ['{"seq": %d, %s\n' % (first_seq + i, serialized[1:])
+               for i, serialized in enumerate(self._buffer)])
+        self._buffer = []
+    finally:
+      self._thread_data.in_log = in_log
 
-    self._thread_data.in_log = False
+  def Close(self):
+    """Writes the buffered events and closes the file."""
+    if self.flush_delay is not None:
+      self.Flush()
+      atexit.unregister(self.Flush)
+    super(JSONLogFile, self).Close()
 
 
 def CapturePythonLogging(callback, level=logging.DEBUG):
@@ -1043,8 +1132,12 @@ class StationStatus(_StationBase):
     kwargs['schema'] = SCHEMA
     return testlog_validator.Validator.Dict(*args, **kwargs)
 
-  def _ValidatorParameterWrapper(*args, **kwargs):
-    # pylint: disable=no-method-argument
+  # Building the schema deep-copies its items, which costs more than the
+  # validation, so it is built once.
+  _parameter_schema_cache = None
+
+  @classmethod
+  def _ParameterSchema(cls):
     DATA_SCHEMA = schema.List('data', schema.FixedDict(
         'data',
         items={},
@@ -1066,7 +1159,13 @@ class StationStatus(_StationBase):
             'valueUnit': schema.Scalar('valueUnit', str),
             'type': schema.Scalar('type', str, list(PARAM_TYPE)),
             'data': DATA_SCHEMA})
-    kwargs['schema'] = SCHEMA
+    return SCHEMA
+
+  def _ValidatorParameterWrapper(*args, **kwargs):
+    # pylint: disable=no-method-argument,protected-access
+    if StationStatus._parameter_schema_cache is None:
+      StationStatus._parameter_schema_cache = StationStatus._ParameterSchema()
+    kwargs['schema'] = StationStatus._parameter_schema_cache
     return testlog_validator.Validator.Dict(*args, **kwargs)
 
   FIELDS = {
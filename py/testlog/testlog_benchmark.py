@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for logging parameters to the primary JSON of testlog.
+
+Each parameter is logged as one station.status event, like a test which logs
+every measurement of a sweep.  Writing every event immediately (one sequence
+file lock and one fsync per event) is compared against buffering events for
+--flush-delay seconds.
+
+Example:
+
+  testlog_benchmark.py --params 5000 --flush-delay 0.1
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from cros.factory.testlog import testlog
+from cros.factory.testlog.utils import file_utils
+from cros.factory.testlog.utils import time_utils
+
+
+def LogParams(log_root, count, flush_delay):
+  """Logs `count` parameters, and returns the seconds it takes."""
+  testlog.Testlog(log_root=log_root, uuid=time_utils.TimedUUID(),
+                  flush_delay=flush_delay)
+  start_time = time.time()
+  for i in range(count):
+    event = testlog.StationStatus()
+    event.CheckNumericParam('current', i * 0.001, min=0, max=100)
+    testlog.Log(event)
+  testlog.GetGlobalTestlog().Close()
+  elapsed = time.time() - start_time
+  lines = file_utils.ReadLines(os.path.join(log_root, 'testlog.json'))
+  assert sum('"current"' in line for line in lines) == count
+  return elapsed
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--params', type=int, default=2000,
+                      help='Number of parameters to log.')
+  parser.add_argument('--flush-delay', type=float, default=0.1,
+                      help='flush_delay of the buffered writer in seconds.')
+  args = parser.parse_args()
+
+  tmp_dir = tempfile.mkdtemp(prefix='testlog_benchmark_')
+  try:
+    # Don't touch the sequence file of the station.
+    # pylint: disable=protected-access
+    testlog._SEQUENCE_PATH = os.path.join(tmp_dir, 'testlog_seq')
+    for name, flush_delay in (('immediate', None),
+                              ('buffered', args.flush_delay)):
+      log_root = os.path.join(tmp_dir, name)
+      elapsed = LogParams(log_root, args.params, flush_delay)
+      print('%-10s %8.2fs %10.0f params/s' % (
+          name, elapsed, args.params / elapsed))
+      file_utils.TryUnlink(testlog._SEQUENCE_PATH)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+  main()
@@ -141,8 +141,11 @@ class SeqGenerator:
 
     return recovery_seq + SEQ_INCREMENT_ON_BOOT
 
-  def _NextOrRaise(self):
-    """Returns the next sequence number, raising an exception on failure."""
+  def _NextOrRaise(self, count=1):
+    """Reserves the next `count` sequence numbers, and returns the first one.
+
+    Raises an exception on failure.
+    """
     with file_utils.FileLock(self.path, self._filelock_waitsecs):
       with open(self.path, 'r+') as f:
         # The file will be closed, and the lock freed, as soon as this
@@ -150,7 +153,7 @@ class SeqGenerator:
         value = int(f.read())
         self._after_read()
         f.seek(0)
-        f.write(str(value + 1))
+        f.write(str(value + count))
       # Don't bother flushing to disk. If a reboot occurs before flushing, the
       # sequence number will be increased by SEQ_INCREMENT_ON_BOOT,
       # maintaining the monotonicity property.
@@ -168,15 +171,20 @@ class SeqGenerator:
                         self.path)
       return None
 
-  def Next(self):
+  def Next(self, count=1):
     """Returns the next sequence number.
 
     This needs to be run in the context of the log file being locked.
     Otherwise, there's a chance that the same `seq` number will be produced
     by two separate processes.
+
+    Args:
+      count: Number of sequence numbers to take at once.  The numbers from the
+          returned one to the returned one + count - 1 are all taken, and the
+          sequence file is only locked once.
     """
     try:
-      return self._NextOrRaise()
+      return self._NextOrRaise(count)
     except (IOError, OSError, ValueError):
       logging.exception('Unable to read global sequence number from %s; '
                         'trying to re-create', self.path)
@@ -188,4 +196,4 @@ class SeqGenerator:
     # any exception.
     file_utils.TryUnlink(self.path)
     self._Create()
-    return self._NextOrRaise()
+    return self._NextOrRaise(count)
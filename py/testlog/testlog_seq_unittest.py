@@ -10,6 +10,7 @@
 
 import json
 import logging
+import multiprocessing
 import os
 import shutil
 import tempfile
@@ -101,6 +102,37 @@ class BootSequenceTest(unittest.TestCase):
       for i in range(3, 6):
         self.assertEqual(i, seq.Next())
 
+  def testNextCount(self):
+    seq = testlog_seq.SeqGenerator(self.seq_path, self.json_path)
+    self.assertEqual(0, seq.Next(count=10))
+    self.assertEqual(9, seq.Current())
+    self.assertEqual(10, seq.Next())
+
+  def testTwoProcesses(self):
+    def target(count):
+      seq = testlog_seq.SeqGenerator(self.seq_path, self.json_path)
+      with open(os.path.join(self.tmp, 'values_%d' % count), 'w') as f:
+        for unused_i in range(100):
+          first = seq.Next(count=count)
+          f.write(''.join('%d\n' % (first + i) for i in range(count)))
+
+    processes = [multiprocessing.Process(target=target, args=(count, ))
+                 for count in (1, 7)]
+    for p in processes:
+      p.start()
+    for p in processes:
+      p.join()
+      self.assertEqual(0, p.exitcode)
+
+    values = []
+    for count in (1, 7):
+      values += [int(line) for line in file_utils.ReadLines(
+          os.path.join(self.tmp, 'values_%d' % count))]
+    # Both processes take numbers from the same sequence file.
+    self.assertEqual(list(range(800)), sorted(values))
+    self.assertEqual(799, testlog_seq.SeqGenerator(
+        self.seq_path, self.json_path).Current())
+
   def _testThreads(self, after_read=lambda: True, filelock_waitsecs=1.0):
     """Tests atomicity by doing operations in 10 threads for 1 sec.
 
@@ -8,15 +8,18 @@ import copy
 import datetime
 import json
 import logging
+import multiprocessing
 import os
 import pprint
 import shutil
 import subprocess
 import tempfile
+import threading
 import time
 import unittest
 
 from cros.factory.testlog import testlog
+from cros.factory.testlog import testlog_seq
 from cros.factory.testlog import testlog_utils
 from cros.factory.testlog.utils import file_utils
 from cros.factory.testlog.utils import json_utils
@@ -110,6 +113,74 @@ class TestlogTest(TestlogTestBase):
     self.assertEqual(len(logged_events), 1)
     self.assertEqual(logged_events[0]['message'], 'testing 123')
 
+  def testFlushDelay(self):
+    primary_json_path = os.path.join(self.state_dir, 'testlog.json')
+    testlog.Testlog(log_root=self.state_dir, uuid=time_utils.TimedUUID(),
+                    flush_delay=60)
+    for count in range(5):
+      testlog.Log(testlog.StationInit({'count': count, 'success': True}))
+    self.assertFalse(os.path.exists(primary_json_path))
+    testlog.GetGlobalTestlog().primary_json.Flush()
+    events = [json.loads(line)
+              for line in file_utils.ReadLines(primary_json_path)]
+    # Events from capturing logging may come first.
+    self.assertEqual(list(range(len(events))),
+                     [event['seq'] for event in events])
+    self.assertEqual(list(range(5)), [event['count'] for event in events
+                                      if event['type'] == 'station.init'])
+
+    testlog.Log(testlog.StationInit({'count': 5, 'success': True}))
+    testlog.GetGlobalTestlog().Close()
+    self.assertEqual(len(events) + 1,
+                     len(file_utils.ReadLines(primary_json_path)))
+    # Sequence numbers are only taken when the events are written.
+    self.assertEqual(str(len(events) + 1), file_utils.ReadFile(
+        testlog._SEQUENCE_PATH))  # pylint: disable=protected-access
+
+  def testFlushDelayTwoProcesses(self):
+    seq_path = os.path.join(self.tmp_dir, 'seq')
+    json_path = os.path.join(self.tmp_dir, 'testlog.json')
+
+    def target(process_id):
+      seq_generator = testlog_seq.SeqGenerator(seq_path, json_path)
+      json_file = testlog.JSONLogFile(
+          uuid=time_utils.TimedUUID(), seq_generator=seq_generator,
+          path=json_path, thread_data=threading.local(), flush_delay=0.01)
+      for count in range(200):
+        json_file.Log(testlog.StationInit(
+            {'count': count, 'success': True, 'stationDeviceId': process_id}))
+        if count % 50 == 0:
+          time.sleep(0.02)
+      json_file.Close()
+
+    processes = [multiprocessing.Process(target=target, args=(str(i), ))
+                 for i in range(2)]
+    for p in processes:
+      p.start()
+    for p in processes:
+      p.join()
+      self.assertEqual(0, p.exitcode)
+
+    events = [json.loads(line) for line in file_utils.ReadLines(json_path)]
+    # Lines of both processes are written in the order of their seq, so
+    # Instalog has processed all of them once it has processed the last seq.
+    self.assertEqual(list(range(400)), [event['seq'] for event in events])
+    for process_id in ('0', '1'):
+      self.assertEqual(list(range(200)), [
+          event['count'] for event in events
+          if event['stationDeviceId'] == process_id])
+    self.assertEqual(399, testlog_seq.SeqGenerator(
+        seq_path, json_path).Current())
+
+  def testFlushDelayExpires(self):
+    primary_json_path = os.path.join(self.state_dir, 'testlog.json')
+    testlog.Testlog(log_root=self.state_dir, uuid=time_utils.TimedUUID(),
+                    flush_delay=0.1)
+    testlog.Log(testlog.StationInit({'count': 1, 'success': True}))
+    time.sleep(0.5)
+    self.assertEqual(1, sum('station.init' in line for line in
+                            file_utils.ReadLines(primary_json_path)))
+
 
 class TestlogEventTest(TestlogTestBase):
 
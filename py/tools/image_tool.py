@@ -11,10 +11,12 @@ To add a subcommand, just add a new SubCommand subclass to this file.
 """
 
 import argparse
+import concurrent.futures
 import contextlib
 import copy
 import errno
 import glob
+import hashlib
 import inspect
 import json
 import logging
@@ -22,6 +24,7 @@ import os
 import pipes
 import re
 import shutil
+import stat
 import subprocess
 import sys
 import tempfile
@@ -89,6 +92,10 @@ MEGABYTE = 1048576
 GIGABYTE_STORAGE = 1000000000
 # Default size of each disk block (or sector).
 DEFAULT_BLOCK_SIZE = pygpt.GPT.DEFAULT_BLOCK_SIZE
+# Bytes to write between each fdatasync when copying to a block device.
+PARTIAL_COPY_SYNC_SIZE = 256 * MEGABYTE
+# Number of partitions to copy at once.
+PARTIAL_COPY_MAX_WORKERS = 4
 # Components for preflash image.
 PREFLASH_COMPONENTS = [
     'release_image', 'test_image', 'toolkit', 'hwid', 'project_config']
@@ -97,6 +104,8 @@ PAYLOAD_COMPONENTS = [
     'release_image', 'test_image',
     'toolkit', 'firmware', 'hwid', 'complete', 'toolkit_config', 'lsb_factory',
     'description', 'project_config']
+# Disk image components that cros_payload can add partition by partition.
+PAYLOAD_IMAGE_COMPONENTS = ['release_image', 'test_image']
 # Payload types
 PAYLOAD_TYPE_TOOLKIT = 'toolkit'
 PAYLOAD_TYPE_TOOLKIT_CONFIG = 'toolkit_config'
@@ -283,36 +292,194 @@ class SysUtils:
       if tmp_folder and delete:
         Sudo(['rm', '-rf', tmp_folder], check=False)
 
+  @staticmethod
+  def _GetDataRanges(fd, offset, count):
+    """Yields (offset, size) of data in a range of a file, skipping holes.
+
+    Files that can't report holes (for example, block devices) are all data.
+    """
+    end = offset + count
+    while offset < end:
+      try:
+        data_offset = os.lseek(fd, offset, os.SEEK_DATA)
+        hole_offset = os.lseek(fd, data_offset, os.SEEK_HOLE)
+      except AttributeError:
+        # SEEK_DATA is not available on this system.
+        yield offset, end - offset
+        return
+      except OSError as e:
+        if e.errno == errno.ENXIO:
+          # No more data till the end of file.
+          return
+        if e.errno in (errno.EINVAL, errno.EOPNOTSUPP):
+          yield offset, end - offset
+          return
+        raise
+      if data_offset >= end:
+        return
+      hole_offset = min(hole_offset, end)
+      yield data_offset, hole_offset - data_offset
+      offset = hole_offset
+
+  @staticmethod
+  def _CopyRange(src_fd, dest_fd, count, src_offset, dest_offset,
+                 buffer_size, methods):
+    """Copies a range of a file to another file.
+
+    The data is copied in kernel by copy_file_range (which may share blocks on
+    file systems supporting reflink) or sendfile, and by read and write if
+    neither works with the files.
+
+    Args:
+      methods: A list of copy methods to try.  The methods not supported by the
+        files are removed from the list, so it can be shared by later calls.
+
+    Returns:
+      Number of bytes copied, which is less than count if the source ends.
+    """
+    copied = 0
+    while copied < count:
+      size = min(count - copied, buffer_size)
+      method = methods[0]
+      try:
+        if method == 'copy_file_range':
+          size = os.copy_file_range(src_fd, dest_fd, size, src_offset + copied,
+                                    dest_offset + copied)
+        elif method == 'sendfile':
+          os.lseek(dest_fd, dest_offset + copied, os.SEEK_SET)
+          size = os.sendfile(dest_fd, src_fd, src_offset + copied, size)
+        else:
+          data = os.pread(src_fd, size, src_offset + copied)
+          size = len(data)
+          written = 0
+          while written < size:
+            written += os.pwrite(dest_fd, data[written:],
+                                 dest_offset + copied + written)
+      except AttributeError:
+        # Python before 3.8 does not have os.copy_file_range.
+        methods.pop(0)
+        continue
+      except OSError as e:
+        if method != 'read' and e.errno in (
+            errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP,
+            errno.ETXTBSY, errno.EBADF):
+          methods.pop(0)
+          continue
+        raise
+      if size == 0:
+        break
+      copied += size
+    return copied
+
+  @staticmethod
+  def _ZeroRange(fd, offset, count, buffer_size):
+    """Fills zeros in a range of a file, except the holes which are zeros."""
+    zeros = b'\0' * min(count, buffer_size)
+    for data_offset, size in list(SysUtils._GetDataRanges(fd, offset, count)):
+      end = data_offset + size
+      while data_offset < end:
+        data_offset += os.pwrite(
+            fd, zeros[:min(end - data_offset, len(zeros))], data_offset)
+
   @staticmethod
   def PartialCopy(src_path, dest_path, count, src_offset=0, dest_offset=0,
                   buffer_size=32 * MEGABYTE, sync=False, verbose=None):
-    """Copy partial contents from one file to another file, like 'dd'."""
-    with open(src_path, 'rb') as src:
-      if verbose is None:
-        verbose = count // buffer_size > 5
-      with open(dest_path, 'r+b') as dest:
-        fd = dest.fileno()
-        src.seek(src_offset)
-        dest.seek(dest_offset)
-        remains = count
-        while remains > 0:
-          data = src.read(min(remains, buffer_size))
-          dest.write(data)
-          remains -= len(data)
-          if sync:
-            dest.flush()
-            os.fdatasync(fd)
+    """Copy partial contents from one file to another file, like 'dd'.
+
+    Holes in the source are not copied, so a sparse source is copied to a
+    sparse destination; the destination is only filled with zeros where it has
+    data.  Data is copied by copy_file_range or sendfile, without passing
+    through Python.
+
+    Args:
+      buffer_size: The size of each copy, for showing the progress.
+      sync: True to call fdatasync when every PARTIAL_COPY_SYNC_SIZE bytes are
+        written, and at the end.
+      verbose: True to show the progress; None to show it if the copy is large.
+    """
+    if verbose is None:
+      verbose = count // buffer_size > 5
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+      dest_fd = os.open(dest_path, os.O_WRONLY)
+      try:
+        methods = ['copy_file_range', 'sendfile', 'read']
+        # Bytes processed, including holes.
+        done = 0
+        unsynced = 0
+
+        def _Progress(new_done, written):
+          nonlocal done, unsynced
+          done = new_done
+          unsynced += written
+          if sync and unsynced >= PARTIAL_COPY_SYNC_SIZE:
+            os.fdatasync(dest_fd)
+            unsynced = 0
           if verbose:
             if sys.stderr.isatty():
               width = 5
               sys.stderr.write(
-                  '%*.1f%%%s' % (width, (1 - remains / count) * 100,
-                                 '\b' * (width + 1)))
+                  '%*.1f%%%s' % (width, done / count * 100, '\b' * (width + 1)))
             else:
               sys.stderr.write('.')
+
+        for data_offset, size in SysUtils._GetDataRanges(
+            src_fd, src_offset, count):
+          # A hole in the source.
+          if data_offset > src_offset + done:
+            hole_size = data_offset - src_offset - done
+            SysUtils._ZeroRange(dest_fd, dest_offset + done, hole_size,
+                                buffer_size)
+            _Progress(done + hole_size, 0)
+          end = data_offset + size
+          while data_offset < end:
+            copy_size = min(end - data_offset, buffer_size)
+            copied = SysUtils._CopyRange(
+                src_fd, dest_fd, copy_size, data_offset,
+                dest_offset + data_offset - src_offset, buffer_size, methods)
+            data_offset += copied
+            _Progress(data_offset - src_offset, copied)
+            if copied < copy_size:
+              raise IOError('Unexpected end of file %s at %d' %
+                            (src_path, data_offset))
+        if done < count:
+          SysUtils._ZeroRange(dest_fd, dest_offset + done, count - done,
+                              buffer_size)
+
+        # The destination may end in a hole.
+        st = os.fstat(dest_fd)
+        if stat.S_ISREG(st.st_mode) and st.st_size < dest_offset + count:
+          os.ftruncate(dest_fd, dest_offset + count)
+        if sync:
+          os.fdatasync(dest_fd)
+      finally:
+        os.close(dest_fd)
+    finally:
+      os.close(src_fd)
     if verbose:
       sys.stderr.write('\n')
 
+  @staticmethod
+  def CopyPartitions(copies, max_workers=None, **kargs):
+    """Copies independent partitions concurrently.
+
+    Args:
+      copies: A list of (source, dest) Partition objects, or (source, dest,
+        copy_kargs) to pass copy_kargs to GPT.Partition.Copy of that copy
+        only.  The destinations must not overlap.
+      max_workers: Maximum number of partitions to copy at once.
+      kargs: Other arguments to GPT.Partition.Copy of every copy.
+    """
+    def _Copy(src, dest, copy_kargs=None):
+      return executor.submit(src.Copy, dest, progress=False,
+                             **dict(kargs, **(copy_kargs or {})))
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers or PARTIAL_COPY_MAX_WORKERS) as executor:
+      futures = [_Copy(*copy) for copy in copies]
+      for future in futures:
+        future.result()
+
   @staticmethod
   def GetDiskUsage(path):
     return int(SudoOutput(['du', '-sk', path]).split()[0]) * 1024
@@ -421,6 +588,157 @@ class CrosPayloadUtils:
     Shell([cls.GetProgramPath(), 'add', json_path, component, resource],
           **kargs)
 
+  @classmethod
+  def AddComponents(cls, json_path, resources, cache_dir=None,
+                    max_workers=None):
+    """Adds components to payloads in parallel.
+
+    Disk image components are added partition by partition, so all partitions
+    and file components are compressed at the same time.  Each of them is added
+    to its own JSON file by `cros_payload`, and merged into json_path at last.
+
+    If cache_dir is given, the payloads are also kept in cache_dir, keyed by
+    the SHA1 of the source partition or file, and reused when the same data is
+    added again, for example when only the toolkit is changed in a new build.
+
+    Args:
+      json_path: path to the board metadata JSON file.
+      resources: a dict of component names to resource paths.
+      cache_dir: a directory to cache payloads, or None to disable caching.
+      max_workers: maximum number of payloads to create at once, default to the
+        number of CPUs.
+    """
+    if not os.path.exists(json_path):
+      logging.warning('Cannot find %s', json_path)
+      return
+    payloads_dir = os.path.dirname(os.path.realpath(json_path))
+    if cache_dir:
+      SysUtils.CreateDirectories(cache_dir)
+
+    metadata = {}
+    jobs = []
+    for component, resource in resources.items():
+      if component in PAYLOAD_IMAGE_COMPONENTS:
+        # Like `cros_payload add`, reset version of disk image components.
+        metadata[component] = {PAYLOAD_SUBTYPE_VERSION: ''}
+      jobs += cls._GetPayloadJobs(component, resource)
+    if any('.part' in job[0] for job in jobs):
+      # Mounting partitions needs sudo; ask for the password only once.
+      Sudo('true')
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers or os.cpu_count()) as executor:
+      futures = [executor.submit(cls._AddPayload, payloads_dir, cache_dir, *job)
+                 for job in jobs]
+      for future in futures:
+        for component, subtypes in future.result().items():
+          metadata.setdefault(component, {}).update(subtypes)
+
+    with open(json_path) as f:
+      new_metadata = json.load(f)
+    for component, subtypes in metadata.items():
+      new_metadata.setdefault(component, {}).update(subtypes)
+    with open(json_path, 'w') as f:
+      json.dump(new_metadata, f, indent=2, separators=(',', ': '))
+      f.write('\n')
+
+  @staticmethod
+  def _GetPayloadJobs(component, resource):
+    """Splits adding a component into jobs of (name, resource, offset, size).
+
+    A disk image is split into its partitions, named 'COMPONENT.partN'.  Other
+    components, and images that are not raw disk images, are added as one job
+    with size None.
+    """
+    if component in PAYLOAD_IMAGE_COMPONENTS:
+      try:
+        gpt = GPT.LoadFromFile(resource)
+      except pygpt.GPTError:
+        logging.debug('%s is not a disk image, added as a whole.', resource)
+      else:
+        return [('%s.part%d' % (component, part.number), resource, part.offset,
+                 part.size) for part in gpt.GetUsedPartitions()]
+    return [(component, resource, 0, None)]
+
+  @staticmethod
+  def _HashPayloadSource(path, offset, size):
+    """Returns the SHA1 of size bytes (or all if None) at offset of path."""
+    if size is None:
+      size = os.path.getsize(path) - offset
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+      f.seek(offset)
+      remains = size
+      while remains > 0:
+        data = f.read(min(remains, 32 * MEGABYTE))
+        if not data:
+          break
+        digest.update(data)
+        remains -= len(data)
+    return digest.hexdigest()
+
+  @staticmethod
+  def _GetPayloadFiles(metadata):
+    """Returns the payload files referred by a JSON metadata."""
+    return [value for subtypes in metadata.values()
+            for subtype, value in subtypes.items()
+            if subtype != PAYLOAD_SUBTYPE_VERSION]
+
+  @staticmethod
+  def _LinkOrCopy(src, dest):
+    """Hard links src to dest, or copies if they are on different devices.
+
+    Payload file names contain MD5 of the contents, so an existing dest is
+    the same file and is kept.
+    """
+    if os.path.exists(dest):
+      return
+    try:
+      os.link(src, dest)
+    except OSError:
+      shutil.copy2(src, dest)
+
+  @classmethod
+  def _AddPayload(cls, payloads_dir, cache_dir, name, resource, offset, size):
+    """Adds a component or partition, and returns its JSON metadata."""
+    cache_path = None
+    if cache_dir:
+      cache_path = os.path.join(cache_dir, '%s.%s.%s.json' % (
+          name, cls._HashPayloadSource(resource, offset, size),
+          os.environ.get('CROS_PAYLOAD_FORMAT', 'gz')))
+      if os.path.exists(cache_path):
+        with open(cache_path) as f:
+          metadata = json.load(f)
+        files = cls._GetPayloadFiles(metadata)
+        if all(os.path.exists(os.path.join(cache_dir, f)) for f in files):
+          logging.debug('Reuse %s payloads from %s.', name, cache_path)
+          for f in files:
+            cls._LinkOrCopy(os.path.join(cache_dir, f),
+                            os.path.join(payloads_dir, f))
+          return metadata
+
+    fd, json_path = tempfile.mkstemp(
+        prefix='tmp_', suffix='.json', dir=payloads_dir)
+    try:
+      with os.fdopen(fd, 'w') as f:
+        f.write('{}')
+      Shell([cls.GetProgramPath(), 'add', json_path, name, resource])
+      with open(json_path) as f:
+        metadata = json.load(f)
+    finally:
+      os.unlink(json_path)
+
+    if cache_path:
+      for f in cls._GetPayloadFiles(metadata):
+        cls._LinkOrCopy(os.path.join(payloads_dir, f),
+                        os.path.join(cache_dir, f))
+      # Write the metadata at last, so it only refers to complete payloads.
+      with tempfile.NamedTemporaryFile(
+          'w', dir=cache_dir, suffix='.json', delete=False) as f:
+        json.dump(metadata, f)
+      os.rename(f.name, cache_path)
+    return metadata
+
   @classmethod
   def InstallComponents(cls, json_path, dest, components, optional=False,
                         **kargs):
@@ -886,13 +1204,16 @@ class GPT(pygpt.GPT):
             new_size // MEGABYTE if new_size else '(ALL)')
       return real_size
 
-    def Copy(self, dest, check_equal=True, sync=False, verbose=False):
+    def Copy(self, dest, check_equal=True, sync=False, verbose=False,
+             progress=None):
       """Copies one partition to another partition.
 
       Args:
         dest: a Partition object as the destination.
         check_equal: True to raise exception if the sizes of partitions are
                      different.
+        progress: True to show the progress, None to show it for large
+                  partitions.
       """
       if self.size != dest.size:
         if check_equal:
@@ -905,7 +1226,7 @@ class GPT(pygpt.GPT):
       if verbose:
         logging.info('Copying partition %s => %s...', self, dest)
       SysUtils.PartialCopy(self.image, dest.image, self.size, self.offset,
-                           dest.offset, sync=sync)
+                           dest.offset, sync=sync, verbose=progress)
 
 
 def Partition(image, number):
@@ -1396,7 +1717,7 @@ class ChromeOSFactoryBundle:
                factory_shim=None, enable_firmware=True, firmware=None,
                hwid=None, complete=None, netboot=None, toolkit_config=None,
                description=None, project_config=None, setup_dir=None,
-               server_url=None):
+               server_url=None, payload_cache=None):
     self._temp_dir = temp_dir
     # Member data will be looked up by getattr so we don't prefix with '_'.
     self._board = board
@@ -1416,6 +1737,7 @@ class ChromeOSFactoryBundle:
     self.project_config = project_config
     self.setup_dir = setup_dir
     self.server_url = server_url
+    self.payload_cache = payload_cache
 
   @classmethod
   def DefineBundleArguments(cls, parser, build_type):
@@ -1528,6 +1850,11 @@ class ChromeOSFactoryBundle:
         action='store_false',
         default=True,
         help='skip running firmware updater')
+    parser.AddArgument(
+        (cls.PREFLASH, cls.RMA),
+        '--payload_cache',
+        help=('directory to keep compressed payloads, so partitions and files '
+              'not changed since the last build are not compressed again'))
     parser.AddArgument(
         (cls.BUNDLE,),
         '--setup_dir',
@@ -1602,13 +1929,16 @@ class ChromeOSFactoryBundle:
     logging.debug('Generating cros_payload contents...')
     json_path = CrosPayloadUtils.InitMetaData(target_dir, self.board)
 
+    resources = {}
     for component in PAYLOAD_COMPONENTS:
       resource = getattr(self, component)
       if resource:
         logging.debug('Add %s payloads from %s...', component, resource)
-        CrosPayloadUtils.AddComponent(json_path, component, resource)
+        resources[component] = resource
       else:
         print('Leaving %s component payload as empty.' % component)
+    CrosPayloadUtils.AddComponents(
+        json_path, resources, cache_dir=self.payload_cache)
 
   @staticmethod
   def CopyPayloads(src_dir, target_dir, json_path):
@@ -1643,11 +1973,9 @@ class ChromeOSFactoryBundle:
     assert os.path.exists(target_dir), 'Path does not exist: %s' % target_dir
     assert os.path.isfile(json_path), 'File does not exist: %s' % json_path
 
-    Sudo('cp -p %s %s/' % (json_path, target_dir))
     files = CrosPayloadUtils.GetAllComponentFiles(json_path)
-    for f in files:
-      path = os.path.join(src_dir, f)
-      Sudo('cp -p %s %s/' % (path, target_dir))
+    Sudo(['cp', '-p', json_path] + [os.path.join(src_dir, f) for f in files] +
+         [target_dir + '/'])
 
   def GetPMBR(self, image_path):
     """Creates a file containing PMBR contents from given image.
@@ -2077,8 +2405,18 @@ class ChromeOSFactoryBundle:
     gpt.WriteProtectiveMBR(output, create=True)
     new_state = Partition(output, PART_CROS_STATEFUL)
     old_state = Partition(images[0], PART_CROS_STATEFUL)
+    # The partitions are independent, so they are copied concurrently.  The
+    # kernel/rootfs partitions were created in the same sizes as the sources,
+    # so only the stateful partition may differ in size.
     # TODO(chenghan): Find a way to copy stateful without cros_payloads/
-    old_state.Copy(new_state, check_equal=False)
+    copies = [(old_state, new_state, {'check_equal': False})]
+    for index, entry in enumerate(entries):
+      copies.append(
+          (entry.kernel, Partition(output, index * 2 + PART_CROS_KERNEL_A)))
+      copies.append(
+          (entry.rootfs, Partition(output, index * 2 + PART_CROS_ROOTFS_A)))
+    print('Copying stateful and kernel/rootfs partitions ...')
+    SysUtils.CopyPartitions(copies)
 
     with CrosPayloadUtils.TempPayloadsDir() as temp_payloads_dir:
       with Partition(output, PART_CROS_STATEFUL).Mount(rw=True) as stateful:
@@ -2104,12 +2442,8 @@ class ChromeOSFactoryBundle:
               lsb_path = os.path.join(src_dir, PATH_LSB_FACTORY)
               CrosPayloadUtils.AddComponent(
                   temp_metadata_path, PAYLOAD_TYPE_LSB_FACTORY, lsb_path)
-          # Copy kernel/rootfs partitions
-          print('Copying %s board kernel/rootfs ...' % entry.board)
           new_kernel = index * 2 + PART_CROS_KERNEL_A
           new_rootfs = index * 2 + PART_CROS_ROOTFS_A
-          entry.kernel.Copy(Partition(output, new_kernel))
-          entry.rootfs.Copy(Partition(output, new_rootfs))
           board_info_list.append(
               RMAImageBoardInfo(entry.board, new_kernel, new_rootfs))
 
@@ -2757,7 +3091,8 @@ class CreatePreflashImageCommand(SubCommand):
           enable_firmware=False,
           hwid=self.args.hwid,
           complete=None,
-          project_config=self.args.project_config)
+          project_config=self.args.project_config,
+          payload_cache=self.args.payload_cache)
       new_size = bundle.CreateDiskImage(
           self.args.output, self.args.sectors, self.args.sector_size,
           self.args.stateful_free_space, self.args.verbose)
@@ -2824,7 +3159,8 @@ class CreateRMAImageCommmand(SubCommand):
           complete=self.args.complete,
           toolkit_config=self.args.toolkit_config,
           description=self.args.description,
-          project_config=self.args.project_config)
+          project_config=self.args.project_config,
+          payload_cache=self.args.payload_cache)
       bundle.CreateRMAImage(self.args.output,
                             active_test_list=self.args.active_test_list)
       ChromeOSFactoryBundle.ShowRMAImage(output)
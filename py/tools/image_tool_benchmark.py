@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for copying partitions of a sparse disk image by image_tool.
+
+A disk image of --size GiB with --partitions partitions is generated, where
+only --data-percent of each partition has data, like a freshly built factory
+image.  Partitions are copied to another image with the same layout by:
+
+ - legacy: read and write with a 32MB buffer, like the old PartialCopy.
+ - sparse: SysUtils.PartialCopy, one partition after another.
+ - concurrent: SysUtils.CopyPartitions.
+
+The source image is read once before copying, so all cases read it from the
+page cache.
+
+Example:
+
+  image_tool_benchmark.py --size 8 --partitions 4 --data-percent 10
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from cros.factory.tools import image_tool
+
+
+MEGABYTE = image_tool.MEGABYTE
+
+
+def _LegacyPartialCopy(src_path, dest_path, count, src_offset, dest_offset,
+                       buffer_size=32 * MEGABYTE):
+  with open(src_path, 'rb') as src, open(dest_path, 'r+b') as dest:
+    src.seek(src_offset)
+    dest.seek(dest_offset)
+    remains = count
+    while remains > 0:
+      data = src.read(min(remains, buffer_size))
+      dest.write(data)
+      remains -= len(data)
+
+
+def _CreateImage(path, size, num_partitions):
+  """Creates an image with partitions of same sizes, and returns them."""
+  cgpt = image_tool.SysUtils.FindCGPT()
+  with open(path, 'wb') as f:
+    f.truncate(size)
+  subprocess.check_call('%s create %s' % (cgpt, path), shell=True)
+  blocks = size // image_tool.DEFAULT_BLOCK_SIZE
+  # Leave space for primary and secondary partition tables.
+  part_blocks = (blocks - 2048) // num_partitions
+  for i in range(num_partitions):
+    subprocess.check_call('%s add -i %d -s %d -b %d -t data %s' % (
+        cgpt, i + 1, part_blocks, 1024 + i * part_blocks, path), shell=True)
+  gpt = image_tool.GPT.LoadFromFile(path)
+  return [gpt.GetPartition(i + 1) for i in range(num_partitions)]
+
+
+def _FillData(partitions, data_percent):
+  """Writes 1MB chunks of data evenly into the partitions."""
+  chunk = os.urandom(MEGABYTE)
+  stride = max(1, 100 // data_percent)
+  with open(partitions[0].image, 'r+b') as f:
+    for part in partitions:
+      for offset in range(0, part.size - MEGABYTE, stride * MEGABYTE):
+        f.seek(part.offset + offset)
+        f.write(chunk)
+
+
+def _IsSameData(src_parts, dest_parts):
+  for src_part, dest_part in zip(src_parts, dest_parts):
+    with open(src_part.image, 'rb') as src, open(dest_part.image, 'rb') as dest:
+      src.seek(src_part.offset)
+      dest.seek(dest_part.offset)
+      for unused_offset in range(0, src_part.size, 32 * MEGABYTE):
+        if src.read(32 * MEGABYTE) != dest.read(32 * MEGABYTE):
+          return False
+  return True
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--size', type=int, default=4,
+                      help='Size of the disk image in GiB.')
+  parser.add_argument('--partitions', type=int, default=4,
+                      help='Number of partitions.')
+  parser.add_argument('--data-percent', type=int, default=10,
+                      help='Percentage of each partition that has data.')
+  parser.add_argument('--dir', default=None,
+                      help='Directory for the images, default to a temporary '
+                           'directory.')
+  parser.add_argument('--verify', action='store_true',
+                      help='Compare the copied partitions with the source.')
+  args = parser.parse_args()
+
+  tmp_dir = tempfile.mkdtemp(prefix='image_tool_benchmark_', dir=args.dir)
+  try:
+    size = args.size * 1024 * MEGABYTE
+    src = os.path.join(tmp_dir, 'src.bin')
+    dest = os.path.join(tmp_dir, 'dest.bin')
+    src_parts = _CreateImage(src, size, args.partitions)
+    _FillData(src_parts, args.data_percent)
+    with open(src, 'rb') as f:
+      while f.read(32 * MEGABYTE):
+        pass
+    print('Source: %d MB, %d MB on disk' % (
+        size // MEGABYTE, os.stat(src).st_blocks * 512 // MEGABYTE))
+
+    def _Legacy(dest_parts):
+      for src_part, dest_part in zip(src_parts, dest_parts):
+        _LegacyPartialCopy(src, dest, src_part.size, src_part.offset,
+                           dest_part.offset)
+
+    def _Sparse(dest_parts):
+      for src_part, dest_part in zip(src_parts, dest_parts):
+        src_part.Copy(dest_part, progress=False)
+
+    def _Concurrent(dest_parts):
+      image_tool.SysUtils.CopyPartitions(list(zip(src_parts, dest_parts)))
+
+    copied = sum(part.size for part in src_parts)
+    for name, func in [('legacy', _Legacy), ('sparse', _Sparse),
+                       ('concurrent', _Concurrent)]:
+      dest_parts = _CreateImage(dest, size, args.partitions)
+      start_time = time.time()
+      func(dest_parts)
+      elapsed = time.time() - start_time
+      print('%-10s %7.2fs %8.0f MB/s, %6d MB on disk' % (
+          name, elapsed, copied / MEGABYTE / elapsed,
+          os.stat(dest).st_blocks * 512 // MEGABYTE))
+      if args.verify:
+        assert _IsSameData(src_parts, dest_parts), 'Partitions are different.'
+      os.unlink(dest)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for generating cros_payload contents of a bundle by image_tool.
+
+A test image of --partitions partitions of --part-size MiB is generated, where
+only --data-percent of each partition has data, and a --file-size MiB file
+stands in for file components like the toolkit.  Payloads are created by:
+
+ - serial: `cros_payload add` for one component after another, like the old
+   ChromeOSFactoryBundle.CreatePayloads.
+ - parallel: CrosPayloadUtils.AddComponents without cache.
+ - full: CrosPayloadUtils.AddComponents with an empty cache.
+ - incremental: CrosPayloadUtils.AddComponents with the cache of the full
+   build, after the file and one partition are changed, like a rebuild with a
+   new toolkit.
+
+Example:
+
+  image_tool_payload_benchmark.py --partitions 4 --part-size 256
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from cros.factory.tools import image_tool
+
+
+MEGABYTE = image_tool.MEGABYTE
+
+
+def _CreateImage(path, num_partitions, part_size, data_percent):
+  """Creates a test image, and returns the partition numbers."""
+  cgpt = image_tool.SysUtils.FindCGPT()
+  with open(path, 'wb') as f:
+    # Leave space for primary and secondary partition tables.
+    f.truncate((num_partitions + 2) * part_size)
+  subprocess.check_call('%s create %s' % (cgpt, path), shell=True)
+  # Partitions 1 and 3 are mounted by cros_payload, so they are not used.
+  numbers = [nr for nr in range(2, num_partitions + 3) if nr != 3]
+  for i, nr in enumerate(numbers):
+    subprocess.check_call(
+        '%s add -i %d -s %d -b %d -t data %s' % (
+            cgpt, nr, part_size // 512, (i + 1) * part_size // 512, path),
+        shell=True)
+    _FillPartition(path, nr, data_percent)
+  subprocess.check_call('%s boot -p %s' % (cgpt, path), shell=True,
+                        stdout=subprocess.DEVNULL)
+  return numbers
+
+
+def _FillPartition(path, nr, data_percent):
+  """Writes 1MB chunks of random data evenly into a partition."""
+  part = image_tool.GPT.LoadFromFile(path).GetPartition(nr)
+  stride = max(1, 100 // data_percent)
+  with open(path, 'r+b') as f:
+    for offset in range(0, part.size, stride * MEGABYTE):
+      f.seek(part.offset + offset)
+      f.write(os.urandom(MEGABYTE))
+
+
+def _WriteFile(path, size):
+  with open(path, 'wb') as f:
+    f.write(os.urandom(size))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--partitions', type=int, default=4,
+                      help='Number of partitions in the test image.')
+  parser.add_argument('--part-size', type=int, default=256,
+                      help='Size of each partition in MiB.')
+  parser.add_argument('--data-percent', type=int, default=25,
+                      help='Percentage of each partition that has data.')
+  parser.add_argument('--file-size', type=int, default=64,
+                      help='Size of the file component in MiB.')
+  parser.add_argument('--dir', default=None,
+                      help='Directory for the payloads, default to a '
+                           'temporary directory.')
+  args = parser.parse_args()
+
+  utils = image_tool.CrosPayloadUtils
+  tmp_dir = tempfile.mkdtemp(prefix='image_tool_payload_benchmark_',
+                             dir=args.dir)
+  try:
+    image = os.path.join(tmp_dir, 'test_image.bin')
+    numbers = _CreateImage(image, args.partitions, args.part_size * MEGABYTE,
+                           args.data_percent)
+    description = os.path.join(tmp_dir, 'description.txt')
+    _WriteFile(description, args.file_size * MEGABYTE)
+    resources = {'test_image': image, 'description': description}
+    cache_dir = os.path.join(tmp_dir, 'cache')
+
+    def _Serial(json_path):
+      for component, resource in resources.items():
+        utils.AddComponent(json_path, component, resource, silent=True)
+
+    def _Parallel(json_path):
+      utils.AddComponents(json_path, resources)
+
+    def _Cached(json_path):
+      utils.AddComponents(json_path, resources, cache_dir=cache_dir)
+
+    def _Change():
+      _WriteFile(description, args.file_size * MEGABYTE)
+      _FillPartition(image, numbers[-1], args.data_percent)
+
+    for name, func, prepare in [('serial', _Serial, None),
+                                ('parallel', _Parallel, None),
+                                ('full', _Cached, None),
+                                ('incremental', _Cached, _Change)]:
+      if prepare:
+        prepare()
+      payloads_dir = os.path.join(tmp_dir, name)
+      os.mkdir(payloads_dir)
+      json_path = utils.InitMetaData(payloads_dir, 'benchmark')
+      start_time = time.time()
+      func(json_path)
+      print('%-12s %7.2fs' % (name, time.time() - start_time))
+      shutil.rmtree(payloads_dir)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+  main()
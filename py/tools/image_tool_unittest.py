@@ -5,6 +5,7 @@
 # found in the LICENSE file.
 
 import argparse
+import errno
 import inspect
 import json
 import os
@@ -302,6 +303,159 @@ class UserInputTest(unittest.TestCase):
     self.assertEqual(answer, None)
 
 
+class PartialCopyTest(unittest.TestCase):
+  """Unit tests for SysUtils.PartialCopy."""
+
+  BLOCK = 1024 * 1024
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp(prefix='image_tool_unittest_')
+    self.src = os.path.join(self.temp_dir, 'src')
+    self.dest = os.path.join(self.temp_dir, 'dest')
+    # A sparse file of 8 blocks, with data in block 1 and 5.
+    with open(self.src, 'wb') as f:
+      f.truncate(8 * self.BLOCK)
+      for block in (1, 5):
+        f.seek(block * self.BLOCK)
+        f.write(bytes([block]) * self.BLOCK)
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def ReadFile(self, path):
+    with open(path, 'rb') as f:
+      return f.read()
+
+  def testSparse(self):
+    with open(self.dest, 'wb') as f:
+      f.truncate(2 * self.BLOCK)
+    image_tool.SysUtils.PartialCopy(
+        self.src, self.dest, 7 * self.BLOCK, self.BLOCK, self.BLOCK)
+    self.assertEqual(self.ReadFile(self.src), self.ReadFile(self.dest))
+    st = os.stat(self.dest)
+    if os.stat(self.src).st_blocks < 8 * self.BLOCK // 512:
+      # Holes are kept if the file system supports them.
+      self.assertLessEqual(st.st_blocks, os.stat(self.src).st_blocks)
+
+  def testOverwrite(self):
+    # Data in the destination is cleared where the source has holes.
+    with open(self.dest, 'wb') as f:
+      f.write(b'\xff' * 10 * self.BLOCK)
+    image_tool.SysUtils.PartialCopy(
+        self.src, self.dest, 6 * self.BLOCK - 10, 10, self.BLOCK, sync=True)
+    expected = bytearray(b'\xff' * 10 * self.BLOCK)
+    expected[self.BLOCK:7 * self.BLOCK - 10] = self.ReadFile(self.src)[
+        10:6 * self.BLOCK]
+    self.assertEqual(bytes(expected), self.ReadFile(self.dest))
+
+  def testFallback(self):
+    with open(self.dest, 'wb') as f:
+      f.truncate(8 * self.BLOCK)
+    with mock.patch('os.copy_file_range',
+                    side_effect=OSError(errno.EXDEV, 'EXDEV')):
+      with mock.patch('os.sendfile',
+                      side_effect=OSError(errno.EINVAL, 'EINVAL')):
+        image_tool.SysUtils.PartialCopy(self.src, self.dest, 8 * self.BLOCK)
+    self.assertEqual(self.ReadFile(self.src), self.ReadFile(self.dest))
+
+
+class CopyPartitionsTest(unittest.TestCase):
+  """Unit tests for SysUtils.CopyPartitions."""
+
+  def testCopyArguments(self):
+    srcs = [mock.Mock(), mock.Mock()]
+    dests = [mock.Mock(), mock.Mock()]
+    image_tool.SysUtils.CopyPartitions(
+        [(srcs[0], dests[0], {'check_equal': False}), (srcs[1], dests[1])],
+        sync=True)
+    srcs[0].Copy.assert_called_once_with(
+        dests[0], progress=False, sync=True, check_equal=False)
+    srcs[1].Copy.assert_called_once_with(dests[1], progress=False, sync=True)
+
+
+class AddComponentsTest(unittest.TestCase):
+  """Unit tests for CrosPayloadUtils.AddComponents."""
+
+  PART_SIZE = 2 * 1024 * 1024
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp(prefix='image_tool_unittest_')
+    self.image = os.path.join(self.temp_dir, 'test_image.bin')
+    with open(self.image, 'wb') as f:
+      f.truncate(4 * self.PART_SIZE)
+    cgpt = image_tool.SysUtils.FindCGPT()
+    subprocess.check_call('%s create %s' % (cgpt, self.image), shell=True)
+    # Partitions 1 and 3 are mounted by cros_payload, so they are not used.
+    for nr in (2, 4):
+      subprocess.check_call('%s add -i %d -s %d -b %d -t data %s' % (
+          cgpt, nr, self.PART_SIZE // 512, nr * self.PART_SIZE // 1024,
+          self.image), shell=True)
+      self.WritePartition(nr)
+    # partx needs the protective MBR.
+    subprocess.check_call('%s boot -p %s' % (cgpt, self.image), shell=True,
+                          stdout=subprocess.DEVNULL)
+    hwid = os.path.join(self.temp_dir, 'hwid.sh')
+    with open(hwid, 'w') as f:
+      f.write('checksum: 1234\n')
+    self.resources = {'test_image': self.image, 'hwid': hwid}
+    self.cache_dir = os.path.join(self.temp_dir, 'cache')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def WritePartition(self, nr):
+    part = image_tool.GPT.LoadFromFile(self.image).GetPartition(nr)
+    with open(self.image, 'r+b') as f:
+      f.seek(part.offset)
+      f.write(os.urandom(part.size // 2))
+
+  def CreatePayloads(self, name, add_func):
+    payloads_dir = os.path.join(self.temp_dir, name)
+    os.mkdir(payloads_dir)
+    json_path = image_tool.CrosPayloadUtils.InitMetaData(payloads_dir, 'test')
+    add_func(json_path)
+    with open(json_path) as f:
+      return json.load(f), sorted(os.listdir(payloads_dir))
+
+  def AddComponents(self, name, **kargs):
+    with mock.patch.object(image_tool, 'Shell',
+                           wraps=image_tool.Shell) as shell:
+      result = self.CreatePayloads(
+          name, lambda json_path: image_tool.CrosPayloadUtils.AddComponents(
+              json_path, self.resources, **kargs))
+    added = sorted(call[0][0][3] for call in shell.call_args_list
+                   if call[0][0][1:2] == ['add'])
+    return result, added
+
+  def testAddComponents(self):
+    def _AddSerially(json_path):
+      for component, resource in self.resources.items():
+        image_tool.CrosPayloadUtils.AddComponent(json_path, component, resource)
+
+    expected = self.CreatePayloads('serial', _AddSerially)
+    self.assertEqual(
+        {'test_image': {'version': '', 'part2': mock.ANY, 'part4': mock.ANY},
+         'hwid': {'version': '1234', 'file': mock.ANY}}, expected[0])
+    self.assertEqual(
+        (expected, ['hwid', 'test_image.part2', 'test_image.part4']),
+        self.AddComponents('parallel'))
+
+  def testCache(self):
+    expected, added = self.AddComponents('full', cache_dir=self.cache_dir)
+    self.assertEqual(3, len(added))
+    self.assertEqual((expected, []),
+                     self.AddComponents('cached', cache_dir=self.cache_dir))
+
+    self.WritePartition(4)
+    (metadata, unused_files), added = self.AddComponents(
+        'incremental', cache_dir=self.cache_dir)
+    self.assertEqual(['test_image.part4'], added)
+    self.assertEqual(expected[0]['test_image']['part2'],
+                     metadata['test_image']['part2'])
+    self.assertNotEqual(expected[0]['test_image']['part4'],
+                        metadata['test_image']['part4'])
+
+
 if __name__ == '__main__':
   # Support `cros_payload` in bin/ folder.
   new_path = os.path.realpath(os.path.join(
@@ -21,7 +21,8 @@ UMPIRE_VERSION = 5
 # TODO(pihsun): Most of these fields are probably not necessary after the match
 # rules are removed.
 DUT_INFO_KEYS = set(['sn', 'mlb_sn', 'firmware', 'ec', 'pd', 'stage',
-                     'uuid', 'drop_slot'])
+                     'uuid', 'drop_slot', 'priority_class', 'download_size',
+                     'downloaded'])
 
 # Deprecated keys in DUT info.
 LEGACY_DUT_INFO_KEYS = set(['board'])
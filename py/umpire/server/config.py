@@ -30,6 +30,29 @@ _BUNDLE_JSON_SCHEMA = {
     'required': ['id', 'note', 'payloads'],
     'additionalProperties': False}
 
+# Download slots manager parameters.
+_DOWNLOAD_SLOTS_JSON_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'initial_slots': {'type': 'integer', 'minimum': 1},
+        'min_slots': {'type': 'integer', 'minimum': 1},
+        'max_slots': {'type': 'integer', 'minimum': 1},
+        'adjust_interval': {'type': 'number', 'minimum': 0},
+        'slot_alive_time': {'type': 'number', 'minimum': 0},
+        'classes': {
+            'type': 'object',
+            'additionalProperties': {
+                'type': 'object',
+                'properties': {
+                    'priority': {'type': 'integer'},
+                    'weight': {'type': 'number', 'minimum': 0}
+                },
+                'additionalProperties': False}
+        },
+        'default_class': {'type': 'string'}
+    },
+    'additionalProperties': False}
+
 def ValidateConfig(config):
   """Validates Umpire config dict.
 
@@ -61,7 +84,8 @@ def ValidateConfig(config):
               },
               'multicast': {
                   'type': 'string'
-              }
+              },
+              'download_slots': _DOWNLOAD_SLOTS_JSON_SCHEMA
           },
           'required': ['services', 'bundles', 'active_bundle_id'],
           'additionalProperties': False})
@@ -14,6 +14,7 @@ from cros.factory.umpire.server import config
 from cros.factory.umpire.server import resource
 from cros.factory.umpire.server import umpire_env
 from cros.factory.utils import file_utils
+from cros.factory.utils import schema
 
 TESTDATA_DIR = os.path.join(os.path.dirname(__file__), 'testdata')
 MINIMAL_CONFIG = os.path.join(TESTDATA_DIR, 'minimal_umpire.json')
@@ -62,6 +63,18 @@ class UmpireConfigTest(unittest.TestCase):
     # Make sure that the structure is deep-copied.
     self.assertEqual(original_payloads, conf['bundles'][0]['payloads'])
 
+  def testValidateConfigWithDownloadSlots(self):
+    with open(EMPTY_SERVICES_CONFIG) as f:
+      config_dict = json.load(f)
+    config_dict['download_slots'] = {
+        'initial_slots': 5,
+        'classes': {'line': {'priority': 1, 'weight': 2.5}}}
+    config.ValidateConfig(config_dict)
+
+    config_dict['download_slots']['classes']['line']['weight'] = -1
+    self.assertRaises(schema.SchemaException, config.ValidateConfig,
+                      config_dict)
+
   def testDumpConfig(self):
     conf = config.UmpireConfig(file_path=MINIMAL_CONFIG)
     new_config = conf.Dump()
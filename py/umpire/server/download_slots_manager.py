@@ -12,50 +12,188 @@ available download session (N_PLACE: 0) or been put in the queue due to slots
 are all occupied already (ex: "N_PLACE: 3" shows that two DUTs are waiting for
 the slot in front of it). In the end, the cookie of drop_slot would indicate
 that this session is done so the slot can be reclaimed for other session.
+
+DUTs may also send these keys in DUT info:
+
+  priority_class: The name of a priority class, for example 'rma' or 'line'.
+  download_size: Bytes to download, sent when requesting a slot.
+  downloaded: Bytes downloaded so far, sent in heartbeats.
+
+The number of slots is adjusted from the download progress reported by DUTs.
+Each slot's throughput is measured between its heartbeats.  Like TCP Vegas,
+if the aggregate throughput of slots is close to what they would get at the
+best throughput each of them has seen, the link has spare bandwidth, and more
+slots are given out while DUTs are waiting.  The capacity of the link is the
+highest aggregate throughput seen recently (or the current one if slots lose
+most of their throughput), and slots beyond what it serves at the best
+throughput of a typical slot seen recently are removed.  Without progress
+reports, the initial number of slots is kept.
+
+Waiting DUTs are served by priority, and DUTs of classes with the same priority
+share the link by weighted fair queuing on their download sizes.
 """
 
 import collections
+import copy
+import heapq
+import itertools
 import logging
+import math
+import threading
 import time
 import uuid
 
-from twisted.internet import reactor
-
 
-_SLOTS_NUMBER = 10
+_DEFAULT_SLOTS = 10
+_DEFAULT_MIN_SLOTS = 1
+_DEFAULT_MAX_SLOTS = 100
+# Seconds between adjustments of the number of slots.  It should be longer than
+# the interval of heartbeats, which carry the progress.
+_DEFAULT_ADJUST_INTERVAL = 120.0
 # Expects that client side will send heart beat in every 60 seconds
-_SLOT_ALIVE_TIME = 80.0
+_DEFAULT_SLOT_ALIVE_TIME = 80.0
+_DEFAULT_CLASS = 'line'
+# Classes with lower priority values are served first.
+_DEFAULT_CLASSES = {
+    'rma': {'priority': 0, 'weight': 1},
+    'line': {'priority': 1, 'weight': 1},
+}
+# Fractions of throughput lost to congestion, below which slots are added, and
+# above which the link capacity is taken as the current throughput.
+_LOW_CONGESTION = 0.1
+_HIGH_CONGESTION = 0.5
+# Slots kept beyond what the link capacity serves, to keep probing for more.
+_HEADROOM = 0.1
+# The link capacity and the best throughput of a typical slot decay by this
+# factor in each adjustment, so they follow changes of the link.
+_CAPACITY_DECAY = 0.98
+# Percentile of best throughput of slots taken as a typical slot.
+_TYPICAL_SLOT_PERCENTILE = 0.75
+_WAIT_TIME_SAMPLES = 1000
+
+
+class _Session:
+  """A DUT holding or waiting for a slot.
+
+  Properties:
+    identity: The UUID of the session.
+    class_name: The name of the priority class.
+    size: Bytes to download.
+    request_time: Time of the slot request.
+    last_seen: Time of the last request.
+    sort_key: A tuple of (priority, finish tag, sequence) ordering waiting
+        sessions.
+    start_tag: The virtual start time in weighted fair queuing.
+    downloaded: Bytes downloaded when last reported.
+    progress_time: Time of the last progress report, or when the DUT was told
+        it got a slot.  None if it has not been told.
+    rate: Download throughput in bytes per second between the last two
+        progress reports.
+    rate_time: Time when rate was measured.
+    best_rate: The highest rate measured.
+  """
+
+  def __init__(self, identity, class_name, size, now):
+    self.identity = identity
+    self.class_name = class_name
+    self.size = size
+    self.request_time = now
+    self.last_seen = now
+    self.sort_key = None
+    self.start_tag = 0.0
+    self.downloaded = 0
+    self.progress_time = None
+    self.rate = None
+    self.rate_time = None
+    self.best_rate = 0.0
 
 
 class DownloadSlotsManager:
   """Download Slots Manager
 
-  DownloadSlotsManager is responsible for keeping a fixed number of DUTs can get
-  the slot. And only DUTs got slots can start to download resources from factory
-  server.
+  DownloadSlotsManager is responsible for limiting the number of DUTs which can
+  get the slot. And only DUTs got slots can start to download resources from
+  factory server.
 
   This class will also monitor whether there are any slots owned by dead DUTs so
   we can prevent slots from always being occupied. This is achieved by asking
   DUTs to send heartbeat constantly in order to keep it's own slot alive.
+  Expired sessions are removed when handling requests, since DUTs waiting for
+  slots keep sending requests.
 
   Properties:
-    slots: A dict to record slots allocated status. The key is UUID and the
-           value is timestamp when requested or re-newed by heartbeat.
-    wait_queue: If all slots are occupied already then DUTs requesting slots
-                would be put into this OrderedDict and once available slot is
-                released the DUT in head of OrderedDict will have priority to
-                own.
-    delayed_call: An object works as a timer in order to check expired slots.
+    slots: A dict to record sessions which own slots. The key is UUID.
+    wait_queue: A dict of sessions waiting for slots. The key is UUID.
     max_slots_num: The maximum slots number is defined to limit how many DUTs
-                   can download resources in parallel.
+                   can download resources in parallel. It is adjusted by the
+                   measured throughput.
   """
-  def __init__(self):
+
+  def __init__(self, config=None, time_func=time.time):
+    """Constructor.
+
+    Args:
+      config: The 'download_slots' dict of the Umpire config.
+      time_func: A function returning the current time, for simulations.
+    """
+    self._time = time_func
+    self._lock = threading.RLock()
     self.slots = {}
-    self.wait_queue = collections.OrderedDict()
-    self.delayed_call = None
-    # TODO(marcochen): Support this variable to get value from umpire config and
-    # be configured from DOME by users.
-    self.max_slots_num = _SLOTS_NUMBER
+    self.wait_queue = {}
+    self.max_slots_num = _DEFAULT_SLOTS
+    self._heap = []
+    self._sequence = itertools.count()
+    self._virtual_time = 0.0
+    self._finish_tags = {}
+    self._total_size = 0
+    self._sized_count = 0
+    self._last_adjust_time = time_func()
+    self._congestion = 0.0
+    self._capacity = 0.0
+    self._slot_rate = 0.0
+    self._wait_times = collections.deque(maxlen=_WAIT_TIME_SAMPLES)
+    self._granted_count = 0
+    self._expired_count = 0
+    self._config = None
+    self.Configure(config or {})
+
+  def Configure(self, config):
+    """Applies the 'download_slots' dict of the Umpire config.
+
+    Nothing is changed if the config is the same as the current one.
+    """
+    with self._lock:
+      if config == self._config:
+        return
+      old_config = self._config or {}
+      self._config = copy.deepcopy(config)
+      self.min_slots_num = config.get('min_slots', _DEFAULT_MIN_SLOTS)
+      self.upper_slots_num = max(self.min_slots_num,
+                                 config.get('max_slots', _DEFAULT_MAX_SLOTS))
+      initial_slots = config.get('initial_slots', _DEFAULT_SLOTS)
+      if initial_slots != old_config.get('initial_slots', _DEFAULT_SLOTS):
+        self.max_slots_num = initial_slots
+      self.max_slots_num = min(max(self.max_slots_num, self.min_slots_num),
+                               self.upper_slots_num)
+      self.adjust_interval = config.get('adjust_interval',
+                                        _DEFAULT_ADJUST_INTERVAL)
+      self.slot_alive_time = config.get('slot_alive_time',
+                                        _DEFAULT_SLOT_ALIVE_TIME)
+      self.classes = copy.deepcopy(_DEFAULT_CLASSES)
+      for class_name, info in config.get('classes', {}).items():
+        if info.get('weight', 1) <= 0:
+          logging.error('Ignore class %r with non-positive weight.', class_name)
+          continue
+        self.classes[class_name] = info
+      self.default_class = config.get('default_class', _DEFAULT_CLASS)
+      if self.default_class not in self.classes:
+        logging.error('Unknown default class %r.', self.default_class)
+        self.default_class = _DEFAULT_CLASS
+      self._Dispatch(self._time())
+
+  def _GetClassInfo(self, class_name):
+    info = self.classes[class_name]
+    return info.get('priority', 0), info.get('weight', 1)
 
   def _CheckRequestParameters(self, identity, drop_slot):
     if identity:
@@ -67,103 +205,219 @@ class DownloadSlotsManager:
       return False
     return True
 
-  def _TryToRequestSlot(self):
+  def _GetDownloadSize(self, dut_info):
+    """Returns download_size in DUT info, or the average of known sizes."""
+    try:
+      size = int(dut_info['download_size'])
+      if size > 0:
+        self._total_size += size
+        self._sized_count += 1
+        return size
+    except (KeyError, ValueError):
+      pass
+    if self._sized_count:
+      return self._total_size / self._sized_count
+    return 1
+
+  def _Enqueue(self, session):
+    """Puts a session into the wait queue by weighted fair queuing."""
+    priority, weight = self._GetClassInfo(session.class_name)
+    session.start_tag = max(self._virtual_time,
+                            self._finish_tags.get(session.class_name, 0.0))
+    finish_tag = session.start_tag + session.size / weight
+    self._finish_tags[session.class_name] = finish_tag
+    session.sort_key = (priority, finish_tag, next(self._sequence))
+    self.wait_queue[session.identity] = session
+    heapq.heappush(self._heap, (session.sort_key, session.identity))
+
+  def _Dispatch(self, now):
+    """Gives available slots to waiting sessions."""
+    while len(self.slots) < self.max_slots_num and self.wait_queue:
+      sort_key, identity = heapq.heappop(self._heap)
+      session = self.wait_queue.get(identity)
+      if session is None or session.sort_key != sort_key:
+        continue
+      del self.wait_queue[identity]
+      self._virtual_time = max(self._virtual_time, session.start_tag)
+      self.slots[identity] = session
+      self._wait_times.append(now - session.request_time)
+      self._granted_count += 1
+      logging.debug('Congrats! available slot is ready for %s.', identity)
+    # Drop entries of removed sessions.
+    if len(self._heap) > 2 * len(self.wait_queue) + 64:
+      self._heap = [(s.sort_key, s.identity) for s in self.wait_queue.values()]
+      heapq.heapify(self._heap)
+
+  def _GetPlace(self, session, now):
+    if session.identity in self.slots:
+      if session.progress_time is None:
+        # The DUT starts downloading now.
+        session.progress_time = now
+      return 0
+    return 1 + sum(1 for s in self.wait_queue.values()
+                   if s.sort_key < session.sort_key)
+
+  def _TryToRequestSlot(self, dut_info, now):
     identity = str(uuid.uuid1())
-    now = time.time()
-
-    if len(self.slots) + len(self.wait_queue) < self.max_slots_num:
-      self.slots[identity] = now
+    class_name = dut_info.get('priority_class', self.default_class)
+    if class_name not in self.classes:
+      logging.warning('Unknown priority class %r from %s.', class_name,
+                      identity)
+      class_name = self.default_class
+    session = _Session(identity, class_name, self._GetDownloadSize(dut_info),
+                       now)
+    self._Enqueue(session)
+    self._Dispatch(now)
+    place = self._GetPlace(session, now)
+    if place:
+      logging.debug('Slots are all occupied so need to wait in %d place.',
+                    place)
+    else:
       logging.debug('Slot is requested and identity is %s.', identity)
-
-      self._PrepareTimerForDeadSlot()
-
-      return (identity, 0)
-
-    # All slots are occupied already so need to be put into queue.
-    self.wait_queue[identity] = now
-    place = len(self.wait_queue)
-    logging.debug('Slots are all occupied so need to wait in %d place.', place)
-
     return (identity, place)
 
-  def _DropOccupiedSlot(self, identity):
+  def _DropOccupiedSlot(self, identity, now):
     if identity in self.slots:
       del self.slots[identity]
     else:
       del self.wait_queue[identity]
 
     logging.debug('One slot is available now from %s.', identity)
-    self._CheckAvailableSlot()
+    self._Dispatch(now)
 
     return (identity, -1)
 
-  def _HeartBeat(self, identity):
-    now = time.time()
-    if identity in self.slots:
-      self.slots[identity] = now
-      place = 0
+  def _UpdateProgress(self, identity, dut_info, now):
+    session = self.slots.get(identity)
+    if (session is None or session.progress_time is None or
+        'downloaded' not in dut_info):
+      return
+    try:
+      downloaded = int(dut_info['downloaded'])
+    except ValueError:
+      return
+    if now > session.progress_time:
+      session.rate = max(0, downloaded - session.downloaded) / (
+          now - session.progress_time)
+      session.rate_time = now
+      session.best_rate = max(session.best_rate, session.rate)
+    session.downloaded = downloaded
+    session.progress_time = now
+
+  def _HeartBeat(self, identity, now):
+    session = self.slots.get(identity) or self.wait_queue[identity]
+    session.last_seen = now
+    return (identity, self._GetPlace(session, now))
+
+  def _RemoveExpiredSessions(self, now):
+    for sessions in (self.slots, self.wait_queue):
+      expired = [identity for identity, session in sessions.items()
+                 if now - session.last_seen >= self.slot_alive_time]
+      for identity in expired:
+        logging.debug('Session %s is expired.', identity)
+        del sessions[identity]
+      self._expired_count += len(expired)
+
+  def _GetReportingSlots(self, now):
+    """Returns sessions of slots which are reporting progress."""
+    return [session for session in self.slots.values()
+            if session.rate_time is not None and
+            now - session.rate_time < self.slot_alive_time]
+
+  def _AdjustSlots(self, now):
+    """Adjusts the number of slots from throughput of slots."""
+    if now - self._last_adjust_time < self.adjust_interval:
+      return
+    self._last_adjust_time = now
+    sessions = self._GetReportingSlots(now)
+    best_throughput = sum(session.best_rate for session in sessions)
+    if not best_throughput:
+      return
+    throughput = sum(session.rate for session in sessions)
+    self._congestion = 1 - throughput / best_throughput
+    if self._congestion > _HIGH_CONGESTION:
+      # The link serves much less than before, for example when it is shared
+      # with other traffic.
+      self._capacity = throughput
     else:
-      self.wait_queue[identity] = now
-      place = list(self.wait_queue).index(identity) + 1
-    return (identity, place)
-
-  def _CheckAvailableSlot(self):
-    if len(self.slots) >= self.max_slots_num or not self.wait_queue:
+      self._capacity = max(self._capacity * _CAPACITY_DECAY, throughput)
+    best_rates = sorted(session.best_rate for session in sessions)
+    self._slot_rate = max(
+        self._slot_rate * _CAPACITY_DECAY,
+        best_rates[int(len(best_rates) * _TYPICAL_SLOT_PERCENTILE)])
+    if self._slot_rate <= 0:
+      # Most slots have not downloaded anything yet, so keep the slots until
+      # the rate of a typical slot is known.
       return
-
-    # available slot is ready now.
-    available_slots = self.max_slots_num - len(self.slots)
-    while available_slots > 0 and self.wait_queue:
-      identity, timestamp = self.wait_queue.popitem(last=False)
-      self.slots[identity] = timestamp
-      available_slots -= 1
-      logging.debug('Congrats! available slot is ready for %s.', identity)
+    capacity_slots = int(math.ceil(
+        self._capacity / self._slot_rate * (1 + _HEADROOM)))
+    if self._congestion < _LOW_CONGESTION:
+      # Only add slots when they are all used.
+      if self.wait_queue and len(self.slots) >= self.max_slots_num:
+        self.max_slots_num = min(
+            self.upper_slots_num,
+            self.max_slots_num + max(1, self.max_slots_num // 4))
+    elif self.max_slots_num > capacity_slots:
+      self.max_slots_num = max(self.min_slots_num, capacity_slots)
+    logging.debug('Slots: %d, throughput: %.0f, congestion: %.2f',
+                  self.max_slots_num, throughput, self._congestion)
 
   def ProcessSlotRequest(self, dut_info):
     identity = dut_info.get('uuid')
     drop_slot = 'drop_slot' in dut_info
 
-    # do error handling first.
-    if not self._CheckRequestParameters(identity, drop_slot):
-      return None
-
-    # start to process the request.
-    if not identity:
-      result = self._TryToRequestSlot()
-    elif drop_slot:
-      result = self._DropOccupiedSlot(identity)
-    else:
-      result = self._HeartBeat(identity)
+    with self._lock:
+      now = self._time()
+      self._AdjustSlots(now)
+      self._RemoveExpiredSessions(now)
+      self._Dispatch(now)
+
+      # do error handling first.
+      if not self._CheckRequestParameters(identity, drop_slot):
+        return None
+
+      # start to process the request.
+      if not identity:
+        result = self._TryToRequestSlot(dut_info, now)
+      else:
+        self._UpdateProgress(identity, dut_info, now)
+        if drop_slot:
+          result = self._DropOccupiedSlot(identity, now)
+        else:
+          result = self._HeartBeat(identity, now)
 
     return 'UUID: %s\nN_PLACE: %d\n' % result
 
-  def _RemoveExpiredSession(self):
-    now = time.time()
-    self.slots = {identity: t for identity, t in self.slots.items()
-                  if now - t < _SLOT_ALIVE_TIME}
-    self.wait_queue = collections.OrderedDict(
-        (identity, t) for identity, t in self.wait_queue.items()
-        if now - t < _SLOT_ALIVE_TIME)
-    self._CheckAvailableSlot()
-
-  def _PrepareTimerForDeadSlot(self, timeout=_SLOT_ALIVE_TIME):
-    if self.delayed_call is None:
-      self.delayed_call = reactor.callLater(timeout, self._SlotTimeOutFunc)
-      logging.debug('Timer is up.')
-
-  def _SlotTimeOutFunc(self):
-    logging.debug('Timer is fired to check slots which are expired.')
-    self.delayed_call = None
-    self._RemoveExpiredSession()
-
-    if not self.slots and not self.wait_queue:
-      logging.debug('No timer is fired.')
-      return
-
-    # Fire another timer for oldest slot now.
-    joined_dict = self.slots.copy()
-    joined_dict.update(self.wait_queue)
-    oldest_slot = min(joined_dict, key=joined_dict.get)
-    next_time = _SLOT_ALIVE_TIME - (time.time() - joined_dict[oldest_slot]) + 1
-    self._PrepareTimerForDeadSlot(next_time)
-    logging.debug('Another timer is up for slot - %s', oldest_slot)
+  def GetMetrics(self):
+    """Returns a dict of the status of slots and the wait queue."""
+    with self._lock:
+      now = self._time()
+      self._RemoveExpiredSessions(now)
+      queue_depth = collections.Counter(
+          session.class_name for session in self.wait_queue.values())
+      wait_times = sorted(self._wait_times)
+      def Percentile(p):
+        return wait_times[min(len(wait_times) - 1, int(len(wait_times) * p))]
+      return {
+          'slots': self.max_slots_num,
+          'used_slots': len(self.slots),
+          'queue_depth': len(self.wait_queue),
+          'queue_depth_by_class': {name: queue_depth[name]
+                                   for name in self.classes},
+          'oldest_wait_time': max(
+              [now - s.request_time for s in self.wait_queue.values()] or [0]),
+          'throughput': sum(session.rate
+                            for session in self._GetReportingSlots(now)),
+          'congestion': self._congestion,
+          'capacity': self._capacity,
+          'slot_throughput': self._slot_rate,
+          'granted': self._granted_count,
+          'expired': self._expired_count,
+          'wait_time': {
+              'samples': len(wait_times),
+              'mean': sum(wait_times) / len(wait_times) if wait_times else 0,
+              'p50': Percentile(0.5) if wait_times else 0,
+              'p95': Percentile(0.95) if wait_times else 0,
+              'max': wait_times[-1] if wait_times else 0,
+          },
+      }
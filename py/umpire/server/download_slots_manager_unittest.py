@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import re
+import unittest
+
+from cros.factory.umpire.server import download_slots_manager
+
+
+class FakeTime:
+
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+
+class DownloadSlotsManagerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.time = FakeTime()
+    self.manager = download_slots_manager.DownloadSlotsManager(
+        {'initial_slots': 2, 'adjust_interval': 10}, time_func=self.time)
+    self.downloaded = {}
+
+  def _Request(self, **dut_info):
+    result = self.manager.ProcessSlotRequest(
+        {key: str(value) for key, value in dut_info.items()})
+    if result is None:
+      return None
+    match = re.match(r'UUID: (\S+)\nN_PLACE: (-?\d+)\n$', result)
+    return match.group(1), int(match.group(2))
+
+  def testRequestAndDrop(self):
+    a, place_a = self._Request()
+    unused_b, place_b = self._Request()
+    c, place_c = self._Request()
+    d, place_d = self._Request()
+    self.assertEqual([0, 0, 1, 2], [place_a, place_b, place_c, place_d])
+
+    self.assertEqual((a, -1), self._Request(uuid=a, drop_slot=''))
+    self.assertEqual((c, 0), self._Request(uuid=c))
+    self.assertEqual((d, 1), self._Request(uuid=d))
+    self.assertIsNone(self._Request(uuid=a))
+    self.assertIsNone(self._Request(drop_slot=''))
+
+  def testExpire(self):
+    a, unused_place = self._Request()
+    b, unused_place = self._Request()
+    c, place = self._Request()
+    self.assertEqual(1, place)
+    self.time.now += 50
+    self._Request(uuid=b)
+    self._Request(uuid=c)
+    self.time.now += 50
+    # a is expired.
+    self.assertEqual((c, 0), self._Request(uuid=c))
+    self.assertIsNone(self._Request(uuid=a))
+    self.assertEqual(1, self.manager.GetMetrics()['expired'])
+
+  def testPriorityAndWeightedFairness(self):
+    self.manager.Configure({
+        'initial_slots': 1,
+        'classes': {'line': {'priority': 1, 'weight': 1},
+                    'other_line': {'priority': 1, 'weight': 3}}})
+    self._Request()
+    line = [self._Request(download_size=100)[0] for unused_i in range(3)]
+    other = [self._Request(priority_class='other_line', download_size=100)[0]
+             for unused_i in range(3)]
+    unused_rma, place = self._Request(priority_class='rma')
+    self.assertEqual(1, place)
+    # Finish tags: line 101, 201, 301 after the first request of size 1;
+    # other_line 33, 67, 100.
+    places = {identity: self._Request(uuid=identity)[1]
+              for identity in line + other}
+    self.assertEqual([5, 6, 7], [places[identity] for identity in line])
+    self.assertEqual([2, 3, 4], [places[identity] for identity in other])
+
+    metrics = self.manager.GetMetrics()
+    self.assertEqual(7, metrics['queue_depth'])
+    self.assertEqual({'rma': 1, 'line': 3, 'other_line': 3},
+                     metrics['queue_depth_by_class'])
+
+  def _ReportProgress(self, identities, rate):
+    """Reports downloads in 10 seconds at the given rate for each slot."""
+    self.time.now += 10
+    for identity in identities:
+      self.downloaded[identity] = self.downloaded.get(identity, 0) + rate * 10
+      self._Request(uuid=identity, downloaded=self.downloaded[identity])
+
+  def testAddSlotsWhenLinkIsIdle(self):
+    slots = [self._Request()[0] for unused_i in range(2)]
+    waiting, unused_place = self._Request()
+    self._Request()
+    self._ReportProgress(slots, 1000)
+    self.assertEqual(2, self.manager.max_slots_num)
+    self._ReportProgress(slots, 1000)
+    self.assertEqual(3, self.manager.max_slots_num)
+    self.assertEqual((waiting, 0), self._Request(uuid=waiting))
+    self.assertEqual(2000, self.manager.GetMetrics()['throughput'])
+
+  def testRemoveSlotsWhenLinkIsSaturated(self):
+    self.manager.Configure({'initial_slots': 10, 'adjust_interval': 10})
+    slots = [self._Request()[0] for unused_i in range(10)]
+    self._ReportProgress(slots, 1000)
+    self._ReportProgress(slots, 200)
+    self.assertEqual(10, self.manager.max_slots_num)
+    self._ReportProgress(slots, 200)
+    # The link serves 2000 bytes per second, which is 2 slots at 1000.
+    self.assertEqual(3, self.manager.max_slots_num)
+    metrics = self.manager.GetMetrics()
+    self.assertEqual(2000, metrics['capacity'])
+    self.assertEqual(1000, metrics['slot_throughput'])
+    self.assertAlmostEqual(0.8, metrics['congestion'])
+
+  def testKeepSlotsWithoutSlotRate(self):
+    self.manager.Configure({'initial_slots': 10, 'adjust_interval': 10})
+    slots = [self._Request()[0] for unused_i in range(10)]
+    # Only one slot has downloaded anything, so the rate of a typical slot is
+    # unknown.
+    self.time.now += 10
+    self._Request(uuid=slots[0], downloaded=10000)
+    for identity in slots[1:]:
+      self._Request(uuid=identity, downloaded=0)
+    self._ReportProgress(slots, 0)
+    self.assertEqual(10, self.manager.max_slots_num)
+    self.assertEqual(0, self.manager.GetMetrics()['slot_throughput'])
+
+  def testWaitTimeMetrics(self):
+    slot, unused_place = self._Request()
+    self._Request()
+    waiting, unused_place = self._Request()
+    self.time.now += 30
+    self.assertEqual(30, self.manager.GetMetrics()['oldest_wait_time'])
+    self._Request(uuid=slot, drop_slot='')
+    self.assertEqual((waiting, 0), self._Request(uuid=waiting))
+    metrics = self.manager.GetMetrics()
+    self.assertEqual(3, metrics['granted'])
+    self.assertEqual({'samples': 3, 'mean': 10, 'p50': 0, 'p95': 30,
+                      'max': 30}, metrics['wait_time'])
+
+
+  def testIgnoreNonPositiveWeight(self):
+    self.manager.Configure({
+        'classes': {'line': {'priority': 1, 'weight': 0},
+                    'zero': {'priority': 1, 'weight': 0}}})
+    self.assertEqual(1, self.manager.classes['line']['weight'])
+    self.assertNotIn('zero', self.manager.classes)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Simulates waves of DUTs reimaging through DownloadSlotsManager.
+
+DUTs arrive in waves, request download slots, send heartbeats with their
+progress, and drop their slots when done, on a simulated clock.  Downloading
+DUTs share the server link fairly, each up to its own maximum rate.  When more
+DUTs download than the link can serve at full rate, the link loses some
+throughput to contention.
+
+A fixed number of slots (like the previous manager) is compared against the
+adaptive manager.
+
+Example:
+
+  download_slots_simulator.py --duts 200 --bandwidth 100 --dut-rate 8
+"""
+
+import argparse
+import random
+import re
+
+from cros.factory.umpire.server import download_slots_manager
+
+
+_MB = 1 << 20
+
+
+class _SimulatedDUT:
+
+  def __init__(self, arrival, size, max_rate, class_name, next_request):
+    self.arrival = arrival
+    self.size = size
+    self.max_rate = max_rate
+    self.class_name = class_name
+    self.next_request = next_request
+    self.identity = None
+    self.has_slot = False
+    self.downloaded = 0.0
+    self.rate = 0.0
+    self.done_time = None
+
+
+class Simulator:
+  """Replays waves of DUTs against a DownloadSlotsManager.
+
+  Args:
+    config: The 'download_slots' config of the manager.
+    args: Parsed command line arguments.
+  """
+
+  def __init__(self, config, args):
+    self.now = 0.0
+    self.args = args
+    self.manager = download_slots_manager.DownloadSlotsManager(
+        config, time_func=lambda: self.now)
+    rand = random.Random(args.seed)
+    self.duts = []
+    for wave in range(args.waves):
+      for unused_i in range(args.duts):
+        arrival = wave * args.wave_interval + rand.uniform(0, args.arrival)
+        size = args.size * _MB * rand.uniform(1 - args.size_jitter,
+                                              1 + args.size_jitter)
+        max_rate = args.dut_rate * _MB * rand.uniform(
+            1 - args.dut_rate_jitter, 1 + args.dut_rate_jitter)
+        class_name = 'rma' if rand.random() < args.rma_fraction else 'line'
+        self.duts.append(
+            _SimulatedDUT(arrival, size, max_rate, class_name, arrival))
+    self.total_bytes = 0.0
+    self.slots_seconds = 0.0
+
+  def _Request(self, dut, **dut_info):
+    if dut.identity:
+      dut_info['uuid'] = dut.identity
+    result = self.manager.ProcessSlotRequest(
+        {key: str(value) for key, value in dut_info.items()})
+    if result is None:
+      # Expired; request a new slot.
+      dut.identity = None
+      dut.has_slot = False
+      return self._Request(dut, priority_class=dut.class_name,
+                           download_size=int(dut.size - dut.downloaded))
+    match = re.match(r'UUID: (\S+)\nN_PLACE: (-?\d+)\n', result)
+    dut.identity = match.group(1)
+    return int(match.group(2))
+
+  def _Step(self, dt):
+    args = self.args
+    for dut in self.duts:
+      if dut.done_time is not None or dut.next_request > self.now:
+        continue
+      if dut.identity is None:
+        place = self._Request(dut, priority_class=dut.class_name,
+                              download_size=int(dut.size))
+      else:
+        place = self._Request(dut, downloaded=int(dut.downloaded))
+      if place == 0 and not dut.has_slot:
+        dut.has_slot = True
+        dut.downloaded = 0.0
+      dut.next_request = self.now + args.heartbeat
+
+    downloading = [dut for dut in self.duts
+                   if dut.has_slot and dut.done_time is None]
+    if not downloading:
+      return
+    # Max-min fair share of the link, which loses throughput to contention
+    # when more DUTs download than the link serves at full rate.
+    demand = sum(dut.max_rate for dut in downloading)
+    bandwidth = args.bandwidth * _MB
+    excess = max(0, len(downloading) * (1 - bandwidth / demand))
+    bandwidth /= 1 + args.contention * excess
+    share = bandwidth / len(downloading)
+    remaining = len(downloading)
+    for dut in sorted(downloading, key=lambda dut: dut.max_rate):
+      dut.rate = min(dut.max_rate, share)
+      bandwidth -= dut.rate
+      remaining -= 1
+      if remaining:
+        share = bandwidth / remaining
+    self.slots_seconds += len(downloading) * dt
+    for dut in downloading:
+      rate = dut.rate
+      dut.downloaded += rate * dt
+      self.total_bytes += rate * dt
+      if dut.downloaded >= dut.size:
+        dut.done_time = self.now
+        self._Request(dut, downloaded=int(dut.size), drop_slot='')
+
+  def Run(self, dt=1.0):
+    while any(dut.done_time is None for dut in self.duts):
+      self._Step(dt)
+      self.now += dt
+    return self.now
+
+
+def _Report(name, simulator):
+  duts = simulator.duts
+  elapsed = simulator.now - min(dut.arrival for dut in duts)
+  def Mean(values):
+    return sum(values) / len(values) if values else 0
+  completion = sorted(dut.done_time - dut.arrival for dut in duts)
+  rma = [dut.done_time - dut.arrival for dut in duts if dut.class_name == 'rma']
+  metrics = simulator.manager.GetMetrics()
+  print('%-10s makespan %6.0fs  completion mean %6.0fs p95 %6.0fs  '
+        'rma mean %6.0fs  wait mean %6.0fs  link %5.1f%%  avg slots %5.1f' % (
+            name, elapsed, Mean(completion),
+            completion[int(len(completion) * 0.95)], Mean(rma),
+            metrics['wait_time']['mean'],
+            100.0 * simulator.total_bytes / (
+                simulator.args.bandwidth * _MB * elapsed),
+            simulator.slots_seconds / elapsed))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--duts', type=int, default=200,
+                      help='DUTs in each wave.')
+  parser.add_argument('--waves', type=int, default=1, help='Number of waves.')
+  parser.add_argument('--wave-interval', type=float, default=3600,
+                      help='Seconds between waves.')
+  parser.add_argument('--arrival', type=float, default=300,
+                      help='Seconds over which DUTs of a wave arrive.')
+  parser.add_argument('--bandwidth', type=float, default=100,
+                      help='Link bandwidth of the server in MB/s.')
+  parser.add_argument('--dut-rate', type=float, default=4,
+                      help='Average maximum download rate of a DUT in MB/s.')
+  parser.add_argument('--dut-rate-jitter', type=float, default=0.25,
+                      help='Relative variation of maximum rates of DUTs.')
+  parser.add_argument('--contention', type=float, default=0.02,
+                      help='Fraction of the link lost per DUT beyond what the '
+                      'link serves at full rate.')
+  parser.add_argument('--size', type=float, default=2000,
+                      help='Average download size in MB.')
+  parser.add_argument('--size-jitter', type=float, default=0.5,
+                      help='Relative variation of download sizes.')
+  parser.add_argument('--rma-fraction', type=float, default=0.05,
+                      help='Fraction of DUTs in the RMA class.')
+  parser.add_argument('--heartbeat', type=float, default=60,
+                      help='Seconds between heartbeats of DUTs.')
+  parser.add_argument('--adjust-interval', type=float, default=120,
+                      help='adjust_interval of the adaptive manager.')
+  parser.add_argument('--slots', type=int, default=10,
+                      help='Number of fixed slots, and initial slots of the '
+                      'adaptive manager.')
+  parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+  args = parser.parse_args()
+
+  policies = [
+      ('fixed', {'initial_slots': args.slots, 'min_slots': args.slots,
+                 'max_slots': args.slots}),
+      ('adaptive', {'initial_slots': args.slots,
+                    'adjust_interval': args.adjust_interval}),
+  ]
+  for name, config in policies:
+    simulator = Simulator(config, args)
+    simulator.Run()
+    _Report(name, simulator)
+
+
+if __name__ == '__main__':
+  main()
@@ -85,13 +85,25 @@ def BuildConfigFileName(type_name, file_path):
     type_name: An element of ConfigTypeNames.
     file_path: path to the config file.
 
+  Returns:
+    Resource name.
+  """
+  return BuildConfigFileNameFromHash(type_name,
+                                     GetResourceHashFromFile(file_path))
+
+
+def BuildConfigFileNameFromHash(type_name, res_hash):
+  """Builds resource name for a config file of the given hash.
+
+  Args:
+    type_name: An element of ConfigTypeNames.
+    res_hash: Hash of the config file in hexadecimal.
+
   Returns:
     Resource name.
   """
   cfg_type = GetConfigType(type_name)
-  return '.'.join([cfg_type.fn_prefix,
-                   GetResourceHashFromFile(file_path),
-                   cfg_type.fn_suffix])
+  return '.'.join([cfg_type.fn_prefix, res_hash, cfg_type.fn_suffix])
 
 
 def IsConfigFileName(basename):
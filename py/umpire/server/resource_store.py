@@ -0,0 +1,368 @@
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Content-addressed store of Umpire resources.
+
+Resource files are still named as before (for example payload configs by their
+MD5, and payload components by cros_payload), but the store keeps an index of
+their contents in <base_dir>/umpire_data/resource_index.json:
+
+- The digest of every resource, so a file already in the store is recognized
+  without comparing it byte by byte, and a file with the same contents as an
+  existing resource of another name is hard linked to it instead of stored
+  twice.
+- The payloads generated by cros_payload for each imported source file, so
+  importing a file that was imported before skips cros_payload entirely.
+- The resources referenced by each bundle's payload config, and reference
+  counts of resources, so garbage collection only reads payload configs of
+  bundles added since the last collection.
+
+Digests are SHA-256 of the SHA-256 of each chunk of a file.  Chunks are hashed
+by a pool of threads while the file is streamed, so hashing large files is not
+bound by one CPU.
+"""
+
+import collections
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent import futures
+
+from cros.factory.umpire import common
+from cros.factory.utils import file_utils
+
+
+INDEX_VERSION = 1
+_CHUNK_SIZE = 4 * 1024 * 1024
+_HASH_THREADS = 4
+# Linux ioctl to clone (reflink) a whole file, from <linux/fs.h>.
+_FICLONE = 0x40049409
+_TEMP_PREFIX = '.tmp_'
+
+
+def _ReadChunks(f):
+  while True:
+    data = f.read(_CHUNK_SIZE)
+    if not data:
+      return
+    yield data
+
+
+class ChunkHasher:
+  """Computes the chunk-level digest of a stream.
+
+  Chunks given to Update are hashed by a thread pool.  Each chunk must be
+  exactly _CHUNK_SIZE bytes except the last one, so the digest does not depend
+  on how the stream is read.
+  """
+
+  def __init__(self, executor):
+    self._executor = executor
+    # Pending chunk hashes.  The number is bounded so that memory use is bounded
+    # if hashing is slower than reading.
+    self._pending = collections.deque()
+    self._hash = hashlib.sha256()
+    self.size = 0
+
+  def Update(self, data):
+    self.size += len(data)
+    self._pending.append(self._executor.submit(
+        lambda data: hashlib.sha256(data).digest(), data))
+    while len(self._pending) > _HASH_THREADS * 2:
+      self._hash.update(self._pending.popleft().result())
+
+  def HexDigest(self):
+    while self._pending:
+      self._hash.update(self._pending.popleft().result())
+    return self._hash.hexdigest()
+
+
+def _Reflink(src_path, dst_path):
+  """Clones src_path to dst_path sharing the same blocks.
+
+  Returns:
+    True if cloned.  False if the file system does not support it.
+  """
+  with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+    try:
+      fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    except OSError:
+      return False
+  return True
+
+
+class ResourceStore:
+  """Adds, deduplicates and garbage collects resource files.
+
+  Properties:
+    resources_dir: The directory of resource files.
+    index_path: Path to the index file.
+  """
+
+  def __init__(self, resources_dir, index_path):
+    self.resources_dir = resources_dir
+    self.index_path = index_path
+    self._lock = threading.RLock()
+    self._executor = futures.ThreadPoolExecutor(max_workers=_HASH_THREADS)
+    self._index = None
+
+  def _ListResources(self):
+    if not os.path.isdir(self.resources_dir):
+      return []
+    return [name for name in os.listdir(self.resources_dir)
+            if not name.startswith(_TEMP_PREFIX)]
+
+  def _NewIndex(self):
+    """Creates the index of existing resource files.
+
+    Digests are computed when needed.
+    """
+    return {
+        'version': INDEX_VERSION,
+        'resources': {name: {'digest': None}
+                      for name in self._ListResources()},
+        'payloads': {},
+        'payload_configs': {},
+        'refcounts': {},
+    }
+
+  @property
+  def index(self):
+    with self._lock:
+      if self._index is None:
+        index = None
+        if os.path.exists(self.index_path):
+          try:
+            index = json.loads(file_utils.ReadFile(self.index_path))
+          except ValueError:
+            logging.exception('Rebuilding broken resource index %s',
+                              self.index_path)
+        if not index or index.get('version') != INDEX_VERSION:
+          index = self._NewIndex()
+        self._index = index
+      return self._index
+
+  def _SaveIndex(self):
+    file_utils.TryMakeDirs(os.path.dirname(self.index_path))
+    with file_utils.AtomicWrite(self.index_path) as f:
+      json.dump(self.index, f, sort_keys=True)
+
+  def HashFile(self, path, extra_hash=None):
+    """Returns the digest of a file.
+
+    Args:
+      extra_hash: A hashlib object to update with the contents as well.
+    """
+    hasher = ChunkHasher(self._executor)
+    with open(path, 'rb') as f:
+      for data in _ReadChunks(f):
+        hasher.Update(data)
+        if extra_hash:
+          extra_hash.update(data)
+    return hasher.HexDigest()
+
+  def _GetDigest(self, name):
+    """Returns the digest of a resource, computing it if not known yet."""
+    entry = self.index['resources'].setdefault(name, {'digest': None})
+    if not entry['digest']:
+      entry['digest'] = self.HashFile(os.path.join(self.resources_dir, name))
+    return entry['digest']
+
+  def _FindByDigest(self, digest):
+    for name, entry in self.index['resources'].items():
+      if entry['digest'] == digest and os.path.exists(
+          os.path.join(self.resources_dir, name)):
+        return name
+    return None
+
+  def _Commit(self, tmp_path, res_name, digest):
+    """Moves a new file in the resources directory to its resource name.
+
+    If the resource exists, it must have the same digest, and tmp_path is
+    removed.  If another resource has the same digest, it is hard linked
+    instead.
+    """
+    dst_path = os.path.join(self.resources_dir, res_name)
+    with self._lock:
+      if os.path.exists(dst_path):
+        os.unlink(tmp_path)
+        if self._GetDigest(res_name) != digest:
+          raise common.UmpireError(
+              'Hash collision: new file != resource file %r' % dst_path)
+        logging.warning('Skip adding as file already exists: %s', dst_path)
+        self._SaveIndex()
+        return
+      same_name = self._FindByDigest(digest)
+      if same_name:
+        os.unlink(tmp_path)
+        os.link(os.path.join(self.resources_dir, same_name), dst_path)
+        logging.info('File added: %s (linked to %s)', dst_path, same_name)
+      else:
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, dst_path)
+        logging.info('File added: %s', dst_path)
+      self.index['resources'][res_name] = {'digest': digest}
+      self._SaveIndex()
+
+  def AddFile(self, src_path, res_name, use_move):
+    """Adds a file as the given resource.
+
+    Args:
+      src_path: The file to add.
+      res_name: The resource name.
+      use_move: Move src_path into the store instead of copying.  src_path must
+          be on the same file system as the store.
+
+    Raises:
+      UmpireError if the resource exists but has different contents.
+    """
+    if use_move:
+      tmp_path = file_utils.CreateTemporaryFile(dir=self.resources_dir,
+                                                prefix=_TEMP_PREFIX)
+      os.rename(src_path, tmp_path)
+      self._Commit(tmp_path, res_name, self.HashFile(tmp_path))
+    else:
+      self.AddFileWithHashedName(src_path, lambda unused_md5: res_name)
+
+  def AddFileWithHashedName(self, src_path, build_name):
+    """Copies a file into the store, named by its MD5.
+
+    The file is read once to copy, compute its MD5 and its digest.  The copy is
+    a reflink if the file system supports it.
+
+    Args:
+      src_path: The file to add.
+      build_name: A function which returns the resource name from the MD5 of
+          the file in hexadecimal.
+
+    Returns:
+      The resource name.
+    """
+    tmp_path = file_utils.CreateTemporaryFile(dir=self.resources_dir,
+                                              prefix=_TEMP_PREFIX)
+    try:
+      md5 = hashlib.md5()
+      if _Reflink(src_path, tmp_path):
+        digest = self.HashFile(tmp_path, extra_hash=md5)
+      else:
+        hasher = ChunkHasher(self._executor)
+        with open(src_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+          for data in _ReadChunks(src):
+            dst.write(data)
+            hasher.Update(data)
+            md5.update(data)
+          dst.flush()
+          os.fdatasync(dst.fileno())
+        digest = hasher.HexDigest()
+      res_name = build_name(md5.hexdigest())
+      self._Commit(tmp_path, res_name, digest)
+      return res_name
+    except Exception:
+      file_utils.TryUnlink(tmp_path)
+      raise
+
+  def GetSourceKey(self, file_path, type_name, salt=''):
+    """Returns the key to cache payloads generated from a source file.
+
+    Args:
+      file_path: The source file.
+      type_name: The payload type.
+      salt: Anything else the generated payloads depend on.
+    """
+    return '%s:%s:%s' % (type_name, self.HashFile(file_path),
+                         hashlib.sha256(salt.encode('utf-8')).hexdigest())
+
+  def GetCachedPayloads(self, key):
+    """Returns the cached payloads of a source key, or None.
+
+    Payloads are only returned if all their resources still exist.
+    """
+    with self._lock:
+      entry = self.index['payloads'].get(key)
+      if not entry:
+        return None
+      for res_name in entry['resources']:
+        if not os.path.exists(os.path.join(self.resources_dir, res_name)):
+          del self.index['payloads'][key]
+          return None
+      return json.loads(json.dumps(entry['payloads']))
+
+  def CachePayloads(self, key, payloads, res_names):
+    """Caches payloads generated from a source.
+
+    Args:
+      key: The source key from GetSourceKey.
+      payloads: The JSON dictionary generated by cros_payload.
+      res_names: Resources the payloads refer to.
+    """
+    with self._lock:
+      self.index['payloads'][key] = {'payloads': payloads,
+                                     'resources': sorted(res_names)}
+      self._SaveIndex()
+
+  def CollectGarbage(self, active_payload_configs, get_files, keep):
+    """Removes resources not referenced by active payload configs.
+
+    Only payload configs which were not active at the last collection are
+    read.  Reference counts of resources are updated incrementally.
+
+    Args:
+      active_payload_configs: Names of payload configs of all bundles.
+      get_files: A function which returns the resource names referenced by a
+          payload config.
+      keep: A function which returns True for a resource name that must not
+          be removed even if not referenced.
+
+    Returns:
+      A tuple of (names of removed resources, bytes freed).
+    """
+    with self._lock:
+      index = self.index
+      refcounts = index['refcounts']
+      active = set(active_payload_configs)
+      for name in set(index['payload_configs']) - active:
+        for res_name in index['payload_configs'].pop(name):
+          refcounts[res_name] -= 1
+          if refcounts[res_name] <= 0:
+            del refcounts[res_name]
+      for name in active - set(index['payload_configs']):
+        files = sorted(set(get_files(name)))
+        index['payload_configs'][name] = files
+        for res_name in files:
+          refcounts[res_name] = refcounts.get(res_name, 0) + 1
+
+      # Files put into the resources directory by other means are collected
+      # as well.
+      for res_name in self._ListResources():
+        index['resources'].setdefault(res_name, {'digest': None})
+
+      deleted_files = []
+      deleted_size = 0
+      for res_name in sorted(index['resources']):
+        if res_name in refcounts or keep(res_name):
+          continue
+        path = os.path.join(self.resources_dir, res_name)
+        try:
+          stat = os.stat(path)
+          os.unlink(path)
+        except OSError as e:
+          if e.errno != errno.ENOENT:
+            raise
+        else:
+          deleted_files.append(res_name)
+          # Blocks of hard linked resources are freed with the last link.
+          if stat.st_nlink == 1:
+            deleted_size += stat.st_size
+        del index['resources'][res_name]
+
+      deleted = set(deleted_files)
+      for key, entry in list(index['payloads'].items()):
+        if deleted.intersection(entry['resources']):
+          del index['payloads'][key]
+      self._SaveIndex()
+      return deleted_files, deleted_size
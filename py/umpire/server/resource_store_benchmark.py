@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for importing bundles into the Umpire resource store.
+
+Creates a bundle of random component files, and imports it three times: cold,
+again unchanged, and with one component changed.  Each component is turned into
+a resource by gzip, like cros_payload does for most payload types.  The legacy
+import (always generate the resource, then compare and copy it into the
+resources directory) is compared against ResourceStore, which skips generating
+resources of components imported before.
+
+Example:
+
+  resource_store_benchmark.py --components 8 --size 256
+"""
+
+import argparse
+import filecmp
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from cros.factory.umpire.server import resource_store
+from cros.factory.utils import file_utils
+
+
+def _Generate(src_path, temp_dir):
+  """Generates the resource of a component, and returns its path and name."""
+  name = os.path.basename(src_path)
+  path = os.path.join(temp_dir, name + '.gz')
+  with open(path, 'wb') as f:
+    subprocess.check_call(['gzip', '-1', '-c', src_path], stdout=f)
+  return path, '%s.%s.gz' % (name, file_utils.MD5InHex(path))
+
+
+def LegacyImport(bundle_dir, resources_dir, temp_dir):
+  for name in sorted(os.listdir(bundle_dir)):
+    path, res_name = _Generate(os.path.join(bundle_dir, name), temp_dir)
+    dst_path = os.path.join(resources_dir, res_name)
+    if os.path.exists(dst_path):
+      if not filecmp.cmp(path, dst_path, shallow=False):
+        raise ValueError('Hash collision')
+      os.unlink(path)
+    else:
+      shutil.copy(path, dst_path)
+      os.unlink(path)
+
+
+def StoreImport(bundle_dir, store, temp_dir):
+  for name in sorted(os.listdir(bundle_dir)):
+    src_path = os.path.join(bundle_dir, name)
+    key = store.GetSourceKey(src_path, 'component')
+    if store.GetCachedPayloads(key) is not None:
+      continue
+    path, res_name = _Generate(src_path, temp_dir)
+    store.AddFile(path, res_name, True)
+    store.CachePayloads(key, {'file': res_name}, [res_name])
+
+
+def _DiskUsage(path):
+  inodes = {}
+  for name in os.listdir(path):
+    stat = os.stat(os.path.join(path, name))
+    inodes[stat.st_ino] = stat.st_blocks * 512
+  return sum(inodes.values())
+
+
+def _CreateComponent(path, size, seed):
+  # Random bytes repeated, so gzip has some work to do.
+  block = hashlib.sha256(seed.encode('utf-8')).digest() * 128 + os.urandom(
+      4096)
+  with open(path, 'wb') as f:
+    for unused_i in range(size // len(block) + 1):
+      f.write(block)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--components', type=int, default=8,
+                      help='Number of components in the bundle.')
+  parser.add_argument('--size', type=int, default=64,
+                      help='Size of each component in MB.')
+  args = parser.parse_args()
+
+  tmp_dir = tempfile.mkdtemp(prefix='resource_store_benchmark_')
+  try:
+    bundle_dir = os.path.join(tmp_dir, 'bundle')
+    os.mkdir(bundle_dir)
+    for i in range(args.components):
+      _CreateComponent(os.path.join(bundle_dir, 'component%d' % i),
+                       args.size << 20, str(i))
+
+    for method in ('legacy', 'store'):
+      resources_dir = os.path.join(tmp_dir, method, 'resources')
+      temp_dir = os.path.join(tmp_dir, method, 'temp')
+      os.makedirs(resources_dir)
+      os.makedirs(temp_dir)
+      store = resource_store.ResourceStore(
+          resources_dir, os.path.join(tmp_dir, method, 'index.json'))
+      for step in ('cold', 'unchanged', 'one changed'):
+        if step == 'one changed':
+          _CreateComponent(os.path.join(bundle_dir, 'component0'),
+                           args.size << 20, 'changed')
+        start_time = time.time()
+        if method == 'legacy':
+          LegacyImport(bundle_dir, resources_dir, temp_dir)
+        else:
+          StoreImport(bundle_dir, store, temp_dir)
+        print('%-8s %-12s %8.2fs %8.1f MB on disk' % (
+            method, step, time.time() - start_time,
+            _DiskUsage(resources_dir) / 2 ** 20))
+      # Restore the bundle for the next method.
+      _CreateComponent(os.path.join(bundle_dir, 'component0'),
+                       args.size << 20, '0')
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cros.factory.umpire import common
+from cros.factory.umpire.server import resource_store
+from cros.factory.utils import file_utils
+
+
+class ResourceStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.resources_dir = os.path.join(self.temp_dir, 'resources')
+    self.index_path = os.path.join(self.temp_dir, 'umpire_data', 'index.json')
+    os.mkdir(self.resources_dir)
+    self.store = resource_store.ResourceStore(self.resources_dir,
+                                              self.index_path)
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def _CreateFile(self, name, content):
+    path = os.path.join(self.temp_dir, name)
+    if isinstance(content, str):
+      content = content.encode('utf-8')
+    file_utils.WriteFile(path, content, encoding=None)
+    return path
+
+  def _ResourcePath(self, name):
+    return os.path.join(self.resources_dir, name)
+
+  def _ReopenStore(self):
+    self.store = resource_store.ResourceStore(self.resources_dir,
+                                              self.index_path)
+
+  def testHashFile(self):
+    content = os.urandom(1000)
+    path = self._CreateFile('src', content)
+    with mock.patch.object(resource_store, '_CHUNK_SIZE', 300):
+      md5 = hashlib.md5()
+      digest = self.store.HashFile(path, extra_hash=md5)
+    chunk_hashes = b''.join(hashlib.sha256(content[i:i + 300]).digest()
+                            for i in range(0, 1000, 300))
+    self.assertEqual(hashlib.sha256(chunk_hashes).hexdigest(), digest)
+    self.assertEqual(hashlib.md5(content).hexdigest(), md5.hexdigest())
+
+  def testAddFileWithHashedName(self):
+    src = self._CreateFile('src', 'config')
+    res_name = self.store.AddFileWithHashedName(src, 'conf.{}.json'.format)
+    self.assertEqual('conf.%s.json' % file_utils.MD5InHex(src), res_name)
+    self.assertEqual('config',
+                     file_utils.ReadFile(self._ResourcePath(res_name)))
+    self.assertTrue(os.path.exists(src))
+    self.assertEqual([res_name], os.listdir(self.resources_dir))
+
+  def testAddFileExisting(self):
+    self.store.AddFile(self._CreateFile('a', 'data'), 'res', False)
+    self.store.AddFile(self._CreateFile('b', 'data'), 'res', True)
+    self.assertFalse(os.path.exists(os.path.join(self.temp_dir, 'b')))
+
+    self._ReopenStore()
+    with self.assertRaisesRegex(common.UmpireError, 'Hash collision'):
+      self.store.AddFile(self._CreateFile('c', 'other'), 'res', True)
+    self.assertEqual(['res'], os.listdir(self.resources_dir))
+
+  def testAddFileDeduplicated(self):
+    self.store.AddFile(self._CreateFile('a', 'data'), 'res1', True)
+    self.store.AddFile(self._CreateFile('b', 'data'), 'res2', True)
+    self.assertTrue(os.path.samefile(self._ResourcePath('res1'),
+                                     self._ResourcePath('res2')))
+
+  def testCachedPayloads(self):
+    src = self._CreateFile('src', 'image')
+    key = self.store.GetSourceKey(src, 'release_image', 'v1')
+    self.assertNotEqual(key, self.store.GetSourceKey(src, 'test_image', 'v1'))
+    self.assertNotEqual(key,
+                        self.store.GetSourceKey(src, 'release_image', 'v2'))
+    self.assertIsNone(self.store.GetCachedPayloads(key))
+
+    payloads = {'release_image': {'part1': 'res1', 'version': '1'}}
+    self.store.AddFile(self._CreateFile('p1', 'part1'), 'res1', True)
+    self.store.CachePayloads(key, payloads, ['res1'])
+    self._ReopenStore()
+    self.assertEqual(payloads, self.store.GetCachedPayloads(key))
+
+    os.unlink(self._ResourcePath('res1'))
+    self.assertIsNone(self.store.GetCachedPayloads(key))
+
+  def testCollectGarbage(self):
+    for name in ('res1', 'res2', 'res3', 'config'):
+      self.store.AddFile(self._CreateFile(name, name), name, True)
+    # Put by other means.
+    file_utils.WriteFile(self._ResourcePath('res4'), 'res4')
+    self.store.CachePayloads('key', {}, ['res3'])
+    payload_configs = {'payloads1': ['res1', 'res2'], 'payloads2': ['res2']}
+    get_files = mock.Mock(side_effect=payload_configs.get)
+    keep = lambda name: name == 'config'
+
+    self.assertEqual(
+        (['res3', 'res4'], 8),
+        self.store.CollectGarbage(['payloads1', 'payloads2'], get_files, keep))
+    self.assertEqual(['config', 'res1', 'res2'],
+                     sorted(os.listdir(self.resources_dir)))
+    self.assertIsNone(self.store.GetCachedPayloads('key'))
+    self.assertEqual(2, get_files.call_count)
+
+    # Only payload configs that were not active are read.
+    self._ReopenStore()
+    self.assertEqual(
+        (['res1'], 4),
+        self.store.CollectGarbage(['payloads2'], get_files, keep))
+    self.assertEqual(2, get_files.call_count)
+    self.assertEqual(['config', 'res2'], sorted(os.listdir(self.resources_dir)))
+
+  def testCollectGarbageHardLinks(self):
+    self.store.AddFile(self._CreateFile('a', 'data'), 'res1', True)
+    self.store.AddFile(self._CreateFile('b', 'data'), 'res2', True)
+    get_files = {'payloads1': ['res1']}.get
+    self.assertEqual((['res2'], 0),
+                     self.store.CollectGarbage(['payloads1'], get_files,
+                                               lambda unused_name: False))
+    self.assertEqual((['res1'], 4),
+                     self.store.CollectGarbage([], get_files,
+                                               lambda unused_name: False))
+
+
+if __name__ == '__main__':
+  unittest.main()
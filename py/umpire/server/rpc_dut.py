@@ -6,6 +6,7 @@
 
 import csv
 import glob
+import io
 import os
 import shutil
 import tarfile
@@ -18,6 +19,7 @@ from twisted.web import xmlrpc as twisted_xmlrpc
 from cros.factory.umpire import common
 from cros.factory.umpire.server import umpire_env
 from cros.factory.umpire.server import umpire_rpc
+from cros.factory.umpire.server import upload_store
 from cros.factory.umpire.server import utils
 from cros.factory.utils import file_utils
 from cros.factory.utils import webservice_utils
@@ -259,8 +261,18 @@ class LogDUTCommands(umpire_rpc.UmpireRPC):
 
   RPC URL:
     http://umpire_server_address:umpire_port/umpire
+
+  Args:
+    daemon: UmpireDaemon object.
+    uploads: The UploadStore to append the uploads, shared with the upload web
+        application, or None to create one.
   """
 
+  def __init__(self, daemon, uploads=None):
+    super(LogDUTCommands, self).__init__(daemon)
+    self._uploads = uploads or upload_store.UploadStore(
+        self.env.umpire_data_dir)
+
   def _ReturnTrue(self, result):
     """Returns true."""
     del result  # Unused.
@@ -290,17 +302,18 @@ class LogDUTCommands(umpire_rpc.UmpireRPC):
       upload_type: one of LogRPCCommand.LOG_TYPES.
       file_name: full basename of log file.
       content: binary data.
-      mode: open file mode. 'wb' to write binary file, 'a' to append file.
+      mode: open file mode. 'wb' to write binary file, 'ab' to append file.
     """
+    save_path = self._uploads.GetPath(upload_type, file_name, self._Now())
+    if mode == 'ab':
+      # Append in place, instead of copying the whole file for each chunk.
+      self._uploads.Append(save_path, io.BytesIO(content))
+      return
     with file_utils.UnopenedTemporaryFile() as temp_path:
       # To support paths in file_name, the save_dir will be splitted after
       # concatenate to full save_path.
-      save_path = os.path.join(self.env.umpire_data_dir, upload_type,
-                               time.strftime('%Y%m%d', self._Now()), file_name)
       save_dir = os.path.dirname(os.path.abspath(save_path))
       file_utils.TryMakeDirs(save_dir)
-      if mode == 'ab' and os.path.isfile(save_path):
-        shutil.copy2(save_path, temp_path)
       with open(temp_path, mode) as f:
         f.write(content)
       # Do not use os.rename() to move file. os.rename() behavior is OS
@@ -19,7 +19,7 @@ from cros.factory.umpire import common
 from cros.factory.umpire.server.commands import parameters
 from cros.factory.umpire.server import config
 from cros.factory.umpire.server import resource
-from cros.factory.umpire.server import utils
+from cros.factory.umpire.server import resource_store
 from cros.factory.utils import file_utils
 from cros.factory.utils import net_utils
 from cros.factory.utils import process_utils
@@ -48,6 +48,7 @@ _CONFIG_DIR = 'conf'
 _LOG_DIR = 'log'
 _PID_DIR = 'run'
 _TEMP_DIR = 'temp'
+_RESOURCE_INDEX_FILE = 'resource_index.json'
 _WEBAPP_PORT_OFFSET = 1
 _CLI_PORT_OFFSET = 2
 _RPC_PORT_OFFSET = 3
@@ -82,6 +83,8 @@ class UmpireEnv:
     self.server_toolkit_dir = os.path.join(root_dir, DEFAULT_SERVER_DIR)
     self.config_path = None
     self.config = None
+    self._resource_store = None
+    self._cros_payload_hash = None
 
   @property
   def resources_dir(self):
@@ -111,6 +114,15 @@ class UmpireEnv:
   def umpire_data_dir(self):
     return os.path.join(self.base_dir, _UMPIRE_DATA_DIR)
 
+  @property
+  def resource_store(self):
+    if (self._resource_store is None or
+        self._resource_store.resources_dir != self.resources_dir):
+      self._resource_store = resource_store.ResourceStore(
+          self.resources_dir,
+          os.path.join(self.umpire_data_dir, _RESOURCE_INDEX_FILE))
+    return self._resource_store
+
   @property
   def active_config_file(self):
     return os.path.join(self.base_dir, _ACTIVE_UMPIRE_CONFIG)
@@ -242,12 +254,22 @@ class UmpireEnv:
                                base=self.base_dir)
 
   def _AddResource(self, src_path, res_name, use_move):
-    dst_path = os.path.join(self.resources_dir, res_name)
-    utils.CheckAndMoveFile(src_path, dst_path, use_move)
+    self.resource_store.AddFile(src_path, res_name, use_move)
+
+  def _GetCrosPayloadHash(self):
+    """Returns the hash of cros_payload, which generated payloads depend on."""
+    if self._cros_payload_hash is None:
+      self._cros_payload_hash = file_utils.MD5InHex(
+          os.path.realpath(CROS_PAYLOAD))
+    return self._cros_payload_hash
 
   def AddPayload(self, file_path, type_name):
     """Adds a cros_payload component into <base_dir>/resources.
 
+    If the same file was added as the same type before and its resources still
+    exist, the payloads generated then are returned without running
+    cros_payload again.
+
     Args:
       file_path: file to be added.
       type_name: An element of resource.PayloadTypeNames.
@@ -255,6 +277,14 @@ class UmpireEnv:
     Returns:
       The json dictionary generated by cros_payload.
     """
+    store = self.resource_store
+    source_key = store.GetSourceKey(file_path, type_name,
+                                    self._GetCrosPayloadHash())
+    payloads = store.GetCachedPayloads(source_key)
+    if payloads is not None:
+      logging.info('Reuse resources of %s imported before', file_path)
+      return payloads
+
     with file_utils.TempDirectory(dir=self.temp_dir) as temp_dir:
       json_name = '.json'
       json_path = os.path.join(temp_dir, json_name)
@@ -272,9 +302,11 @@ class UmpireEnv:
             'Cannot identify version information from <%s> payload.' %
             type_name)
 
-      for filename in os.listdir(temp_dir):
+      res_names = os.listdir(temp_dir)
+      for filename in res_names:
         self._AddResource(os.path.join(temp_dir, filename), filename, True)
 
+    store.CachePayloads(source_key, payloads, res_names)
     return payloads
 
   def AddConfig(self, file_path, type_name):
@@ -288,9 +320,9 @@ class UmpireEnv:
       Resource file name.
     """
     file_utils.CheckPath(file_path, 'source')
-    res_name = resource.BuildConfigFileName(type_name, file_path)
-    self._AddResource(file_path, res_name, False)
-    return res_name
+    return self.resource_store.AddFileWithHashedName(
+        file_path,
+        lambda md5: resource.BuildConfigFileNameFromHash(type_name, md5))
 
   def AddConfigFromBlob(self, blob, type_name):
     """Adds a config file into <base_dir>/resources.
@@ -356,22 +388,14 @@ class UmpireEnv:
     """Remove inactive resources.
 
     Remove resource files that are not used by any bundles in active config.
+    Only payload configs of bundles added since the last collection are read.
     """
-    active_files = set()
-
-    for bundle in self.config['bundles']:
-      for unused_type, unused_part, res_name in self.GetPayloadFiles(
-          bundle['payloads']):
-        active_files.add(res_name)
-
-    deleted_files = []
-    deleted_size = 0
-    for f in os.listdir(self.resources_dir):
-      if not resource.IsConfigFileName(f) and f not in active_files:
-        deleted_files.append(f)
-        f_path = os.path.join(self.resources_dir, f)
-        deleted_size += os.path.getsize(f_path)
-        os.unlink(f_path)
+    deleted_files, deleted_size = self.resource_store.CollectGarbage(
+        [bundle['payloads'] for bundle in self.config['bundles']],
+        lambda payloads_name: [
+            res_name for unused_type, unused_part, res_name
+            in self.GetPayloadFiles(payloads_name)],
+        resource.IsConfigFileName)
     # XML-RPC does not support 64-bits integer so we need to convert
     # deleted_size to string.
     return {
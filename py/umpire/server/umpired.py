@@ -15,9 +15,11 @@ from cros.factory.umpire.server import migrate
 from cros.factory.umpire.server import rpc_cli
 from cros.factory.umpire.server import rpc_dut
 from cros.factory.umpire.server import umpire_env
+from cros.factory.umpire.server import upload_store
 from cros.factory.umpire.server import utils
 from cros.factory.umpire.server import webapp_download_slots
 from cros.factory.umpire.server import webapp_resourcemap
+from cros.factory.umpire.server import webapp_upload
 
 
 def StartServer():
@@ -45,14 +47,20 @@ def StartServer():
   # TODO(hungte) Change shopfloor service to a real Umpire service.
   # Add Shopfloor Service RPC handlers
   umpired.AddMethodForDUT(rpc_dut.ShopfloorServiceDUTCommands(umpired))
-  # Add log RPC handlers.
-  umpired.AddMethodForDUT(rpc_dut.LogDUTCommands(umpired))
+  # Add log RPC handlers, which share the uploaded files with the upload web
+  # application.
+  uploads = upload_store.UploadStore(env.umpire_data_dir)
+  umpired.AddMethodForDUT(rpc_dut.LogDUTCommands(umpired, uploads))
   # Add web applications.
   umpired.AddWebApp(
       webapp_resourcemap.PATH_INFO, webapp_resourcemap.ResourceMapApp(env))
+  download_slots_app = webapp_download_slots.DownloadSlotsApp(env)
+  umpired.AddWebApp(webapp_download_slots.PATH_INFO, download_slots_app)
   umpired.AddWebApp(
-      webapp_download_slots.PATH_INFO,
-      webapp_download_slots.DownloadSlotsApp())
+      webapp_download_slots.METRICS_PATH_INFO,
+      webapp_download_slots.DownloadSlotsMetricsApp(download_slots_app))
+  umpired.AddWebApp(
+      webapp_upload.PATH_INFO, webapp_upload.UploadApp(env, uploads))
   # Start listening to command port and webapp port.
   umpired.Run()
 
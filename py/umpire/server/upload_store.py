@@ -0,0 +1,225 @@
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Store of files uploaded by DUTs.
+
+DUTs upload logs to <umpire_data>/<upload_type>/<YYYYMMDD>/<file_name>, either
+by appending chunks (like event logs), or by uploading whole files (like
+reports).  A whole file can also be uploaded by chunks, which are appended to
+<umpire_data>/<upload_type>/.partial/<file_name>, and the partial file is moved
+to the directory of the day when it's complete.
+
+Chunks are appended to the files in place, and each chunk may come with the
+offset of it in the file, so a DUT can resume an upload after a failure, and
+a chunk sent twice is only stored once.  Chunks to the same file are written
+one after another, and the files being appended are kept open, at most
+`max_open_files` of them, so the file descriptors are bounded no matter how
+many DUTs are uploading.
+"""
+
+import collections
+import contextlib
+import os
+import threading
+import time
+
+from cros.factory.umpire import common
+from cros.factory.utils import file_utils
+
+
+_MAX_OPEN_FILES = 256
+_BLOCK_SIZE = 64 * 1024
+PARTIAL_DIR = '.partial'
+
+
+class OffsetError(common.UmpireError):
+  """The offset of a chunk is beyond the end of the file.
+
+  Properties:
+    size: The size of the file.
+  """
+
+  def __init__(self, path, offset, size):
+    super(OffsetError, self).__init__(
+        'Offset %d is beyond the size %d of %s' % (offset, size, path))
+    self.size = size
+
+
+class _OpenFile:
+  """A file opened for appending, with the number of its users."""
+
+  def __init__(self, path):
+    self.file = open(path, 'ab')
+    # Other users should be able to read the uploaded files.
+    os.fchmod(self.file.fileno(), 0o644)
+    self.users = 0
+    self.evicted = False
+
+
+class UploadStore:
+  """Saves the files uploaded by DUTs.
+
+  The methods are thread-safe.
+
+  Args:
+    data_dir: The directory to save the files, usually umpire_data_dir.
+    max_open_files: Maximum number of files kept open for appending.
+  """
+
+  def __init__(self, data_dir, max_open_files=_MAX_OPEN_FILES):
+    self._data_dir = data_dir
+    self._max_open_files = max_open_files
+    # Protects _open_files and _path_locks.
+    self._lock = threading.Lock()
+    # Files kept open, in the order of the last use.
+    self._open_files = collections.OrderedDict()
+    # A dict which maps a path to a pair of its lock and the number of users.
+    self._path_locks = {}
+
+  def GetPath(self, upload_type, file_name, now=None):
+    """Returns the path to save an uploaded file.
+
+    Args:
+      upload_type: The type of the upload, for example 'eventlog'.
+      file_name: The name of the file, which may contain directories.
+      now: The time tuple of the day, defaults to the current UTC time.
+    """
+    return os.path.join(self._data_dir, upload_type,
+                        time.strftime('%Y%m%d', now or time.gmtime()),
+                        file_name)
+
+  def GetPartialPath(self, upload_type, file_name):
+    """Returns the path to save a file being uploaded by chunks."""
+    return os.path.join(self._data_dir, upload_type, PARTIAL_DIR, file_name)
+
+  def GetSize(self, path):
+    """Returns the size of a file, or 0 if it doesn't exist."""
+    with self._LockPath(path):
+      try:
+        return os.path.getsize(path)
+      except OSError:
+        return 0
+
+  def Append(self, path, stream, length=None, offset=None):
+    """Appends the data read from a stream to a file.
+
+    Args:
+      path: The path of the file, created if it doesn't exist.
+      stream: A file-like object to read the data.
+      length: Number of bytes to read, or None to read until EOF.
+      offset: The offset of the data in the file, or None to append the data
+          to the end of the file.  The data before the end of the file are
+          assumed to be the same as those in the file, and are skipped.
+
+    Returns:
+      The size of the file after appending.
+
+    Raises:
+      OffsetError if offset is beyond the end of the file.
+    """
+    with self._LockPath(path):
+      with self._OpenForAppend(path) as f:
+        size = os.fstat(f.fileno()).st_size
+        if offset is not None and offset > size:
+          raise OffsetError(path, offset, size)
+        skip = size - offset if offset is not None else 0
+        try:
+          while length is None or length > 0:
+            data = stream.read(_BLOCK_SIZE if length is None else
+                               min(_BLOCK_SIZE, length))
+            if not data:
+              break
+            if length is not None:
+              length -= len(data)
+            if skip:
+              skipped = min(skip, len(data))
+              data = data[skipped:]
+              skip -= skipped
+            f.write(data)
+            size += len(data)
+        finally:
+          f.flush()
+        return size
+
+  def Commit(self, partial_path, path):
+    """Moves a completely uploaded file to its final path.
+
+    Returns:
+      The size of the file.
+    """
+    with self._LockPath(partial_path):
+      self._Close(partial_path)
+      file_utils.TryMakeDirs(os.path.dirname(path))
+      os.replace(partial_path, path)
+      return os.path.getsize(path)
+
+  def Close(self):
+    """Closes all the open files."""
+    with self._lock:
+      open_files = list(self._open_files.values())
+      self._open_files.clear()
+      for open_file in open_files:
+        open_file.evicted = True
+    for open_file in open_files:
+      self._Release(open_file, 0)
+
+  @contextlib.contextmanager
+  def _LockPath(self, path):
+    """Locks a path, so at most one thread is using the file."""
+    with self._lock:
+      path_lock = self._path_locks.setdefault(path, [threading.Lock(), 0])
+      path_lock[1] += 1
+    try:
+      with path_lock[0]:
+        yield
+    finally:
+      with self._lock:
+        path_lock[1] -= 1
+        if not path_lock[1]:
+          del self._path_locks[path]
+
+  @contextlib.contextmanager
+  def _OpenForAppend(self, path):
+    """Gets the open file of a path, which must be locked by the caller."""
+    with self._lock:
+      open_file = self._open_files.pop(path, None)
+    if open_file is None:
+      file_utils.TryMakeDirs(os.path.dirname(path))
+      open_file = _OpenFile(path)
+
+    evicted_files = []
+    with self._lock:
+      self._open_files[path] = open_file
+      open_file.users += 1
+      while len(self._open_files) > self._max_open_files:
+        unused_path, evicted_file = self._open_files.popitem(last=False)
+        evicted_file.evicted = True
+        evicted_files.append(evicted_file)
+    # The evicted files are closed when they are not used by other threads.
+    for evicted_file in evicted_files:
+      self._Release(evicted_file, 0)
+    try:
+      yield open_file.file
+    finally:
+      self._Release(open_file, 1)
+
+  def _Release(self, open_file, users):
+    """Releases the users of an open file, and closes it if it's evicted."""
+    with self._lock:
+      open_file.users -= users
+      should_close = open_file.evicted and not open_file.users
+      if should_close:
+        # Only close once.
+        open_file.evicted = False
+    if should_close:
+      open_file.file.close()
+
+  def _Close(self, path):
+    """Closes the open file of a path, which must be locked by the caller."""
+    with self._lock:
+      open_file = self._open_files.pop(path, None)
+      if open_file is None:
+        return
+      open_file.evicted = True
+    self._Release(open_file, 0)
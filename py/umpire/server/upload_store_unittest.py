@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import io
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+from cros.factory.umpire.server import upload_store
+from cros.factory.utils import file_utils
+
+
+class UploadStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.store = upload_store.UploadStore(self.temp_dir, max_open_files=2)
+
+  def tearDown(self):
+    self.store.Close()
+    shutil.rmtree(self.temp_dir)
+
+  def _Append(self, path, data, **kwargs):
+    return self.store.Append(path, io.BytesIO(data), **kwargs)
+
+  def _ReadFile(self, path):
+    return file_utils.ReadFile(path, encoding=None)
+
+  def testGetPath(self):
+    now = time.strptime('20200102', '%Y%m%d')
+    self.assertEqual(os.path.join(self.temp_dir, 'report', '20200102', 'a/b'),
+                     self.store.GetPath('report', 'a/b', now))
+    self.assertEqual(os.path.join(self.temp_dir, 'report', '.partial', 'a/b'),
+                     self.store.GetPartialPath('report', 'a/b'))
+
+  def testAppend(self):
+    path = os.path.join(self.temp_dir, 'a', 'b')
+    self.assertEqual(0, self.store.GetSize(path))
+    self.assertEqual(3, self._Append(path, b'123'))
+    self.assertEqual(6, self._Append(path, b'456'))
+    self.assertEqual(b'123456', self._ReadFile(path))
+    self.assertEqual(6, self.store.GetSize(path))
+    self.assertEqual(0o644, stat.S_IMODE(os.stat(path).st_mode))
+
+  def testAppendLength(self):
+    path = os.path.join(self.temp_dir, 'a')
+    self.assertEqual(2, self._Append(path, b'123', length=2))
+    self.assertEqual(b'12', self._ReadFile(path))
+
+  def testAppendOffset(self):
+    path = os.path.join(self.temp_dir, 'a')
+    self._Append(path, b'123', offset=0)
+    # The data already in the file are skipped.
+    self.assertEqual(5, self._Append(path, b'2345', offset=1))
+    self.assertEqual(5, self._Append(path, b'45', offset=3))
+    self.assertEqual(b'12345', self._ReadFile(path))
+
+    with self.assertRaises(upload_store.OffsetError) as cm:
+      self._Append(path, b'7', offset=6)
+    self.assertEqual(5, cm.exception.size)
+    self.assertEqual(b'12345', self._ReadFile(path))
+
+  def testMaxOpenFiles(self):
+    paths = [os.path.join(self.temp_dir, str(i)) for i in range(5)]
+    for unused_i in range(2):
+      for path in paths:
+        self._Append(path, b'x')
+    # pylint: disable=protected-access
+    self.assertEqual(paths[-2:], list(self.store._open_files))
+    for path in paths:
+      self.assertEqual(b'xx', self._ReadFile(path))
+
+  def testCommit(self):
+    partial_path = self.store.GetPartialPath('report', 'a')
+    path = self.store.GetPath('report', 'a')
+    self._Append(partial_path, b'123')
+    self.assertEqual(3, self.store.Commit(partial_path, path))
+    self.assertFalse(os.path.exists(partial_path))
+    self.assertEqual(b'123', self._ReadFile(path))
+
+    # The file can be uploaded again.
+    self._Append(partial_path, b'4')
+    self.assertEqual(1, self.store.Commit(partial_path, path))
+    self.assertEqual(b'4', self._ReadFile(path))
+
+  def testConcurrentAppend(self):
+    path = os.path.join(self.temp_dir, 'a')
+    data = [bytes([ord('a') + i]) * 100000 for i in range(8)]
+    threads = [threading.Thread(target=self._Append, args=(path, d))
+               for d in data]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    content = self._ReadFile(path)
+    self.assertEqual(sorted(data),
+                     sorted(content[i:i + 100000]
+                            for i in range(0, len(content), 100000)))
+
+
+if __name__ == '__main__':
+  unittest.main()
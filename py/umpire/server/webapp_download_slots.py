@@ -5,9 +5,11 @@
 """Umpire download slots web application.
 
 The class handles 'http://umpire_address:umpire_port/webapps/download_slots'
-HTTP GET.
+HTTP GET, and '/webapps/download_slots/metrics' returns the status of slots and
+the wait queue in JSON.
 """
 
+import json
 import logging
 
 from cros.factory.umpire.server import download_slots_manager
@@ -16,20 +18,45 @@ from cros.factory.umpire.server import webapp_utils
 
 
 PATH_INFO = '/webapps/download_slots'
+METRICS_PATH_INFO = '/webapps/download_slots/metrics'
 
 
 class DownloadSlotsApp(wsgi.WebApp):
-  """Download slots web application class."""
+  """Download slots web application class.
 
-  def __init__(self):
-    self._manager = download_slots_manager.DownloadSlotsManager()
+  Args:
+    env: UmpireEnv object.  The manager is configured by 'download_slots' in
+        the active config.
+  """
+
+  def __init__(self, env):
+    self._env = env
+    self.manager = download_slots_manager.DownloadSlotsManager()
 
   def Handle(self, session):
     """Gets resource map from DUT info and return text/plain result."""
     logging.debug('download_slots app: %s', session)
     if session.REQUEST_METHOD == 'GET':
+      self.manager.Configure((self._env.config or {}).get('download_slots', {}))
       dut_info = webapp_utils.ParseDUTHeader(session.HTTP_X_UMPIRE_DUT)
-      result = self._manager.ProcessSlotRequest(dut_info)
+      result = self.manager.ProcessSlotRequest(dut_info)
       if result:
         return session.Respond(result)
     return session.BadRequest400()
+
+
+class DownloadSlotsMetricsApp(wsgi.WebApp):
+  """Download slots metrics web application class.
+
+  Args:
+    download_slots_app: The DownloadSlotsApp to report.
+  """
+
+  def __init__(self, download_slots_app):
+    self._manager = download_slots_app.manager
+
+  def Handle(self, session):
+    if session.REQUEST_METHOD == 'GET':
+      return session.Respond(json.dumps(self._manager.GetMetrics()),
+                             content_type='application/json')
+    return session.BadRequest400()
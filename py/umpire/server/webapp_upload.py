@@ -0,0 +1,134 @@
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Umpire upload web application.
+
+The class handles 'http://umpire_address:umpire_port/webapps/upload', which
+saves the files uploaded by DUTs as raw HTTP bodies, instead of the base64
+encoded blobs of the XML-RPC calls like UploadReport.
+
+The file is specified by the query string:
+
+  type: The upload type, one of UPLOAD_TYPES.
+  name: The file name, which may contain directories.
+  offset: (Optional) The offset of the body in the file.  If the server already
+      has the data at the offset, the duplicated part is skipped, so an upload
+      can be resumed by sending the data again from any offset not beyond the
+      size of the file.
+  complete: (Optional) For types other than 'eventlog', '1' if this is the last
+      chunk of the file.
+
+Event logs are appended to <umpire_data>/eventlog/<YYYYMMDD>/<name>.  Other
+files are appended to <umpire_data>/<type>/.partial/<name>, and moved to
+<umpire_data>/<type>/<YYYYMMDD>/<name> when complete.
+
+POST (or PUT) appends the body and returns the size of the file in JSON, for
+example {"size": 1024}.  If the offset is beyond the size of the file, the
+server returns 409 (Conflict) and the size, so the DUT can resume from there.
+GET returns the size of the file, so the DUT can find where to resume.
+"""
+
+import json
+import logging
+import os
+import urllib.parse
+
+from twisted.web import http
+
+from cros.factory.umpire.server import upload_store
+from cros.factory.umpire.server.web import wsgi
+
+
+PATH_INFO = '/webapps/upload'
+
+EVENTLOG = 'eventlog'
+UPLOAD_TYPES = (EVENTLOG, 'report', 'aux_log')
+
+
+class UploadApp(wsgi.WebApp):
+  """Upload web application class.
+
+  Args:
+    env: UmpireEnv object.
+    store: The UploadStore to save the files, or None to create one in the
+        data directory of env.
+  """
+
+  def __init__(self, env, store=None):
+    self._env = env
+    self.store = store or upload_store.UploadStore(env.umpire_data_dir)
+
+  def Handle(self, session):
+    logging.debug('upload app: %s', session)
+    try:
+      args = self._ParseQuery(session.QUERY_STRING)
+    except ValueError as e:
+      logging.warning('upload app: invalid query %r: %s',
+                      session.QUERY_STRING, e)
+      return session.BadRequest400()
+    upload_type, name, offset, complete = args
+
+    if upload_type == EVENTLOG:
+      path = self.store.GetPath(upload_type, name)
+    else:
+      path = self.store.GetPartialPath(upload_type, name)
+
+    if session.REQUEST_METHOD == 'GET':
+      return self._RespondSize(
+          session, self._GetSize(upload_type, name, path))
+
+    if session.REQUEST_METHOD not in ('POST', 'PUT'):
+      return session.MethodNotAllowed405()
+
+    # CONTENT_LENGTH is empty if the request has no Content-Length header.
+    length = int(session.CONTENT_LENGTH) if session.CONTENT_LENGTH else None
+    try:
+      size = self.store.Append(path, session.wsgi_input, length=length,
+                               offset=offset)
+    except upload_store.OffsetError as e:
+      size = e.size or self._GetSize(upload_type, name, path)
+      return self._RespondSize(session, size, code=http.CONFLICT)
+    if complete:
+      size = self.store.Commit(path, self.store.GetPath(upload_type, name))
+    return self._RespondSize(session, size)
+
+  def _ParseQuery(self, query_string):
+    """Parses the query string.
+
+    Returns:
+      A tuple (upload_type, name, offset, complete).
+
+    Raises:
+      ValueError if the query string is invalid.
+    """
+    query = dict(urllib.parse.parse_qsl(query_string, strict_parsing=True))
+    upload_type = query.get('type')
+    if upload_type not in UPLOAD_TYPES:
+      raise ValueError('Unknown upload type %r' % upload_type)
+    name = query.get('name', '')
+    parts = name.split(os.sep)
+    if (os.path.normpath(name) != name or
+        any(part in ('', os.curdir, os.pardir) for part in parts) or
+        parts[0] == upload_store.PARTIAL_DIR):
+      raise ValueError('Invalid file name %r' % name)
+    offset = query.get('offset')
+    if offset is not None:
+      offset = int(offset)
+      if offset < 0:
+        raise ValueError('Negative offset %d' % offset)
+    complete = query.get('complete') == '1'
+    if complete and upload_type == EVENTLOG:
+      raise ValueError('Event logs are never complete')
+    return upload_type, name, offset, complete
+
+  def _GetSize(self, upload_type, name, path):
+    """Returns the size of a file, which may be complete already."""
+    size = self.store.GetSize(path)
+    if not size and upload_type != EVENTLOG:
+      size = self.store.GetSize(self.store.GetPath(upload_type, name))
+    return size
+
+  def _RespondSize(self, session, size, code=http.OK):
+    return session.Respond(json.dumps({'size': size}),
+                           content_type='application/json', code=code)
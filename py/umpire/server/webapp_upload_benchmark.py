@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Load test for appending the files uploaded by DUTs.
+
+--duts DUTs upload their event logs concurrently, each by --chunks chunks of
+--chunk-size bytes, which are appended to one file per DUT:
+
+ - legacy: by copying the file, appending the chunk and moving the file back,
+   like the old LogDUTCommands._SaveUpload.
+ - store: by UploadStore.Append, like LogDUTCommands.UploadEvent now.
+ - http: by POST to the upload web application, served by Twisted with
+   --threads threads like Umpire, with the chunks sent from --duts threads.
+
+The size of each file is checked after each case.
+
+Example:
+
+  webapp_upload_benchmark.py --duts 300 --chunks 50 --chunk-size 8192
+"""
+
+import argparse
+import http.client
+import io
+import json
+import os
+import shutil
+import threading
+import time
+
+from twisted.internet import reactor
+from twisted.web import server
+from twisted.web import wsgi as twisted_wsgi
+
+from cros.factory.umpire.server import upload_store
+from cros.factory.umpire.server import webapp_upload
+from cros.factory.utils import file_utils
+
+
+def _LegacyAppend(path, content):
+  with file_utils.UnopenedTemporaryFile() as temp_path:
+    file_utils.TryMakeDirs(os.path.dirname(path))
+    if os.path.isfile(path):
+      shutil.copy2(path, temp_path)
+    with open(temp_path, 'ab') as f:
+      f.write(content)
+    shutil.move(temp_path, path)
+    os.chmod(path, 0o644)
+
+
+def _RunDUTs(num_duts, upload):
+  """Runs upload(dut_index) in num_duts threads and returns the elapsed time."""
+  threads = [threading.Thread(target=upload, args=(i, ))
+             for i in range(num_duts)]
+  start_time = time.time()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return time.time() - start_time
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--duts', type=int, default=300,
+                      help='Number of DUTs uploading concurrently.')
+  parser.add_argument('--chunks', type=int, default=50,
+                      help='Number of chunks uploaded by each DUT.')
+  parser.add_argument('--chunk-size', type=int, default=8192,
+                      help='Size of each chunk in bytes.')
+  parser.add_argument('--threads', type=int, default=10,
+                      help='Number of threads of the http server.')
+  args = parser.parse_args()
+
+  chunk = b'x' * args.chunk_size
+  expected_size = args.chunks * args.chunk_size
+
+  with file_utils.TempDirectory(prefix='webapp_upload_benchmark_') as tmp_dir:
+    store = upload_store.UploadStore(tmp_dir)
+    app = webapp_upload.UploadApp(None, store)
+    reactor.suggestThreadPoolSize(args.threads)
+    port = reactor.listenTCP(0, server.Site(twisted_wsgi.WSGIResource(
+        reactor, reactor.getThreadPool(), app)), interface='127.0.0.1')
+    reactor_thread = threading.Thread(
+        target=reactor.run, kwargs={'installSignalHandlers': False})
+    reactor_thread.start()
+
+    def _Legacy(dut):
+      path = store.GetPath('legacy', 'dut%d' % dut)
+      for unused_i in range(args.chunks):
+        _LegacyAppend(path, chunk)
+
+    def _Store(dut):
+      path = store.GetPath('store', 'dut%d' % dut)
+      for unused_i in range(args.chunks):
+        store.Append(path, io.BytesIO(chunk))
+
+    retries = []
+
+    def _Http(dut):
+      url = '%s?type=eventlog&name=http/dut%d' % (webapp_upload.PATH_INFO, dut)
+      conn = http.client.HTTPConnection('127.0.0.1', port.getHost().port)
+      offset = 0
+      resume = False
+      while offset < expected_size:
+        try:
+          if resume:
+            # Ask the server where to resume, since the last chunk may or may
+            # not be saved.
+            conn.request('GET', url)
+          else:
+            # Resumed uploads may start in the middle of a chunk.
+            conn.request('POST', '%s&offset=%d' % (url, offset),
+                         chunk[offset % args.chunk_size:])
+          response = conn.getresponse()
+          assert response.status == 200, response.status
+          offset = json.loads(response.read())['size']
+          resume = False
+        except ConnectionError:
+          # The server may drop connections if too many DUTs connect at once,
+          # so connect again and resume like a DUT does.
+          retries.append(dut)
+          conn.close()
+          resume = True
+      conn.close()
+
+    try:
+      print('DUTs: %d, %d bytes each' % (args.duts, expected_size))
+      for name, upload, upload_type, prefix in [
+          ('legacy', _Legacy, 'legacy', ''),
+          ('store', _Store, 'store', ''),
+          ('http', _Http, 'eventlog', 'http/')]:
+        elapsed = _RunDUTs(args.duts, upload)
+        for dut in range(args.duts):
+          path = store.GetPath(upload_type, '%sdut%d' % (prefix, dut))
+          assert os.path.getsize(path) == expected_size, path
+        print('%-8s %8.2f s %10.1f MB/s' % (
+            name, elapsed, args.duts * expected_size / elapsed / 1e6))
+      print('Reconnections in http: %d' % len(retries))
+    finally:
+      reactor.callFromThread(reactor.stop)
+      reactor_thread.join()
+      store.Close()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import glob
+import io
+import json
+import os
+import unittest
+
+from cros.factory.umpire.server import umpire_env
+from cros.factory.umpire.server import webapp_upload
+from cros.factory.umpire.server.web import wsgi
+from cros.factory.utils import file_utils
+
+
+class UploadAppTest(unittest.TestCase):
+
+  def setUp(self):
+    self.env = umpire_env.UmpireEnvForTest()
+    self.app = webapp_upload.UploadApp(self.env)
+    self.status = None
+
+  def tearDown(self):
+    self.app.store.Close()
+    self.env.Close()
+
+  def _Request(self, query, data=None, method=None):
+    """Sends a request to the app, and returns the status and the size."""
+    def _StartResponse(status, unused_headers):
+      self.status = int(status.split()[0])
+
+    environ = {
+        'REQUEST_METHOD': method or ('GET' if data is None else 'POST'),
+        'QUERY_STRING': query,
+        'CONTENT_LENGTH': '' if data is None else str(len(data)),
+        'wsgi.input': io.BytesIO(data or b'')}
+    body = self.app.Handle(wsgi.WSGISession(environ, _StartResponse))
+    size = json.loads(body[0])['size'] if self.status in (200, 409) else None
+    return self.status, size
+
+  def _ReadUploads(self, upload_type):
+    return [file_utils.ReadFile(path, encoding=None) for path in glob.glob(
+        os.path.join(self.env.umpire_data_dir, upload_type, '*', '*'))]
+
+  def testEventLog(self):
+    self.assertEqual((200, 0), self._Request('type=eventlog&name=a'))
+    self.assertEqual((200, 3), self._Request('type=eventlog&name=a', b'123'))
+    self.assertEqual((200, 6), self._Request('type=eventlog&name=a', b'456'))
+    self.assertEqual((200, 6), self._Request('type=eventlog&name=a'))
+    self.assertEqual([b'123456'], self._ReadUploads('eventlog'))
+
+  def testResume(self):
+    self.assertEqual((200, 3), self._Request(
+        'type=report&name=r.tar.xz&offset=0', b'123'))
+    # The DUT didn't get the response, and sends the chunk again.
+    self.assertEqual((200, 3), self._Request(
+        'type=report&name=r.tar.xz&offset=0', b'123'))
+    self.assertEqual((409, 3), self._Request(
+        'type=report&name=r.tar.xz&offset=4', b'56'))
+    self.assertEqual((200, 3), self._Request('type=report&name=r.tar.xz'))
+    self.assertEqual([], self._ReadUploads('report'))
+    self.assertEqual((200, 6), self._Request(
+        'type=report&name=r.tar.xz&offset=3&complete=1', b'456'))
+    self.assertEqual([b'123456'], self._ReadUploads('report'))
+    self.assertEqual((200, 6), self._Request('type=report&name=r.tar.xz'))
+    # The DUT sends the last chunk again after the file is complete.
+    self.assertEqual((409, 6), self._Request(
+        'type=report&name=r.tar.xz&offset=3&complete=1', b'456'))
+    self.assertEqual([b'123456'], self._ReadUploads('report'))
+
+  def testBadRequest(self):
+    for query in ['', 'type=foo&name=a', 'type=report', 'type=report&name=/a',
+                  'type=report&name=.', 'type=report&name=a/.',
+                  'type=report&name=a//b', 'type=report&name=a/',
+                  'type=report&name=../a', 'type=report&name=a/../../b',
+                  'type=report&name=.partial/a', 'type=report&name=a&offset=x',
+                  'type=report&name=a&offset=-1',
+                  'type=eventlog&name=a&complete=1']:
+      self.assertEqual((400, None), self._Request(query, b'1'), query)
+    self.assertEqual((405, None),
+                     self._Request('type=report&name=a', method='DELETE'))
+
+
+if __name__ == '__main__':
+  unittest.main()
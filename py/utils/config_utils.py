@@ -43,8 +43,9 @@ Usage:
 
 import collections
 import collections.abc
+import copy
+import functools
 import glob
-import inspect
 import json
 import logging
 import os
@@ -74,6 +75,13 @@ _CONFIG_NAME_LOGGING = 'Logging'
 # Cache of configuration for config_utils itself.
 _CACHED_CONFIG_UTILS_CONFIG = None
 
+# Cache of configs loaded by LoadConfig, see _CachedConfig.
+_CACHED_CONFIGS = {}
+
+# Cache of compiled schema validators, mapping the path of a schema file to a
+# pair of its signature and the validator.
+_CACHED_SCHEMA_VALIDATORS = {}
+
 # Dummy cache for loop dependency detection.
 _DUMMY_CACHE = object()
 
@@ -226,33 +234,72 @@ def _LoadJsonFile(file_path, logger):
   return None
 
 
-def _LoadRawConfig(config_dir, config_name, logger=_DummyLogger):
+def _GetFileSignature(file_path):
+  """Returns the stat signature of a file, or None if it doesn't exist.
+
+  Files in a python archive (PAR) don't exist on the file system and always
+  have None as their signature, which is fine since a PAR is never updated in
+  place.
+  """
+  try:
+    stat = os.stat(file_path)
+  except OSError:
+    return None
+  return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _LoadRawConfig(config_dir, config_name, logger=_DummyLogger,
+                   signatures=None):
   """Internal function to load JSON config from specified path.
 
+  Args:
+    signatures: If not None, a dict to which the path of the config file is
+        added with its signature before it's loaded.
+
   Returns:
     A configuration object.
   """
   try:
     config_path = os.path.join(config_dir, config_name + CONFIG_FILE_EXT)
     logger('config_utils: Checking %s', config_path)
+    if signatures is not None:
+      signatures[config_path] = _GetFileSignature(config_path)
     return _LoadJsonFile(config_path, logger)
   except _JsonFileInvalidError as e:
     raise ConfigFileInvalidError(e.filename, e.detail)
 
 
-def _LoadRawSchema(config_dir, schema_name, logger=_DummyLogger):
+def _LoadRawSchema(config_dir, schema_name, logger=_DummyLogger,
+                   signatures=None):
   """Internal function to load JSON schema from specified path.
 
+  Args:
+    signatures: See `_LoadRawConfig`.
+
   Returns:
     A schema object.
   """
   try:
     schema_path = os.path.join(config_dir, schema_name + SCHEMA_FILE_EXT)
+    if signatures is not None:
+      signatures[schema_path] = _GetFileSignature(schema_path)
     return _LoadJsonFile(schema_path, logger)
   except _JsonFileInvalidError as e:
     raise SchemaFileInvalidError(e.filename, e.detail)
 
 
+def _GetSchemaValidator(schema_path, signature, schema):
+  """Returns the compiled validator of a schema, or the cached one."""
+  cached = _CACHED_SCHEMA_VALIDATORS.get(schema_path)
+  if cached and cached[0] == signature:
+    return cached[1]
+  validator_cls = jsonschema.validators.validator_for(schema)
+  validator_cls.check_schema(schema)
+  validator = validator_cls(schema)
+  _CACHED_SCHEMA_VALIDATORS[schema_path] = (signature, validator)
+  return validator
+
+
 def _LoadConfigUtilsConfig():
   """Internal function to load the config for config_utils itself."""
   global _CACHED_CONFIG_UTILS_CONFIG  # pylint: disable=global-statement
@@ -375,21 +422,36 @@ def SaveRuntimeConfig(config_name, value):
       pass
 
 
-def _ResolveConfigInfo(config_name, frame, extra_config_dirs):
-  config_dirs = [
-      GetRuntimeConfigDirectory(),
-      GetBuildConfigDirectory(),
-  ]
+@functools.lru_cache(maxsize=None)
+def _GetCallerInfo(module_path, module_file):
+  """Returns the default config name and the config dirs of a caller module.
 
-  module_file = inspect.getframeinfo(frame)[0]
-  # When running as pyc inside ZIP(PAR), getmodule() will fail.
-  default_config_name, caller_dir = GetDefaultConfigInfo(
-      inspect.getmodule(frame), module_file)
+  Args:
+    module_path: `__file__` of the caller module, or None if it's unknown.
+    module_file: the file name of the code of the caller.
+  """
+  # When running as pyc inside ZIP(PAR), `__file__` may be unavailable.
+  path = os.path.realpath(module_path or module_file)
+  default_config_name = os.path.splitext(os.path.basename(path))[0]
+  caller_dir = os.path.dirname(path)
 
   caller_dirs = [caller_dir]
   # If the file is a symbolic link, we also search it's original path.
   if os.path.islink(module_file):
     caller_dirs.append(os.path.dirname(os.path.realpath(module_file)))
+  return default_config_name, tuple(caller_dirs)
+
+
+def _ResolveConfigInfo(config_name, frame, extra_config_dirs):
+  config_dirs = [
+      GetRuntimeConfigDirectory(),
+      GetBuildConfigDirectory(),
+  ]
+
+  # Looking up the module of the frame by `inspect` is slow, so it's resolved
+  # by the globals of the frame, and cached.
+  default_config_name, caller_dirs = _GetCallerInfo(
+      frame.f_globals.get('__file__'), frame.f_code.co_filename)
 
   for config_dir in reversed(extra_config_dirs):
     config_dirs += caller_dirs if config_dir == CALLER_DIR else [config_dir]
@@ -399,7 +461,7 @@ def _ResolveConfigInfo(config_name, frame, extra_config_dirs):
 
 def LoadConfig(config_name=None, schema_name=None, validate_schema=True,
                default_config_dirs=CALLER_DIR, allow_inherit=False,
-               generate_depend=False):
+               generate_depend=False, frozen=False):
   """Loads a configuration as mapping by given file name.
 
   The config files are retrieved and overridden in order:
@@ -456,6 +518,15 @@ def LoadConfig(config_name=None, schema_name=None, validate_schema=True,
 
         If `generate_depend` is False, `A.GetDepend()` will be empty.
 
+    frozen: if this is True, returns a read-only config shared by all the
+        callers loading the same config, instead of a copy.  The dicts and
+        lists in a read-only config raise TypeError if they are modified, and
+        `copy.deepcopy` of it returns a modifiable copy.
+
+  The loaded configs are cached in the process.  A cached config is reused
+  until any of the config and schema files checked to load it is created,
+  modified or removed.
+
   Returns:
     The config as mapping object.
 
@@ -477,8 +548,31 @@ def LoadConfig(config_name=None, schema_name=None, validate_schema=True,
     raise ConfigNotFoundError('LoadConfig() requires a config name.')
 
   logger = _GetLogger()
+  cache_key = (config_name, schema_name, validate_schema, tuple(config_dirs),
+               allow_inherit, generate_depend)
+  cached_config = _CACHED_CONFIGS.get(cache_key)
+  if cached_config and not cached_config.IsModified():
+    logger('config_utils: Using cached config <%s>.', config_name)
+  else:
+    cached_config = _CachedConfig(
+        *_LoadConfig(config_name, schema_name, validate_schema, config_dirs,
+                     allow_inherit, generate_depend, logger))
+    _CACHED_CONFIGS[cache_key] = cached_config
+  return cached_config.GetFrozen() if frozen else cached_config.GetCopy()
+
+
+def _LoadConfig(config_name, schema_name, validate_schema, config_dirs,
+                allow_inherit, generate_depend, logger):
+  """Internal function to load a config, see `LoadConfig`.
+
+  Returns:
+    A pair of the loaded ResolvedConfig object, and a dict which maps the path
+    of each config and schema file checked to load it to the signature of the
+    file.
+  """
+  signatures = {}
   raw_config_list = _LoadRawConfigList(config_name, config_dirs, allow_inherit,
-                                       logger, {})
+                                       logger, {}, signatures)
   config = raw_config_list.Resolve()
 
   # Remove the special key so that we don't need to write schema for this field.
@@ -494,20 +588,26 @@ def LoadConfig(config_name=None, schema_name=None, validate_schema=True,
     schema = {}
     for config_dir in config_dirs:
       new_schema = _LoadRawSchema(
-          config_dir, schema_name or config_name, logger)
+          config_dir, schema_name or config_name, logger, signatures)
 
       if new_schema is not None:
         # Config data can be extended, but schema must be self-contained.
         schema = new_schema
+        schema_path = os.path.join(
+            config_dir, (schema_name or config_name) + SCHEMA_FILE_EXT)
         break
     assert schema, 'Need JSON schema file defined for %s.' % config_name
     if _CAN_VALIDATE_SCHEMA:
       try:
-        jsonschema.validate(config, schema)
+        validator = _GetSchemaValidator(
+            schema_path, signatures[schema_path], schema)
+        error = jsonschema.exceptions.best_match(validator.iter_errors(config))
       except Exception as e:
+        error = e
+      if error is not None:
         # Only get the `message` property of the exception to prevent
         # from dumping whole schema data in the log.
-        raise ConfigInvalidError(str(e), raw_config_list.CollectDepend())
+        raise ConfigInvalidError(str(error), raw_config_list.CollectDepend())
 
     else:
       logger('Configuration schema <%s> not validated because jsonschema '
@@ -518,7 +618,7 @@ def LoadConfig(config_name=None, schema_name=None, validate_schema=True,
   config = ResolvedConfig(config)
   if generate_depend:
     config.SetDepend(raw_config_list.CollectDepend())
-  return config
+  return config, signatures
 
 
 def GlobConfig(config_pattern, default_config_dirs=CALLER_DIR):
@@ -594,6 +694,81 @@ class ResolvedConfig(dict):
     return self._recipe
 
 
+def _ReadOnly(obj, *unused_args, **unused_kargs):
+  raise TypeError('The config is read-only: %r' % (obj, ))
+
+
+class _FrozenDict(dict):
+  """A read-only dict in the configs returned by `LoadConfig(frozen=True)`."""
+  __setitem__ = __delitem__ = __ior__ = _ReadOnly
+  clear = pop = popitem = setdefault = update = _ReadOnly
+
+  def __reduce__(self):
+    # Copied or unpickled as a modifiable dict.
+    return (dict, (dict(self), ))
+
+
+class _FrozenList(list):
+  """A read-only list in the configs returned by `LoadConfig(frozen=True)`."""
+  __setitem__ = __delitem__ = __iadd__ = __imul__ = _ReadOnly
+  append = clear = extend = insert = pop = remove = reverse = sort = _ReadOnly
+
+  def __reduce__(self):
+    # Copied or unpickled as a modifiable list.
+    return (list, (list(self), ))
+
+
+class _FrozenResolvedConfig(_FrozenDict, ResolvedConfig):
+  """A read-only ResolvedConfig."""
+
+  def __reduce__(self):
+    return (ResolvedConfig, (dict(self), ))
+
+
+def _Freeze(value):
+  """Returns a read-only copy of a JSON value."""
+  if isinstance(value, dict):
+    return _FrozenDict((k, _Freeze(v)) for k, v in value.items())
+  if isinstance(value, list):
+    return _FrozenList(_Freeze(v) for v in value)
+  return value
+
+
+class _CachedConfig:
+  """A config loaded by `LoadConfig`, and the files it's loaded from."""
+
+  def __init__(self, config, signatures):
+    """Constructor.
+
+    Args:
+      config: The loaded ResolvedConfig object.
+      signatures: A dict which maps the path of each file checked to load the
+          config to its signature.
+    """
+    self._config = config
+    self._signatures = signatures
+    self._frozen_config = None
+
+  def IsModified(self):
+    """Returns True if any of the files is changed since it's loaded."""
+    return any(_GetFileSignature(path) != signature
+               for path, signature in self._signatures.items())
+
+  def GetCopy(self):
+    """Returns a copy of the config which can be modified by the caller."""
+    config = ResolvedConfig(copy.deepcopy(dict(self._config)))
+    config.SetDepend(list(self._config.GetDepend()))
+    return config
+
+  def GetFrozen(self):
+    """Returns the read-only config shared by the callers."""
+    if self._frozen_config is None:
+      frozen_config = _FrozenResolvedConfig(_Freeze(self._config))
+      frozen_config.SetDepend(_Freeze(self._config.GetDepend()))
+      self._frozen_config = frozen_config
+    return self._frozen_config
+
+
 def _C3Linearization(parent_configs, config_name):
   """C3 superclass linearization for inherited configs.
 
@@ -635,8 +810,12 @@ def _C3Linearization(parent_configs, config_name):
 
 
 def _LoadRawConfigList(config_name, config_dirs, allow_inherit,
-                       logger, cached_configs):
-  """Internal function to load the config list."""
+                       logger, cached_configs, signatures=None):
+  """Internal function to load the config list.
+
+  Args:
+    signatures: See `_LoadRawConfig`.
+  """
   if config_name in cached_configs:
     assert cached_configs[config_name] != _DUMMY_CACHE, (
         'Detected loop inheritance dependency of %s' % config_name)
@@ -649,7 +828,7 @@ def _LoadRawConfigList(config_name, config_dirs, allow_inherit,
 
   found_configs = []
   for config_dir in config_dirs:
-    new_config = _LoadRawConfig(config_dir, config_name, logger)
+    new_config = _LoadRawConfig(config_dir, config_name, logger, signatures)
 
     if new_config is not None:
       found_configs.append((config_dir, new_config))
@@ -678,7 +857,8 @@ def _LoadRawConfigList(config_name, config_dirs, allow_inherit,
             config_dirs=config_dirs,
             allow_inherit=allow_inherit,
             cached_configs=cached_configs,
-            logger=logger)
+            logger=logger,
+            signatures=signatures)
         parent_configs.append(current_config)
       config_list.update(_C3Linearization(parent_configs, config_name))
 
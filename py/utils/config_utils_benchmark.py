@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for loading the configs of Goofy by config_utils.LoadConfig.
+
+The configs loaded when Goofy starts (the Goofy options, the plugins, the
+active test list and all the test lists) are loaded --rounds times by:
+
+ - cold: with the cache of LoadConfig cleared before each round, so each config
+   is read, resolved and validated again, like the old LoadConfig.
+ - cached: reusing the cached configs, each returned as a copy.
+ - frozen: reusing the cached configs by LoadConfig(frozen=True).
+
+Example:
+
+  config_utils_benchmark.py --rounds 20
+"""
+
+import argparse
+import os
+import time
+
+from cros.factory.test.env import paths
+from cros.factory.test.test_lists import manager
+from cros.factory.test.test_lists import test_list_common
+from cros.factory.utils import config_utils
+
+
+_GOOFY_DIR = os.path.join(paths.FACTORY_PYTHON_PACKAGE_DIR, 'goofy')
+_PLUGINS_DIR = os.path.join(_GOOFY_DIR, 'plugins')
+
+
+def _GetGoofyConfigs():
+  """Returns a list of the arguments of LoadConfig when Goofy starts."""
+  configs = [
+      dict(config_name='goofy', validate_schema=False,
+           default_config_dirs=_GOOFY_DIR),
+      dict(config_name='goofy_plugins', schema_name='plugins',
+           default_config_dirs=_PLUGINS_DIR),
+      dict(config_name='goofy_plugin_chromeos', schema_name='plugins',
+           default_config_dirs=_PLUGINS_DIR, allow_inherit=True),
+      dict(config_name=test_list_common.ACTIVE_TEST_LIST_CONFIG_NAME,
+           default_config_dirs=os.path.dirname(
+               test_list_common.ACTIVE_TEST_LIST_CONFIG_PATH)),
+      dict(config_name=test_list_common.TEST_LIST_CONSTANTS_CONFIG_NAME)]
+  for test_list_id in manager.Loader().FindTestLists():
+    configs.append(dict(
+        config_name=test_list_common.GetTestListConfigName(test_list_id),
+        schema_name=test_list_common.TEST_LIST_SCHEMA_NAME,
+        default_config_dirs=test_list_common.TEST_LISTS_PATH,
+        allow_inherit=True, generate_depend=True))
+
+  def _CanLoad(kwargs):
+    try:
+      config_utils.LoadConfig(**kwargs)
+      return True
+    except config_utils.ConfigNotFoundError:
+      return False
+
+  return [kwargs for kwargs in configs if _CanLoad(kwargs)]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--rounds', type=int, default=20,
+                      help='Number of times the configs are loaded.')
+  args = parser.parse_args()
+
+  configs = _GetGoofyConfigs()
+  print('Configs: %d' % len(configs))
+
+  def _Cold():
+    # pylint: disable=protected-access
+    config_utils._CACHED_CONFIGS.clear()
+    config_utils._CACHED_SCHEMA_VALIDATORS.clear()
+    return [config_utils.LoadConfig(**kwargs) for kwargs in configs]
+
+  def _Cached():
+    return [config_utils.LoadConfig(**kwargs) for kwargs in configs]
+
+  def _Frozen():
+    return [config_utils.LoadConfig(frozen=True, **kwargs)
+            for kwargs in configs]
+
+  expected = _Cold()
+  for name, func in [('cold', _Cold), ('cached', _Cached),
+                     ('frozen', _Frozen)]:
+    start_time = time.time()
+    for unused_i in range(args.rounds):
+      results = func()
+    elapsed = (time.time() - start_time) / args.rounds
+    assert results == expected, 'Configs are different.'
+    print('%-8s %8.1f ms' % (name, elapsed * 1000))
+
+
+if __name__ == '__main__':
+  main()
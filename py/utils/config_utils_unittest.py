@@ -4,12 +4,16 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import copy
 import json
 import logging
 import os
+import shutil
+import tempfile
 import unittest
 
 from cros.factory.utils import config_utils
+from cros.factory.utils import file_utils
 from cros.factory.utils import type_utils
 
 
@@ -149,6 +153,68 @@ class ConfigUtilsTest(unittest.TestCase):
           allow_inherit=True)
 
 
+class CachedConfigTest(unittest.TestCase):
+  """Test the cache of LoadConfig."""
+
+  def setUp(self):
+    self.default_dir = tempfile.mkdtemp(prefix='config_utils_unittest.')
+    self.extra_dir = tempfile.mkdtemp(prefix='config_utils_unittest.')
+    self._WriteConfig(self.default_dir, 'test', {'a': {'b': [1]}})
+    self._WriteConfig(self.default_dir, 'test.schema', {'type': 'object'})
+
+  def tearDown(self):
+    shutil.rmtree(self.default_dir)
+    shutil.rmtree(self.extra_dir)
+
+  def _WriteConfig(self, config_dir, config_name, value):
+    path = os.path.join(config_dir, config_name + config_utils.CONFIG_FILE_EXT)
+    file_utils.WriteFile(path + '~', json.dumps(value))
+    os.rename(path + '~', path)
+
+  def _LoadConfig(self, **kwargs):
+    return config_utils.LoadConfig(
+        'test', default_config_dirs=[self.extra_dir, self.default_dir],
+        generate_depend=True, **kwargs)
+
+  def testCopy(self):
+    config = self._LoadConfig()
+    config['a']['b'].append(2)
+    self.assertEqual({'a': {'b': [1]}}, self._LoadConfig())
+
+  def testReload(self):
+    self.assertEqual({'a': {'b': [1]}}, self._LoadConfig())
+
+    self._WriteConfig(self.default_dir, 'test', {'a': {'b': [2]}})
+    self.assertEqual({'a': {'b': [2]}}, self._LoadConfig())
+
+    # A new config overriding the default one.
+    self._WriteConfig(self.extra_dir, 'test', {'c': 3})
+    config = self._LoadConfig()
+    self.assertEqual({'a': {'b': [2]}, 'c': 3}, config)
+    self.assertEqual(2, len(config.GetDepend()))
+
+    os.unlink(os.path.join(self.extra_dir, 'test.json'))
+    self.assertEqual({'a': {'b': [2]}}, self._LoadConfig())
+
+  def testFrozen(self):
+    config = self._LoadConfig(frozen=True)
+    self.assertIs(config, self._LoadConfig(frozen=True))
+    self.assertEqual({'a': {'b': [1]}}, config)
+    self.assertIsInstance(config, config_utils.ResolvedConfig)
+    self.assertEqual(1, len(config.GetDepend()))
+    self.assertEqual(json.dumps({'a': {'b': [1]}}), json.dumps(config))
+    self.assertRaises(TypeError, config.update, {})
+    self.assertRaises(TypeError, config['a'].pop, 'b')
+    self.assertRaises(TypeError, config['a']['b'].append, 2)
+
+    config_copy = copy.deepcopy(config)
+    config_copy['a']['b'].append(2)
+    self.assertEqual({'a': {'b': [1, 2]}}, config_copy)
+
+    self._WriteConfig(self.default_dir, 'test', {'a': {'b': [2]}})
+    self.assertEqual({'a': {'b': [2]}}, self._LoadConfig(frozen=True))
+
+
 class ResolvedConfigTest(unittest.TestCase):
   """Test ResolvedConfig"""
 
@@ -0,0 +1,346 @@
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""A journaled store of recursive dictionary data.
+
+JournaledDictStore provides the same interface as shelve_utils.DictShelfView,
+but is designed for frequent small updates of large data:
+
+- Leaves (values which are not dicts) are kept pickled in memory, with an index
+  from each key to its children, so reading or replacing a subtree only visits
+  the subtree.
+- Changes are grouped in transactions.  Each transaction is appended to a
+  journal file as one checksummed record, with a single fsync.
+- When the journal grows larger than the snapshot, the whole data is written
+  to a new snapshot file atomically, and the journal is emptied.
+
+On open, the snapshot is loaded and the records in the journal are replayed.
+A record torn by a crash fails its checksum; it and everything after it are
+discarded, so the data is the one of the last committed transaction.  Since
+each record replaces whole subtrees, replaying records already included in the
+snapshot (when a crash happens between writing the snapshot and emptying the
+journal) gives the same data.
+
+Files of a store at `path`::
+
+  path/snapshot
+  path/journal
+"""
+
+import collections.abc
+import contextlib
+import logging
+import os
+import pickle
+import struct
+import zlib
+
+from . import file_utils
+from .shelve_utils import DictKey
+
+
+_SNAPSHOT_FILE = 'snapshot'
+_JOURNAL_FILE = 'journal'
+_SNAPSHOT_VERSION = 1
+# Length and CRC32 of the payload.
+_RECORD_HEADER = struct.Struct('<II')
+# The journal is compacted when it grows larger than both this and the
+# snapshot.
+_DEFAULT_MIN_COMPACT_SIZE = 1 << 20
+
+
+class JournaledDictStore:
+  """A recursive dictionary persisted by a snapshot and a journal.
+
+  Keys are paths separated by dots; see shelve_utils.DictKey.  For example::
+
+    store.SetValue('a.b.c', True)
+    assert store.GetChildren('a') == {'b'}
+    assert store.GetValue('a') == {'b': {'c': True}}
+
+  Args:
+    path: Directory of the files, or None to keep the data in memory only.
+    fsync: Whether to fsync the journal when a transaction is committed.
+  """
+
+  def __init__(self, path=None, fsync=True):
+    self._path = path
+    self._fsync = fsync
+    # Pickled values of leaves, and the children of each key (including
+    # leaves, and the root '' if there is any data).
+    self._values = {}
+    self._children = {}
+    # Operations and undo log of the current transaction.
+    self._transaction_depth = 0
+    self._pending = []
+    self._undo = []
+    self._journal = None
+    self._journal_size = 0
+    self._snapshot_size = 0
+    if path:
+      file_utils.TryMakeDirs(path)
+      self._Load()
+
+  @property
+  def snapshot_path(self):
+    return os.path.join(self._path, _SNAPSHOT_FILE)
+
+  @property
+  def journal_path(self):
+    return os.path.join(self._path, _JOURNAL_FILE)
+
+  def Exists(self):
+    """Returns True if the store has been written to disk."""
+    return bool(self._path) and (os.path.exists(self.snapshot_path) or
+                                 os.path.getsize(self.journal_path) > 0)
+
+  @contextlib.contextmanager
+  def Transaction(self):
+    """Groups the changes in the context into one journal record.
+
+    Changes are visible to reads immediately, and written to disk when the
+    outermost transaction exits.  If an exception is raised, the changes in
+    the outermost transaction are reverted.
+    """
+    self._transaction_depth += 1
+    try:
+      yield
+    except BaseException:
+      self._transaction_depth -= 1
+      if not self._transaction_depth:
+        self._Rollback()
+      raise
+    self._transaction_depth -= 1
+    if not self._transaction_depth:
+      self._Commit()
+
+  def GetValue(self, key, optional=False):
+    """Retrives a value, recursively.
+
+    Args:
+      key: The key whose value to retrieve.
+      optional: True to return None if not found; False to raise a KeyError.
+    """
+    if key not in self._children:
+      if optional:
+        return None
+      raise KeyError(key)
+
+    def Walk(path):
+      children = self._children[path]
+      if children:
+        return {child: Walk(DictKey.Join(path, child)) for child in children}
+      return pickle.loads(self._values[path])
+    return Walk(key)
+
+  def SetValue(self, key, value, sync=True):
+    """Set key with value. `d[key] = value`"""
+    del sync  # Always written when the transaction is committed.
+    leaves = self._Flatten(key, value)
+    if leaves or key in self._children:
+      with self.Transaction():
+        self._Replace(key, leaves)
+
+  def UpdateValue(self, key, value, sync=True):
+    """Sets each leaf in value, and keeps other keys."""
+    del sync  # Always written when the transaction is committed.
+    leaves = self._Flatten(key, value)
+    with self.Transaction():
+      for leaf_key, leaf_value in leaves.items():
+        self._Replace(leaf_key, {leaf_key: leaf_value})
+
+  def UpdateFrom(self, other):
+    """Same as UpdateValue('', other.GetValue('')), without unpickling."""
+    # pylint: disable=protected-access
+    with self.Transaction():
+      for leaf_key, leaf_value in other._values.items():
+        self._Replace(leaf_key, {leaf_key: leaf_value})
+
+  def DeleteKeys(self, keys, optional=False):
+    """Delete each key in `keys`, recursively.
+
+    If there are keys cannot be found, a KeyError exception will be raised for
+    those keys, but other keys which are valid will be deleted first.
+    """
+    invalid_keys = set()
+    with self.Transaction():
+      # Delete children before parents, since deleting the last child of a key
+      # deletes the key.
+      last_deleted_key = None
+      for key in sorted(keys, reverse=True):
+        if key in self._children:
+          self._Replace(key, {})
+          last_deleted_key = key
+        elif not (last_deleted_key is not None and
+                  DictKey.IsAncestor(key, last_deleted_key)):
+          invalid_keys.add(key)
+    if not optional and invalid_keys:
+      raise KeyError(' '.join(invalid_keys))
+
+  def GetChildren(self, key):
+    """Returns the set of the children of `key`."""
+    return set(self._children[key])
+
+  def GetKeys(self):
+    """List of keys of the leaves."""
+    return list(self._values)
+
+  def HasKey(self, key):
+    """Check if `key` is a leaf, or an ancestor of a leaf."""
+    return key in self._children
+
+  def Clear(self):
+    """Removes everything."""
+    if self._children:
+      with self.Transaction():
+        self._Replace('', {})
+
+  def Close(self):
+    """Closes the journal."""
+    if self._journal:
+      self._journal.close()
+      self._journal = None
+
+  def Compact(self):
+    """Writes a snapshot of all data, and empties the journal."""
+    if not self._path:
+      return
+    data = pickle.dumps({'version': _SNAPSHOT_VERSION, 'values': self._values},
+                        pickle.HIGHEST_PROTOCOL)
+    with file_utils.AtomicWrite(self.snapshot_path, binary=True,
+                                fsync=self._fsync) as f:
+      f.write(data)
+    self._snapshot_size = len(data)
+    self._journal.seek(0)
+    self._journal.truncate()
+    self._journal_size = 0
+    if self._fsync:
+      os.fsync(self._journal.fileno())
+
+  @staticmethod
+  def _Flatten(key, value):
+    """Returns a dict of the pickled values of all leaves in value."""
+    leaves = {}
+    def Flatten(key, value):
+      if isinstance(value, collections.abc.Mapping):
+        for child in value:
+          Flatten(DictKey.Join(key, child), value[child])
+      else:
+        leaves[key] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    Flatten(key, value)
+    return leaves
+
+  def _SetLeaf(self, key, value):
+    self._values[key] = value
+    if key in self._children:
+      return
+    self._children[key] = set()
+    while key:
+      parent, tail = DictKey.Split(key)
+      exists = parent in self._children
+      self._children.setdefault(parent, set()).add(tail)
+      if exists:
+        return
+      key = parent
+
+  def _DeleteLeaf(self, key):
+    del self._values[key]
+    if self._children[key]:
+      return
+    del self._children[key]
+    while key:
+      parent, tail = DictKey.Split(key)
+      siblings = self._children[parent]
+      siblings.discard(tail)
+      if siblings or parent in self._values:
+        return
+      del self._children[parent]
+      key = parent
+
+  def _GetLeaves(self, key):
+    """Returns the keys of all leaves in the subtree of key."""
+    leaves = []
+    stack = [key] if key in self._children else []
+    while stack:
+      node = stack.pop()
+      if node in self._values:
+        leaves.append(node)
+      stack.extend(DictKey.Join(node, child) for child in self._children[node])
+    return leaves
+
+  def _Replace(self, key, leaves):
+    """Replaces the subtree of key with leaves, as one journal operation."""
+    removed = self._GetLeaves(key)
+    if leaves:
+      # A leaf can't have children; remove ancestors which are leaves.
+      ancestor = key
+      while ancestor:
+        ancestor = DictKey.GetParent(ancestor)
+        if ancestor in self._values:
+          removed.append(ancestor)
+    for leaf_key in removed:
+      self._undo.append((leaf_key, self._values[leaf_key]))
+      self._DeleteLeaf(leaf_key)
+    for leaf_key, value in leaves.items():
+      self._undo.append((leaf_key, None))
+      self._SetLeaf(leaf_key, value)
+    self._pending.append((key, leaves))
+
+  def _Rollback(self):
+    for leaf_key, value in reversed(self._undo):
+      if value is None:
+        self._DeleteLeaf(leaf_key)
+      else:
+        self._SetLeaf(leaf_key, value)
+    self._undo = []
+    self._pending = []
+
+  def _Commit(self):
+    pending, self._pending = self._pending, []
+    self._undo = []
+    if not self._path or not pending:
+      return
+    payload = pickle.dumps(pending, pickle.HIGHEST_PROTOCOL)
+    self._journal.write(
+        _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+    self._journal.flush()
+    if self._fsync:
+      os.fsync(self._journal.fileno())
+    self._journal_size += _RECORD_HEADER.size + len(payload)
+    if self._journal_size > max(_DEFAULT_MIN_COMPACT_SIZE,
+                                self._snapshot_size):
+      self.Compact()
+
+  def _Load(self):
+    if os.path.exists(self.snapshot_path):
+      with open(self.snapshot_path, 'rb') as f:
+        data = f.read()
+      snapshot = pickle.loads(data)
+      if snapshot['version'] != _SNAPSHOT_VERSION:
+        raise ValueError('Unknown version of snapshot %s: %r' %
+                         (self.snapshot_path, snapshot['version']))
+      for key, value in snapshot['values'].items():
+        self._SetLeaf(key, value)
+      self._snapshot_size = len(data)
+
+    self._journal = open(self.journal_path, 'ab+')
+    self._journal.seek(0)
+    journal = self._journal.read()
+    offset = 0
+    while offset + _RECORD_HEADER.size <= len(journal):
+      length, crc = _RECORD_HEADER.unpack_from(journal, offset)
+      payload = journal[offset + _RECORD_HEADER.size:
+                        offset + _RECORD_HEADER.size + length]
+      if len(payload) != length or zlib.crc32(payload) != crc:
+        break
+      for key, leaves in pickle.loads(payload):
+        self._Replace(key, leaves)
+      offset += _RECORD_HEADER.size + length
+    self._pending = []
+    self._undo = []
+    if offset != len(journal):
+      logging.warning('Discarding %d bytes of incomplete journal in %s',
+                      len(journal) - offset, self.journal_path)
+      self._journal.truncate(offset)
+    self._journal_size = offset
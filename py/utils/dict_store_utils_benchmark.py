@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark for updating factory state in a shelf and a journaled store.
+
+A state of --tests test states is created, and then each test state is
+updated --rounds times, like Goofy does when running tests.  Each update is
+synced to disk, and reading the whole state is timed afterwards.
+
+Example:
+
+  dict_store_utils_benchmark.py --tests 500 --rounds 4
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from cros.factory.utils import dict_store_utils
+from cros.factory.utils import shelve_utils
+
+
+def _Bench(view, num_tests, rounds):
+  """Returns the seconds of updating and reading the view."""
+  view.SetValue('', {'test%d' % i: {'__test_state__': {'status': 'UNTESTED'}}
+                     for i in range(num_tests)})
+  start_time = time.time()
+  for count in range(rounds):
+    for i in range(num_tests):
+      view.SetValue('test%d.__test_state__' % i,
+                    {'status': 'PASSED', 'count': count})
+  update_time = time.time() - start_time
+
+  start_time = time.time()
+  value = view.GetValue('')
+  read_time = time.time() - start_time
+  assert len(value) == num_tests
+  return update_time, read_time
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--tests', type=int, default=500,
+                      help='Number of test states.')
+  parser.add_argument('--rounds', type=int, default=4,
+                      help='Number of times each test state is updated.')
+  args = parser.parse_args()
+
+  tmp_dir = tempfile.mkdtemp(prefix='dict_store_utils_benchmark_')
+  try:
+    views = [
+        ('shelf', shelve_utils.DictShelfView(
+            shelve_utils.OpenShelfOrBackup(os.path.join(tmp_dir, 'tests')))),
+        ('journal', dict_store_utils.JournaledDictStore(
+            os.path.join(tmp_dir, 'tests_store'))),
+    ]
+    updates = args.tests * args.rounds
+    for name, view in views:
+      update_time, read_time = _Bench(view, args.tests, args.rounds)
+      view.Close()
+      print('%-8s %8.2fs %10.0f updates/s, read all in %.4fs' % (
+          name, update_time, updates / update_time, read_time))
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+  main()
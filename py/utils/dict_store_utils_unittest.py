@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cros.factory.utils import dict_store_utils
+from cros.factory.utils import shelve_utils
+
+
+class JournaledDictStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp(prefix='dict_store_utils_unittest.')
+    self.path = os.path.join(self.tmp, 'store')
+    self.store = dict_store_utils.JournaledDictStore(self.path)
+
+  def tearDown(self):
+    self.store.Close()
+    shutil.rmtree(self.tmp)
+
+  def _Reopen(self):
+    self.store.Close()
+    self.store = dict_store_utils.JournaledDictStore(self.path)
+
+  def testSameAsDictShelfView(self):
+    shelf_view = shelve_utils.DictShelfView(shelve_utils.InMemoryShelf())
+    operations = [
+        ('SetValue', 'a.b.c', 1),
+        ('SetValue', 'a.b.d', [2]),
+        ('SetValue', 'x', {'y': 3, 'z': {'w': 4}}),
+        ('UpdateValue', 'a', {'b': {'c': 5}, 'e': 6}),
+        ('SetValue', 'x.z', 7),
+        ('SetValue', 'x.z.v', 8),
+        ('SetValue', 'a.e', {}),
+        ('DeleteKeys', ['a.b.d', 'a.b', 'x.y'], None),
+    ]
+    for method, key, value in operations:
+      for view in (shelf_view, self.store):
+        if method == 'DeleteKeys':
+          view.DeleteKeys(key)
+        else:
+          getattr(view, method)(key, value)
+      self.assertEqual(shelf_view.GetValue(''), self.store.GetValue(''))
+      self.assertCountEqual(shelf_view.GetKeys(), self.store.GetKeys())
+      for key in shelf_view.GetKeys():
+        while True:
+          self.assertTrue(self.store.HasKey(key))
+          self.assertEqual(set(shelf_view.GetChildren(key)),
+                           self.store.GetChildren(key))
+          if not key:
+            break
+          key = shelve_utils.DictKey.GetParent(key)
+
+    self._Reopen()
+    self.assertEqual(shelf_view.GetValue(''), self.store.GetValue(''))
+
+  def testGetValue(self):
+    self.assertFalse(self.store.HasKey(''))
+    self.assertIsNone(self.store.GetValue('a', optional=True))
+    self.assertRaises(KeyError, self.store.GetValue, 'a')
+
+    self.store.SetValue('a', {'b': [1]})
+    value = self.store.GetValue('a.b')
+    value.append(2)
+    # Returns a copy.
+    self.assertEqual([1], self.store.GetValue('a.b'))
+
+  def testDeleteKeys(self):
+    self.store.SetValue('a', {'b': 1, 'c': 2})
+    with self.assertRaises(KeyError):
+      self.store.DeleteKeys(['a.b', 'x'])
+    self.assertEqual({'a': {'c': 2}}, self.store.GetValue(''))
+    self.store.DeleteKeys(['a.c', 'a'])
+    self.assertFalse(self.store.HasKey(''))
+
+  def testTransaction(self):
+    # pylint: disable=protected-access
+    self.store.SetValue('a', 1)
+    offset = os.path.getsize(self.store.journal_path)
+    with self.store.Transaction():
+      self.store.SetValue('b', 2)
+      self.store.SetValue('c', 3)
+      self.assertEqual(3, self.store.GetValue('c'))
+    # Written as one record.
+    with open(self.store.journal_path, 'rb') as f:
+      journal = f.read()
+    length, unused_crc = dict_store_utils._RECORD_HEADER.unpack_from(
+        journal, offset)
+    self.assertEqual(len(journal),
+                     offset + dict_store_utils._RECORD_HEADER.size + length)
+
+    with self.assertRaises(ValueError):
+      with self.store.Transaction():
+        self.store.SetValue('a.x', 4)
+        self.store.DeleteKeys(['b'])
+        with self.store.Transaction():
+          self.store.SetValue('c', {'d': 5})
+        raise ValueError
+    self.assertEqual({'a': 1, 'b': 2, 'c': 3}, self.store.GetValue(''))
+
+    self._Reopen()
+    self.assertEqual({'a': 1, 'b': 2, 'c': 3}, self.store.GetValue(''))
+
+  def testTornRecord(self):
+    self.store.SetValue('a', 1)
+    size = os.path.getsize(self.store.journal_path)
+    self.store.SetValue('a', {'b': 2, 'c': 3})
+    self.store.Close()
+    with open(self.store.journal_path, 'r+b') as f:
+      f.truncate(os.path.getsize(self.store.journal_path) - 1)
+
+    self._Reopen()
+    self.assertEqual({'a': 1}, self.store.GetValue(''))
+    self.assertEqual(size, os.path.getsize(self.store.journal_path))
+    # Records are appended after the valid ones.
+    self.store.SetValue('b', 4)
+    self._Reopen()
+    self.assertEqual({'a': 1, 'b': 4}, self.store.GetValue(''))
+
+  def testCompact(self):
+    self.store.SetValue('a', {'b': 1, 'c': 2})
+    self.store.DeleteKeys(['a.b'])
+    self.store.Compact()
+    self.assertEqual(0, os.path.getsize(self.store.journal_path))
+    self.store.SetValue('d', 3)
+    self._Reopen()
+    self.assertEqual({'a': {'c': 2}, 'd': 3}, self.store.GetValue(''))
+
+  def testReplayAfterCompact(self):
+    self.store.SetValue('a', {'b': 1})
+    self.store.SetValue('a.c', 2)
+    self.store.DeleteKeys(['a.b'])
+    self.store.Close()
+    with open(self.store.journal_path, 'rb') as f:
+      journal = f.read()
+
+    # Crashes after writing the snapshot, before emptying the journal.
+    self._Reopen()
+    self.store.Compact()
+    self.store.Close()
+    with open(self.store.journal_path, 'wb') as f:
+      f.write(journal)
+    self._Reopen()
+    self.assertEqual({'a': {'c': 2}}, self.store.GetValue(''))
+
+  def testUpdateFrom(self):
+    other = dict_store_utils.JournaledDictStore()
+    other.SetValue('a', {'b': 1, 'c': {'d': 2}})
+    self.store.SetValue('a', {'b': 0, 'c': 0, 'e': 3})
+    self.store.UpdateFrom(other)
+    self.assertEqual({'a': {'b': 1, 'c': {'d': 2}, 'e': 3}},
+                     self.store.GetValue(''))
+
+  def testInMemory(self):
+    store = dict_store_utils.JournaledDictStore()
+    store.SetValue('a.b', 1)
+    store.Clear()
+    self.assertFalse(store.HasKey(''))
+    self.assertFalse(store.Exists())
+    store.Close()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,144 @@
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Utilities to compile Python expressions once and evaluate them many times.
+
+Test lists and HWID databases have Python expressions (for example, `run_if`
+of tests, and rules of HWID databases) which are evaluated repeatedly.
+`Compile` parses and compiles each expression only once, and finds the data
+each expression reads, so the callers can skip evaluating an expression if the
+data is not changed.
+"""
+
+import ast
+import collections
+import functools
+
+
+# Number of compiled expressions to keep.  Test lists and HWID databases have
+# at most hundreds of distinct expressions.
+_CACHE_SIZE = 4096
+
+
+CompiledExpression = collections.namedtuple(
+    'CompiledExpression', ['code', 'dependencies'])
+"""A compiled expression.
+
+Properties:
+  code: A code object to be evaluated by `eval`.
+  dependencies: A frozenset of the dot-separated keys read from the names
+      in `tracked_names` of `Compile`.  For example, `device.foo.bar` reads
+      'device.foo.bar', and `device['foo']` reads 'device'.  A key means the
+      value of the key, including all of its children.
+"""
+
+
+class NodeTransformer_AddGet(ast.NodeTransformer):
+  """Given a list of names, we will call `Get` function for you.
+
+  For example, name_list=['device']::
+
+    "device.foo.bar"  ==> "device.foo.bar.Get(None)"
+
+  where `None` is the default value for `Get` function.
+  And `device.foo.bar.Get` will still be `device.foo.bar.Get`.
+  """
+  def __init__(self, name_list):
+    super(NodeTransformer_AddGet, self).__init__()
+    if not isinstance(name_list, list):
+      name_list = [name_list]
+    self.name_list = name_list
+
+  def visit_Attribute(self, node):
+    """Convert the attribute.
+
+    An attribute node will be: `var.foo.bar.baz`, and the node we got is the
+    last attribute node (that is, we will visit `var.foo.bar.baz`, not
+    `var.foo.bar` or its prefix).  And NodeTransformer will not recursively
+    process a node if it is processed, so we only need to worry about process a
+    node twice.
+
+    This will fail for code like::
+
+      "eval! any(v.baz.Get() for v in [device.foo, device.bar])"
+
+    But you can always rewrite it to::
+
+      "eval! any(v for v in [device.foo.baz, device.bar.baz])"
+
+    So it should be fine.
+    """
+    if isinstance(node.ctx, ast.Load) and node.attr != 'Get':
+      v = node
+      while isinstance(v, ast.Attribute):
+        v = v.value
+      if isinstance(v, ast.Name) and v.id in self.name_list:
+        new_node = ast.Call(
+            func=ast.Attribute(
+                attr='Get',
+                value=node,
+                ctx=node.ctx),
+            # Use `None` as default value
+            args=[ast.Constant(value=None)],
+            keywords=[])
+        ast.copy_location(new_node, node)
+        return ast.fix_missing_locations(new_node)
+    return node
+
+
+class _DependencyCollector(ast.NodeVisitor):
+  """Collects the keys read from the given names in a syntax tree."""
+
+  def __init__(self, names):
+    super(_DependencyCollector, self).__init__()
+    self.names = names
+    self.dependencies = set()
+
+  def visit_Attribute(self, node):
+    attrs = []
+    v = node
+    while isinstance(v, ast.Attribute):
+      attrs.append(v.attr)
+      v = v.value
+    if not (isinstance(v, ast.Name) and v.id in self.names):
+      self.generic_visit(node)
+      return
+    attrs.reverse()
+    # `device.foo.Get(...)` reads 'device.foo'.
+    if attrs[-1] == 'Get':
+      attrs.pop()
+    self.dependencies.add('.'.join([v.id] + attrs))
+
+  def visit_Name(self, node):
+    if node.id in self.names:
+      self.dependencies.add(node.id)
+
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def Compile(expression, get_names=(), tracked_names=()):
+  """Compiles a Python expression, or returns the cached result.
+
+  Like `eval` on a string, leading spaces and tabs of the expression are
+  ignored.
+
+  Args:
+    expression: A string of the Python expression.
+    get_names: A tuple of names whose attributes are read by the `Get` method,
+        see `NodeTransformer_AddGet`.
+    tracked_names: A tuple of names whose attributes are collected in the
+        dependencies.
+
+  Returns:
+    A `CompiledExpression` object.
+
+  Raises:
+    SyntaxError if the expression is invalid.
+  """
+  syntax_tree = ast.parse(expression.lstrip(' \t'), mode='eval')
+  collector = _DependencyCollector(tracked_names)
+  collector.visit(syntax_tree)
+  if get_names:
+    syntax_tree = NodeTransformer_AddGet(list(get_names)).visit(syntax_tree)
+  return CompiledExpression(compile(syntax_tree, '<string>', 'eval'),
+                            frozenset(collector.dependencies))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import unittest
+
+from cros.factory.utils import expression_utils
+
+
+class _Selector:
+  def __init__(self, key=''):
+    self.key = key
+
+  def __getattr__(self, name):
+    return _Selector(self.key + '.' + name if self.key else name)
+
+  def Get(self, default):
+    del default  # Unused.
+    return 'value of ' + self.key
+
+
+class CompileTest(unittest.TestCase):
+  def testCompile(self):
+    compiled = expression_utils.Compile('1 + x')
+    result = eval(compiled.code, {'x': 2})  # pylint: disable=eval-used
+    self.assertEqual(result, 3)
+    self.assertEqual(compiled.dependencies, frozenset())
+    # Leading spaces are ignored like `eval`.
+    compiled = expression_utils.Compile(' \t1')
+    self.assertEqual(eval(compiled.code), 1)  # pylint: disable=eval-used
+    self.assertRaises(SyntaxError, expression_utils.Compile, '!x')
+
+  def testCached(self):
+    self.assertIs(expression_utils.Compile('a and b'),
+                  expression_utils.Compile('a and b'))
+    self.assertIsNot(expression_utils.Compile('a and b'),
+                     expression_utils.Compile('a and b', get_names=('a',)))
+
+  def testGetNames(self):
+    compiled = expression_utils.Compile(
+        'device.foo.bar + device.baz.Get("x") + other.foo.key',
+        get_names=('device',))
+    namespace = {'device': _Selector(), 'other': _Selector('other')}
+    self.assertEqual(
+        eval(compiled.code, namespace),  # pylint: disable=eval-used
+        'value of foo.barvalue of bazother.foo')
+
+  def testDependencies(self):
+    self.assertEqual(
+        expression_utils.Compile(
+            'device.a.b or device.c.Get(1) or device.d["e"].f or '
+            'len(device.g) or x.y or constants.z',
+            tracked_names=('device', 'x')).dependencies,
+        frozenset(['device.a.b', 'device.c', 'device.d', 'device.g', 'x.y']))
+    self.assertEqual(
+        expression_utils.Compile('device or device.a',
+                                 tracked_names=('device',)).dependencies,
+        frozenset(['device', 'device.a']))
+
+
+if __name__ == '__main__':
+  unittest.main()
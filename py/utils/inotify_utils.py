@@ -0,0 +1,166 @@
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""A minimal wrapper of Linux inotify(7) without external dependencies.
+
+Example::
+
+  inotify = inotify_utils.Inotify()
+  inotify.AddWatch('/var/log',
+                   inotify_utils.IN_MODIFY | inotify_utils.IN_CREATE)
+  for event in inotify.Read(timeout=1):
+    print(event.name, event.mask)
+  inotify.Close()
+"""
+
+import collections
+import ctypes
+import errno
+import os
+import select
+import struct
+
+
+# Events, from <sys/inotify.h>.
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN = 0x00000020
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+_IN_CLOEXEC = os.O_CLOEXEC
+_IN_NONBLOCK = os.O_NONBLOCK
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_BYTES = 64 * 1024
+_MAX_READS = 16
+
+InotifyEvent = collections.namedtuple('InotifyEvent',
+                                      ['wd', 'mask', 'cookie', 'name'])
+
+_libc = None
+
+
+def _GetLibc():
+  global _libc  # pylint: disable=global-statement
+  if _libc is None:
+    # Symbols of the C library are already loaded into the process.  Avoid
+    # ctypes.util.find_library, which runs external programs.
+    _libc = ctypes.CDLL(None, use_errno=True)
+  return _libc
+
+
+def IsAvailable():
+  """Returns True if inotify can be used on this system."""
+  try:
+    return hasattr(_GetLibc(), 'inotify_init1')
+  except OSError:
+    return False
+
+
+def _CheckResult(result, message):
+  if result < 0:
+    error = ctypes.get_errno()
+    raise OSError(error, '%s: %s' % (message, os.strerror(error)))
+  return result
+
+
+def ParseEvents(data):
+  """Parses the buffer read from an inotify file descriptor.
+
+  Returns:
+    A list of InotifyEvent.
+  """
+  events = []
+  pos = 0
+  while pos + _EVENT_HEADER.size <= len(data):
+    wd, mask, cookie, name_len = _EVENT_HEADER.unpack_from(data, pos)
+    pos += _EVENT_HEADER.size
+    name = data[pos:pos + name_len].rstrip(b'\0')
+    pos += name_len
+    events.append(InotifyEvent(wd, mask, cookie, os.fsdecode(name)))
+  return events
+
+
+class Inotify:
+  """An inotify instance.
+
+  Raises OSError on failures of the underlying system calls, for example when
+  the maximum number of instances or watches is reached.
+  """
+
+  def __init__(self):
+    self._libc = _GetLibc()
+    self._fd = _CheckResult(self._libc.inotify_init1(_IN_NONBLOCK |
+                                                     _IN_CLOEXEC),
+                            'inotify_init1')
+
+  def fileno(self):
+    return self._fd
+
+  def AddWatch(self, path, mask):
+    """Watches a path for the given events, and returns the watch descriptor.
+
+    Watching the same path again replaces the mask and returns the same watch
+    descriptor.
+    """
+    return _CheckResult(
+        self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask),
+        'inotify_add_watch %s' % path)
+
+  def RemoveWatch(self, wd):
+    """Removes a watch.  Ignores watches which are already removed."""
+    if self._libc.inotify_rm_watch(self._fd, wd) < 0:
+      error = ctypes.get_errno()
+      if error != errno.EINVAL:
+        raise OSError(error, 'inotify_rm_watch: %s' % os.strerror(error))
+
+  def Read(self, timeout=None):
+    """Waits for events until timeout.
+
+    Args:
+      timeout: Seconds to wait for.  None to wait forever, and 0 to return
+          immediately.
+
+    Returns:
+      A list of InotifyEvent, which may be empty.
+    """
+    readable, unused_w, unused_x = select.select([self._fd], [], [], timeout)
+    if not readable:
+      return []
+    # Drain pending events, so that the kernel queue does not overflow when
+    # events come faster than the caller wakes up.  Stop after a while to
+    # return events to the caller even if they keep coming.
+    chunks = []
+    for unused_i in range(_MAX_READS):
+      try:
+        data = os.read(self._fd, _READ_BYTES)
+      except BlockingIOError:
+        break
+      chunks.append(data)
+      if len(data) < _READ_BYTES // 2:
+        break
+    return ParseEvents(b''.join(chunks))
+
+  def Close(self):
+    if self._fd is not None:
+      os.close(self._fd)
+      self._fd = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, tb):
+    self.Close()
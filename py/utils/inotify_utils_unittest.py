@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+#
+# Copyright 2020 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unit tests for inotify_utils module."""
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from cros.factory.utils import inotify_utils
+
+
+class ParseEventsTest(unittest.TestCase):
+
+  def testParse(self):
+    data = (struct.pack('iIII', 1, inotify_utils.IN_MODIFY, 0, 8) +
+            b'a.log\0\0\0' +
+            struct.pack('iIII', 2, inotify_utils.IN_Q_OVERFLOW, 0, 0))
+    self.assertEqual(
+        [inotify_utils.InotifyEvent(1, inotify_utils.IN_MODIFY, 0, 'a.log'),
+         inotify_utils.InotifyEvent(2, inotify_utils.IN_Q_OVERFLOW, 0, '')],
+        inotify_utils.ParseEvents(data))
+
+
+@unittest.skipUnless(inotify_utils.IsAvailable(), 'inotify is not available')
+class InotifyTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp(prefix='inotify_utils_unittest_')
+    self.inotify = inotify_utils.Inotify()
+
+  def tearDown(self):
+    self.inotify.Close()
+    shutil.rmtree(self.tmp_dir)
+
+  def testWatchDirectory(self):
+    wd = self.inotify.AddWatch(
+        self.tmp_dir, inotify_utils.IN_CREATE | inotify_utils.IN_MODIFY)
+    self.assertEqual([], self.inotify.Read(timeout=0))
+
+    path = os.path.join(self.tmp_dir, 'a.log')
+    with open(path, 'w') as f:
+      f.write('line\n')
+    events = self.inotify.Read(timeout=1)
+    self.assertEqual(
+        [(wd, inotify_utils.IN_CREATE, 'a.log'),
+         (wd, inotify_utils.IN_MODIFY, 'a.log')],
+        [(e.wd, e.mask, e.name) for e in events])
+
+    self.inotify.RemoveWatch(wd)
+    self.inotify.RemoveWatch(wd)
+    self.assertEqual(inotify_utils.IN_IGNORED,
+                     self.inotify.Read(timeout=1)[0].mask)
+
+  def testWatchMissingPath(self):
+    with self.assertRaises(OSError):
+      self.inotify.AddWatch(os.path.join(self.tmp_dir, 'missing'),
+                            inotify_utils.IN_MODIFY)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -4,8 +4,10 @@
 
 """The abstraction of minimal functions needed to access a system."""
 
+import collections
 import glob
 import logging
+import os
 import pipes
 import shutil
 import subprocess
@@ -16,6 +18,9 @@ from . import process_utils
 # Use process_utils.CalledProcessError for invocation exceptions.
 CalledProcessError = process_utils.CalledProcessError
 
+# The result of StatMany.
+FileStat = collections.namedtuple('FileStat', ['mode', 'size', 'mtime'])
+
 
 class SystemInterface:
   """Abstract interface for accessing a system."""
@@ -70,6 +75,47 @@ class SystemInterface:
       x = f.read() if count is None else f.read(count)
       return x.decode('utf-8')
 
+  def ReadFiles(self, paths):
+    """Returns contents of many files on target device.
+
+    This is preferred to calling ReadFile in a loop on remote devices, since
+    all files are read in one round trip.  Files like sysfs nodes can be read,
+    but the whole contents are always read.
+
+    Args:
+      paths: A list of file paths on target device.
+
+    Returns:
+      A dict {path: contents} of files that were read successfully.  Paths that
+      can't be read (for example, not existing) are not in the dict.
+    """
+    result = {}
+    for path in paths:
+      try:
+        with open(path, 'rb') as f:
+          result[path] = f.read().decode('utf-8')
+      except (IOError, UnicodeDecodeError):
+        pass
+    return result
+
+  def StatMany(self, paths):
+    """Returns the status of many files on target device, following symlinks.
+
+    Args:
+      paths: A list of file paths on target device.
+
+    Returns:
+      A dict {path: FileStat} of existing files.
+    """
+    result = {}
+    for path in paths:
+      try:
+        st = os.stat(path)
+      except OSError:
+        continue
+      result[path] = FileStat(st.st_mode, st.st_size, st.st_mtime)
+    return result
+
   def WriteFile(self, path, content):
     """Writes some content into file on target device.
 
@@ -239,3 +285,14 @@ class SystemInterface:
       A list of files matching pattern on target device.
     """
     return glob.glob(pattern)
+
+  def GlobMany(self, patterns):
+    """Finds files on target device by many patterns in one round trip.
+
+    Args:
+      patterns: A list of file path patterns, see Glob.
+
+    Returns:
+      A dict {pattern: list of matching files}.
+    """
+    return {pattern: self.Glob(pattern) for pattern in patterns}
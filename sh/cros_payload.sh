@@ -367,7 +367,8 @@ cmd_help() {
   add JSON_PATH COMPONENT FILE
 
       Creates payloads from FILE as COMPONENT to the JSON_PATH. Payloads wil
-      be stored in same folder as JSON_PATH.
+      be stored in same folder as JSON_PATH. For disk image components, only
+      partition N is added if COMPONENT is given as 'COMPONENT.partN'.
 
       Example: $0 add static/test.json test_image chromiumos_test_image.bin
 
@@ -717,11 +718,13 @@ add_image_part() {
 }
 
 # Adds an disk image type payload.
-# Usage: add_image_component JSON_PATH COMPONENT FILE
+# Usage: add_image_component JSON_PATH COMPONENT FILE [PART_NO]
+#  If PART_NO is given, only the partition PART_NO is added.
 add_image_component() {
   local json_path="$1"
   local component="$2"
   local file="$3"
+  local part_no="$4"
   local nr start sectors uuid part_command
   local rootfs_start rootfs_sectors
 
@@ -736,12 +739,17 @@ add_image_component() {
     die "Missing partition tools - please install cgpt or partx."
   fi
 
-  # Reset version because add_image_part ignores partitions without version.
-  update_json_meta "${json_path}" "${component}" version ""
+  if [ -z "${part_no}" ]; then
+    # Reset version because add_image_part ignores partitions without version.
+    update_json_meta "${json_path}" "${component}" version ""
+  fi
 
   # TODO(hungte) Add part0 as GPT itself.
   ${part_command} "${file}" | while read start sectors nr uuid; do
     debug "${part_command} ${file} -> ${start} ${sectors} ${nr} ${uuid}"
+    if [ -n "${part_no}" ] && [ "${nr}" != "${part_no}" ]; then
+      continue
+    fi
     # ${uuid} is not really needed for add_image_part.
     add_image_part "${json_path}" "${component}" "${file}" "${nr}" \
       "${start}" "${sectors}"
@@ -902,6 +910,12 @@ cmd_add() {
       file="$(get_uncompressed_file "${file}")"
       add_image_component "${json_path}" "${component}" "${file}"
       ;;
+    release_image.part* | test_image.part*)
+      cache_sudo
+      file="$(get_uncompressed_file "${file}")"
+      add_image_component "${json_path}" "${component%.part*}" "${file}" \
+        "${component##*.part}"
+      ;;
     toolkit | hwid | firmware | complete | netboot_* | toolkit_config | \
         lsb_factory | description)
       file="$(get_uncompressed_file "${file}")"